@@ -0,0 +1,5 @@
+"""
+MorphoLang Benchmarks
+
+Performance measurements for the compiler, decoder and verification modules.
+"""
@@ -0,0 +1,66 @@
+"""
+Benchmark: per-pixel calibration fitting and calibrated analysis.
+
+Compares the vectorized fit with a per-pixel np.polyfit loop on a small
+field, then times fitting and applying full-frame maps at larger sizes.
+
+Usage:
+    python -m benchmarks.bench_calibration
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from verification.calibration import CalibrationCache, fit_block, ratio_map
+from verification.dye_decode import BioStateValidator
+from verification.kernel import RatiometricScratch
+
+CLAMP_MV = [-60.0, -45.0, -30.0, -15.0, 0.0]
+LOOP_SHAPE = (64, 64)
+SHAPES = [(512, 512), (2048, 2048)]
+
+
+def clamp_series(shape, rng):
+    """Donor/acceptor frames for each clamp level with a slope that drifts across the field."""
+    slope = np.linspace(80.0, 120.0, shape[1], dtype=np.float32)[None, :]
+    acceptor = rng.integers(190, 211, size=shape, dtype=np.uint8)
+    donors = [np.clip(acceptor * ((v + 70.0) / slope), 0, 255).astype(np.uint8) for v in CLAMP_MV]
+    return donors, [acceptor] * len(CLAMP_MV)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    donors, acceptors = clamp_series(LOOP_SHAPE, rng)
+    scratch = RatiometricScratch()
+    ratios = np.stack([ratio_map(d, a, scratch=scratch) for d, a in zip(donors, acceptors)]).reshape(len(CLAMP_MV), -1)
+    t_loop = timeit.timeit(lambda: [np.polyfit(ratios[:, i], CLAMP_MV, 1) for i in range(ratios.shape[1])], number=1)
+    t_vec = min(timeit.repeat(lambda: fit_block(ratios, np.array(CLAMP_MV)), number=1, repeat=5))
+    print(f"{LOOP_SHAPE[0]}x{LOOP_SHAPE[1]} linear fit: polyfit loop {t_loop * 1e3:.1f} ms, "
+          f"vectorized {t_vec * 1e3:.2f} ms")
+
+    validator = BioStateValidator()
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = CalibrationCache(tmp)
+        for shape in SHAPES:
+            donors, acceptors = clamp_series(shape, rng)
+            for degree in (1, 2):
+                t_fit = timeit.timeit(lambda: cache.fit('bench', f'd{degree}', donors, acceptors, CLAMP_MV, degree),
+                                      number=1)
+                calibrated = BioStateValidator(calibration=cache.get('bench', f'd{degree}'))
+                out = np.empty(shape, dtype=np.float32)
+                t_apply = min(timeit.repeat(lambda: calibrated.compute_vmem_into(donors[2], acceptors[2], out, scratch),
+                                            number=1, repeat=5))
+                t_global = min(timeit.repeat(lambda: validator.compute_vmem_into(donors[2], acceptors[2], out, scratch),
+                                             number=1, repeat=5))
+                print(f"{shape[0]}x{shape[1]} degree {degree}: fit {t_fit * 1e3:.0f} ms, "
+                      f"apply {t_apply * 1e3:.2f} ms (global calibration {t_global * 1e3:.2f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark: moving frames from acquisition to analysis.
+
+In-process, a PNG round-trip through disk (what the rig scripts did) is
+compared with handing analyze_ratiometric the arrays. Across processes,
+pickling frame pairs through a multiprocessing.Queue is compared with a
+FrameRing, where the worker reads the frames in shared memory.
+
+Usage:
+    python -m benchmarks.bench_frame_transport
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import synthetic_image_pair
+from verification.dye_decode import BioStateValidator
+from verification.frames import FrameRing
+from verification.kernel import RatiometricScratch
+
+SHAPE = (2048, 2048)
+REPEATS = 5
+FRAMES = 20
+
+
+def queue_worker(frames, results):
+    validator = BioStateValidator()
+    out = np.empty(SHAPE, dtype=np.float32)
+    scratch = RatiometricScratch()
+    while True:
+        pair = frames.get()
+        if pair is None:
+            break
+        validator.compute_vmem_into(pair[0], pair[1], out, scratch)
+    results.put(None)
+
+
+def ring_worker(ring, results):
+    validator = BioStateValidator()
+    out = np.empty(SHAPE, dtype=np.float32)
+    scratch = RatiometricScratch()
+    for frame in ring.frames():
+        validator.compute_vmem_into(frame.donor, frame.acceptor, out, scratch)
+    ring.close()
+    results.put(None)
+
+
+def _start(context, target, *args):
+    worker = context.Process(target=target, args=args)
+    worker.start()
+    return worker
+
+
+def stream(send, start_worker, finish, results):
+    """Frames per second through a producer and one analysis process."""
+    worker = start_worker()
+    started = time.perf_counter()
+    for _ in range(FRAMES):
+        send()
+    finish()
+    results.get()
+    elapsed = time.perf_counter() - started
+    worker.join()
+    return FRAMES / elapsed
+
+
+def main():
+    validator = BioStateValidator()
+    donor, acceptor = np.empty(SHAPE, np.uint8), np.empty(SHAPE, np.uint8)
+    synthetic_image_pair(SHAPE, donor, acceptor)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        donor_path, acceptor_path = os.path.join(tmp, 'donor.png'), os.path.join(tmp, 'acceptor.png')
+
+        def via_disk():
+            cv2.imwrite(donor_path, donor)
+            cv2.imwrite(acceptor_path, acceptor)
+            return validator.analyze_ratiometric(donor_path, acceptor_path)
+
+        t_disk = min(timeit.repeat(via_disk, number=1, repeat=REPEATS))
+    t_memory = min(timeit.repeat(lambda: validator.analyze_ratiometric(donor, acceptor), number=1, repeat=REPEATS))
+    print(f"{SHAPE[0]}x{SHAPE[1]} in-process: PNG round-trip {t_disk * 1e3:8.1f} ms, "
+          f"in-memory {t_memory * 1e3:8.1f} ms  ({t_disk / t_memory:.1f}x)")
+
+    context = multiprocessing.get_context()
+    results = context.Queue()
+
+    frames = context.Queue(maxsize=4)
+    queue_rate = stream(lambda: frames.put((donor, acceptor)),
+                        lambda: _start(context, queue_worker, frames, results),
+                        lambda: frames.put(None), results)
+
+    with FrameRing(SHAPE, slots=4, context=context) as ring:
+        ring_rate = stream(lambda: ring.put(donor, acceptor),
+                           lambda: _start(context, ring_worker, ring, results),
+                           ring.close_writer, results)
+    print(f"{SHAPE[0]}x{SHAPE[1]} to a worker:  pickled queue {queue_rate:6.1f} frames/s, "
+          f"frame ring {ring_rate:6.1f} frames/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark: indexed vs. linear subroutine lookup.
+
+Shows that BioCompiler lookups through SubroutineIndex stay flat as the
+library grows, while the original linear scan grows with library size.
+
+Usage:
+    python -m benchmarks.bench_library_index
+"""
+
+import random
+import sys
+import os
+import timeit
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import synthetic_library
+from compiler.library_index import SubroutineIndex
+
+SIZES = [100, 1000, 10000, 50000]
+QUERIES = 200
+
+
+def linear_find(library: List[Dict], organ: str, species: str) -> Optional[Dict]:
+    """The pre-index lookup: a scan over every entry."""
+    for sub in library:
+        target = sub['target_morphology']
+        if target['organ'].lower() == organ.lower() and \
+           target['species'].lower() == species.lower():
+            return sub
+    return None
+
+
+def main():
+    rng = random.Random(1)
+    print(f"{'entries':>10} {'build (ms)':>12} {'linear (us)':>12} {'indexed (us)':>13}")
+    for size in SIZES:
+        library = synthetic_library(size)
+        queries = [(t['organ'].upper(), t['species'])
+                   for t in (rng.choice(library)['target_morphology'] for _ in range(QUERIES))]
+
+        build = timeit.timeit(lambda: SubroutineIndex(library), number=1)
+        index = SubroutineIndex(library)
+
+        linear = timeit.timeit(lambda: [linear_find(library, o, s) for o, s in queries], number=1)
+        indexed = timeit.timeit(lambda: [index.lookup(o, s) for o, s in queries], number=1)
+
+        print(f"{size:>10} {build * 1e3:>12.2f} {linear / QUERIES * 1e6:>12.1f} "
+              f"{indexed / QUERIES * 1e6:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
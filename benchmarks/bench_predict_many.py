@@ -0,0 +1,40 @@
+"""
+Benchmark: vectorized per-pixel decoding with BioDecoder.predict_many.
+
+Usage:
+    python -m benchmarks.bench_predict_many
+"""
+
+import sys
+import os
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import synthetic_library, DOMAINS
+from compiler.predict_morphology import BioDecoder
+
+SHAPES = [(512, 512), (2048, 2048)]
+LIBRARY_SIZE = 1000
+
+
+def main():
+    decoder = BioDecoder()
+    decoder.library = synthetic_library(LIBRARY_SIZE)
+    decoder._build_indexes()
+    rng = np.random.default_rng(0)
+
+    compile_time = timeit.timeit(lambda: decoder.predict_many(np.zeros(1), np.zeros(1, int), DOMAINS), number=1)
+    print(f"compile ({LIBRARY_SIZE} entries, {len(DOMAINS)} labels): {compile_time * 1e3:.1f} ms")
+
+    for shape in SHAPES:
+        vmem_map = rng.uniform(-90, 40, size=shape).astype(np.float32)
+        labels = rng.integers(0, len(DOMAINS), size=shape)
+        per_frame = timeit.timeit(lambda: decoder.predict_many(vmem_map, labels, DOMAINS), number=5) / 5
+        print(f"{shape[0]}x{shape[1]}: {per_frame * 1e3:.1f} ms/frame ({1 / per_frame:.1f} fps)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmark: generate_protocol vs. the memoized ProtocolRenderer.
+
+Renders a whole library three ways: with BioCompiler.generate_protocol,
+with a cold ProtocolRenderer, and with a warm one after editing the
+biomarkers of 1% of the subroutines (the nightly-regeneration case).
+
+Usage:
+    python -m benchmarks.bench_protocol_renderer
+"""
+
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import synthetic_library
+from compiler.experiment_gen import BioCompiler
+from compiler.protocol_renderer import ProtocolRenderer
+
+SIZES = [1000, 10000]
+GENERATED_AT = datetime(2025, 1, 1)
+
+
+def main():
+    compiler = BioCompiler()
+    print(f"{'entries':>10} {'generate (ms)':>14} {'cold (ms)':>10} {'warm+1% edit (ms)':>18} {'re-rendered':>12}")
+    for size in SIZES:
+        library = synthetic_library(size)
+        renderer = ProtocolRenderer(compiler, maxsize=8 * size)
+
+        baseline = timeit.timeit(lambda: [compiler.generate_protocol(s, GENERATED_AT) for s in library], number=1)
+        cold = timeit.timeit(lambda: [renderer.render(s, GENERATED_AT) for s in library], number=1)
+
+        for sub in library[::100]:
+            sub['downstream_biomarkers'] = sub.get('downstream_biomarkers', []) + [
+                {'gene': f"gene_{sub['id']}", 'expected_expression': 'upregulated',
+                 'check_time': '24h', 'location': 'target domain'}]
+        misses = renderer.misses
+        warm = timeit.timeit(lambda: [renderer.render(s, GENERATED_AT) for s in library], number=1)
+
+        assert [renderer.render(s, GENERATED_AT) for s in library] == \
+            [compiler.generate_protocol(s, GENERATED_AT) for s in library]
+        print(f"{size:>10} {baseline * 1e3:>14.1f} {cold * 1e3:>10.1f} {warm * 1e3:>18.1f} "
+              f"{renderer.misses - misses:>12}")
+
+
+if __name__ == "__main__":
+    main()
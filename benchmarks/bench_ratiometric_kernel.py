@@ -0,0 +1,47 @@
+"""
+Benchmark: allocating reference pipeline vs. the in-place ratiometric kernel.
+
+Usage:
+    python -m benchmarks.bench_ratiometric_kernel
+"""
+
+import os
+import sys
+import timeit
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from verification.dye_decode import BioStateValidator
+from verification.kernel import RatiometricScratch
+
+SHAPES = [(512, 512), (2048, 2048)]
+REPEATS = 10
+
+
+def reference(donor, acceptor, slope=100.0, intercept=-70.0):
+    img_d_blur = cv2.GaussianBlur(donor, (5, 5), 0).astype(np.float32)
+    img_a_blur = cv2.GaussianBlur(acceptor, (5, 5), 0).astype(np.float32)
+    img_a_blur[img_a_blur == 0] = 0.1
+    return ((img_d_blur / img_a_blur) * slope) + intercept
+
+
+def main():
+    validator = BioStateValidator()
+    rng = np.random.default_rng(0)
+    for shape in SHAPES:
+        donor = rng.integers(0, 256, size=shape, dtype=np.uint8)
+        acceptor = rng.integers(0, 256, size=shape, dtype=np.uint8)
+        out = np.empty(shape, dtype=np.float32)
+        scratch = RatiometricScratch(shape, donor.dtype)
+
+        t_ref = min(timeit.repeat(lambda: reference(donor, acceptor), number=1, repeat=REPEATS))
+        t_kernel = min(timeit.repeat(lambda: validator.compute_vmem_into(donor, acceptor, out, scratch),
+                                     number=1, repeat=REPEATS))
+        print(f"{shape[0]}x{shape[1]}: reference {t_ref * 1e3:.2f} ms, in-place {t_kernel * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Benchmark: validating a bulk-contributed corpus.
+
+Writes a synthetic library to a temporary JSON file and validates it with
+the compiled schema checker, inline and across all cores.
+
+Usage:
+    python -m benchmarks.bench_schema_validator
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import synthetic_library
+from compiler.schema_validator import validate_corpus
+
+SIZES = [10000, 100000]
+
+
+def main():
+    print(f"{'entries':>10} {'workers':>8} {'seconds':>8} {'entries/s':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in SIZES:
+            path = os.path.join(tmp, f'library_{size}.json')
+            with open(path, 'w') as f:
+                json.dump(synthetic_library(size), f)
+            for workers in (1, None):
+                started = time.perf_counter()
+                report = validate_corpus([path], workers=workers)
+                seconds = time.perf_counter() - started
+                print(f"{report['entries']:>10} {workers or os.cpu_count():>8} {seconds:>8.2f} "
+                      f"{report['entries'] / seconds:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
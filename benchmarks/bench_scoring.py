@@ -0,0 +1,45 @@
+"""
+Benchmark: ranking observations with the likelihood scorer.
+
+Compares a Python loop of predict_scored calls with one rank_many call
+over the same batch of observations.
+
+Usage:
+    python -m benchmarks.bench_scoring
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import DOMAINS, synthetic_library
+from compiler.predict_morphology import BioDecoder
+
+SIZES = [1000, 10000]
+OBSERVATIONS = 1000
+TOP_K = 5
+
+
+def main():
+    rng = np.random.default_rng(0)
+    vmems = rng.uniform(-90.0, 40.0, OBSERVATIONS)
+    domains = rng.choice(DOMAINS, OBSERVATIONS).tolist()
+
+    print(f"{'entries':>10} {'loop (ms)':>10} {'batch (ms)':>11} {'speedup':>8}")
+    for size in SIZES:
+        decoder = BioDecoder()
+        decoder.library = synthetic_library(size)
+        decoder._build_indexes()
+
+        loop = timeit.timeit(lambda: [decoder.predict_scored(v, d, top_k=TOP_K)
+                                      for v, d in zip(vmems, domains)], number=1)
+        batch = timeit.timeit(lambda: decoder.rank_many(vmems, domains, top_k=TOP_K), number=1)
+        print(f"{size:>10} {loop * 1e3:>10.1f} {batch * 1e3:>11.1f} {loop / batch:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark: per-call rig scripts vs. the resident verification service.
+
+A "cold" call starts a fresh interpreter that imports the verifier, loads
+the subroutine and processes one frame pair, which is what each rig paid
+before the service existed. Service calls go through VerificationClient
+with shared-memory frames. Throughput is then measured with several
+concurrent clients for 1 worker and for all cores.
+
+Usage:
+    python -m benchmarks.bench_service
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import BASE_DIR, synthetic_image_pair
+from verification.service import VerificationClient, VerificationService
+
+SUBROUTINE = 'xenopus_ectopic_eye_induction_v1'
+SHAPE = (1024, 1024)
+CLIENTS = 8
+REQUESTS_PER_CLIENT = 10
+COLD_CALLS = 3
+
+COLD_SCRIPT = """
+import json, sys
+sys.path.insert(0, {base!r})
+from verification.dye_decode import BioStateValidator
+validator = BioStateValidator()
+state = [s for s in json.load(open({db!r})) if s['id'] == {sid!r}][0]['bioelectric_state']
+vmem = validator.analyze_ratiometric({donor!r}, {acceptor!r})
+validator.verify_state(vmem, state)
+"""
+
+
+def run_service(socket_path, workers):
+    service = VerificationService(socket_path, workers=workers)
+    loop = asyncio.new_event_loop()
+    asyncio.run_coroutine_threadsafe(service.start(), loop)
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    while not os.path.exists(socket_path):
+        time.sleep(0.01)
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(service.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+    return stop
+
+
+def main():
+    donor, acceptor = np.empty(SHAPE, np.uint8), np.empty(SHAPE, np.uint8)
+    synthetic_image_pair(SHAPE, donor, acceptor)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        donor_path, acceptor_path = os.path.join(tmp, 'donor.png'), os.path.join(tmp, 'acceptor.png')
+        cv2.imwrite(donor_path, donor)
+        cv2.imwrite(acceptor_path, acceptor)
+        script = COLD_SCRIPT.format(base=BASE_DIR, db=os.path.join(BASE_DIR, 'database', 'database_seed.json'),
+                                    sid=SUBROUTINE, donor=donor_path, acceptor=acceptor_path)
+        started = time.perf_counter()
+        for _ in range(COLD_CALLS):
+            subprocess.run([sys.executable, '-c', script], check=True)
+        cold = (time.perf_counter() - started) / COLD_CALLS
+        print(f"cold script per call:        {cold * 1e3:8.1f} ms")
+
+        for workers in sorted({1, os.cpu_count() or 1}):
+            socket_path = os.path.join(tmp, f'service_{workers}.sock')
+            stop = run_service(socket_path, workers)
+            try:
+                with VerificationClient(socket_path) as client:
+                    client.verify(SUBROUTINE, donor, acceptor)
+                    started = time.perf_counter()
+                    for _ in range(REQUESTS_PER_CLIENT):
+                        client.verify(SUBROUTINE, donor, acceptor)
+                    latency = (time.perf_counter() - started) / REQUESTS_PER_CLIENT
+
+                def rig(_):
+                    with VerificationClient(socket_path) as client:
+                        for _ in range(REQUESTS_PER_CLIENT):
+                            client.verify(SUBROUTINE, donor, acceptor)
+
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=CLIENTS) as rigs:
+                    list(rigs.map(rig, range(CLIENTS)))
+                throughput = CLIENTS * REQUESTS_PER_CLIENT / (time.perf_counter() - started)
+            finally:
+                stop()
+            print(f"service, {workers:>2} worker(s): latency {latency * 1e3:6.1f} ms, "
+                  f"{CLIENTS} clients {throughput:6.1f} frames/s")
+
+
+if __name__ == "__main__":
+    main()
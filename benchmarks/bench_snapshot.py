@@ -0,0 +1,50 @@
+"""
+Benchmark: cold load of a JSON library vs. a compiled snapshot.
+
+Measures the time to open the library and answer one lookup, which is what
+a CLI invocation or a fresh worker pays.
+
+Usage:
+    python -m benchmarks.bench_snapshot
+"""
+
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import synthetic_library
+from compiler.library_index import SubroutineIndex
+from compiler.snapshot import SnapshotLibrary, build_snapshot
+
+SIZES = [1000, 10000, 50000]
+
+
+def main():
+    print(f"{'entries':>10} {'json (ms)':>10} {'snapshot (ms)':>14} {'file MB':>8} {'snap MB':>8}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in SIZES:
+            json_path = os.path.join(tmpdir, f'library_{size}.json')
+            with open(json_path, 'w') as f:
+                json.dump(synthetic_library(size), f)
+            snap_path = build_snapshot(os.path.join(tmpdir, f'library_{size}.mlsnap'), [json_path])
+
+            def cold_json():
+                with open(json_path, 'r') as f:
+                    library = json.load(f)
+                return SubroutineIndex(library).lookup('eye', 'Species 000001')
+
+            def cold_snapshot():
+                return SubroutineIndex(SnapshotLibrary(snap_path)).lookup('eye', 'Species 000001')
+
+            t_json = min(timeit.repeat(cold_json, number=1, repeat=3))
+            t_snap = min(timeit.repeat(cold_snapshot, number=1, repeat=3))
+            print(f"{size:>10} {t_json * 1e3:>10.1f} {t_snap * 1e3:>14.1f} "
+                  f"{os.path.getsize(json_path) / 1e6:>8.1f} {os.path.getsize(snap_path) / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
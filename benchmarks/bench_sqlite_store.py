@@ -0,0 +1,70 @@
+"""
+Benchmark: in-memory JSON library vs. SQLite store.
+
+For each corpus size, measures the memory held by a BioCompiler + BioDecoder
+pair after start-up (tracemalloc) and the latency of find_subroutine and
+predict, once with the JSON database and once with a store built from it.
+tracemalloc sees Python objects only; SQLite's own page cache (bounded, a
+few MB by default) is not included.
+
+Usage:
+    python -m benchmarks.bench_sqlite_store
+"""
+
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import DOMAINS, ORGANS, synthetic_library
+from compiler.experiment_gen import BioCompiler
+from compiler.library_loader import invalidate_library
+from compiler.predict_morphology import BioDecoder
+from compiler.sqlite_store import build_store
+
+SIZES = [10000, 50000]
+QUERIES = 500
+
+
+def measure(path, queries):
+    invalidate_library()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        compiler, decoder = BioCompiler(path), BioDecoder(path)
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        lookup = timeit.timeit(lambda: [compiler.find_subroutine(organ, species) for organ, species, _, _ in queries],
+                               number=1)
+        predict = timeit.timeit(lambda: [decoder.predict(vmem, domain, species) for _, species, vmem, domain in queries],
+                                number=1)
+    return held, lookup / len(queries), predict / len(queries)
+
+
+def main():
+    rng = random.Random(0)
+    print(f"{'entries':>8} {'backend':>8} {'memory (MB)':>12} {'lookup (us)':>12} {'predict (us)':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in SIZES:
+            library = synthetic_library(size)
+            json_path = os.path.join(tmp, f'library_{size}.json')
+            with open(json_path, 'w') as f:
+                json.dump(library, f)
+            store_path = build_store(os.path.join(tmp, f'library_{size}.sqlite'), [json_path])
+            queries = [(rng.choice(ORGANS), library[rng.randrange(size)]['target_morphology']['species'],
+                        rng.uniform(-90.0, 40.0), rng.choice(DOMAINS)) for _ in range(QUERIES)]
+            del library
+
+            for backend, path in (('json', json_path), ('sqlite', store_path)):
+                held, lookup, predict = measure(path, queries)
+                print(f"{size:>8} {backend:>8} {held / 1e6:>12.1f} {lookup * 1e6:>12.1f} {predict * 1e6:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
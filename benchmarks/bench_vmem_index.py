@@ -0,0 +1,42 @@
+"""
+Benchmark: interval-tree vs. linear Vmem decoding.
+
+Usage:
+    python -m benchmarks.bench_vmem_index
+"""
+
+import random
+import sys
+import os
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import synthetic_library, DOMAINS
+from compiler.predict_morphology import BioDecoder
+from compiler.vmem_index import VmemIndex
+
+SIZES = [100, 1000, 10000, 50000]
+QUERIES = 200
+
+
+def main():
+    rng = random.Random(1)
+    decoder = BioDecoder()
+    print(f"{'entries':>10} {'build (ms)':>12} {'linear (us)':>12} {'indexed (us)':>13}")
+    for size in SIZES:
+        decoder.library = synthetic_library(size)
+        build = timeit.timeit(lambda: VmemIndex(decoder.library), number=1)
+        decoder._build_indexes()
+
+        queries = [(rng.uniform(-90, 40), rng.choice(DOMAINS), f"Species {rng.randrange(max(4, size // 20)):06d}")
+                   for _ in range(QUERIES)]
+        linear = timeit.timeit(lambda: [decoder.predict_linear(*q) for q in queries], number=1)
+        indexed = timeit.timeit(lambda: [decoder.vmem_index.query(*q) for q in queries], number=1)
+
+        print(f"{size:>10} {build * 1e3:>12.2f} {linear / QUERIES * 1e6:>12.1f} "
+              f"{indexed / QUERIES * 1e6:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
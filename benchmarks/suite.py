@@ -0,0 +1,314 @@
+"""
+Benchmark suite with a regression baseline.
+
+Times the hot paths of the compiler, decoder and validator on synthetic
+data and compares the results with a recorded baseline. A case regresses
+when its best time per operation exceeds the baseline by more than the
+threshold (default 25%); the run then exits with status 1, so it can gate
+CI or a release.
+
+Cases (the size is library entries, or the image side in pixels):
+
+    find_subroutine             BioCompiler.find_subroutine, per query
+    predict                     BioDecoder.predict, per query
+    generate_protocol           BioCompiler.generate_protocol, per protocol
+    analyze_ratiometric         BioStateValidator.analyze_ratiometric on PNGs, per pair
+    analyze_ratiometric_tiled   the memory-mapped variant on .npy files, per pair
+    verify_state                BioStateValidator.verify_state with a domain mask, per map
+
+The quick profile runs in about a minute. The full profile goes up to 10^6
+entries and 16k x 16k images and needs ~4 GB of memory and 1 GB of disk.
+Timings depend on the machine: record a baseline on the machine that
+will be compared against it.
+
+Usage:
+    python -m benchmarks.suite                      # quick profile vs. benchmarks/baseline.json
+    python -m benchmarks.suite --profile full
+    python -m benchmarks.suite --only predict --threshold 0.1
+    python -m benchmarks.suite --update-baseline    # record the current timings
+"""
+
+import argparse
+import contextlib
+import functools
+import json
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import DOMAINS, ORGANS, synthetic_library, write_image_pair
+from compiler.experiment_gen import BioCompiler
+from compiler.predict_morphology import BioDecoder
+from verification.dye_decode import BioStateValidator
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_THRESHOLD = 0.25
+QUERIES = 200
+GENERATED_AT = datetime(2024, 1, 1)
+
+
+class Case(NamedTuple):
+    name: str
+    group: str  # cases of one group at one size share their synthetic inputs
+    unit: str
+    setup: Callable[[int, str], 'contextlib.AbstractContextManager']
+
+
+@functools.lru_cache(maxsize=1)
+def _library(size: int) -> List[Dict]:
+    return synthetic_library(size, share_static=size > 10000)
+
+
+def _compiler(size: int) -> BioCompiler:
+    compiler = BioCompiler()
+    compiler.library = _library(size)
+    compiler._build_indexes()
+    return compiler
+
+
+@contextlib.contextmanager
+def _find_subroutine(size: int, workdir: str) -> Iterator[Tuple[Callable, int]]:
+    rng = random.Random(size)
+    library = _library(size)
+    compiler = _compiler(size)
+    queries = [(rng.choice(ORGANS), library[rng.randrange(size)]['target_morphology']['species'])
+               for _ in range(QUERIES)]
+    yield lambda: [compiler.find_subroutine(organ, species) for organ, species in queries], len(queries)
+
+
+@contextlib.contextmanager
+def _predict(size: int, workdir: str) -> Iterator[Tuple[Callable, int]]:
+    rng = random.Random(size)
+    decoder = BioDecoder()
+    decoder.library = _library(size)
+    decoder._build_indexes()
+    queries = [(rng.uniform(-90.0, 40.0), rng.choice(DOMAINS)) for _ in range(QUERIES)]
+    yield lambda: [decoder.predict(vmem, domain) for vmem, domain in queries], len(queries)
+
+
+@contextlib.contextmanager
+def _generate_protocol(size: int, workdir: str) -> Iterator[Tuple[Callable, int]]:
+    library = _library(size)
+    compiler = _compiler(size)
+    subroutines = [library[i] for i in range(0, size, max(1, size // QUERIES))][:QUERIES]
+    yield lambda: [compiler.generate_protocol(sub, GENERATED_AT) for sub in subroutines], len(subroutines)
+
+
+@contextlib.contextmanager
+def _image_pair(side: int, workdir: str, fmt: str) -> Iterator[Tuple[str, str]]:
+    paths = write_image_pair(workdir, (side, side), fmt)
+    try:
+        yield paths
+    finally:
+        for path in paths:
+            os.remove(path)
+
+
+@contextlib.contextmanager
+def _analyze_ratiometric(side: int, workdir: str) -> Iterator[Tuple[Callable, int]]:
+    validator = BioStateValidator()
+    with _image_pair(side, workdir, 'png') as (donor, acceptor):
+        yield lambda: validator.analyze_ratiometric(donor, acceptor), 1
+
+
+@contextlib.contextmanager
+def _analyze_ratiometric_tiled(side: int, workdir: str) -> Iterator[Tuple[Callable, int]]:
+    validator = BioStateValidator()
+    output = os.path.join(workdir, 'vmem.npy')
+    with _image_pair(side, workdir, 'npy') as (donor, acceptor):
+        yield lambda: validator.analyze_ratiometric_tiled(donor, acceptor, output), 1
+    os.remove(output)
+
+
+@contextlib.contextmanager
+def _verify_state(side: int, workdir: str) -> Iterator[Tuple[Callable, int]]:
+    validator = BioStateValidator()
+    vmem_map = np.random.default_rng(side).normal(-40.0, 5.0, size=(side, side)).astype(np.float32)
+    mask = np.zeros((side, side), dtype=bool)
+    mask[side // 4:3 * side // 4, side // 4:3 * side // 4] = True
+    target = {'target_vmem_range': [-50, -30], 'spatial_domain': 'ventral_ectoderm'}
+    yield lambda: validator.verify_state(vmem_map, target, mask), 1
+
+
+CASES = {case.name: case for case in [
+    Case('find_subroutine', 'library', 'query', _find_subroutine),
+    Case('predict', 'library', 'query', _predict),
+    Case('generate_protocol', 'library', 'protocol', _generate_protocol),
+    Case('analyze_ratiometric', 'image', 'pair', _analyze_ratiometric),
+    Case('analyze_ratiometric_tiled', 'image', 'pair', _analyze_ratiometric_tiled),
+    Case('verify_state', 'image', 'map', _verify_state),
+]}
+
+PROFILES = {
+    'quick': {
+        'find_subroutine': [1000, 10000],
+        'predict': [1000, 10000],
+        'generate_protocol': [1000],
+        'analyze_ratiometric': [512, 2048],
+        'analyze_ratiometric_tiled': [2048],
+        'verify_state': [512, 2048],
+    },
+    'full': {
+        'find_subroutine': [1000, 10000, 100000, 1000000],
+        'predict': [1000, 10000, 100000, 1000000],
+        'generate_protocol': [1000, 1000000],
+        'analyze_ratiometric': [512, 2048, 8192],
+        'analyze_ratiometric_tiled': [2048, 16384],
+        'verify_state': [512, 2048, 16384],
+    },
+}
+
+
+def result_key(case: str, size: int) -> str:
+    return f"{case}[{size}]"
+
+
+def measure(fn: Callable, ops: int, repeats: int = 5) -> float:
+    """Best time per operation over `repeats` runs of at least ~0.2 s each (one call minimum)."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeats, number=number)) / (number * ops)
+
+
+def run(profile: str = 'quick', only: Optional[str] = None, repeats: int = 5,
+        progress: Optional[Callable[[str, float], None]] = None) -> Dict[str, Dict]:
+    """
+    Runs the cases of a profile and returns {result key: {'seconds', 'unit'}}.
+
+    `only` is a regular expression matched against result keys such as
+    'predict[10000]'. Cases are ordered so that each synthetic library is
+    generated once.
+    """
+    pattern = re.compile(only) if only else None
+    tasks = [(CASES[name], size) for name, sizes in PROFILES[profile].items() for size in sizes
+             if pattern is None or pattern.search(result_key(name, size))]
+    tasks.sort(key=lambda task: (task[0].group, task[1]))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for case, size in tasks:
+            with case.setup(size, workdir) as (fn, ops):
+                seconds = measure(fn, ops, repeats)
+            key = result_key(case.name, size)
+            results[key] = {'seconds': seconds, 'unit': case.unit}
+            if progress is not None:
+                progress(key, seconds)
+    _library.cache_clear()
+    return results
+
+
+def machine_info() -> Dict:
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'processor': platform.processor() or platform.machine(),
+            'cpus': os.cpu_count()}
+
+
+def load_baseline(path: str) -> Dict:
+    """Reads a baseline file; a missing file is an empty baseline."""
+    if not os.path.exists(path):
+        return {'machine': None, 'results': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, results: Dict[str, Dict], previous: Optional[Dict] = None):
+    """Writes `results` over the entries of `previous` (other profiles' entries are kept)."""
+    merged = dict((previous or {}).get('results', {}))
+    merged.update(results)
+    baseline = {'machine': machine_info(), 'recorded': datetime.now().isoformat(timespec='seconds'),
+                'results': dict(sorted(merged.items()))}
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+
+
+def compare(results: Dict[str, Dict], baseline: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[Dict]:
+    """
+    Compares results with a baseline.
+
+    Returns one row per result: key, seconds, baseline seconds (None for new
+    cases), relative change, and status 'ok', 'faster', 'new' or 'regression'.
+    """
+    rows = []
+    for key, result in results.items():
+        reference = baseline.get('results', {}).get(key)
+        if reference is None:
+            rows.append({'key': key, 'seconds': result['seconds'], 'baseline': None,
+                         'change': None, 'status': 'new'})
+            continue
+        change = result['seconds'] / reference['seconds'] - 1.0
+        if change > threshold:
+            status = 'regression'
+        elif change < -threshold:
+            status = 'faster'
+        else:
+            status = 'ok'
+        rows.append({'key': key, 'seconds': result['seconds'], 'baseline': reference['seconds'],
+                     'change': change, 'status': status})
+    return rows
+
+
+def _format_time(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return '-'
+    for scale, suffix in ((1.0, 's'), (1e-3, 'ms'), (1e-6, 'us')):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {suffix}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and check it against a baseline.")
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick')
+    parser.add_argument('--only', help="Regular expression selecting cases, e.g. 'predict|verify_state'")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown before failing (default: 0.25 = 25%%)")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--update-baseline', action='store_true', help="Record the results as the new baseline")
+    parser.add_argument('--json', action='store_true', help="Print the comparison as JSON")
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    if baseline['machine'] is not None and baseline['machine'] != machine_info():
+        print("[!] Warning: Baseline was recorded on a different machine; timings may not be comparable.",
+              file=sys.stderr)
+
+    progress = None if args.json else lambda key, seconds: print(f"[*] {key:<36} {_format_time(seconds):>10}")
+    results = run(args.profile, args.only, args.repeats, progress)
+
+    if args.update_baseline:
+        save_baseline(args.baseline, results, baseline)
+        print(f"[*] Recorded {len(results)} results in {args.baseline}")
+        return 0
+
+    rows = compare(results, baseline, args.threshold)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"\n{'case':<36} {'baseline':>10} {'current':>10} {'change':>8}  status")
+        for row in rows:
+            change = '-' if row['change'] is None else f"{row['change']:+.0%}"
+            print(f"{row['key']:<36} {_format_time(row['baseline']):>10} {_format_time(row['seconds']):>10} "
+                  f"{change:>8}  {row['status']}")
+
+    regressions = [row for row in rows if row['status'] == 'regression']
+    if regressions:
+        print(f"[!] Error: {len(regressions)} case(s) slower than the baseline by more than "
+              f"{args.threshold:.0%}.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+Synthetic data generators for MorphoLang benchmarks.
+"""
+
+import copy
+import json
+import os
+import random
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED_DATABASE = os.path.join(BASE_DIR, 'database', 'database_seed.json')
+
+ORGANS = ['eye', 'limb', 'head', 'tail', 'brain']
+ACTIONS = ['induce', 'regenerate', 'remodel', 'suppress_tumor']
+DOMAINS = ['ventral_ectoderm', 'regeneration_bud', 'amputation_stump', 'global_network',
+           'blastema', 'dorsal_ectoderm', 'neural_plate', 'lateral_flank']
+DRIVERS = ['Kv1.5', 'Kir4.1', 'Yeast PMA1 H+ Pump', 'V-ATPase', 'Monensin Cocktail',
+           'Gap Junction Blocker (Octanol)', 'ChR2', 'Ivermectin']
+
+
+def _copy_varied_fields(template: Dict) -> Dict:
+    """Copies the parts of a template synthetic_library rewrites; everything else is shared."""
+    sub = dict(template)
+    sub['bioelectric_state'] = dict(template['bioelectric_state'])
+    sub['control_loop'] = dict(template['control_loop'])
+    sub['control_loop']['feedback_mechanism'] = dict(template['control_loop']['feedback_mechanism'])
+    sub['hardware_drivers'] = [dict(template['hardware_drivers'][0])] + template['hardware_drivers'][1:]
+    return sub
+
+
+def synthetic_library(size: int, seed: int = 0, share_static: bool = False) -> List[Dict]:
+    """
+    Builds a library of `size` schema-shaped subroutines by mutating the seed entries.
+
+    Species names are drawn from a pool that grows with the library so that
+    the number of distinct (organ, species, action) keys grows as well.
+    With `share_static`, sections that are never varied (metadata, biomarkers,
+    delivery...) are shared with the templates instead of deep-copied, which
+    makes 10^6-entry libraries affordable; callers must treat entries as
+    read-only.
+    """
+    rng = random.Random(seed)
+    with open(SEED_DATABASE, 'r') as f:
+        templates = json.load(f)
+
+    n_species = max(4, size // 20)
+    library = []
+    for i in range(size):
+        template = templates[i % len(templates)]
+        sub = _copy_varied_fields(template) if share_static else copy.deepcopy(template)
+        sub['id'] = f"synthetic_{i:07d}"
+        sub['target_morphology'] = {
+            'organ': rng.choice(ORGANS),
+            'species': f"Species {rng.randrange(n_species):06d}",
+            'action': rng.choice(ACTIONS),
+        }
+        low = rng.uniform(-90.0, 10.0)
+        state = sub['bioelectric_state']
+        state['target_vmem_range'] = [round(low, 1), round(low + rng.uniform(0.0, 30.0), 1)]
+        feedback = sub['control_loop']['feedback_mechanism']
+        feedback['if_vmem_drifts_above'] = state['target_vmem_range'][1] + 5.0
+        feedback['if_vmem_drifts_below'] = state['target_vmem_range'][0] - 5.0
+        state['spatial_domain'] = rng.choice(DOMAINS)
+        sub['hardware_drivers'][0]['name'] = rng.choice(DRIVERS)
+        library.append(sub)
+    return library
+
+
+def synthetic_image_pair(shape: Tuple[int, int], out_donor: np.ndarray, out_acceptor: np.ndarray,
+                         vmem: float = -40.0, slope: float = 100.0, intercept: float = -70.0,
+                         seed: int = 0, block_rows: int = 1024):
+    """
+    Fills uint8 donor/acceptor images whose ratio decodes to roughly `vmem`.
+
+    The acceptor is noise around 200; the donor is acceptor * R with
+    R = (vmem - intercept) / slope. Rows are generated in blocks so that
+    memory-mapped 16k x 16k outputs never need a full-size temporary.
+    """
+    ratio = (vmem - intercept) / slope
+    rng = np.random.default_rng(seed)
+    for top in range(0, shape[0], block_rows):
+        rows = slice(top, min(top + block_rows, shape[0]))
+        acceptor = rng.integers(190, 211, size=(rows.stop - rows.start, shape[1]), dtype=np.uint8)
+        out_acceptor[rows] = acceptor
+        out_donor[rows] = np.clip(acceptor * np.float32(ratio), 0, 255)
+
+
+def write_image_pair(directory: str, shape: Tuple[int, int], fmt: str = 'png', **kwargs) -> Tuple[str, str]:
+    """
+    Writes a synthetic donor/acceptor pair into `directory` and returns the two paths.
+
+    fmt='png' produces files for BioStateValidator.analyze_ratiometric;
+    fmt='npy' produces memory-mappable files for analyze_ratiometric_tiled.
+    Keyword arguments are passed to synthetic_image_pair.
+    """
+    stem = os.path.join(directory, f"{shape[0]}x{shape[1]}")
+    donor_path, acceptor_path = f"{stem}_donor.{fmt}", f"{stem}_acceptor.{fmt}"
+    if fmt == 'npy':
+        donor = np.lib.format.open_memmap(donor_path, mode='w+', dtype=np.uint8, shape=shape)
+        acceptor = np.lib.format.open_memmap(acceptor_path, mode='w+', dtype=np.uint8, shape=shape)
+        synthetic_image_pair(shape, donor, acceptor, **kwargs)
+        donor.flush()
+        acceptor.flush()
+        del donor, acceptor
+    else:
+        donor, acceptor = np.empty(shape, np.uint8), np.empty(shape, np.uint8)
+        synthetic_image_pair(shape, donor, acceptor, **kwargs)
+        cv2.imwrite(donor_path, donor)
+        cv2.imwrite(acceptor_path, acceptor)
+    return donor_path, acceptor_path
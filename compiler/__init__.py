@@ -5,6 +5,9 @@ This module contains the bioelectric compiler that translates high-level
 anatomical goals into low-level molecular interventions.
 """
 
+from .domain_vocabulary import DomainVocabulary
 from .experiment_gen import BioCompiler
+from .library_index import SubroutineIndex
+from .protocol_renderer import ProtocolRenderer
 
-__all__ = ['BioCompiler']
+__all__ = ['BioCompiler', 'DomainVocabulary', 'SubroutineIndex', 'ProtocolRenderer']
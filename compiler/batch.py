@@ -0,0 +1,167 @@
+"""
+Batch protocol compilation.
+
+Renders protocols for many subroutines across a process pool. Each worker
+loads the library once, renders its share and writes every protocol straight
+to disk, so the parent only ever holds file names and sizes. A fixed
+timestamp is injected into every protocol so that two runs over the same
+library produce byte-identical output that can be diffed.
+
+Ids become file names, so an id that is not a plain file name (path
+separators, '..', leading dots) is skipped rather than written outside the
+output directory, and a repeated id is skipped rather than overwriting the
+earlier protocol. Both are reported in the manifest's 'skipped' list.
+
+Usage:
+    python -m compiler.batch OUTPUT_DIR [--timestamp "2025-01-01 00:00"] [--workers N]
+                                        [--database PATH] [--organ ORGAN] [--species SPECIES]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import datetime
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Tuple
+
+from instrumentation.log import configure_logging, get_logger
+
+from .experiment_gen import BioCompiler
+
+_log = get_logger(__name__)
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M'
+SAFE_ID = re.compile(r'[A-Za-z0-9][A-Za-z0-9._-]*')
+
+_worker_compiler: Optional[BioCompiler] = None
+
+
+def _init_worker(database_path: Optional[str]):
+    global _worker_compiler
+    _worker_compiler = BioCompiler(database_path)
+
+
+def _render_to_file(task) -> Dict:
+    """Worker: render one subroutine (by library position) and write it to disk."""
+    position, output_dir, generated_at = task
+    subroutine = _worker_compiler.library[position]
+    data = _worker_compiler.generate_protocol(subroutine, generated_at=generated_at).encode('utf-8')
+
+    path = os.path.join(output_dir, f"{subroutine['id']}.txt")
+    with open(path, 'wb') as f:
+        f.write(data)
+    return {'id': subroutine['id'], 'file': os.path.basename(path), 'bytes': len(data),
+            'sha256': hashlib.sha256(data).hexdigest()}
+
+
+def select_subroutines(compiler: BioCompiler, organ: Optional[str] = None,
+                       species: Optional[str] = None) -> List[int]:
+    """Library positions of the subroutines to compile, optionally filtered by organ/species."""
+    positions = []
+    for position, sub in enumerate(compiler.library):
+        target = sub['target_morphology']
+        if organ and target['organ'].lower() != organ.lower():
+            continue
+        if species and target['species'].lower() != species.lower():
+            continue
+        positions.append(position)
+    return positions
+
+
+def check_output_ids(compiler: BioCompiler, positions: List[int]) -> Tuple[List[int], List[Dict]]:
+    """
+    Splits positions into those safe to write as <id>.txt and skipped entries.
+
+    An id must be a plain file name (SAFE_ID); of several entries sharing an
+    id, the first in library order is kept.
+    """
+    kept, skipped, seen = [], [], {}
+    for position in positions:
+        sub_id = compiler.library[position].get('id')
+        if not isinstance(sub_id, str) or not SAFE_ID.fullmatch(sub_id):
+            skipped.append({'position': position, 'id': sub_id, 'reason': 'id is not a safe file name'})
+        elif sub_id in seen:
+            skipped.append({'position': position, 'id': sub_id,
+                            'reason': f"duplicate id (first at position {seen[sub_id]})"})
+        else:
+            seen[sub_id] = position
+            kept.append(position)
+    for entry in skipped:
+        _log.warning("Skipping subroutine at position %d (%r): %s.", entry['position'], entry['id'], entry['reason'])
+    return kept, skipped
+
+
+def compile_batch(output_dir: str, database_path: Optional[str] = None,
+                  generated_at: Optional[datetime] = None, workers: Optional[int] = None,
+                  organ: Optional[str] = None, species: Optional[str] = None) -> Dict:
+    """
+    Compiles protocols for every selected subroutine into `output_dir`.
+
+    Protocols are written as <id>.txt as soon as each one finishes, and a
+    manifest.json (sorted by id, with sizes and SHA-256 digests) is written
+    last. Every protocol carries the same `generated_at` timestamp (default:
+    the batch start time). Entries with unsafe or duplicate ids are skipped
+    (see check_output_ids).
+
+    Returns:
+        Dict: Throughput report: count, bytes, seconds, protocols_per_second, manifest path,
+        skipped entries.
+    """
+    generated_at = generated_at or datetime.now()
+    os.makedirs(output_dir, exist_ok=True)
+    compiler = BioCompiler(database_path)
+    positions, skipped = check_output_ids(compiler, select_subroutines(compiler, organ, species))
+    tasks = [(position, output_dir, generated_at) for position in positions]
+
+    started = time.perf_counter()
+    if workers == 1 or len(tasks) <= 1:
+        _init_worker(database_path)
+        entries = [_render_to_file(task) for task in tasks]
+    else:
+        with Pool(processes=workers, initializer=_init_worker, initargs=(database_path,)) as pool:
+            chunksize = max(1, len(tasks) // (8 * (workers or os.cpu_count() or 1)))
+            entries = list(pool.imap_unordered(_render_to_file, tasks, chunksize=chunksize))
+    seconds = time.perf_counter() - started
+
+    entries.sort(key=lambda entry: entry['id'])
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    with open(manifest_path, 'w') as f:
+        json.dump({'generated_at': generated_at.strftime(TIMESTAMP_FORMAT), 'protocols': entries,
+                   'skipped': skipped}, f, indent=2)
+
+    total_bytes = sum(entry['bytes'] for entry in entries)
+    return {
+        'count': len(entries),
+        'bytes': total_bytes,
+        'seconds': seconds,
+        'protocols_per_second': len(entries) / seconds if seconds > 0 else float('inf'),
+        'manifest': manifest_path,
+        'skipped': skipped,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile protocols for many subroutines in parallel.")
+    parser.add_argument('output_dir', help="Directory to write <id>.txt protocols and manifest.json into")
+    parser.add_argument('--database', help="Library to compile (default: bundled database)")
+    parser.add_argument('--timestamp', help=f"Fixed 'Generated:' time, format '{TIMESTAMP_FORMAT}' (default: now)")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: all cores)")
+    parser.add_argument('--organ', help="Only compile subroutines for this organ")
+    parser.add_argument('--species', help="Only compile subroutines for this species")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    generated_at = datetime.strptime(args.timestamp, TIMESTAMP_FORMAT) if args.timestamp else None
+    report = compile_batch(args.output_dir, args.database, generated_at, args.workers, args.organ, args.species)
+    print(f"[*] Compiled {report['count']} protocols ({report['bytes'] / 1e6:.2f} MB) "
+          f"in {report['seconds']:.2f}s: {report['protocols_per_second']:.1f} protocols/s")
+    if report['skipped']:
+        print(f"[!] Skipped {len(report['skipped'])} subroutines with unsafe or duplicate ids (see manifest)")
+    print(f"[*] Manifest: {report['manifest']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Controlled vocabulary of spatial domains.
+
+Spatial domains used to be compared as raw strings: the decoder accepted any
+pair of names where one contained the other, and the compiler searched a
+hard-coded list of local domains by substring. That matched 'bud' against
+'regeneration_bud' and 'neural_plate' against nothing, depending on spelling.
+
+The vocabulary instead maps every exact name or synonym to a canonical
+domain ('Amputation Stump', 'stump' -> amputation_stump). Matching and scope
+use only that exact lookup: a name that is not in the vocabulary is related
+to nothing but itself and has no scope. It never falls back to a parent or to
+a similarly spelled domain, so 'ventral_mesoderm' does not match
+ventral_ectoderm and 'lateral_ectoderm' does not match ectoderm.
+
+For unknown names, suggest() offers a "did you mean" guess:
+
+    1. tokens     the longest known term appearing as whole tokens in the name
+                  ('amputation_stump_left' -> amputation_stump)
+    2. prefix     a trie walk over all terms ('regen' -> regeneration_bud)
+    3. fuzzy      character trigram similarity >= FUZZY_THRESHOLD, found
+                  through an inverted n-gram index ('ventral_ectodrem')
+
+When a step finds several canonical domains equally good, the suggestion is
+their lowest common ancestor in the hierarchy, or nothing if they share none.
+
+Two domains are related when one is an ancestor of the other (blastema is
+part of regeneration_bud, which is part of amputation_stump). Lookups are a
+dictionary probe plus a set membership test.
+"""
+
+import re
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+FUZZY_THRESHOLD = 0.5
+MIN_PREFIX_LENGTH = 4
+NGRAM = 3
+
+# canonical name -> parent (part-of), synonyms and scope. Scope is inherited by
+# descendants: 'local' domains need a spatially restricted delivery method.
+DEFAULT_DOMAINS: Dict[str, Dict] = {
+    'global_network': {'synonyms': ['whole_body', 'whole_organism', 'systemic', 'global'],
+                       'scope': 'systemic'},
+    'amputation_stump': {'synonyms': ['stump', 'amputation_site', 'amputation_plane', 'wound_site'],
+                         'scope': 'local'},
+    'regeneration_bud': {'parent': 'amputation_stump', 'synonyms': ['regenerative_bud', 'regenerating_bud']},
+    'blastema': {'parent': 'regeneration_bud', 'synonyms': ['regeneration_blastema']},
+    'ectoderm': {},
+    'ventral_ectoderm': {'parent': 'ectoderm', 'scope': 'local'},
+    'dorsal_ectoderm': {'parent': 'ectoderm'},
+    'neural_plate': {'parent': 'dorsal_ectoderm'},
+    'lateral_flank': {'synonyms': ['flank']},
+}
+
+_SEPARATORS = re.compile(r'[^0-9a-z+]+')
+
+
+def normalize(name: Optional[str]) -> str:
+    """Lowercases a domain name and joins its words with single underscores."""
+    return _SEPARATORS.sub('_', (name or '').lower()).strip('_')
+
+
+def _ngrams(term: str) -> Set[str]:
+    padded = f"_{term}_"
+    return {padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1)}
+
+
+class DomainVocabulary:
+    """
+    Normalized spatial-domain names, synonyms and part-of hierarchy.
+
+    Built once from a domain spec (see DEFAULT_DOMAINS) into a term table, and
+    a character trie and n-gram index for suggestions; see the module docstring.
+    """
+
+    def __init__(self, domains: Optional[Dict[str, Dict]] = None):
+        domains = DEFAULT_DOMAINS if domains is None else domains
+        self._parent: Dict[str, Optional[str]] = {}
+        self._scope: Dict[str, Optional[str]] = {}
+        self._terms: Dict[str, str] = {}
+
+        for name, spec in domains.items():
+            canonical = normalize(name)
+            self._parent[canonical] = normalize(spec.get('parent')) or None
+            self._scope[canonical] = spec.get('scope')
+            for term in [canonical] + [normalize(s) for s in spec.get('synonyms', [])]:
+                if self._terms.setdefault(term, canonical) != canonical:
+                    raise ValueError(f"Domain term '{term}' is used by both "
+                                     f"'{self._terms[term]}' and '{canonical}'.")
+
+        self._ancestors: Dict[str, Tuple[str, ...]] = {}
+        for canonical in self._parent:
+            chain, node = [], canonical
+            while node is not None:
+                if node in chain:
+                    raise ValueError(f"Domain hierarchy has a cycle through '{node}'.")
+                if node not in self._parent:
+                    raise ValueError(f"Domain '{chain[-1]}' has unknown parent '{node}'.")
+                chain.append(node)
+                node = self._parent[node]
+            self._ancestors[canonical] = tuple(chain)
+        self._ancestor_sets: Dict[str, FrozenSet[str]] = {
+            canonical: frozenset(chain) for canonical, chain in self._ancestors.items()
+        }
+
+        # Trie: each node maps characters to children; '' holds the canonical
+        # domains of every term passing through the node.
+        self._trie: Dict = {'': set()}
+        self._grams: Dict[str, List[str]] = {}
+        self._term_grams: Dict[str, int] = {}
+        for term, canonical in self._terms.items():
+            node = self._trie
+            for char in term:
+                node = node.setdefault(char, {'': set()})
+                node[''].add(canonical)
+            grams = _ngrams(term)
+            self._term_grams[term] = len(grams)
+            for gram in grams:
+                self._grams.setdefault(gram, []).append(term)
+        self._longest_term = max((term.count('_') + 1 for term in self._terms), default=0)
+
+        self._suggested: Dict[str, Optional[str]] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return self.resolve(name) is not None
+
+    def domains(self) -> List[str]:
+        """Canonical domain names, in spec order."""
+        return list(self._parent)
+
+    def canonical(self, name: str) -> str:
+        """
+        The canonical name for an exact name or synonym, else the normalized name.
+
+        Unlike suggest() this never guesses, so it is safe as an index key.
+        """
+        key = normalize(name)
+        return self._terms.get(key, key)
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Canonical domain for an exact name or synonym, or None if it is not in the vocabulary."""
+        return self._terms.get(normalize(name))
+
+    def suggest(self, name: str) -> Optional[str]:
+        """
+        Best-guess canonical domain for a free-form name, for "did you mean" messages.
+
+        Only for reporting: matching and scope never use the guess.
+        """
+        key = normalize(name)
+        try:
+            return self._suggested[key]
+        except KeyError:
+            pass
+        canonical = self._terms.get(key)
+        if canonical is None and key:
+            canonical = self._by_tokens(key) or self._by_prefix(key) or self._by_ngrams(key)
+        self._suggested[key] = canonical
+        return canonical
+
+    def _common_ancestor(self, candidates: Iterable[str]) -> Optional[str]:
+        """Deepest domain that every candidate is part of (or equal to)."""
+        candidates = list(candidates)
+        shared = set(self._ancestors[candidates[0]])
+        for canonical in candidates[1:]:
+            shared.intersection_update(self._ancestors[canonical])
+        for node in self._ancestors[candidates[0]]:
+            if node in shared:
+                return node
+        return None
+
+    def _by_tokens(self, key: str) -> Optional[str]:
+        """Longest known term made of whole, consecutive tokens of `key`."""
+        tokens = key.split('_')
+        for length in range(min(len(tokens), self._longest_term), 0, -1):
+            found = {self._terms[term] for term in
+                     ('_'.join(tokens[i:i + length]) for i in range(len(tokens) - length + 1))
+                     if term in self._terms}
+            if found:
+                return self._common_ancestor(found)
+        return None
+
+    def _by_prefix(self, key: str) -> Optional[str]:
+        if len(key) < MIN_PREFIX_LENGTH:
+            return None
+        node = self._trie
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return None
+        return self._common_ancestor(node[''])
+
+    def _by_ngrams(self, key: str) -> Optional[str]:
+        grams = _ngrams(key)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for term in self._grams.get(gram, ()):
+                shared[term] = shared.get(term, 0) + 1
+
+        best, found = FUZZY_THRESHOLD, set()
+        for term, count in shared.items():
+            similarity = count / (len(grams) + self._term_grams[term] - count)
+            if similarity > best:
+                best, found = similarity, {self._terms[term]}
+            elif similarity == best:
+                found.add(self._terms[term])
+        return self._common_ancestor(found) if found else None
+
+    def ancestors(self, name: str) -> Tuple[str, ...]:
+        """The named domain followed by everything it is part of, innermost first (empty if unknown)."""
+        canonical = self.resolve(name)
+        return self._ancestors[canonical] if canonical else ()
+
+    def distance(self, a: str, b: str) -> Optional[int]:
+        """
+        Hierarchy steps between two related domains (0 for the same domain).
+
+        Returns None when neither domain is part of the other. Unrecognized
+        names are only related to themselves.
+        """
+        ca, cb = self.resolve(a), self.resolve(b)
+        if ca is None or cb is None:
+            return 0 if ca is None and cb is None and normalize(a) == normalize(b) else None
+        if cb in self._ancestor_sets[ca]:
+            return self._ancestors[ca].index(cb)
+        if ca in self._ancestor_sets[cb]:
+            return self._ancestors[cb].index(ca)
+        return None
+
+    def related(self, a: str, b: str) -> bool:
+        """True if the domains are the same or one is part of the other."""
+        return self.distance(a, b) is not None
+
+    def scope(self, name: str) -> Optional[str]:
+        """Scope ('local', 'systemic') of a domain, inherited from its ancestors."""
+        for node in self.ancestors(name):
+            if self._scope[node]:
+                return self._scope[node]
+        return None
+
+
+_default: Optional[DomainVocabulary] = None
+
+
+def default_vocabulary() -> DomainVocabulary:
+    """The shared vocabulary built from DEFAULT_DOMAINS."""
+    global _default
+    if _default is None:
+        _default = DomainVocabulary()
+    return _default
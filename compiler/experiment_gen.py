@@ -1,43 +1,79 @@
-import json
 import os
 from typing import List, Dict, Optional
 from datetime import datetime
 
+from instrumentation import metrics
+from instrumentation.log import configure_logging, get_logger
+
+from .domain_vocabulary import default_vocabulary
+from .library_index import SubroutineIndex
+from .library_loader import default_database_path, derive, load_library
+from .sqlite_store import SubroutineStore
+
+_log = get_logger(__name__)
+
+# Measurement timelines by intervention length: (longest max_duration_hours, checkpoints)
+CHECKPOINT_TIERS = [
+    (48, [0, 4, 8, 12, 24, 36, 48]),
+    (72, [0, 6, 12, 24, 36, 48, 60, 72]),
+    (None, [0, 8, 24, 48, 72, 96, 120, 168]),
+]
+
+
+def default_checkpoints(max_hours: float) -> List[int]:
+    """The recommended measurement timeline (hours) for an intervention of `max_hours`."""
+    for limit, checkpoints in CHECKPOINT_TIERS:
+        if limit is None or max_hours <= limit:
+            return [t for t in checkpoints if t <= max_hours]
+
 class BioCompiler:
     def __init__(self, database_path=None):
         if database_path is None:
-            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            database_path = os.path.join(base_dir, 'database', 'database_seed.json')
+            database_path = default_database_path()
         
+        self.database_path = database_path
         self.library = self._load_library(database_path)
+        self._build_indexes()
 
     def _load_library(self, path: str) -> List[Dict]:
-        """Loads the bioelectric subroutines from the database file."""
-        if not os.path.exists(path):
-            print(f"[!] Warning: Database not found at {path}.")
-            return []
-        try:
-            with open(path, 'r') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            print(f"[!] Error: Failed to decode JSON from {path}.")
-            return []
+        """Loads the bioelectric subroutines (shared and cached across instances)."""
+        return load_library(path)
+
+    def refresh(self):
+        """Picks up changes to the database file made since this instance was built."""
+        self.library = self._load_library(self.database_path)
+        self._build_indexes()
+
+    def _build_indexes(self):
+        if isinstance(self.library, SubroutineStore):
+            # A SQLite store answers lookups itself.
+            self.index = self.library
+        else:
+            self.index = derive(self.library, 'subroutine_index', SubroutineIndex)
 
     def find_subroutine(self, organ: str, species: str) -> Optional[Dict]:
-        """Scans the library for a matching high-level command."""
-        print(f"[*] Compiling request: Build '{organ}' in '{species}'...")
-        for sub in self.library:
-            target = sub['target_morphology']
-            if target['organ'].lower() == organ.lower() and \
-               target['species'].lower() == species.lower():
-                return sub
-        return None
+        """Looks up the first library entry matching a high-level command."""
+        _log.info("Compiling request: Build '%s' in '%s'...", organ, species)
+        with metrics.span('lookup'):
+            matches = self.index.lookup(organ, species)
+        return matches[0] if matches else None
+
+    def find_subroutines(self, organ: str, species: str, action: Optional[str] = None) -> List[Dict]:
+        """Returns every subroutine matching organ/species (and action, if given)."""
+        with metrics.span('lookup'):
+            return self.index.lookup(organ, species, action)
+
+    def find_by_domain(self, spatial_domain: str) -> List[Dict]:
+        """Returns every subroutine targeting the given spatial domain."""
+        return self.index.by_domain(spatial_domain)
+
+    def find_by_driver(self, driver_name: str) -> List[Dict]:
+        """Returns every subroutine that can be driven by the named hardware driver."""
+        return self.index.by_driver(driver_name)
 
     def _analyze_spatial_risks(self, spatial_domain: str, delivery_method: Dict) -> Optional[str]:
         """Check for mismatches between target domain and delivery method."""
-        local_domains = ['ventral_ectoderm', 'amputation_stump', 'regeneration_bud', 'blastema']
-        
-        is_local_target = any(domain in spatial_domain.lower() for domain in local_domains)
+        is_local_target = default_vocabulary().scope(spatial_domain) == 'local'
         is_systemic_delivery = delivery_method.get('spatial_restriction') == 'systemic'
         
         if is_local_target and is_systemic_delivery:
@@ -61,16 +97,7 @@ class BioCompiler:
         
         max_hours = control_loop['termination_criteria']['max_duration_hours']
         
-        if max_hours <= 48:
-            checkpoints = [0, 4, 8, 12, 24, 36, 48]
-        elif max_hours <= 72:
-            checkpoints = [0, 6, 12, 24, 36, 48, 60, 72]
-        else:
-            checkpoints = [0, 8, 24, 48, 72, 96, 120, 168]
-        
-        checkpoints = [t for t in checkpoints if t <= max_hours]
-        
-        for t in checkpoints:
+        for t in default_checkpoints(max_hours):
             if t == 0:
                 protocol.append(f"  T+{t}h:  Baseline measurement (immediately post-intervention)")
             else:
@@ -139,40 +166,35 @@ class BioCompiler:
             
         return protocol
 
-    def generate_protocol(self, subroutine: Dict) -> str:
-        """Translates the Bioelectric State into a Homeostatic Control Protocol."""
-        target = subroutine['target_morphology']
-        state = subroutine['bioelectric_state']
-        drivers = subroutine['hardware_drivers']
-        dev_context = subroutine.get('developmental_context', {})
-        control_loop = subroutine.get('control_loop', {})
-        delivery = subroutine.get('delivery_method', {})
-        biomarkers = subroutine.get('downstream_biomarkers', [])
-        
-        protocol = []
-        protocol.append("=" * 70)
-        protocol.append(f"BIOELECTRIC COMPILER PROTOCOL v0.4 (Genetic Interface)")
-        protocol.append(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
-        protocol.append(f"TARGET: {target['action'].upper()} {target['organ'].upper()} in {target['species']}")
-        protocol.append("=" * 70)
-        
-        if dev_context:
-            protocol.append("")
-            protocol.append("[PHASE 0: DEVELOPMENTAL CONTEXT]")
-            protocol.append(f"Intervention Window:")
-            protocol.append(f"  > Start Stage:    {dev_context.get('stage_start', 'Unknown')}")
-            protocol.append(f"  > End Stage:      {dev_context.get('stage_end', 'Unknown')}")
-            protocol.append(f"  > System:         {dev_context.get('reference_system', 'Unknown')}")
+    def _section_context(self, dev_context: Dict) -> List[str]:
+        """PHASE 0: developmental window (omitted when there is no context)."""
+        if not dev_context:
+            return []
+        return [
+            "",
+            "[PHASE 0: DEVELOPMENTAL CONTEXT]",
+            f"Intervention Window:",
+            f"  > Start Stage:    {dev_context.get('stage_start', 'Unknown')}",
+            f"  > End Stage:      {dev_context.get('stage_end', 'Unknown')}",
+            f"  > System:         {dev_context.get('reference_system', 'Unknown')}",
+        ]
 
-        protocol.append("")
-        protocol.append("[PHASE 1: TARGET STATE DEFINITION]")
-        protocol.append(f"To achieve {target['organ']} morphogenesis, tissue must enter:")
-        protocol.append(f"  > Spatial Domain: {state['spatial_domain']}")
-        protocol.append(f"  > Target Vmem:    {state['target_vmem_range']} mV")
-        protocol.append(f"  > Duration:       {state['duration_hours']}h (minimum)")
-        protocol.append(f"  > Profile:        {state.get('temporal_profile', 'constant').upper()} signal")
-        protocol.append(f"  > Notes:          {state.get('notes', 'N/A')}")
+    def _section_target(self, target: Dict, state: Dict) -> List[str]:
+        """PHASE 1: the bioelectric state to reach."""
+        return [
+            "",
+            "[PHASE 1: TARGET STATE DEFINITION]",
+            f"To achieve {target['organ']} morphogenesis, tissue must enter:",
+            f"  > Spatial Domain: {state['spatial_domain']}",
+            f"  > Target Vmem:    {state['target_vmem_range']} mV",
+            f"  > Duration:       {state['duration_hours']}h (minimum)",
+            f"  > Profile:        {state.get('temporal_profile', 'constant').upper()} signal",
+            f"  > Notes:          {state.get('notes', 'N/A')}",
+        ]
 
+    def _section_hardware(self, drivers: List[Dict], references: Optional[List[str]]) -> List[str]:
+        """PHASE 2: driver options and literature references."""
+        protocol = []
         protocol.append("")
         protocol.append("[PHASE 2: HARDWARE SELECTION]")
         protocol.append("Select ONE of the following drivers:")
@@ -183,47 +205,50 @@ class BioCompiler:
             protocol.append(f"    - Mechanism: {driver['mechanism_of_action']}")
             protocol.append(f"    - Dosage:    {driver.get('dosage', 'See references')}")
         
-        if 'metadata' in subroutine and 'references' in subroutine['metadata']:
+        if references is not None:
             protocol.append(f"")
-            protocol.append(f"  References: {', '.join(subroutine['metadata']['references'])}")
+            protocol.append(f"  References: {', '.join(references)}")
+        return protocol
 
-        if delivery:
+    def _section_delivery(self, delivery: Dict, spatial_domain: str) -> List[str]:
+        """PHASE 3: delivery method and spatial risk analysis (omitted without a method)."""
+        if not delivery:
+            return []
+        protocol = []
+        protocol.append("")
+        protocol.append("[PHASE 3: DELIVERY & SPATIAL CONSTRAINTS]")
+        protocol.append(f"Method:       {delivery.get('type', 'Unknown')}")
+        protocol.append(f"Restriction:  {delivery.get('spatial_restriction', 'Unknown')}")
+        protocol.append(f"Timing:       {delivery.get('timing', 'See context')}")
+        if delivery.get('notes'):
+            protocol.append(f"Notes:        {delivery['notes']}")
+        
+        spatial_warning = self._analyze_spatial_risks(spatial_domain, delivery)
+        if spatial_warning:
             protocol.append("")
-            protocol.append("[PHASE 3: DELIVERY & SPATIAL CONSTRAINTS]")
-            protocol.append(f"Method:       {delivery.get('type', 'Unknown')}")
-            protocol.append(f"Restriction:  {delivery.get('spatial_restriction', 'Unknown')}")
-            protocol.append(f"Timing:       {delivery.get('timing', 'See context')}")
-            if delivery.get('notes'):
-                protocol.append(f"Notes:        {delivery['notes']}")
-            
-            spatial_warning = self._analyze_spatial_risks(state['spatial_domain'], delivery)
-            if spatial_warning:
-                protocol.append("")
-                protocol.append(spatial_warning)
+            protocol.append(spatial_warning)
+        return protocol
 
-        if control_loop:
-            protocol.append("")
-            protocol.append("[PHASE 4: HOMEOSTATIC MAINTENANCE]")
-            protocol.append("This is a CLOSED-LOOP intervention. The tissue will attempt to")
-            protocol.append("restore its original setpoint. Active monitoring and feedback are required.")
-            protocol.append("")
-            
-            schedule = self._generate_monitoring_schedule(control_loop, state)
-            for line in schedule:
-                protocol.append(line)
-            
-            protocol.append("")
-            
-            feedback = self._generate_feedback_logic(control_loop, state)
-            for line in feedback:
-                protocol.append(line)
-            
-            protocol.append("")
-            
-            termination = self._generate_termination_criteria(control_loop)
-            for line in termination:
-                protocol.append(line)
+    def _section_control_loop(self, control_loop: Dict, state: Dict) -> List[str]:
+        """PHASE 4: monitoring, feedback and termination (omitted for open-loop protocols)."""
+        if not control_loop:
+            return []
+        protocol = []
+        protocol.append("")
+        protocol.append("[PHASE 4: HOMEOSTATIC MAINTENANCE]")
+        protocol.append("This is a CLOSED-LOOP intervention. The tissue will attempt to")
+        protocol.append("restore its original setpoint. Active monitoring and feedback are required.")
+        protocol.append("")
+        protocol.extend(self._generate_monitoring_schedule(control_loop, state))
+        protocol.append("")
+        protocol.extend(self._generate_feedback_logic(control_loop, state))
+        protocol.append("")
+        protocol.extend(self._generate_termination_criteria(control_loop))
+        return protocol
 
+    def _section_verification(self, biomarkers: List[Dict]) -> List[str]:
+        """PHASE 5: imaging readout plus any genetic markers."""
+        protocol = []
         protocol.append("")
         protocol.append("[PHASE 5: SAFETY & VERIFICATION]")
         protocol.append("(!) VERIFICATION METHOD:")
@@ -232,16 +257,56 @@ class BioCompiler:
         
         if biomarkers:
             protocol.append("")
-            genetic_verification = self._generate_genetic_verification(biomarkers)
-            for line in genetic_verification:
-                protocol.append(line)
-        
-        protocol.append("")
-        protocol.append("=" * 70)
-        
-        return "\n".join(protocol)
+            protocol.extend(self._generate_genetic_verification(biomarkers))
+        return protocol
+
+    def _header(self, target: Dict, generated_at: datetime) -> List[str]:
+        return [
+            "=" * 70,
+            f"BIOELECTRIC COMPILER PROTOCOL v0.4 (Genetic Interface)",
+            f"Generated: {generated_at.strftime('%Y-%m-%d %H:%M')}",
+            f"TARGET: {target['action'].upper()} {target['organ'].upper()} in {target['species']}",
+            "=" * 70,
+        ]
+
+    def protocol_sections(self, subroutine: Dict) -> List[tuple]:
+        """
+        Splits a subroutine into the protocol's body sections.
+
+        Returns:
+            List[tuple]: (render method, args) per section, in protocol order.
+            Each section's output depends only on its args.
+        """
+        state = subroutine['bioelectric_state']
+        metadata = subroutine.get('metadata', {})
+        return [
+            (self._section_context, (subroutine.get('developmental_context', {}),)),
+            (self._section_target, (subroutine['target_morphology'], state)),
+            (self._section_hardware, (subroutine['hardware_drivers'], metadata.get('references'))),
+            (self._section_delivery, (subroutine.get('delivery_method', {}), state['spatial_domain'])),
+            (self._section_control_loop, (subroutine.get('control_loop', {}), state)),
+            (self._section_verification, (subroutine.get('downstream_biomarkers', []),)),
+        ]
+
+    def generate_protocol(self, subroutine: Dict, generated_at: Optional[datetime] = None) -> str:
+        """
+        Translates the Bioelectric State into a Homeostatic Control Protocol.
+
+        Pass `generated_at` to fix the header timestamp (e.g. for reproducible
+        batch output); it defaults to the current time.
+        """
+        if generated_at is None:
+            generated_at = datetime.now()
+        with metrics.span('render'):
+            protocol = self._header(subroutine['target_morphology'], generated_at)
+            for render, args in self.protocol_sections(subroutine):
+                protocol.extend(render(*args))
+            protocol.append("")
+            protocol.append("=" * 70)
+            return "\n".join(protocol)
 
 if __name__ == "__main__":
+    configure_logging()
     compiler = BioCompiler()
     result_subroutine = compiler.find_subroutine(organ="eye", species="Xenopus laevis")
     
@@ -0,0 +1,330 @@
+"""
+Inverse design: propose new subroutines for a target bioelectric_state.
+
+Searches combinations of hardware drivers, dosages and delivery scopes. Each
+candidate is applied to a small lattice (simulation.tissue_field) holding the
+target spatial_domain, and the simulated Vmem map is scored against
+target_vmem_range:
+
+    score = in_range_fraction                  (target domain cells inside the range)
+          - 0.02 * mean_distance_mv            (how far the rest of the domain misses)
+          - off_target_fraction                (other cells moved > 5 mV from rest)
+          - dose_weight * total_dose           (prefer lighter interventions)
+
+Candidates are deduplicated by their physical effect before anything is
+simulated. Kv1.5 at dose 1.5 and Kir4.1 at dose 1.0 load the membrane
+identically, and so do the two proton pumps, so each distinct lattice is
+solved once and the result is memoized across searches. Unique lattices are
+solved in batches (one stacked stencil solve per batch), with batches spread
+over a process pool.
+
+The top-k candidates are emitted as subroutines in the library schema.
+
+Usage:
+    python -m compiler.inverse_design ORGAN SPECIES [--top-k K] [--max-drivers N] [--workers N]
+"""
+
+import argparse
+import copy
+import hashlib
+import itertools
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from instrumentation.log import configure_logging
+from simulation.tissue_field import DRIVER_MODELS, TissueField, driver_model, solve_many
+
+DEFAULT_DOSES = (0.25, 0.5, 1.0, 1.5, 2.0)
+DEFAULT_SCOPES = ('local', 'regional', 'systemic')
+DELIVERY_FOR_SCOPE = {
+    'local': 'microinjection',
+    'regional': 'bead_implantation',
+    'systemic': 'bath_application',
+}
+OFF_TARGET_MV = 5.0
+
+_worker_geometry: Optional['DesignGeometry'] = None
+
+
+class DesignGeometry:
+    """The lattice a design is evaluated on: a target domain and the delivery scopes around it."""
+
+    def __init__(self, shape: Tuple[int, int] = (48, 48), target_mask: Optional[np.ndarray] = None,
+                 regional_margin: int = 6, resting_vmem: float = -25.0,
+                 gap_junction_conductance: float = 10.0):
+        """
+        Args:
+            shape (Tuple[int, int]): Lattice size.
+            target_mask (np.ndarray, optional): Cells of the target spatial_domain
+                (default: a centred disk of radius min(shape) / 5).
+            regional_margin (int): How far (cells) regional delivery spreads past the domain.
+            resting_vmem (float): Untreated tissue Vmem (mV).
+            gap_junction_conductance (float): Coupling, as in TissueField.
+        """
+        self.shape = tuple(shape)
+        if target_mask is None:
+            yy, xx = np.mgrid[:shape[0], :shape[1]]
+            radius = min(shape) / 5.0
+            target_mask = (yy - (shape[0] - 1) / 2) ** 2 + (xx - (shape[1] - 1) / 2) ** 2 <= radius ** 2
+        self.target_mask = np.asarray(target_mask, dtype=bool)
+        if self.target_mask.shape != self.shape or not self.target_mask.any():
+            raise ValueError("target_mask must be a non-empty mask of the lattice shape.")
+        self.regional_margin = regional_margin
+        self.resting_vmem = resting_vmem
+        self.gap_junction_conductance = gap_junction_conductance
+        self.scopes = {
+            'local': self.target_mask,
+            'regional': _dilate(self.target_mask, regional_margin),
+            'systemic': np.ones(self.shape, dtype=bool),
+        }
+
+    def params(self) -> Dict:
+        return {'shape': self.shape, 'target_mask': self.target_mask,
+                'regional_margin': self.regional_margin,
+                'resting_vmem': self.resting_vmem,
+                'gap_junction_conductance': self.gap_junction_conductance}
+
+    def field(self, effect: Tuple) -> TissueField:
+        """Builds the lattice for a physical effect key (see physical_effect)."""
+        scope, conductance, current, coupling = effect
+        field = TissueField(self.shape, self.resting_vmem,
+                            gap_junction_conductance=self.gap_junction_conductance)
+        mask = self.scopes[scope]
+        field._driver_conductance[mask] = conductance
+        field._driver_current[mask] = current
+        field._coupling[mask] = coupling
+        return field
+
+
+def _dilate(mask: np.ndarray, steps: int) -> np.ndarray:
+    grown = mask.copy()
+    for _ in range(steps):
+        step = grown.copy()
+        step[1:, :] |= grown[:-1, :]
+        step[:-1, :] |= grown[1:, :]
+        step[:, 1:] |= grown[:, :-1]
+        step[:, :-1] |= grown[:, 1:]
+        grown = step
+    return grown
+
+
+def physical_effect(drivers: Sequence[Tuple[str, float]], scope: str) -> Tuple:
+    """
+    The lattice a candidate produces: (scope, conductance, current, coupling).
+
+    Candidates with equal effects simulate identically, so this is the memo key.
+    """
+    conductance, current, coupling = 0.0, 0.0, 1.0
+    for name, dose in drivers:
+        model = driver_model(name)
+        conductance += model.conductance * dose
+        current += model.conductance * dose * model.reversal_mv
+        coupling *= model.coupling_scale ** dose
+    return (scope, round(conductance, 9), round(current, 9), round(coupling, 9))
+
+
+def score_map(vmem_map: np.ndarray, target_mask: np.ndarray, target_range: Sequence[float],
+              resting_vmem: float, total_dose: float, dose_weight: float) -> Dict[str, float]:
+    """Scores one simulated Vmem map against the target range (see the module docstring)."""
+    low, high = sorted(target_range)
+    inside = vmem_map[target_mask]
+    distance = np.maximum(low - inside, 0.0) + np.maximum(inside - high, 0.0)
+    outside = vmem_map[~target_mask]
+    off_target = float((np.abs(outside - resting_vmem) > OFF_TARGET_MV).mean()) if outside.size else 0.0
+    in_range = float((distance == 0).mean())
+    metrics = {
+        'in_range_fraction': in_range,
+        'mean_distance_mv': float(distance.mean()),
+        'domain_mean_vmem': float(inside.mean()),
+        'off_target_fraction': off_target,
+    }
+    metrics['score'] = (in_range - 0.02 * metrics['mean_distance_mv'] - off_target
+                        - dose_weight * total_dose)
+    return metrics
+
+
+def _init_worker(geometry_params: Dict):
+    global _worker_geometry
+    _worker_geometry = DesignGeometry(**geometry_params)
+
+
+def _simulate_batch(effects: List[Tuple]) -> List[np.ndarray]:
+    """Worker: solves a batch of unique lattices as one stacked solve."""
+    return list(solve_many([_worker_geometry.field(effect) for effect in effects]))
+
+
+class InverseDesigner:
+    """Proposes driver/dosage/delivery combinations that reach a target bioelectric_state."""
+
+    def __init__(self, library: Optional[Sequence[Dict]] = None, geometry: Optional[DesignGeometry] = None,
+                 workers: Optional[int] = None, batch_size: int = 64, dose_weight: float = 0.02):
+        """
+        Args:
+            library (Sequence[Dict], optional): Subroutines to copy driver metadata
+                (type, mechanism, reference dosage) from.
+            geometry (DesignGeometry, optional): Evaluation lattice (default geometry if omitted).
+            workers (int, optional): Worker processes for batches (default: all cores; 1 runs inline).
+            batch_size (int): Lattices solved together in one stacked solve.
+            dose_weight (float): Score penalty per unit of total dose.
+        """
+        self.geometry = geometry or DesignGeometry()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.dose_weight = dose_weight
+        self._maps: Dict[Tuple, np.ndarray] = {}
+        self.candidates_seen = 0
+        self.simulated = 0
+        self._driver_info = {}
+        for sub in library or []:
+            for driver in sub.get('hardware_drivers', []):
+                self._driver_info.setdefault(driver['name'].lower(), driver)
+
+    def candidates(self, drivers: Optional[Sequence[str]] = None, doses: Sequence[float] = DEFAULT_DOSES,
+                   max_drivers: int = 2, scopes: Sequence[str] = DEFAULT_SCOPES):
+        """Yields (((driver, dose), ...), scope) for every combination in the search space."""
+        names = list(drivers) if drivers is not None else [m.name for m in DRIVER_MODELS.values()]
+        for scope in scopes:
+            if scope not in self.geometry.scopes:
+                raise ValueError(f"Unknown delivery scope '{scope}'.")
+            for count in range(1, max_drivers + 1):
+                for combo in itertools.combinations(names, count):
+                    for dose_combo in itertools.product(doses, repeat=count):
+                        yield tuple(zip(combo, dose_combo)), scope
+
+    def _simulate(self, effects: List[Tuple]):
+        """Simulates effects not yet memoized, in batches across the pool."""
+        missing = [effect for effect in dict.fromkeys(effects) if effect not in self._maps]
+        if not missing:
+            return
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+        if self.workers == 1 or len(batches) == 1:
+            _init_worker(self.geometry.params())
+            results = [_simulate_batch(batch) for batch in batches]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(self.geometry.params(),)) as pool:
+                results = list(pool.map(_simulate_batch, batches))
+        for batch, maps in zip(batches, results):
+            self._maps.update(zip(batch, maps))
+        self.simulated += len(missing)
+
+    def search(self, target_state: Dict, top_k: int = 5, **space) -> List[Dict]:
+        """
+        Scores the whole search space against a bioelectric_state.
+
+        Args:
+            target_state (Dict): bioelectric_state with 'target_vmem_range'.
+            top_k (int): Number of candidates to return.
+            **space: drivers, doses, max_drivers, scopes (see candidates()).
+
+        Returns:
+            List[Dict]: Best candidates first, each with 'drivers' [(name, dose)],
+            'scope' and the score metrics.
+        """
+        candidates = list(self.candidates(**space))
+        self.candidates_seen += len(candidates)
+        effects = [physical_effect(drivers, scope) for drivers, scope in candidates]
+        self._simulate(effects)
+
+        scored = []
+        target_range = target_state['target_vmem_range']
+        for (drivers, scope), effect in zip(candidates, effects):
+            total_dose = sum(dose for _, dose in drivers)
+            metrics = score_map(self._maps[effect], self.geometry.target_mask, target_range,
+                                self.geometry.resting_vmem, total_dose, self.dose_weight)
+            scored.append(dict(metrics, drivers=list(drivers), scope=scope))
+        scored.sort(key=lambda c: -c['score'])
+        return scored[:top_k]
+
+    def design(self, template: Dict, top_k: int = 5, **space) -> List[Dict]:
+        """
+        Proposes top-k new subroutines for the template's target and bioelectric_state.
+
+        `template` is any subroutine-shaped dict with 'target_morphology' and
+        'bioelectric_state'; its developmental_context and control_loop are
+        carried over into the proposals.
+        """
+        return [self.to_subroutine(template, candidate, rank)
+                for rank, candidate in enumerate(self.search(template['bioelectric_state'], top_k, **space), 1)]
+
+    def to_subroutine(self, template: Dict, candidate: Dict, rank: int = 1) -> Dict:
+        """Renders a scored candidate as a library-schema subroutine."""
+        target = template['target_morphology']
+        key = json.dumps([target, candidate['drivers'], candidate['scope']], sort_keys=True)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:8]
+
+        drivers = []
+        for name, dose in candidate['drivers']:
+            info = self._driver_info.get(name.lower(), {})
+            reference = info.get('dosage')
+            drivers.append({
+                'type': info.get('type', 'drug_cocktail' if driver_model(name).conductance == 0 else 'ion_channel_mRNA'),
+                'name': name,
+                'mechanism_of_action': info.get('mechanism_of_action', 'See simulation model'),
+                'dosage': f"{dose:g}x reference dose" + (f" (reference: {reference})" if reference else ""),
+            })
+
+        scope = candidate['scope']
+        return {
+            'id': f"designed_{target['organ']}_{digest}",
+            'metadata': {
+                'author': 'MorphoLang inverse design',
+                'description': f"Rank {rank} simulated candidate for {target['action']} {target['organ']} "
+                               f"in {target['species']}; requires experimental validation.",
+                'version': '0.1',
+                'references': [],
+                'inverse_design': {k: candidate[k] for k in
+                                   ('score', 'in_range_fraction', 'mean_distance_mv',
+                                    'domain_mean_vmem', 'off_target_fraction')},
+            },
+            'developmental_context': dict(template.get('developmental_context') or
+                                          {'stage_start': 'Unknown', 'reference_system': 'Unknown'}),
+            'target_morphology': dict(target),
+            'bioelectric_state': copy.deepcopy(template['bioelectric_state']),
+            'hardware_drivers': drivers,
+            'control_loop': copy.deepcopy(template.get('control_loop', {})),
+            'delivery_method': {
+                'type': DELIVERY_FOR_SCOPE[scope],
+                'spatial_restriction': scope,
+                'timing': template.get('delivery_method', {}).get('timing', 'See developmental context'),
+            },
+        }
+
+    def stats(self) -> Dict[str, int]:
+        return {'candidates': self.candidates_seen, 'simulated': self.simulated,
+                'memoized': len(self._maps)}
+
+
+def main(argv=None):
+    from .experiment_gen import BioCompiler
+
+    parser = argparse.ArgumentParser(description="Propose new subroutines for an existing target state.")
+    parser.add_argument('organ')
+    parser.add_argument('species')
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--max-drivers', type=int, default=2)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    compiler = BioCompiler()
+    template = compiler.find_subroutine(args.organ, args.species)
+    if template is None:
+        print("[!] Error: No known bioelectric subroutine for this morphology.")
+        return
+
+    designer = InverseDesigner(compiler.library, workers=args.workers)
+    started = time.perf_counter()
+    proposals = designer.design(template, args.top_k, max_drivers=args.max_drivers)
+    stats = designer.stats()
+    print(f"[*] Scored {stats['candidates']} candidates ({stats['simulated']} unique lattices) "
+          f"in {time.perf_counter() - started:.1f}s")
+    print(json.dumps(proposals, indent=2))
+
+
+if __name__ == "__main__":
+    main()
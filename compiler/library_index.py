@@ -0,0 +1,112 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .domain_vocabulary import default_vocabulary
+
+# (organ, species, action, spatial_domain, driver names, vmem_low, vmem_high)
+IndexRow = Tuple[str, str, str, str, Tuple[str, ...], float, float]
+
+
+def _row(sub: Dict) -> IndexRow:
+    target = sub.get('target_morphology', {})
+    state = sub.get('bioelectric_state', {})
+    vmem_range = state.get('target_vmem_range')
+    min_v, max_v = sorted(vmem_range) if vmem_range else (float('nan'), float('nan'))
+    return (
+        target.get('organ') or '',
+        target.get('species') or '',
+        target.get('action') or '',
+        state.get('spatial_domain') or '',
+        tuple(driver.get('name') or '' for driver in sub.get('hardware_drivers', [])),
+        min_v,
+        max_v,
+    )
+
+
+def index_rows(library) -> Iterator[IndexRow]:
+    """
+    Yields the fields the indexes are built from, one row per library entry.
+
+    Libraries that can produce these rows without materializing whole
+    documents (e.g. a compiled snapshot) expose an `index_rows()` method.
+    """
+    rows = getattr(library, 'index_rows', None)
+    if rows is not None:
+        return rows()
+    return (_row(sub) for sub in library)
+
+
+def _norm(value: Optional[str]) -> str:
+    """Normalizes a lookup key the same way the compiler compares names."""
+    return (value or '').lower()
+
+
+class SubroutineIndex:
+    """
+    In-memory hash indexes over a subroutine library.
+
+    Built once when the library is loaded so that lookups cost a dictionary
+    probe instead of a scan over every entry. All lookups return every match,
+    in library order.
+
+    Primary index:
+        (organ, species, action) -> subroutines
+
+    Secondary indexes:
+        spatial_domain -> subroutines
+        hardware driver name -> subroutines
+    """
+
+    def __init__(self, library: List[Dict]):
+        self.library = library
+        self._by_target: Dict[Tuple[str, str, str], List[int]] = {}
+        self._by_organ_species: Dict[Tuple[str, str], List[int]] = {}
+        self._by_domain: Dict[str, List[int]] = {}
+        self._by_driver: Dict[str, List[int]] = {}
+
+        vocabulary = default_vocabulary()
+        for pos, (organ, species, action, domain, drivers, _, _) in enumerate(index_rows(library)):
+            organ, species, action = _norm(organ), _norm(species), _norm(action)
+
+            self._by_target.setdefault((organ, species, action), []).append(pos)
+            self._by_organ_species.setdefault((organ, species), []).append(pos)
+
+            domain = vocabulary.canonical(domain)
+            if domain:
+                self._by_domain.setdefault(domain, []).append(pos)
+
+            seen = set()
+            for name in drivers:
+                name = _norm(name)
+                if name and name not in seen:
+                    seen.add(name)
+                    self._by_driver.setdefault(name, []).append(pos)
+
+    def __len__(self) -> int:
+        return len(self.library)
+
+    def _materialize(self, positions: Iterable[int]) -> List[Dict]:
+        return [self.library[pos] for pos in positions]
+
+    def lookup(self, organ: str, species: str, action: Optional[str] = None) -> List[Dict]:
+        """Returns all subroutines for an organ/species pair, optionally narrowed by action."""
+        if action is None:
+            positions = self._by_organ_species.get((_norm(organ), _norm(species)), [])
+        else:
+            positions = self._by_target.get((_norm(organ), _norm(species), _norm(action)), [])
+        return self._materialize(positions)
+
+    def by_domain(self, spatial_domain: str) -> List[Dict]:
+        """Returns all subroutines targeting exactly this spatial domain (or a synonym of it)."""
+        return self._materialize(self._by_domain.get(default_vocabulary().canonical(spatial_domain), []))
+
+    def by_driver(self, driver_name: str) -> List[Dict]:
+        """Returns all subroutines that list this hardware driver."""
+        return self._materialize(self._by_driver.get(_norm(driver_name), []))
+
+    def domains(self) -> List[str]:
+        """Returns the distinct (canonical) spatial domains in the library."""
+        return list(self._by_domain)
+
+    def drivers(self) -> List[str]:
+        """Returns the distinct (normalized) hardware driver names in the library."""
+        return list(self._by_driver)
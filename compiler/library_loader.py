@@ -0,0 +1,209 @@
+import json
+import os
+import struct
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from instrumentation import metrics
+from instrumentation.log import get_logger
+
+from .snapshot import SNAPSHOT_SUFFIX, SnapshotLibrary, read_sources
+from .sqlite_store import STORE_SUFFIX, SubroutineStore
+
+
+_log = get_logger(__name__)
+
+
+class LibraryCache:
+    """
+    Process-wide LRU cache of parsed subroutine libraries.
+
+    Entries are keyed by absolute path and validated against the file's
+    (mtime, size) on every load, so a changed file is re-parsed on the next
+    load (hot reload) while unchanged files are returned without touching the
+    JSON parser. Objects derived from a library (indexes, lookup tables) can be
+    memoized alongside it with `derive` and are dropped with it.
+
+    Cached libraries are shared between every BioCompiler/BioDecoder built
+    from the same file and must be treated as read-only.
+    """
+
+    def __init__(self, maxsize: int = 8):
+        self.maxsize = maxsize
+        self._entries: 'OrderedDict[str, Tuple[Tuple, List[Dict], Dict[str, Any]]]' = OrderedDict()
+        self._derived_by_id: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _stat_key(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def load(self, path: str) -> List[Dict]:
+        """
+        Returns the parsed library at `path`, re-reading it only if it changed on disk.
+
+        `path` may be a JSON database, a compiled snapshot (see
+        compiler.snapshot) or a SQLite store (see compiler.sqlite_store). A
+        snapshot or store whose JSON sources changed since it was built is
+        ignored in favour of parsing those sources.
+        """
+        path = os.path.abspath(path)
+        stat_key = self._stat_key(path)
+        if stat_key is None:
+            _log.warning("Database not found at %s.", path)
+            self.invalidate(path)
+            return []
+
+        if path.endswith(SNAPSHOT_SUFFIX):
+            snapshot = self._cached(path, stat_key, lambda: self._open_snapshot(path))
+            if not snapshot or snapshot.is_fresh():
+                return snapshot
+            _log.warning("Snapshot %s is stale; loading its JSON sources instead.", path)
+            return self.load_sources(snapshot.current_sources())
+
+        if path.endswith(STORE_SUFFIX):
+            store = self._cached(path, stat_key, lambda: self._open_store(path))
+            if not store or store.is_fresh():
+                return store
+            _log.warning("Store %s is stale; loading its JSON sources instead.", path)
+            return self.load_sources(store.sources)
+
+        return self._cached(path, stat_key, lambda: self._parse_json(path))
+
+    def load_sources(self, paths: List[str]) -> List[Dict]:
+        """Loads and merges several JSON sources (see snapshot.read_sources) as one cached library."""
+        paths = [os.path.abspath(p) for p in paths]
+        stat_keys = tuple(self._stat_key(p) for p in paths)
+        if None in stat_keys:
+            missing = paths[stat_keys.index(None)]
+            _log.warning("Database not found at %s.", missing)
+            return []
+        return self._cached('\0'.join(paths), stat_keys, lambda: self._parse_sources(paths))
+
+    def _cached(self, key: str, stat_key: Tuple, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stat_key:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.count('library_cache_total', result='hit')
+                return entry[1]
+
+        metrics.count('library_cache_total', result='miss')
+        with metrics.span('library_load'):
+            library = loader()
+        if library is None:
+            self.invalidate(key)
+            return []
+
+        with self._lock:
+            self.misses += 1
+            self._drop(key)
+            derived: Dict[str, Any] = {}
+            self._entries[key] = (stat_key, library, derived)
+            self._derived_by_id[id(library)] = derived
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+        return library
+
+    @staticmethod
+    def _parse_json(path: str) -> Optional[List[Dict]]:
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            _log.error("Failed to decode JSON from %s.", path)
+            return None
+
+    @staticmethod
+    def _parse_sources(paths: List[str]) -> Optional[List[Dict]]:
+        try:
+            return read_sources(paths)
+        except json.JSONDecodeError as e:
+            _log.error("Failed to decode JSON sources: %s", e)
+            return None
+
+    @staticmethod
+    def _open_snapshot(path: str) -> Optional[SnapshotLibrary]:
+        try:
+            return SnapshotLibrary(path)
+        except (ValueError, struct.error) as e:
+            _log.error("Failed to open snapshot %s: %s", path, e)
+            return None
+
+    @staticmethod
+    def _open_store(path: str) -> Optional[SubroutineStore]:
+        try:
+            return SubroutineStore(path)
+        except ValueError as e:
+            _log.error("Failed to open store %s: %s", path, e)
+            return None
+
+    def derive(self, library: List[Dict], name: str, factory: Callable[[List[Dict]], Any]) -> Any:
+        """
+        Returns `factory(library)`, memoized for as long as `library` stays cached.
+
+        Libraries that did not come from this cache (e.g. assembled in memory)
+        are not memoized; the factory simply runs.
+        """
+        with self._lock:
+            derived = self._derived_by_id.get(id(library))
+            if derived is not None and name in derived:
+                return derived[name]
+        value = factory(library)
+        if derived is not None:
+            with self._lock:
+                value = derived.setdefault(name, value)
+        return value
+
+    def invalidate(self, path: Optional[str] = None):
+        """Drops one cached library (or all of them when `path` is None)."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._derived_by_id.clear()
+            else:
+                self._drop(path if '\0' in path else os.path.abspath(path))
+
+    def _drop(self, path: str):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._derived_by_id.pop(id(entry[1]), None)
+
+
+_default_cache = LibraryCache()
+
+
+def load_library(path: str) -> List[Dict]:
+    """Loads a subroutine library through the shared process-wide cache."""
+    return _default_cache.load(path)
+
+
+def derive(library: List[Dict], name: str, factory: Callable[[List[Dict]], Any]) -> Any:
+    """Memoizes an object derived from a library loaded through the shared cache."""
+    return _default_cache.derive(library, name, factory)
+
+
+def invalidate_library(path: Optional[str] = None):
+    """Forces the next load of `path` (or of every library) to re-read the file."""
+    _default_cache.invalidate(path)
+
+
+def default_database_path() -> str:
+    """
+    Path to the default library: $MORPHOLANG_DATABASE, or the seed database JSON.
+
+    Compiled snapshots and SQLite stores are opt-in: point MORPHOLANG_DATABASE
+    (or database_path) at one. Note that they differ from the seed database
+    in content, not just format: by default they cover the seed database plus
+    every subroutines/*.json file.
+    """
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.environ.get('MORPHOLANG_DATABASE', os.path.join(base_dir, 'database', 'database_seed.json'))
@@ -1,27 +1,53 @@
-import json
-import os
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from instrumentation import metrics
+from instrumentation.log import configure_logging, get_logger
+
+from .domain_vocabulary import default_vocabulary
+from .library_loader import default_database_path, derive, load_library
+from .scoring import LikelihoodScorer
+from .sqlite_store import SubroutineStore
+from .vmem_index import VmemIndex, VmemSegmentTable, domains_match, label_names
+
+_log = get_logger(__name__)
+
 
 class BioDecoder:
     def __init__(self, database_path=None):
         """Initialize the decoder with the bioelectric database."""
         if database_path is None:
-            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            database_path = os.path.join(base_dir, 'database', 'database_seed.json')
+            database_path = default_database_path()
         
+        self.database_path = database_path
         self.library = self._load_library(database_path)
+        self._build_indexes()
 
     def _load_library(self, path: str) -> List[Dict]:
-        """Loads the bioelectric subroutines."""
-        if not os.path.exists(path):
-            print(f"[!] Warning: Database not found at {path}.")
-            return []
-        try:
-            with open(path, 'r') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            print(f"[!] Error: Failed to decode JSON from {path}.")
-            return []
+        """Loads the bioelectric subroutines (shared and cached across instances)."""
+        return load_library(path)
+
+    def refresh(self):
+        """Picks up changes to the database file made since this instance was built."""
+        self.library = self._load_library(self.database_path)
+        self._build_indexes()
+
+    def _build_indexes(self):
+        if isinstance(self.library, SubroutineStore):
+            # A SQLite store answers range queries itself.
+            self.vmem_index = self.library
+        else:
+            self.vmem_index = derive(self.library, 'vmem_index', VmemIndex)
+        self._segment_tables: Dict[Tuple, VmemSegmentTable] = derive(self.library, 'segment_tables', lambda _: {})
+        self._scorer: Optional[LikelihoodScorer] = None
+
+    @property
+    def scorer(self) -> LikelihoodScorer:
+        """Library arrays for graded scoring, built on first use."""
+        if self._scorer is None:
+            self._scorer = derive(self.library, 'likelihood_scorer', LikelihoodScorer)
+        return self._scorer
 
     def predict(self, vmem: float, spatial_domain: str, species: str = None) -> List[Dict]:
         """
@@ -35,20 +61,105 @@ class BioDecoder:
         Returns:
             List[Dict]: List of matching subroutines/predictions.
         """
+        _log.info("Analyzing bioelectric pattern: %s mV in '%s'...", vmem, spatial_domain)
+        with metrics.span('decode'):
+            matches = self.vmem_index.query(vmem, spatial_domain, species)
+        vocabulary = default_vocabulary()
+        if not matches and spatial_domain not in vocabulary:
+            suggestion = vocabulary.suggest(spatial_domain)
+            if suggestion:
+                _log.info("Unknown spatial domain '%s'; did you mean '%s'?", spatial_domain, suggestion)
+        return matches
+
+    def predict_many(self, vmem_map: np.ndarray, domain_labels: np.ndarray,
+                     domain_names: Union[Sequence[Optional[str]], Mapping[int, str]],
+                     species: str = None) -> np.ndarray:
+        """
+        Batch Inverse Lookup: classifies every pixel of a Vmem map in one vectorized pass.
+
+        Args:
+            vmem_map (np.ndarray): Observed Vmem in mV (e.g. from BioStateValidator.analyze_ratiometric).
+            domain_labels (np.ndarray): Integer domain label per pixel, same shape as vmem_map.
+            domain_names: Spatial domain name for each label (sequence indexed by label, or dict).
+                Labels that are missing or map to None are treated as background.
+            species (str, optional): Filter by species.
+
+        Returns:
+            np.ndarray: int32 array of library positions (self.library[i]); -1 where no
+            subroutine matches. Where several match, the first in library order wins,
+            i.e. the same subroutine as predict(...)[0].
+        """
+        names = label_names(domain_names)
+        key = (names, species.lower() if species else None)
+        table = self._segment_tables.get(key)
+        if table is None:
+            table = VmemSegmentTable(self.library, names, species)
+            self._segment_tables[key] = table
+        return table.classify(vmem_map, domain_labels)
+
+    def predict_scored(self, vmem: float, spatial_domain: str, species: str = None, top_k: int = 5,
+                       min_likelihood: float = 0.01, vmem_sigma: float = 5.0,
+                       cross_species: float = 0.1) -> List[Dict]:
+        """
+        Ranked Inverse Lookup: scores every subroutine instead of filtering.
+
+        Args:
+            vmem (float): Observed membrane potential in mV.
+            spatial_domain (str): Tissue location.
+            species (str, optional): Preferred species (others are down-weighted, not dropped).
+            top_k (int): Maximum number of results.
+            min_likelihood (float): Drop results below this likelihood.
+            vmem_sigma (float): Tolerance (mV) for observations just outside a range.
+            cross_species (float): Likelihood weight of subroutines from other species.
+
+        Returns:
+            List[Dict]: Best first, each {'subroutine', 'position', 'likelihood', 'probability'};
+            see compiler.scoring for how likelihoods are computed.
+        """
+        positions, likelihoods, probabilities = self.rank_many(
+            vmem, spatial_domain, species, top_k, min_likelihood, vmem_sigma, cross_species)
+        return [
+            {'subroutine': self.library[int(pos)], 'position': int(pos),
+             'likelihood': float(likelihood), 'probability': float(probability)}
+            for pos, likelihood, probability in zip(positions[0], likelihoods[0], probabilities[0])
+            if pos >= 0
+        ]
+
+    def rank_many(self, vmem: Union[float, Sequence[float], np.ndarray],
+                  spatial_domain: Union[str, Sequence[str]], species: str = None, top_k: int = 5,
+                  min_likelihood: float = 0.01, vmem_sigma: float = 5.0,
+                  cross_species: float = 0.1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Ranks the library for a whole batch of observations in one vectorized pass.
+
+        Args:
+            vmem: Observed Vmem values (mV).
+            spatial_domain: One domain for all observations, or one per observation.
+            species, top_k, min_likelihood, vmem_sigma, cross_species: As for predict_scored.
+
+        Returns:
+            (positions, likelihoods, probabilities), each (n_observations, top_k), best
+            first; positions index self.library and are -1 for empty slots.
+        """
+        return self.scorer.rank(vmem, spatial_domain, species, top_k, min_likelihood, vmem_sigma, cross_species)
+
+    def predict_linear(self, vmem: float, spatial_domain: str, species: str = None) -> List[Dict]:
+        """
+        Reference implementation of `predict` that scans the whole library.
+
+        Kept for equivalence testing against the interval-tree index.
+        """
         matches = []
         
-        print(f"[*] Analyzing bioelectric pattern: {vmem} mV in '{spatial_domain}'...")
-        
         for sub in self.library:
             # Check Species (if provided)
             target = sub['target_morphology']
             if species and target['species'].lower() != species.lower():
                 continue
                 
-            # Check Spatial Domain (fuzzy match)
+            # Check Spatial Domain (same domain or part of it)
             state = sub['bioelectric_state']
-            if spatial_domain.lower() not in state['spatial_domain'].lower() and \
-               state['spatial_domain'].lower() not in spatial_domain.lower():
+            if not domains_match(spatial_domain, state['spatial_domain']):
                 continue
                 
             # Check Voltage Range
@@ -59,7 +170,13 @@ class BioDecoder:
         return matches
 
     def generate_report(self, matches: List[Dict]) -> str:
-        """Generates a readable prediction report."""
+        """
+        Generates a readable prediction report.
+
+        Accepts the subroutines returned by `predict` (hard matches) or the
+        ranked results of `predict_scored`, which are reported with graded
+        confidence.
+        """
         if not matches:
             return "No matching morphological outcomes found for this pattern."
             
@@ -70,13 +187,22 @@ class BioDecoder:
         report.append("=" * 60)
         
         for i, match in enumerate(matches, 1):
+            scored = match if 'subroutine' in match else None
+            if scored:
+                match = scored['subroutine']
             target = match['target_morphology']
             state = match['bioelectric_state']
             
             report.append(f"\nPREDICTION #{i}: {target['action'].upper()} {target['organ'].upper()}")
             report.append(f"  Species:    {target['species']}")
             report.append(f"  Mechanism:  {state['notes']}")
-            report.append(f"  Confidence: High (Voltage matches target range {state['target_vmem_range']} mV)")
+            if scored:
+                likelihood = scored['likelihood']
+                level = 'High' if likelihood >= 0.9 else 'Medium' if likelihood >= 0.5 else 'Low'
+                report.append(f"  Confidence: {level} (likelihood {likelihood:.2f}, "
+                              f"probability {scored['probability']:.0%}; target range {state['target_vmem_range']} mV)")
+            else:
+                report.append(f"  Confidence: High (Voltage matches target range {state['target_vmem_range']} mV)")
             
             if 'downstream_biomarkers' in match:
                 markers = [m['gene'] for m in match['downstream_biomarkers']]
@@ -86,6 +212,7 @@ class BioDecoder:
         return "\n".join(report)
 
 if __name__ == "__main__":
+    configure_logging()
     # Example Usage
     decoder = BioDecoder()
     
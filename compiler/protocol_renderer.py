@@ -0,0 +1,89 @@
+"""
+Memoized protocol rendering.
+
+A protocol is a header followed by independent sections, and each section's
+text depends only on a small slice of the subroutine. The two heavy sections
+(the homeostatic control loop, built from `control_loop` and
+`bioelectric_state`, and verification, built from `downstream_biomarkers`)
+are cached under a content hash of exactly those inputs. Re-rendering a
+library after editing one subroutine's biomarkers re-renders only that
+subroutine's verification section; identical sections shared between
+subroutines are rendered once. The remaining sections are a handful of
+f-strings each and are cheaper to render than to hash, so they are always
+rendered directly.
+
+Output is identical to BioCompiler.generate_protocol.
+"""
+
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+
+MEMOIZED_SECTIONS = frozenset({'_section_control_loop', '_section_verification'})
+
+
+def content_key(name: str, args: tuple) -> bytes:
+    """
+    Hash of a section name and its (JSON-shaped) inputs.
+
+    Built from repr(), which is several times cheaper than canonical JSON:
+    for plain dicts/lists/scalars equal reprs mean equal content, and a
+    reordering of keys can only cause a cache miss, never a wrong hit.
+    """
+    return hashlib.blake2b(repr((name, args)).encode('utf-8'), digest_size=16).digest()
+
+
+class ProtocolRenderer:
+    """Renders protocols through a bounded, content-addressed section cache."""
+
+    def __init__(self, compiler, maxsize: int = 4096):
+        """
+        Args:
+            compiler (BioCompiler): Supplies the section renderers.
+            maxsize (int): Rendered sections kept (least recently used are evicted).
+        """
+        self.compiler = compiler
+        self.maxsize = maxsize
+        self._sections: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _render_section(self, render, args) -> str:
+        key = content_key(render.__name__, args)
+        text = self._sections.get(key)
+        if text is not None:
+            self._sections.move_to_end(key)
+            self.hits += 1
+            return text
+
+        self.misses += 1
+        text = "\n".join(render(*args))
+        self._sections[key] = text
+        if len(self._sections) > self.maxsize:
+            self._sections.popitem(last=False)
+        return text
+
+    def render(self, subroutine: Dict, generated_at: Optional[datetime] = None) -> str:
+        """Same output as BioCompiler.generate_protocol, reusing unchanged sections."""
+        if generated_at is None:
+            generated_at = datetime.now()
+        parts = ["\n".join(self.compiler._header(subroutine['target_morphology'], generated_at))]
+        for render, args in self.compiler.protocol_sections(subroutine):
+            if render.__name__ in MEMOIZED_SECTIONS:
+                text = self._render_section(render, args)
+            else:
+                text = "\n".join(render(*args))
+            if text:
+                parts.append(text)
+        parts.append("\n" + "=" * 70)
+        return "\n".join(parts)
+
+    def clear(self):
+        """Drops every cached section."""
+        self._sections.clear()
+        self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {'sections': len(self._sections), 'hits': self.hits, 'misses': self.misses}
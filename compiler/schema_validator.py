@@ -0,0 +1,418 @@
+"""
+Bulk validation of subroutines against subroutine_schema.json.
+
+The schema is compiled once into a tree of checker closures (one per schema
+node, with the keywords it uses already looked up), so validating an entry
+is a walk over the document with no schema interpretation on the way. On top
+of the schema, semantic checks catch entries that are well-formed but
+self-contradictory:
+
+    vmem_range_size      target_vmem_range has exactly two values
+    vmem_range_order     target_vmem_range is written [low, high] (a warning)
+    feedback_thresholds  if_vmem_drifts_above / _below lie outside the range
+    duration_limit       duration_hours <= max_duration_hours
+
+Every consumer sorts target_vmem_range, so a reversed range still means
+what it says; it is reported as a warning (WARNING_CODES) that does not
+make the entry invalid.
+
+Sources are validated in parallel, one task per file or block of entries. Every
+problem is reported as a dict:
+
+    {'source': path, 'index': position in the file, 'id': subroutine id,
+     'path': JSON pointer into the entry, 'code': keyword or check name,
+     'severity': 'error' or 'warning', 'message': text}
+
+Usage:
+    python -m compiler.schema_validator [PATH ...] [--workers N] [--json]
+"""
+
+import argparse
+import gc
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence
+
+from instrumentation.log import configure_logging
+
+from .snapshot import default_sources
+
+SPLIT_BYTES = 1 << 20
+WARNING_CODES = frozenset({'vmem_range_order'})
+
+# checker(value, pointer, errors): appends (pointer, code, message) tuples to `errors`.
+Checker = Callable[[object, str, List], None]
+
+# JSON types by the exact Python types json.load produces for them.
+_TYPES = {
+    'object': (dict,),
+    'array': (list,),
+    'string': (str,),
+    'number': (int, float),
+    'integer': (int,),
+    'boolean': (bool,),
+    'null': (type(None),),
+}
+
+
+def default_schema_path() -> str:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, 'subroutine_schema.json')
+
+
+def _accepted_types(schema: Dict) -> Optional[FrozenSet[type]]:
+    expected = schema.get('type')
+    if expected is None:
+        return None
+    names = [expected] if isinstance(expected, str) else list(expected)
+    unknown = [name for name in names if name not in _TYPES]
+    if unknown:
+        raise ValueError(f"Unsupported schema type(s): {unknown}")
+    return frozenset(t for name in names for t in _TYPES[name])
+
+
+def _type_error(schema: Dict, value, pointer: str, errors: List):
+    expected = schema['type']
+    wanted = expected if isinstance(expected, str) else ' or '.join(expected)
+    errors.append((pointer, 'type', f"expected {wanted}, got {type(value).__name__}"))
+
+
+def compile_schema(schema: Dict) -> Checker:
+    """
+    Compiles a JSON schema node into a checker function.
+
+    Supports the draft-07 keywords the subroutine schema uses: type,
+    required, properties, items and enum. Annotations (title, description)
+    are ignored. Types are tested with one set lookup on the exact type, and
+    children that only declare a type are checked inline by their parent
+    instead of through a call.
+    """
+    accepted = _accepted_types(schema)
+    body = _compile_body(schema)
+
+    if body is None:
+        def check(value, pointer, errors):
+            if accepted is not None and type(value) not in accepted:
+                _type_error(schema, value, pointer, errors)
+    else:
+        def check(value, pointer, errors):
+            if accepted is not None and type(value) not in accepted:
+                _type_error(schema, value, pointer, errors)
+            else:
+                body(value, pointer, errors)
+    return check
+
+
+def _compile_body(schema: Dict) -> Optional[Checker]:
+    """Checks for everything but the node's own type, or None if there are none."""
+    checks: List[Checker] = []
+
+    if 'enum' in schema:
+        allowed = list(schema['enum'])
+
+        def check_enum(value, pointer, errors):
+            if value not in allowed:
+                errors.append((pointer, 'enum', f"{value!r} is not one of {allowed}"))
+        checks.append(check_enum)
+
+    required = tuple(schema.get('required', ()))
+    # (name, pointer suffix, schema, accepted types, body): the child's type is checked here.
+    properties = [(name, '/' + name.replace('~', '~0').replace('/', '~1'), sub,
+                   _accepted_types(sub), _compile_body(sub))
+                  for name, sub in schema.get('properties', {}).items()]
+    if required or properties:
+        def check_object(value, pointer, errors):
+            if type(value) is not dict:
+                return
+            for name in required:
+                if name not in value:
+                    errors.append((pointer, 'required', f"missing required field '{name}'"))
+            for name, suffix, sub, accepted, body in properties:
+                if name in value:
+                    child = value[name]
+                    if accepted is not None and type(child) not in accepted:
+                        _type_error(sub, child, pointer + suffix, errors)
+                    elif body is not None:
+                        body(child, pointer + suffix, errors)
+        checks.append(check_object)
+
+    if 'items' in schema:
+        item_schema = schema['items']
+        item_accepted = _accepted_types(item_schema)
+        item_body = _compile_body(item_schema)
+
+        def check_array(value, pointer, errors):
+            if type(value) is not list:
+                return
+            for i, item in enumerate(value):
+                if item_accepted is not None and type(item) not in item_accepted:
+                    _type_error(item_schema, item, f"{pointer}/{i}", errors)
+                elif item_body is not None:
+                    item_body(item, f"{pointer}/{i}", errors)
+        checks.append(check_array)
+
+    if not checks:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_all(value, pointer, errors):
+        for check in checks:
+            check(value, pointer, errors)
+    return check_all
+
+
+def _number(value) -> bool:
+    return type(value) in (int, float)
+
+
+def _get(sub: Dict, *keys):
+    """sub[k1][k2]..., or None if any level is missing or not an object."""
+    for key in keys:
+        if not isinstance(sub, dict):
+            return None
+        sub = sub.get(key)
+    return sub
+
+
+def check_vmem_range_order(sub: Dict, errors: List):
+    vmem_range = _get(sub, 'bioelectric_state', 'target_vmem_range')
+    if not isinstance(vmem_range, list) or not all(_number(v) for v in vmem_range):
+        return
+    if len(vmem_range) != 2:
+        errors.append(('/bioelectric_state/target_vmem_range', 'vmem_range_size',
+                       f"expected [low, high], got {len(vmem_range)} values"))
+    elif vmem_range[0] > vmem_range[1]:
+        errors.append(('/bioelectric_state/target_vmem_range', 'vmem_range_order',
+                       f"low {vmem_range[0]} mV is above high {vmem_range[1]} mV"))
+
+
+def check_feedback_thresholds(sub: Dict, errors: List):
+    vmem_range = _get(sub, 'bioelectric_state', 'target_vmem_range')
+    feedback = _get(sub, 'control_loop', 'feedback_mechanism')
+    if not isinstance(vmem_range, list) or len(vmem_range) != 2 or \
+            not all(_number(v) for v in vmem_range) or not isinstance(feedback, dict):
+        return
+    low, high = sorted(vmem_range)
+    above = feedback.get('if_vmem_drifts_above')
+    if _number(above) and above < high:
+        errors.append(('/control_loop/feedback_mechanism/if_vmem_drifts_above', 'feedback_thresholds',
+                       f"upper threshold {above} mV is inside the target range [{low}, {high}]"))
+    below = feedback.get('if_vmem_drifts_below')
+    if _number(below) and below > low:
+        errors.append(('/control_loop/feedback_mechanism/if_vmem_drifts_below', 'feedback_thresholds',
+                       f"lower threshold {below} mV is inside the target range [{low}, {high}]"))
+
+
+def check_duration_limit(sub: Dict, errors: List):
+    duration = _get(sub, 'bioelectric_state', 'duration_hours')
+    limit = _get(sub, 'control_loop', 'termination_criteria', 'max_duration_hours')
+    if _number(duration) and _number(limit) and duration > limit:
+        errors.append(('/bioelectric_state/duration_hours', 'duration_limit',
+                       f"duration_hours {duration} exceeds max_duration_hours {limit}"))
+
+
+SEMANTIC_CHECKS = [check_vmem_range_order, check_feedback_thresholds, check_duration_limit]
+
+
+class SchemaValidator:
+    """Schema plus semantic validation of individual subroutines (see the module docstring)."""
+
+    def __init__(self, schema: Optional[Dict] = None, semantic_checks=None):
+        if schema is None:
+            with open(default_schema_path(), 'r') as f:
+                schema = json.load(f)
+        self.check = compile_schema(schema)
+        self.semantic_checks = SEMANTIC_CHECKS if semantic_checks is None else semantic_checks
+
+    def problems(self, sub) -> List:
+        """Raw (pointer, code, message) tuples for one entry, schema errors first."""
+        errors = []
+        self.check(sub, '', errors)
+        if isinstance(sub, dict):
+            for semantic_check in self.semantic_checks:
+                semantic_check(sub, errors)
+        return errors
+
+    def validate(self, sub, source: Optional[str] = None, index: Optional[int] = None) -> List[Dict]:
+        """Returns the structured errors and warnings for one entry (empty if it is clean)."""
+        return _records(self.problems(sub), sub, source, index)
+
+    def validate_entries(self, entries: Sequence, source: Optional[str] = None, start: int = 0) -> List[Dict]:
+        """Validates a list of entries, numbering them from `start`."""
+        errors = []
+        for index, sub in enumerate(entries, start):
+            problems = self.problems(sub)
+            if problems:
+                errors.extend(_records(problems, sub, source, index))
+        return errors
+
+
+def _records(problems: List, sub, source: Optional[str], index: Optional[int]) -> List[Dict]:
+    sub_id = sub.get('id') if isinstance(sub, dict) else None
+    return [{'source': source, 'index': index, 'id': sub_id, 'path': pointer, 'code': code,
+             'severity': 'warning' if code in WARNING_CODES else 'error', 'message': message}
+            for pointer, code, message in problems]
+
+
+def read_entries(path: str) -> List:
+    """Entries of a source file: a list of subroutines or a single subroutine."""
+    # Parsing allocates only acyclic containers; pausing the cycle collector
+    # saves it from repeatedly rescanning them (about a quarter of parse time).
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    finally:
+        if collecting:
+            gc.enable()
+    return data if isinstance(data, list) else [data]
+
+
+def _merge(errors: List[Dict], more: List[Dict]) -> List[Dict]:
+    """Both error lists in entry order (the sort is stable within an entry)."""
+    if not more:
+        return errors
+    return sorted(errors + more, key=lambda error: error['index'])
+
+
+def duplicate_ids(entries: Sequence, source: Optional[str] = None) -> List[Dict]:
+    """Errors for every entry reusing an id seen earlier in the same source."""
+    seen, errors = {}, []
+    for index, sub in enumerate(entries):
+        sub_id = sub.get('id') if isinstance(sub, dict) else None
+        if not isinstance(sub_id, str):
+            continue
+        first = seen.setdefault(sub_id, index)
+        if first != index:
+            errors.extend(_records([('/id', 'duplicate_id', f"id '{sub_id}' already used by entry {first}")],
+                                   sub, source, index))
+    return errors
+
+
+_worker_validator: Optional[SchemaValidator] = None
+_worker_sources: Dict[str, List] = {}
+
+
+def _init_worker(schema: Optional[Dict], sources: Dict[str, List]):
+    global _worker_validator, _worker_sources
+    _worker_validator = SchemaValidator(schema)
+    _worker_sources = sources
+
+
+def _validate_block(task) -> List[Dict]:
+    """Worker: validate entries [start, stop) of a source parsed by the parent."""
+    source, start, stop = task
+    return _worker_validator.validate_entries(_worker_sources[source][start:stop], source, start)
+
+
+def _parse_error(path: str, error: Exception) -> Dict:
+    return {'source': path, 'index': None, 'id': None, 'path': '', 'code': 'parse', 'severity': 'error',
+            'message': str(error)}
+
+
+def _validate_file(path: str) -> List:
+    """Worker: parse and validate a whole source file; returns [entry count, errors]."""
+    try:
+        entries = read_entries(path)
+    except (OSError, ValueError) as e:
+        return [0, [_parse_error(path, e)]]
+    return [len(entries), _merge(_worker_validator.validate_entries(entries, path), duplicate_ids(entries, path))]
+
+
+def validate_corpus(paths: Optional[List[str]] = None, workers: Optional[int] = None,
+                    schema: Optional[Dict] = None, block_size: int = 2000,
+                    split_bytes: int = SPLIT_BYTES) -> Dict:
+    """
+    Validates every entry of every source file.
+
+    Small files are parsed and validated by the workers themselves. Files
+    larger than `split_bytes` are parsed here before the pool starts and
+    validated in blocks of `block_size` entries, so one large database still
+    uses every worker; forked workers inherit the parsed entries instead of
+    receiving them pickled. Duplicate ids are reported within a file (across
+    files the first occurrence wins, see snapshot.read_sources).
+
+    Args:
+        paths: JSON sources (default: the seed database and subroutines/*.json).
+        workers (int, optional): Worker processes (default: all cores; 1 runs inline).
+        schema (Dict, optional): Schema to enforce (default: subroutine_schema.json).
+
+    Returns:
+        Dict: sources, entries, invalid_entries (entries with errors), errors and
+        warnings (structured, in source order), seconds and entries_per_second.
+    """
+    paths = default_sources() if paths is None else list(paths)
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+
+    results: Dict[str, List] = {}
+    parsed: Dict[str, List] = {}
+    for path in paths:
+        if os.path.exists(path) and os.path.getsize(path) > split_bytes:
+            try:
+                parsed[path] = read_entries(path)
+            except (OSError, ValueError) as e:
+                results[path] = [0, [_parse_error(path, e)]]
+    small = [path for path in paths if path not in parsed and path not in results]
+    blocks = [(path, start, start + block_size)
+              for path, entries in parsed.items() for start in range(0, len(entries), block_size)]
+
+    def run(executor_map):
+        for path, result in zip(small, executor_map(_validate_file, small)):
+            results[path] = result
+        block_errors: Dict[str, List[Dict]] = {path: [] for path in parsed}
+        for (path, _, _), errors in zip(blocks, executor_map(_validate_block, blocks)):
+            block_errors[path].extend(errors)
+        for path, entries in parsed.items():
+            results[path] = [len(entries), _merge(block_errors[path], duplicate_ids(entries, path))]
+
+    if workers == 1 or len(small) + len(blocks) <= 1:
+        _init_worker(schema, parsed)
+        run(map)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(schema, parsed)) as executor:
+            run(lambda fn, items: executor.map(fn, items, chunksize=max(1, len(items) // (4 * workers))))
+
+    problems = [problem for path in paths for problem in results[path][1]]
+    errors = [problem for problem in problems if problem['severity'] == 'error']
+    entries = sum(results[path][0] for path in paths)
+    seconds = time.perf_counter() - started
+    return {
+        'sources': len(paths),
+        'entries': entries,
+        'invalid_entries': len({(error['source'], error['index']) for error in errors}),
+        'errors': errors,
+        'warnings': [problem for problem in problems if problem['severity'] == 'warning'],
+        'seconds': seconds,
+        'entries_per_second': entries / seconds if seconds > 0 else float('inf'),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate subroutine files against the schema.")
+    parser.add_argument('paths', nargs='*', help="JSON sources (default: database and subroutines/*.json)")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: all cores)")
+    parser.add_argument('--json', action='store_true', help="Print the errors as JSON lines")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    report = validate_corpus(args.paths or None, args.workers)
+    for problem in report['errors'] + report['warnings']:
+        if args.json:
+            print(json.dumps(problem))
+        else:
+            print(f"[!] {problem['severity'].capitalize()}: {problem['source']}[{problem['index']}] ({problem['id']}) "
+                  f"{problem['path'] or '/'}: {problem['code']}: {problem['message']}")
+    print(f"[*] Validated {report['entries']} entries from {report['sources']} sources "
+          f"in {report['seconds']:.2f}s: {report['invalid_entries']} invalid, "
+          f"{len(report['errors'])} errors, {len(report['warnings'])} warnings")
+    return 1 if report['errors'] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
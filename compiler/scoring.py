@@ -0,0 +1,184 @@
+"""
+Graded, vectorized scoring of observations against the whole library.
+
+`BioDecoder.predict` answers yes/no: a subroutine matches only if the
+observed Vmem is inside its range and the domains are related in the
+DomainVocabulary (the same domain, or one part of the other).
+LikelihoodScorer instead assigns every subroutine a likelihood in [0, 1]:
+
+    likelihood = range_term * domain_term * species_term
+
+    range_term   = exp(-d^2 / (2 * vmem_sigma^2)), d = distance (mV) from the
+                   observation to target_vmem_range (0 inside the range)
+    domain_term  = 1 for the same domain, CONTAINED_SIMILARITY ** steps when
+                   one domain is part of the other (predict's rule), otherwise
+                   the token overlap of the names scaled by TOKEN_SIMILARITY,
+                   floored at MIN_DOMAIN_SIMILARITY
+    species_term = 1 for the requested species (or when none is given),
+                   otherwise `cross_species`
+
+Probabilities are likelihoods normalized over the library for each
+observation. For a batch of observations every term is one broadcast
+(n_observations, n_library) array operation, and top-k is an argpartition
+that keeps tied scores in library order; `rank` runs this over cache-sized
+blocks of observations.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .domain_vocabulary import default_vocabulary, normalize
+from .library_index import index_rows
+
+CONTAINED_SIMILARITY = 0.8
+TOKEN_SIMILARITY = 0.5
+MIN_DOMAIN_SIMILARITY = 0.05
+
+
+def domain_similarity(query: str, domain: str) -> float:
+    """Similarity in [MIN_DOMAIN_SIMILARITY, 1] between two spatial domain names."""
+    steps = default_vocabulary().distance(query, domain)
+    if steps is not None:
+        return CONTAINED_SIMILARITY ** steps
+    query, domain = normalize(query), normalize(domain)
+    a, b = set(query.split('_')), set(domain.split('_'))
+    overlap = len(a & b) / len(a | b) if a | b else 0.0
+    return max(TOKEN_SIMILARITY * overlap, MIN_DOMAIN_SIMILARITY)
+
+
+def _factorize(values) -> Tuple[List[str], np.ndarray]:
+    """Distinct values and, for each input, the index of its value."""
+    ids, names = [], {}
+    for value in values:
+        ids.append(names.setdefault(value, len(names)))
+    return list(names), np.array(ids, dtype=np.intp)
+
+
+class LikelihoodScorer:
+    """Precomputed library arrays for scoring observations (see the module docstring)."""
+
+    def __init__(self, library):
+        self.library = library
+        rows = list(index_rows(library))
+        # Scores are float32: plenty for likelihoods, and half the memory traffic.
+        ranges = np.array([row[5:7] for row in rows], dtype=np.float32).reshape(-1, 2)
+        self.low = ranges[:, 0]
+        self.high = ranges[:, 1]
+        self.has_range = ~np.isnan(self.low)
+
+        self.domain_names, self.domain_ids = _factorize(row[3].lower() for row in rows)
+        self.species_names, self.species_ids = _factorize(row[1].lower() for row in rows)
+        self._domain_rows: Dict[str, np.ndarray] = {}
+
+    def _domain_term(self, spatial_domain: str) -> np.ndarray:
+        """Similarity of one query domain to every library entry (cached per query)."""
+        query = spatial_domain.lower()
+        row = self._domain_rows.get(query)
+        if row is None:
+            per_name = np.array([domain_similarity(query, name) for name in self.domain_names] or [0.0],
+                                dtype=np.float32)
+            row = per_name[self.domain_ids]
+            self._domain_rows[query] = row
+        return row
+
+    def likelihoods(self, vmem: Union[float, Sequence[float], np.ndarray],
+                    spatial_domain: Union[str, Sequence[str]], species: Optional[str] = None,
+                    vmem_sigma: float = 5.0, cross_species: float = 0.1) -> np.ndarray:
+        """
+        Likelihood of every subroutine for each observation.
+
+        Args:
+            vmem: One Vmem (mV) or an array of observations.
+            spatial_domain: One domain for all observations, or one per observation.
+            species (str, optional): Preferred species.
+            vmem_sigma (float): Width (mV) of the tolerance outside a range.
+            cross_species (float): Weight of subroutines from other species.
+
+        Returns:
+            np.ndarray: (n_observations, n_library) float32 likelihoods.
+        """
+        vmem = np.atleast_1d(np.asarray(vmem, dtype=np.float32))[:, None]
+        scores = np.maximum(self.low - vmem, np.float32(0.0))
+        scores += np.maximum(vmem - self.high, np.float32(0.0))
+        scores *= scores
+        scores *= np.float32(-0.5 / (vmem_sigma * vmem_sigma))
+        np.exp(scores, out=scores)
+        scores[:, ~self.has_range] = 0.0
+
+        if isinstance(spatial_domain, str):
+            scores *= self._domain_term(spatial_domain)
+        else:
+            if len(spatial_domain) != scores.shape[0]:
+                raise ValueError("Give one spatial_domain, or one per observation.")
+            unique, inverse = np.unique(np.asarray(spatial_domain, dtype=str), return_inverse=True)
+            if len(unique):
+                scores *= np.stack([self._domain_term(name) for name in unique])[inverse]
+
+        if species:
+            prior = np.array([1.0 if name == species.lower() else cross_species
+                              for name in self.species_names] or [0.0], dtype=np.float32)
+            scores *= prior[self.species_ids]
+        return scores
+
+    def rank(self, vmem, spatial_domain, species: Optional[str] = None, k: int = 5,
+             min_likelihood: float = 0.0, vmem_sigma: float = 5.0, cross_species: float = 0.1,
+             block_cells: int = 1 << 18) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        likelihoods() followed by top_k(), in row blocks of about `block_cells` scores.
+
+        Blocking keeps the working matrix cache-sized for large libraries and
+        bounds memory for large batches; results are identical to one big pass.
+        """
+        vmem = np.atleast_1d(np.asarray(vmem, dtype=np.float64))
+        per_row = not isinstance(spatial_domain, str)
+        if per_row and len(spatial_domain) != len(vmem):
+            raise ValueError("Give one spatial_domain, or one per observation.")
+        rows = max(1, block_cells // max(len(self.low), 1))
+        blocks = []
+        for start in range(0, len(vmem), rows):
+            domains = spatial_domain[start:start + rows] if per_row else spatial_domain
+            scores = self.likelihoods(vmem[start:start + rows], domains, species, vmem_sigma, cross_species)
+            blocks.append(self.top_k(scores, k, min_likelihood))
+        if not blocks:
+            return self.top_k(np.zeros((0, len(self.low))), k, min_likelihood)
+        return tuple(np.concatenate(parts) for parts in zip(*blocks))
+
+    def top_k(self, scores: np.ndarray, k: int, min_likelihood: float = 0.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Ranks each row of a likelihood matrix.
+
+        Returns:
+            (positions, likelihoods, probabilities), each (n_observations, k), best
+            first (ties in library order). Positions index the library; -1 marks
+            slots below min_likelihood.
+        """
+        n_obs, n_lib = scores.shape
+        k = min(k, n_lib)
+        if k == 0:
+            empty = np.zeros((n_obs, 0))
+            return empty.astype(np.intp), empty, empty
+        if k < n_lib:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            # argpartition picks arbitrarily among entries tied with the k-th score;
+            # where the tie is reported, keep everything above it and the earliest tied entries.
+            kth = np.take_along_axis(scores, top, axis=1).min(axis=1, keepdims=True)
+            tied = (kth[:, 0] > 0) & (kth[:, 0] >= min_likelihood)
+            if tied.any():
+                rows, kth = scores[tied], kth[tied]
+                above = rows > kth
+                at = rows == kth
+                at &= np.cumsum(at, axis=1) <= k - above.sum(axis=1, keepdims=True)
+                top[tied] = np.nonzero(above | at)[1].reshape(-1, k)
+        else:
+            top = np.broadcast_to(np.arange(n_lib), (n_obs, n_lib))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.lexsort((top, -top_scores), axis=1)
+        positions = np.take_along_axis(top, order, axis=1)
+        likelihoods = np.take_along_axis(top_scores, order, axis=1)
+
+        totals = scores.sum(axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            probabilities = np.where(totals > 0, likelihoods / totals, 0.0)
+        keep = (likelihoods >= min_likelihood) & (likelihoods > 0)
+        return np.where(keep, positions, -1), np.where(keep, likelihoods, 0.0), np.where(keep, probabilities, 0.0)
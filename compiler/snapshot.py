@@ -0,0 +1,345 @@
+"""
+Compiled binary snapshots of the subroutine database.
+
+A snapshot is a single memory-mappable file holding:
+
+  * fixed-width numeric columns (float64) for the fields the compiler and
+    decoder filter on (Vmem range, durations, drift thresholds),
+  * string-reference columns (uint32) into an interned UTF-8 string table
+    for ids, organs, species, actions, domains and driver names,
+  * every full subroutine document as compact JSON, decoded only on access.
+
+Layout (little-endian):
+
+    magic (8 bytes) | version (u32) | header length (u32) | header JSON
+    | 8-byte aligned sections described by the header
+
+The header also records the JSON sources (relative path, mtime, size) the
+snapshot was built from, and the glob patterns that selected them, so a
+loader can detect when it is stale: a changed or removed source, or a new
+file matching one of the patterns (e.g. a new subroutines/*.json).
+
+Build the default snapshot with:
+
+    python -m compiler.snapshot
+
+and use it by passing its path as database_path or setting
+MORPHOLANG_DATABASE=database/library.mlsnap (see
+library_loader.default_database_path). It covers the seed database plus
+subroutines/*.json rather than the seed database alone.
+"""
+
+import argparse
+import fnmatch
+import glob
+import json
+import mmap
+import os
+import struct
+from collections.abc import Sequence
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from instrumentation.log import configure_logging
+
+MAGIC = b'MLSNAP\x00\x00'
+VERSION = 1
+SNAPSHOT_SUFFIX = '.mlsnap'
+_PREAMBLE = struct.Struct('<8sII')
+_ALIGN = 8
+
+NUMERIC_COLUMNS = {
+    'vmem_low': lambda sub: _vmem_range(sub)[0],
+    'vmem_high': lambda sub: _vmem_range(sub)[1],
+    'duration_hours': lambda sub: sub.get('bioelectric_state', {}).get('duration_hours'),
+    'max_duration_hours': lambda sub: sub.get('control_loop', {}).get('termination_criteria', {}).get('max_duration_hours'),
+    'drift_above': lambda sub: sub.get('control_loop', {}).get('feedback_mechanism', {}).get('if_vmem_drifts_above'),
+    'drift_below': lambda sub: sub.get('control_loop', {}).get('feedback_mechanism', {}).get('if_vmem_drifts_below'),
+}
+
+STRING_COLUMNS = {
+    'id': lambda sub: sub.get('id'),
+    'organ': lambda sub: sub.get('target_morphology', {}).get('organ'),
+    'species': lambda sub: sub.get('target_morphology', {}).get('species'),
+    'action': lambda sub: sub.get('target_morphology', {}).get('action'),
+    'spatial_domain': lambda sub: sub.get('bioelectric_state', {}).get('spatial_domain'),
+}
+
+
+def _vmem_range(sub: Dict) -> Tuple[Optional[float], Optional[float]]:
+    vmem_range = sub.get('bioelectric_state', {}).get('target_vmem_range')
+    return tuple(sorted(vmem_range)) if vmem_range else (None, None)
+
+
+def default_source_globs() -> List[str]:
+    """Patterns whose matches belong to the default library (every individual subroutine file)."""
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return [os.path.join(base_dir, 'subroutines', '*.json')]
+
+
+def default_sources() -> List[str]:
+    """The seed database followed by every individual subroutine file."""
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return [os.path.join(base_dir, 'database', 'database_seed.json')] + expand_globs(default_source_globs())
+
+
+def expand_globs(patterns: List[str]) -> List[str]:
+    """Sorted matches of each pattern, in pattern order."""
+    paths = []
+    for pattern in patterns:
+        paths.extend(path for path in sorted(glob.glob(pattern)) if path not in paths)
+    return paths
+
+
+def default_snapshot_path() -> str:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, 'database', 'library' + SNAPSHOT_SUFFIX)
+
+
+def read_sources(paths: List[str]) -> List[Dict]:
+    """
+    Parses and merges JSON sources in order.
+
+    Each file holds either a list of subroutines or a single subroutine.
+    When an id appears more than once, the first occurrence wins, so the
+    seed database takes precedence over the per-file copies.
+    """
+    library, seen = [], set()
+    for path in paths:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        for sub in (data if isinstance(data, list) else [data]):
+            if sub.get('id') in seen:
+                continue
+            seen.add(sub.get('id'))
+            library.append(sub)
+    return library
+
+
+def _source_record(path: str, base_dir: str) -> Dict:
+    st = os.stat(path)
+    return {'path': os.path.relpath(os.path.abspath(path), base_dir),
+            'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+
+
+def build_snapshot(output_path: Optional[str] = None, sources: Optional[List[str]] = None,
+                   source_globs: Optional[List[str]] = None) -> str:
+    """
+    Compiles the JSON sources into a snapshot file and returns its path.
+
+    Files matching `source_globs` are appended to `sources`, and the patterns
+    are recorded so that a later match makes the snapshot stale. Without
+    `sources`, the default library (default_sources / default_source_globs)
+    is compiled.
+    """
+    output_path = os.path.abspath(output_path or default_snapshot_path())
+    if not sources:
+        sources = default_sources()
+        source_globs = default_source_globs() if source_globs is None else source_globs
+    source_globs = [os.path.abspath(pattern) for pattern in source_globs or []]
+    sources = [os.path.abspath(path) for path in sources]
+    sources += [path for path in expand_globs(source_globs) if path not in sources]
+    base_dir = os.path.dirname(output_path)
+    library = read_sources(sources)
+
+    strings: Dict[str, int] = {}
+
+    def intern(value: Optional[str]) -> int:
+        value = value or ''
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    arrays: Dict[str, np.ndarray] = {}
+    for name, getter in NUMERIC_COLUMNS.items():
+        arrays[name] = np.array([np.nan if getter(sub) is None else getter(sub) for sub in library],
+                                dtype='<f8')
+    for name, getter in STRING_COLUMNS.items():
+        arrays[name] = np.array([intern(getter(sub)) for sub in library], dtype='<u4')
+
+    driver_refs, driver_offsets = [], [0]
+    for sub in library:
+        driver_refs.extend(intern(d.get('name')) for d in sub.get('hardware_drivers', []))
+        driver_offsets.append(len(driver_refs))
+    arrays['driver_refs'] = np.array(driver_refs, dtype='<u4')
+    arrays['driver_offsets'] = np.array(driver_offsets, dtype='<u4')
+
+    encoded = [s.encode('utf-8') for s in strings]
+    arrays['string_offsets'] = np.cumsum([0] + [len(b) for b in encoded], dtype='<u8')
+    arrays['string_data'] = np.frombuffer(b''.join(encoded), dtype='u1')
+
+    documents = [json.dumps(sub, separators=(',', ':'), ensure_ascii=False).encode('utf-8') for sub in library]
+    arrays['document_offsets'] = np.cumsum([0] + [len(b) for b in documents], dtype='<u8')
+    arrays['document_data'] = np.frombuffer(b''.join(documents), dtype='u1')
+
+    header = {
+        'count': len(library),
+        'sources': [_source_record(path, base_dir) for path in sources],
+        'source_globs': [os.path.relpath(pattern, base_dir) for pattern in source_globs],
+        'sections': {},
+    }
+
+    # Section offsets depend on the header length, which depends on the offsets;
+    # iterate until the header size settles.
+    header_len = 0
+    while True:
+        offset = _align(_PREAMBLE.size + header_len)
+        for name, array in arrays.items():
+            header['sections'][name] = {'offset': offset, 'dtype': array.dtype.str, 'count': len(array)}
+            offset = _align(offset + array.nbytes)
+        header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        if len(header_bytes) == header_len:
+            break
+        header_len = len(header_bytes)
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(MAGIC, VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.write(b'\x00' * (header['sections'][name]['offset'] - f.tell()))
+            f.write(array.tobytes())
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class SnapshotLibrary(Sequence):
+    """
+    Read-only, memory-mapped view of a compiled snapshot.
+
+    Behaves like the list of subroutine dicts the JSON loader returns, but
+    nothing is decoded up front: numeric columns are zero-copy NumPy views
+    over the mapping, strings are decoded on first use, and a full document
+    is parsed only when that entry is accessed.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, header_len = _PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a MorphoLang snapshot.")
+        if version != VERSION:
+            raise ValueError(f"Unsupported snapshot version {version} in {path} (expected {VERSION}).")
+
+        header = json.loads(self._mmap[_PREAMBLE.size:_PREAMBLE.size + header_len])
+        self._count = header['count']
+        self._sections = header['sections']
+        base_dir = os.path.dirname(self.path)
+        self._sources = [dict(record, path=os.path.normpath(os.path.join(base_dir, record['path'])))
+                         for record in header['sources']]
+        self._source_globs = [os.path.normpath(os.path.join(base_dir, pattern))
+                              for pattern in header.get('source_globs', [])]
+        self._strings: Dict[int, str] = {}
+        self._documents: Dict[int, Dict] = {}
+
+    @property
+    def sources(self) -> List[str]:
+        return [record['path'] for record in self._sources]
+
+    def current_sources(self) -> List[str]:
+        """
+        The sources the snapshot would be built from now.
+
+        Recorded files that no glob pattern selected, followed by the current
+        matches of the patterns, so new subroutine files are included and
+        removed ones dropped.
+        """
+        explicit = [path for path in self.sources
+                    if not any(fnmatch.fnmatch(path, pattern) for pattern in self._source_globs)]
+        return explicit + [os.path.normpath(path) for path in expand_globs(self._source_globs)
+                           if os.path.normpath(path) not in explicit]
+
+    def is_fresh(self) -> bool:
+        """True if the source files, and the set of files matching the source globs, are unchanged."""
+        if self.current_sources() != self.sources:
+            return False
+        for record in self._sources:
+            try:
+                st = os.stat(record['path'])
+            except OSError:
+                return False
+            if (st.st_mtime_ns, st.st_size) != (record['mtime_ns'], record['size']):
+                return False
+        return True
+
+    def _section(self, name: str) -> np.ndarray:
+        info = self._sections[name]
+        if info['count'] == 0:
+            return np.empty(0, dtype=info['dtype'])
+        return np.frombuffer(self._mmap, dtype=info['dtype'], count=info['count'], offset=info['offset'])
+
+    def _string(self, ref: int) -> str:
+        value = self._strings.get(ref)
+        if value is None:
+            offsets = self._section('string_offsets')
+            base = self._sections['string_data']['offset']
+            value = self._mmap[base + int(offsets[ref]):base + int(offsets[ref + 1])].decode('utf-8')
+            self._strings[ref] = value
+        return value
+
+    def column(self, name: str):
+        """
+        Returns one column for every entry.
+
+        Numeric columns come back as read-only float64 views (NaN where the
+        field is absent); string columns as a list of str.
+        """
+        if name in NUMERIC_COLUMNS:
+            return self._section(name)
+        if name in STRING_COLUMNS:
+            return [self._string(int(ref)) for ref in self._section(name)]
+        raise KeyError(name)
+
+    def index_rows(self) -> Iterator[Tuple]:
+        """Index rows (see library_index.index_rows) straight from the columns."""
+        organ, species, action, domain = (self.column(name) for name in
+                                          ('organ', 'species', 'action', 'spatial_domain'))
+        low, high = self._section('vmem_low'), self._section('vmem_high')
+        refs, offsets = self._section('driver_refs'), self._section('driver_offsets')
+        for i in range(self._count):
+            drivers = tuple(self._string(int(ref)) for ref in refs[offsets[i]:offsets[i + 1]])
+            yield (organ[i], species[i], action[i], domain[i], drivers, float(low[i]), float(high[i]))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('snapshot index out of range')
+        doc = self._documents.get(index)
+        if doc is None:
+            offsets = self._section('document_offsets')
+            base = self._sections['document_data']['offset']
+            doc = json.loads(self._mmap[base + int(offsets[index]):base + int(offsets[index + 1])])
+            self._documents[index] = doc
+        return doc
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the subroutine database into a binary snapshot.")
+    parser.add_argument('sources', nargs='*', help="JSON sources (default: seed database + subroutines/*.json)")
+    parser.add_argument('-g', '--glob', action='append', dest='source_globs', metavar='PATTERN',
+                        help="Also include files matching PATTERN, and treat new matches as making the snapshot stale")
+    parser.add_argument('-o', '--output', help=f"Output path (default: {default_snapshot_path()})")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    path = build_snapshot(args.output, args.sources or None, args.source_globs)
+    snapshot = SnapshotLibrary(path)
+    print(f"[*] Wrote {len(snapshot)} subroutines from {len(snapshot.sources)} sources to {path}")
+
+
+if __name__ == "__main__":
+    main()
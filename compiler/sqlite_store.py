@@ -0,0 +1,339 @@
+"""
+SQLite-backed subroutine store.
+
+An alternative to the JSON database and the binary snapshot for corpora too
+large to hold in memory. The store is a single local SQLite file (stdlib
+sqlite3) with one row per subroutine:
+
+  * indexed, lowercased key columns for organ, species, action, spatial
+    domain and the sorted Vmem bounds, plus a driver-name table,
+  * the full subroutine document as compact JSON, decoded only for rows a
+    query returns.
+
+SubroutineStore answers the same lookups as SubroutineIndex and VmemIndex by
+pushing the filters down into SQL, so BioCompiler and BioDecoder use it
+directly instead of building in-memory indexes. Stores are opened read-only
+(`mode=ro` URI); each process, and each thread, gets its own connection, so
+any number of workers can share one file.
+
+Build the default store with:
+
+    python -m compiler.sqlite_store
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from instrumentation.log import configure_logging
+
+from .domain_vocabulary import default_vocabulary
+from .snapshot import _source_record, default_sources
+from .vmem_index import domains_match
+
+STORE_SUFFIX = '.sqlite'
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE sources (path TEXT NOT NULL, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL);
+CREATE TABLE subroutines (
+    pos INTEGER PRIMARY KEY,
+    organ TEXT NOT NULL, species TEXT NOT NULL, action TEXT NOT NULL, spatial_domain TEXT NOT NULL,
+    organ_key TEXT NOT NULL, species_key TEXT NOT NULL, action_key TEXT NOT NULL, domain_key TEXT NOT NULL,
+    vmem_low REAL, vmem_high REAL,
+    document TEXT NOT NULL
+);
+CREATE TABLE drivers (pos INTEGER NOT NULL, seq INTEGER NOT NULL, name TEXT NOT NULL, name_key TEXT NOT NULL,
+                      PRIMARY KEY (pos, seq)) WITHOUT ROWID;
+"""
+
+# Created after the bulk insert, which is much faster than maintaining them row by row.
+_INDEXES = """
+CREATE INDEX subroutines_target ON subroutines (organ_key, species_key, action_key);
+CREATE INDEX subroutines_vmem ON subroutines (domain_key, vmem_low, vmem_high);
+CREATE INDEX drivers_name ON drivers (name_key, pos);
+"""
+
+
+def default_store_path() -> str:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, 'database', 'library' + STORE_SUFFIX)
+
+
+def _row(sub: Dict, pos: int) -> Tuple:
+    target = sub.get('target_morphology', {})
+    state = sub.get('bioelectric_state', {})
+    organ, species, action = target.get('organ') or '', target.get('species') or '', target.get('action') or ''
+    domain = state.get('spatial_domain') or ''
+    vmem_range = state.get('target_vmem_range')
+    low, high = sorted(vmem_range) if vmem_range else (None, None)
+    return (pos, organ, species, action, domain, organ.lower(), species.lower(), action.lower(), domain.lower(),
+            low, high, json.dumps(sub, separators=(',', ':'), ensure_ascii=False))
+
+
+def build_store(output_path: Optional[str] = None, sources: Optional[List[str]] = None) -> str:
+    """
+    Loads the JSON sources into a new store and returns its path.
+
+    Sources are merged like snapshot.read_sources (the first occurrence of an
+    id wins) but parsed and inserted one file at a time. The store is built
+    under a temporary name, which is removed if the build fails.
+    """
+    output_path = os.path.abspath(output_path or default_store_path())
+    sources = sources or default_sources()
+    base_dir = os.path.dirname(output_path)
+
+    tmp_path = output_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(_SCHEMA)
+        seen, pos = set(), 0
+        for path in sources:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            rows, drivers = [], []
+            for sub in (data if isinstance(data, list) else [data]):
+                if sub.get('id') in seen:
+                    continue
+                seen.add(sub.get('id'))
+                rows.append(_row(sub, pos))
+                for seq, driver in enumerate(sub.get('hardware_drivers', [])):
+                    name = driver.get('name') or ''
+                    drivers.append((pos, seq, name, name.lower()))
+                pos += 1
+            conn.executemany("INSERT INTO subroutines VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.executemany("INSERT INTO drivers VALUES (?, ?, ?, ?)", drivers)
+        conn.executescript(_INDEXES)
+        conn.executemany("INSERT INTO sources VALUES (:path, :mtime_ns, :size)",
+                         [_source_record(path, base_dir) for path in sources])
+        conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                         [('schema_version', str(SCHEMA_VERSION)), ('count', str(pos))])
+        conn.execute("ANALYZE")
+        conn.commit()
+    except BaseException:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+    conn.close()
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+class SubroutineStore(Sequence):
+    """
+    Read-only view of a store, usable wherever a library list is.
+
+    Indexing and iteration decode documents on demand (a bounded LRU keeps
+    recently used ones), and the lookup methods mirror SubroutineIndex and
+    VmemIndex with the filtering done by SQLite; their memory use does not
+    grow with the number of stored subroutines.
+
+    BioDecoder's whole-library paths are the exception: predict_many's
+    segment tables and the likelihood scorer (predict_scored, rank_many)
+    read the key columns of every row once through index_rows() and keep
+    per-subroutine arrays, a few dozen bytes per row. No documents are
+    decoded for them.
+    """
+
+    def __init__(self, path: str, cache_size: int = 1024):
+        self.path = os.path.abspath(path)
+        self.cache_size = cache_size
+        self._local = threading.local()
+        self._documents: 'OrderedDict[int, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        try:
+            meta = dict(self._connection().execute("SELECT key, value FROM meta"))
+        except sqlite3.DatabaseError as e:
+            raise ValueError(f"{path} is not a MorphoLang store: {e}")
+        if meta.get('schema_version') != str(SCHEMA_VERSION):
+            raise ValueError(f"Unsupported store version {meta.get('schema_version')} in {path} "
+                             f"(expected {SCHEMA_VERSION}).")
+        self._count = int(meta['count'])
+        base_dir = os.path.dirname(self.path)
+        self._sources = [{'path': os.path.normpath(os.path.join(base_dir, path)), 'mtime_ns': mtime_ns, 'size': size}
+                         for path, mtime_ns, size in self._connection().execute("SELECT * FROM sources")]
+        self._domain_keys: Optional[List[str]] = None
+        self._domain_cache: Dict[Tuple[str, str], List[str]] = {}
+
+    def __reduce__(self):
+        # Connections cannot be pickled; workers reopen the file.
+        return (self.__class__, (self.path, self.cache_size))
+
+    def _connection(self) -> sqlite3.Connection:
+        """This thread's read-only connection, reopened after a fork."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(f"file:{quote(self.path)}?mode=ro", uri=True)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def close(self):
+        """Closes this thread's connection (it is reopened on next use)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @property
+    def sources(self) -> List[str]:
+        return [record['path'] for record in self._sources]
+
+    def is_fresh(self) -> bool:
+        """True if every source file is unchanged since the store was built."""
+        for record in self._sources:
+            try:
+                st = os.stat(record['path'])
+            except OSError:
+                return False
+            if (st.st_mtime_ns, st.st_size) != (record['mtime_ns'], record['size']):
+                return False
+        return True
+
+    # Sequence interface
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._materialize(range(*index.indices(self._count)))
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('store index out of range')
+        return self._materialize([index])[0]
+
+    def __iter__(self) -> Iterator[Dict]:
+        for (document,) in self._connection().execute("SELECT document FROM subroutines ORDER BY pos"):
+            yield json.loads(document)
+
+    def _materialize(self, positions) -> List[Dict]:
+        """Documents for library positions, decoding only those not in the LRU."""
+        positions = list(positions)
+        with self._lock:
+            found = {pos: self._documents[pos] for pos in positions if pos in self._documents}
+            for pos in found:
+                self._documents.move_to_end(pos)
+        missing = [pos for pos in positions if pos not in found]
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            rows = self._connection().execute(
+                f"SELECT pos, document FROM subroutines WHERE pos IN ({','.join('?' * len(chunk))})", chunk)
+            for pos, document in rows:
+                found[pos] = json.loads(document)
+        with self._lock:
+            for pos in missing:
+                self._documents[pos] = found[pos]
+            while len(self._documents) > self.cache_size:
+                self._documents.popitem(last=False)
+        return [found[pos] for pos in positions]
+
+    def _values(self, sql: str, params) -> List:
+        """The first column of every result row."""
+        return [value for (value,) in self._connection().execute(sql, params)]
+
+    def index_rows(self) -> Iterator[Tuple]:
+        """Index rows (see library_index.index_rows), streamed from SQL in library order."""
+        conn = self._connection()
+        drivers = conn.execute("SELECT pos, name FROM drivers ORDER BY pos, seq")
+        pending = next(drivers, None)
+        rows = conn.execute("SELECT pos, organ, species, action, spatial_domain, vmem_low, vmem_high "
+                            "FROM subroutines ORDER BY pos")
+        for pos, organ, species, action, domain, low, high in rows:
+            names = []
+            while pending is not None and pending[0] == pos:
+                names.append(pending[1])
+                pending = next(drivers, None)
+            yield (organ, species, action, domain, tuple(names),
+                   float('nan') if low is None else low, float('nan') if high is None else high)
+
+    # SubroutineIndex interface
+
+    def lookup(self, organ: str, species: str, action: Optional[str] = None) -> List[Dict]:
+        """Returns all subroutines for an organ/species pair, optionally narrowed by action."""
+        sql = "SELECT pos FROM subroutines WHERE organ_key = ? AND species_key = ?"
+        params = [(organ or '').lower(), (species or '').lower()]
+        if action is not None:
+            sql += " AND action_key = ?"
+            params.append(action.lower())
+        return self._materialize(self._values(sql + " ORDER BY pos", params))
+
+    def _domains(self, spatial_domain: str, exact: bool) -> List[str]:
+        """Stored domain keys matching a query: same canonical name, or related (see domains_match)."""
+        key = (spatial_domain.lower(), 'exact' if exact else 'related')
+        keys = self._domain_cache.get(key)
+        if keys is None:
+            if self._domain_keys is None:
+                self._domain_keys = self._values("SELECT DISTINCT domain_key FROM subroutines", ())
+            vocabulary = default_vocabulary()
+            if exact:
+                canonical = vocabulary.canonical(spatial_domain)
+                keys = [d for d in self._domain_keys if d and vocabulary.canonical(d) == canonical]
+            else:
+                keys = [d for d in self._domain_keys if domains_match(spatial_domain, d)]
+            self._domain_cache[key] = keys
+        return keys
+
+    def by_domain(self, spatial_domain: str) -> List[Dict]:
+        """Returns all subroutines targeting exactly this spatial domain (or a synonym of it)."""
+        keys = self._domains(spatial_domain, exact=True)
+        sql = f"SELECT pos FROM subroutines WHERE domain_key IN ({','.join('?' * len(keys))}) ORDER BY pos"
+        return self._materialize(self._values(sql, keys)) if keys else []
+
+    def by_driver(self, driver_name: str) -> List[Dict]:
+        """Returns all subroutines that list this hardware driver."""
+        return self._materialize(self._values(
+            "SELECT DISTINCT pos FROM drivers WHERE name_key = ? ORDER BY pos", [(driver_name or '').lower()]))
+
+    def domains(self) -> List[str]:
+        """Returns the distinct (canonical) spatial domains in the store."""
+        vocabulary = default_vocabulary()
+        keys = self._values("SELECT domain_key FROM subroutines WHERE domain_key != '' "
+                               "GROUP BY domain_key ORDER BY MIN(pos)", ())
+        return list(dict.fromkeys(vocabulary.canonical(key) for key in keys))
+
+    def drivers(self) -> List[str]:
+        """Returns the distinct (normalized) hardware driver names in the store."""
+        rows = self._connection().execute("SELECT name_key FROM drivers WHERE name_key != '' ORDER BY pos, seq")
+        return list(dict.fromkeys(name for (name,) in rows))
+
+    # VmemIndex interface
+
+    def query(self, vmem: float, spatial_domain: str, species: Optional[str] = None) -> List[Dict]:
+        """Returns every subroutine whose range contains `vmem` in a matching domain."""
+        keys = self._domains(spatial_domain, exact=False)
+        if not keys:
+            return []
+        sql = (f"SELECT pos FROM subroutines WHERE domain_key IN ({','.join('?' * len(keys))}) "
+               "AND vmem_low <= ? AND vmem_high >= ?")
+        params = keys + [float(vmem), float(vmem)]
+        if species:
+            sql += " AND species_key = ?"
+            params.append(species.lower())
+        return self._materialize(self._values(sql + " ORDER BY pos", params))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load the subroutine database into a SQLite store.")
+    parser.add_argument('sources', nargs='*', help="JSON sources (default: seed database + subroutines/*.json)")
+    parser.add_argument('-o', '--output', help=f"Output path (default: {default_store_path()})")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    path = build_store(args.output, args.sources or None)
+    store = SubroutineStore(path)
+    print(f"[*] Wrote {len(store)} subroutines from {len(store.sources)} sources to {path}")
+
+
+if __name__ == "__main__":
+    main()
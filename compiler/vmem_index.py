@@ -0,0 +1,247 @@
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .domain_vocabulary import default_vocabulary
+from .library_index import index_rows
+
+
+def domains_match(query: str, domain: str) -> bool:
+    """The decoder's domain rule: the same domain, or one is part of the other (see DomainVocabulary)."""
+    return default_vocabulary().related(query, domain)
+
+
+class IntervalTree:
+    """
+    Centered interval tree over closed intervals [low, high].
+
+    Stabbing queries return the payloads of every interval containing a point
+    in O(log n + k).
+    """
+
+    __slots__ = ('center', 'by_low', 'by_high', 'left', 'right')
+
+    def __init__(self, intervals: List[Tuple[float, float, int]]):
+        points = sorted(p for low, high, _ in intervals for p in (low, high))
+        self.center = points[len(points) // 2] if points else 0.0
+
+        left, right, here = [], [], []
+        for interval in intervals:
+            low, high, _ = interval
+            if high < self.center:
+                left.append(interval)
+            elif low > self.center:
+                right.append(interval)
+            else:
+                here.append(interval)
+
+        self.by_low = sorted(here, key=lambda iv: iv[0])
+        self.by_high = sorted(here, key=lambda iv: iv[1], reverse=True)
+        self.left = IntervalTree(left) if left else None
+        self.right = IntervalTree(right) if right else None
+
+    def stab(self, point: float) -> List[int]:
+        """Returns the payloads of all intervals that contain `point` (none for NaN)."""
+        found = []
+        if point != point:
+            return found
+        node = self
+        while node is not None:
+            if point < node.center:
+                for low, _, payload in node.by_low:
+                    if low > point:
+                        break
+                    found.append(payload)
+                node = node.left
+            elif point > node.center:
+                for _, high, payload in node.by_high:
+                    if high < point:
+                        break
+                    found.append(payload)
+                node = node.right
+            else:
+                found.extend(payload for _, _, payload in node.by_low)
+                break
+        return found
+
+
+class VmemIndex:
+    """
+    Voltage-range index over a subroutine library for BioDecoder.predict.
+
+    Intervals from `target_vmem_range` are partitioned by normalized
+    (spatial_domain, species), with one IntervalTree per partition. A query
+    resolves the matching domain partitions once per distinct domain string
+    (cached), then stabs each tree. Results come back in library order, so
+    they are identical to the linear scan.
+    """
+
+    def __init__(self, library: List[Dict]):
+        self.library = library
+        self._partitions: Dict[str, Dict[str, IntervalTree]] = {}
+        self._domain_cache: Dict[str, List[str]] = {}
+
+        grouped: Dict[str, Dict[str, List[Tuple[float, float, int]]]] = {}
+        for pos, (_, species, _, domain, _, min_v, max_v) in enumerate(index_rows(library)):
+            if min_v != min_v:  # no target range (NaN)
+                continue
+            domain, species = domain.lower(), species.lower()
+            grouped.setdefault(domain, {}).setdefault(species, []).append((min_v, max_v, pos))
+
+        for domain, by_species in grouped.items():
+            self._partitions[domain] = {
+                species: IntervalTree(intervals) for species, intervals in by_species.items()
+            }
+
+    def _matching_domains(self, spatial_domain: str) -> List[str]:
+        """Domain partitions related to the query in the domain vocabulary."""
+        query = spatial_domain.lower()
+        domains = self._domain_cache.get(query)
+        if domains is None:
+            domains = [d for d in self._partitions if domains_match(query, d)]
+            self._domain_cache[query] = domains
+        return domains
+
+    def query(self, vmem: float, spatial_domain: str, species: Optional[str] = None) -> List[Dict]:
+        """Returns every subroutine whose range contains `vmem` in a matching domain."""
+        positions = []
+        species_key = species.lower() if species else None
+        for domain in self._matching_domains(spatial_domain):
+            trees = self._partitions[domain]
+            if species_key is not None:
+                tree = trees.get(species_key)
+                if tree is not None:
+                    positions.extend(tree.stab(vmem))
+            else:
+                for tree in trees.values():
+                    positions.extend(tree.stab(vmem))
+        positions.sort()
+        return [self.library[pos] for pos in positions]
+
+
+class VmemSegmentTable:
+    """
+    Vectorized (vmem, domain label) -> subroutine lookup for whole Vmem maps.
+
+    All range endpoints in the library are compiled into one sorted breakpoint
+    array. For breakpoints b[0] < ... < b[m-1] the real line splits into 2m+1
+    regions (open gaps and the breakpoints themselves); a value's region is
+    `searchsorted(b, v, 'left') + searchsorted(b, v, 'right')`. For every
+    domain label the table stores the first subroutine (in library order)
+    whose closed range covers each region, or -1. Classifying an image is then
+    two `searchsorted` calls and one fancy-indexing gather.
+    """
+
+    def __init__(self, library: List[Dict], domain_names: Sequence[Optional[str]],
+                 species: Optional[str] = None):
+        self.library = library
+        self.domain_names = list(domain_names)
+
+        rows = list(index_rows(library))
+        ranges = np.array([row[5:7] for row in rows], dtype=np.float64).reshape(-1, 2)
+        self.breakpoints = np.unique(ranges[~np.isnan(ranges[:, 0])])
+        low_region = 2 * np.searchsorted(self.breakpoints, ranges[:, 0]) + 1
+        high_region = 2 * np.searchsorted(self.breakpoints, ranges[:, 1]) + 1
+
+        # The extra last row is the background label: it never matches.
+        n_regions = 2 * len(self.breakpoints) + 1
+        self.table = np.full((len(self.domain_names) + 1, n_regions), -1, dtype=np.int32)
+
+        species_key = species.lower() if species else None
+        for label, name in enumerate(self.domain_names):
+            if name is None:
+                continue
+            candidates = [
+                pos for pos, row in enumerate(rows)
+                if row[5] == row[5] and domains_match(name, row[3]) and
+                (species_key is None or row[1].lower() == species_key)
+            ]
+            # Paint in reverse so earlier library entries win overlaps.
+            row = self.table[label]
+            for pos in reversed(candidates):
+                row[low_region[pos]:high_region[pos] + 1] = pos
+
+        self._build_buckets()
+
+    def _build_buckets(self, oversample: int = 64):
+        """
+        Precomputes a uniform bucket grid over the breakpoints.
+
+        Bucket index is f(v) = floor((v - b[0]) * scale), which is monotonic in
+        v, so a bucket holding no breakpoint maps all of its values to a single
+        region. Only pixels falling in buckets that hold a breakpoint need the
+        binary search, which keeps the hot path to a few streaming passes.
+        """
+        self._bucket_regions = None
+        points = self.breakpoints
+        if len(points) < 2:
+            return
+        n_buckets = oversample * len(points)
+        self._bucket_origin = points[0]
+        self._bucket_scale = n_buckets / (points[-1] - points[0])
+        self._bucket_count = n_buckets
+
+        point_buckets = self._bucket_of(points)
+        # Region of a clean bucket k: 2 * (number of breakpoints in buckets < k).
+        buckets = np.arange(-1, n_buckets + 2)
+        self._bucket_regions = (2 * np.searchsorted(point_buckets, buckets, side='left')).astype(np.intp)
+        self._bucket_dirty = np.zeros(len(buckets), dtype=bool)
+        self._bucket_dirty[point_buckets + 1] = True
+
+    def _bucket_of(self, values: np.ndarray) -> np.ndarray:
+        scaled = np.subtract(values, self._bucket_origin, dtype=np.float64)
+        scaled *= self._bucket_scale
+        np.floor(scaled, out=scaled)
+        scaled[np.isnan(scaled)] = self._bucket_count + 1
+        np.clip(scaled, -1, self._bucket_count + 1, out=scaled)
+        return scaled.astype(np.intp)
+
+    def _regions(self, vmem_map: np.ndarray) -> np.ndarray:
+        """Maps each value to its breakpoint region index (0 .. 2m)."""
+        points = self.breakpoints
+        if self._bucket_regions is None:
+            region = np.searchsorted(points, vmem_map, side='left')
+            region += np.searchsorted(points, vmem_map, side='right')
+            return region
+
+        buckets = self._bucket_of(vmem_map)
+        buckets += 1
+        region = self._bucket_regions[buckets]
+        dirty = self._bucket_dirty[buckets]
+        if dirty.any():
+            values = vmem_map[dirty]
+            region[dirty] = (np.searchsorted(points, values, side='left') +
+                             np.searchsorted(points, values, side='right'))
+        return region
+
+    def classify(self, vmem_map: np.ndarray, domain_labels: np.ndarray) -> np.ndarray:
+        """
+        Classifies every pixel at once.
+
+        Args:
+            vmem_map (np.ndarray): Vmem values in mV, any shape.
+            domain_labels (np.ndarray): Integer labels indexing `domain_names`, same shape.
+                Labels outside [0, len(domain_names)) are background.
+
+        Returns:
+            np.ndarray: int32 library positions, -1 where nothing matches.
+        """
+        vmem_map = np.asarray(vmem_map)
+        domain_labels = np.asarray(domain_labels)
+        if vmem_map.shape != domain_labels.shape:
+            raise ValueError("vmem_map and domain_labels must have the same shape.")
+
+        region = self._regions(vmem_map)
+
+        background = len(self.domain_names)
+        labels = domain_labels.astype(np.intp, copy=True)
+        labels[(labels < 0) | (labels >= background)] = background
+        return self.table[labels, region]
+
+
+def label_names(domain_names: Union[Sequence[Optional[str]], Mapping[int, str]]) -> Tuple[Optional[str], ...]:
+    """Normalizes a label -> domain name mapping into a dense tuple indexed by label."""
+    if isinstance(domain_names, Mapping):
+        size = max(domain_names, default=-1) + 1
+        return tuple(domain_names.get(label) for label in range(size))
+    return tuple(domain_names)
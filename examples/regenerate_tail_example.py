@@ -12,8 +12,10 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from compiler.experiment_gen import BioCompiler
+from instrumentation.log import configure_logging
 
 def main():
+    configure_logging()
     print("=" * 60)
     print("MorphoLang Example: Tail Regeneration")
     print("=" * 60)
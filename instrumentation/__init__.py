@@ -0,0 +1,12 @@
+"""
+MorphoLang Instrumentation Module
+
+This module contains the profiling surface shared by the compiler, decoder
+and validator: named timing spans, counters and histograms exportable as
+JSON or Prometheus text, and the leveled logger that replaces console prints.
+"""
+
+from .log import configure_logging, get_logger
+from .metrics import Counter, Histogram, MetricsRegistry
+
+__all__ = ['Counter', 'Histogram', 'MetricsRegistry', 'configure_logging', 'get_logger']
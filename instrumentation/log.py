@@ -0,0 +1,58 @@
+"""
+Leveled logging for the MorphoLang packages.
+
+Library code logs through `get_logger(__name__)` instead of printing. Until
+a program calls `configure_logging`, only warnings and errors are shown
+(through Python's last-resort stderr handler) and info calls return after a
+cached level check. Command-line entry points call `configure_logging()` to
+get the familiar console output on stdout:
+
+    [*] Compiling request: Build 'eye' in 'Xenopus laevis'...
+    [!] Warning: Snapshot ... is stale; loading its JSON sources instead.
+"""
+
+import logging
+import sys
+from typing import Optional, TextIO
+
+ROOT_LOGGER = 'morpholang'
+
+_PREFIXES = {
+    logging.DEBUG: '[*] ',
+    logging.INFO: '[*] ',
+    logging.WARNING: '[!] Warning: ',
+    logging.ERROR: '[!] Error: ',
+    logging.CRITICAL: '[!] Error: ',
+}
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Formats records the way the command-line tools have always printed them."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return _PREFIXES.get(record.levelno, '') + super().format(record)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger for a module, e.g. get_logger(__name__) -> 'morpholang.compiler.experiment_gen'."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+_handler: Optional[logging.Handler] = None
+
+
+def configure_logging(level: int = logging.INFO, stream: Optional[TextIO] = None):
+    """
+    Sends MorphoLang log records at `level` and above to `stream` (default: stdout).
+
+    Calling it again replaces the previous configuration.
+    """
+    global _handler
+    logger = logging.getLogger(ROOT_LOGGER)
+    if _handler is not None:
+        logger.removeHandler(_handler)
+    _handler = logging.StreamHandler(stream or sys.stdout)
+    _handler.setFormatter(ConsoleFormatter())
+    logger.addHandler(_handler)
+    logger.setLevel(level)
+    logger.propagate = False
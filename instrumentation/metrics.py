@@ -0,0 +1,248 @@
+"""
+Named spans, counters and histograms.
+
+Instrumentation is off by default. While it is off, `span()` returns one
+shared no-op context manager and `count()` returns immediately, so the
+calls left in the compiler, decoder and validator hot paths cost a function
+call each. Turn it on with `enable()` (or MORPHOLANG_METRICS=1 in the
+environment), run the workload, then export:
+
+    from instrumentation import metrics
+    metrics.enable()
+    ...
+    print(metrics.export_prometheus())
+
+Every span records its duration into the histogram
+`morpholang_span_seconds{span="<name>"}`. The standard spans are:
+
+    library_load  parsing a library file (cache misses only)
+    lookup        BioCompiler.find_subroutine / find_subroutines
+    decode        BioDecoder.predict
+    render        BioCompiler.generate_protocol
+    image_read    reading donor/acceptor images from disk
+    blur, ratio   the two halves of the ratiometric kernel
+    verify        BioStateValidator.verify_state / verify_domains
+
+Metrics are per process: worker pools record into their own registries.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+PREFIX = 'morpholang_'
+SPAN_HISTOGRAM = 'span_seconds'
+DEFAULT_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    """A monotonically increasing count."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Observation counts in fixed upper-bound buckets, plus count, sum and max."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot: above every bucket (+Inf)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[slot] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """(upper bound, observations <= bound) pairs, ending with (inf, count)."""
+        total, pairs = 0, []
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            total += n
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (0 when empty)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class _Span:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class MetricsRegistry:
+    """Named counters and histograms, created on first use (see the module docstring)."""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._counters: Dict[Tuple[str, Labels], Counter] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._spans: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, **labels) -> Counter:
+        key = (name, _labels(labels))
+        metric = self._counters.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._counters.setdefault(key, Counter())
+        return metric
+
+    def histogram(self, name: str, buckets: Optional[Sequence[float]] = None, **labels) -> Histogram:
+        key = (name, _labels(labels))
+        metric = self._histograms.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._histograms.setdefault(key, Histogram(buckets or DEFAULT_BUCKETS))
+        return metric
+
+    def span(self, name: str):
+        """Context manager timing one named stage (a no-op while disabled)."""
+        if not self.enabled:
+            return _NULL_SPAN
+        histogram = self._spans.get(name)
+        if histogram is None:
+            histogram = self._spans[name] = self.histogram(SPAN_HISTOGRAM, span=name)
+        return _Span(histogram)
+
+    def count(self, name: str, amount: float = 1, **labels):
+        """Increments a counter (a no-op while disabled)."""
+        if self.enabled:
+            self.counter(name, **labels).inc(amount)
+
+    def reset(self):
+        """Drops every metric."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._spans.clear()
+
+    def to_dict(self) -> Dict:
+        """All metrics as plain data: counters and histograms, each with name and labels."""
+        return {
+            'counters': [{'name': name, 'labels': dict(labels), 'value': metric.value}
+                         for (name, labels), metric in sorted(self._counters.items())],
+            'histograms': [{'name': name, 'labels': dict(labels), 'count': metric.count,
+                            'sum': metric.sum, 'max': metric.max,
+                            'mean': metric.sum / metric.count if metric.count else 0.0,
+                            'p50': metric.quantile(0.5), 'p99': metric.quantile(0.99),
+                            'buckets': [[bound, n] for bound, n in metric.cumulative()[:-1]]}
+                           for (name, labels), metric in sorted(self._histograms.items())],
+        }
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for name in sorted({name for name, _ in self._counters}):
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for (metric_name, labels), metric in sorted(self._counters.items()):
+                if metric_name == name:
+                    lines.append(f"{PREFIX}{name}{_format_labels(labels)} {_format_value(metric.value)}")
+        for name in sorted({name for name, _ in self._histograms}):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for (metric_name, labels), metric in sorted(self._histograms.items()):
+                if metric_name != name:
+                    continue
+                for bound, n in metric.cumulative():
+                    le = '+Inf' if bound == float('inf') else _format_value(bound)
+                    lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels + (('le', le),))} {n}")
+                lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {_format_value(metric.sum)}")
+                lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {metric.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry(enabled=os.environ.get('MORPHOLANG_METRICS', '') not in ('', '0'))
+
+
+def enable():
+    registry.enabled = True
+
+
+def disable():
+    registry.enabled = False
+
+
+def span(name: str):
+    """Times a named stage in the default registry (a no-op while disabled)."""
+    return registry.span(name)
+
+
+def count(name: str, amount: float = 1, **labels):
+    """Increments a counter in the default registry (a no-op while disabled)."""
+    registry.count(name, amount, **labels)
+
+
+def export_json(indent: Optional[int] = 2) -> str:
+    return registry.to_json(indent)
+
+
+def export_prometheus() -> str:
+    return registry.to_prometheus()
@@ -0,0 +1,29 @@
+"""
+Shared-memory helpers used across packages.
+
+The verification service, the frame ring and the tissue field simulation
+all map blocks created by another process; this module holds what they
+share, so none of them has to import another's package for it.
+"""
+
+from multiprocessing import resource_tracker, shared_memory
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    Maps an existing shared-memory block without registering it with the resource tracker.
+
+    The creating process owns the block. A tracked attach would let this
+    process's tracker unlink it at exit, or, when both processes share a
+    tracker, drop the owner's own registration.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        pass
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
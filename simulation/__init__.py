@@ -0,0 +1,31 @@
+"""
+MorphoLang Simulation Module
+
+This module contains in-silico models used to tune interventions before
+they are run at the bench, such as a Monte Carlo simulator for the
+homeostatic control loops described in each subroutine and a lattice model
+of how hardware drivers shape tissue Vmem.
+"""
+
+import importlib
+
+__all__ = ['ControlLoopSimulator', 'DriftModel', 'TissueField']
+
+# Submodules are imported on first access, so that `python -m simulation.control_loop`
+# (or tissue_field, sweep) does not find its own module already imported by the package.
+_EXPORTS = {
+    'ControlLoopSimulator': '.control_loop',
+    'DriftModel': '.control_loop',
+    'TissueField': '.tissue_field',
+}
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module, __name__), name)
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
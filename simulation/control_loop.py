@@ -0,0 +1,275 @@
+"""
+Monte Carlo simulation of a subroutine's homeostatic control loop.
+
+Each embryo's Vmem is modelled as an Ornstein-Uhlenbeck process: once the
+intervention has set it inside `target_vmem_range`, the tissue relaxes back
+toward its endogenous setpoint while noise perturbs it. At every monitoring
+checkpoint Vmem is measured (with imaging noise) and the `feedback_mechanism`
+policy is applied: a reading above `if_vmem_drifts_above` or below
+`if_vmem_drifts_below` triggers the corrective action, which pulls Vmem back
+toward the middle of the target range.
+
+An embryo terminates early once it has held the target range continuously
+for `duration_hours`, and otherwise at the `max_duration_hours` safety
+cutoff. All embryos are advanced together as NumPy arrays, so thousands of
+trajectories cost about as much as a handful.
+
+Usage:
+    python -m simulation.control_loop [--embryos N] [--seed S]
+"""
+
+import argparse
+import re
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from instrumentation.log import configure_logging
+
+OUTCOMES = ('target_reached', 'safety_cutoff')
+
+
+class DriftModel:
+    """Stochastic Vmem dynamics of the treated tissue."""
+
+    def __init__(self, setpoint: Optional[float] = None, relaxation_hours: float = 24.0,
+                 noise_mv: float = 1.0, measurement_noise_mv: float = 1.0,
+                 correction_efficacy: float = 0.8, initial_spread_mv: float = 2.0):
+        """
+        Args:
+            setpoint (float, optional): Endogenous Vmem the tissue relaxes back to (mV).
+                Defaults to 10 mV beyond the upper drift threshold, i.e. the tissue
+                slowly depolarizes out of the target state.
+            relaxation_hours (float): Time constant of the return to the setpoint.
+            noise_mv (float): Diffusion of Vmem, in mV per sqrt(hour).
+            measurement_noise_mv (float): Standard deviation of a single imaging reading.
+            correction_efficacy (float): Fraction of the distance to the target centre
+                removed by one corrective action (0..1).
+            initial_spread_mv (float): Standard deviation of Vmem around the target
+                centre right after the initial intervention.
+        """
+        if relaxation_hours <= 0:
+            raise ValueError("relaxation_hours must be positive.")
+        if not 0.0 <= correction_efficacy <= 1.0:
+            raise ValueError("correction_efficacy must be between 0 and 1.")
+        self.setpoint = setpoint
+        self.relaxation_hours = relaxation_hours
+        self.noise_mv = noise_mv
+        self.measurement_noise_mv = measurement_noise_mv
+        self.correction_efficacy = correction_efficacy
+        self.initial_spread_mv = initial_spread_mv
+
+
+def parse_monitoring_frequency(text: str, max_hours: float) -> List[float]:
+    """
+    Turns a free-text `monitoring_frequency` into checkpoint times (hours).
+
+    Understands phrases such as "Every 6 hours ...", "daily", "hourly" and
+    multi-phase schedules like "Every 4 hours for first 24h, then every
+    12 hours ..." or "... during 48h treatment window, then daily ...".
+    The last phase runs until `max_hours`. T+0 is always included.
+    """
+    checkpoints = [0.0]
+    start = 0.0
+    phases = re.split(r'\bthen\b', text.lower())
+    for i, phase in enumerate(phases):
+        match = re.search(r'every\s+(\d+(?:\.\d+)?)\s*(?:h\b|hours?\b)', phase)
+        if match:
+            interval = float(match.group(1))
+        elif 'daily' in phase or re.search(r'every\s+day\b', phase):
+            interval = 24.0
+        elif 'hourly' in phase or re.search(r'every\s+hour\b', phase):
+            interval = 1.0
+        else:
+            continue
+
+        end = max_hours
+        bound = re.search(r'(?:for (?:the )?first|during|for)\s+(\d+(?:\.\d+)?)\s*h', phase)
+        if bound and i < len(phases) - 1:
+            end = min(start + float(bound.group(1)), max_hours)
+
+        t = start + interval
+        while t <= end + 1e-9:
+            checkpoints.append(t)
+            t += interval
+        start = checkpoints[-1] if end >= max_hours else end
+        if start >= max_hours:
+            break
+
+    if len(checkpoints) == 1:
+        raise ValueError(f"Could not parse monitoring frequency: '{text}'")
+    return sorted(set(checkpoints))
+
+
+class ControlLoopSimulator:
+    """Runs a subroutine's feedback policy against many stochastic Vmem trajectories."""
+
+    def __init__(self, subroutine: Dict, drift: Optional[DriftModel] = None, dt_hours: float = 0.25):
+        """
+        Args:
+            subroutine (Dict): Library entry with 'bioelectric_state' and 'control_loop'.
+            drift (DriftModel, optional): Tissue dynamics (default parameters if omitted).
+            dt_hours (float): Integration step.
+        """
+        control_loop = subroutine.get('control_loop')
+        if not control_loop:
+            raise ValueError(f"Subroutine '{subroutine.get('id')}' has no control_loop to simulate.")
+        if dt_hours <= 0:
+            raise ValueError("dt_hours must be positive.")
+
+        state = subroutine['bioelectric_state']
+        feedback = control_loop.get('feedback_mechanism', {})
+        self.subroutine = subroutine
+        self.control_loop = control_loop
+        self.dt_hours = dt_hours
+        self.target_range = tuple(sorted(state['target_vmem_range']))
+        self.duration_hours = float(state['duration_hours'])
+        self.max_hours = float(control_loop['termination_criteria']['max_duration_hours'])
+        self.thresholds = (float(feedback.get('if_vmem_drifts_above', self.target_range[1])),
+                           float(feedback.get('if_vmem_drifts_below', self.target_range[0])))
+        self.drift = drift or DriftModel()
+
+    def default_checkpoints(self) -> List[float]:
+        """Checkpoints parsed from the subroutine's monitoring_frequency."""
+        return parse_monitoring_frequency(self.control_loop['monitoring_frequency'], self.max_hours)
+
+    def simulate(self, n_embryos: int = 1000, checkpoints: Optional[Sequence[float]] = None,
+                 thresholds: Optional[Tuple[float, float]] = None, seed: Optional[int] = 0,
+                 keep_trajectories: bool = False) -> Dict:
+        """
+        Simulates `n_embryos` independent trajectories under one monitoring schedule.
+
+        Args:
+            n_embryos (int): Number of Monte Carlo trajectories.
+            checkpoints (Sequence[float], optional): Measurement times in hours
+                (default: parsed from monitoring_frequency).
+            thresholds (Tuple[float, float], optional): (drift_above, drift_below)
+                override for the feedback policy.
+            seed (int, optional): Random seed.
+            keep_trajectories (bool): Include the full (steps, embryos) Vmem array.
+
+        Returns:
+            Dict: Summary with 'time_in_range', 'interventions', 'outcomes',
+            'termination_hours' and per-embryo arrays under 'per_embryo'.
+        """
+        if n_embryos < 1:
+            raise ValueError("n_embryos must be at least 1.")
+        if checkpoints is None:
+            checkpoints = self.default_checkpoints()
+        above, below = thresholds if thresholds is not None else self.thresholds
+        drift = self.drift
+        low, high = self.target_range
+        centre = (low + high) / 2.0
+        setpoint = drift.setpoint if drift.setpoint is not None else above + 10.0
+
+        dt = self.dt_hours
+        n_steps = int(round(self.max_hours / dt))
+        checkpoint_steps = sorted({int(round(t / dt)) for t in checkpoints if 0 <= t <= self.max_hours})
+        is_checkpoint = np.zeros(n_steps + 1, dtype=bool)
+        is_checkpoint[checkpoint_steps] = True
+        hold_steps = int(np.ceil(self.duration_hours / dt))
+
+        # Exact OU update over one step: v' = mu + (v - mu) * decay + N(0, step_sd)
+        decay = np.exp(-dt / drift.relaxation_hours)
+        step_sd = drift.noise_mv * np.sqrt(drift.relaxation_hours / 2.0 * (1.0 - decay ** 2))
+
+        rng = np.random.default_rng(seed)
+        vmem = centre + rng.normal(0.0, drift.initial_spread_mv, n_embryos)
+        active = np.ones(n_embryos, dtype=bool)
+        steps_in_range = np.zeros(n_embryos, dtype=np.int64)
+        steps_active = np.zeros(n_embryos, dtype=np.int64)
+        run = np.zeros(n_embryos, dtype=np.int64)
+        corrections_above = np.zeros(n_embryos, dtype=np.int64)
+        corrections_below = np.zeros(n_embryos, dtype=np.int64)
+        imaging_sessions = np.zeros(n_embryos, dtype=np.int64)
+        reached_step = np.full(n_embryos, -1, dtype=np.int64)
+        trajectories = np.empty((n_steps + 1, n_embryos), dtype=np.float32) if keep_trajectories else None
+
+        for step in range(n_steps + 1):
+            if step:
+                noise = rng.normal(0.0, step_sd, n_embryos)
+                vmem = np.where(active, setpoint + (vmem - setpoint) * decay + noise, vmem)
+
+            if is_checkpoint[step]:
+                reading = vmem + rng.normal(0.0, drift.measurement_noise_mv, n_embryos)
+                too_high = active & (reading > above)
+                too_low = active & (reading < below)
+                corrections_above += too_high
+                corrections_below += too_low
+                imaging_sessions += active
+                correct = too_high | too_low
+                vmem = np.where(correct, vmem + drift.correction_efficacy * (centre - vmem), vmem)
+
+            inside = (vmem >= low) & (vmem <= high)
+            if step:
+                steps_active += active
+                steps_in_range += active & inside
+            run = np.where(inside, run + 1, 0)
+            done = active & (run > hold_steps)
+            reached_step[done] = step
+            active &= ~done
+            if trajectories is not None:
+                trajectories[step] = vmem
+            if not active.any():
+                break
+
+        termination_hours = np.where(reached_step >= 0, reached_step, n_steps) * dt
+        time_in_range = steps_in_range / np.maximum(steps_active, 1)
+        interventions = corrections_above + corrections_below
+        reached = reached_step >= 0
+
+        result = {
+            'subroutine': self.subroutine.get('id'),
+            'embryos': n_embryos,
+            'checkpoints': [step * dt for step in checkpoint_steps],
+            'thresholds': {'above': above, 'below': below},
+            'time_in_range': _distribution(time_in_range),
+            'interventions': dict(_distribution(interventions),
+                                  above=float(corrections_above.mean()),
+                                  below=float(corrections_below.mean())),
+            'imaging_sessions': _distribution(imaging_sessions),
+            'outcomes': {'target_reached': float(reached.mean()), 'safety_cutoff': float((~reached).mean())},
+            'termination_hours': _distribution(termination_hours),
+            'per_embryo': {
+                'time_in_range': time_in_range,
+                'interventions': interventions,
+                'imaging_sessions': imaging_sessions,
+                'termination_hours': termination_hours,
+                'outcome': np.where(reached, OUTCOMES[0], OUTCOMES[1]),
+            },
+        }
+        if trajectories is not None:
+            result['trajectories'] = trajectories[:step + 1]
+        return result
+
+
+def _distribution(values: np.ndarray) -> Dict[str, float]:
+    p5, p50, p95 = np.percentile(values, [5, 50, 95])
+    return {'mean': float(np.mean(values)), 'p5': float(p5), 'p50': float(p50), 'p95': float(p95)}
+
+
+def main(argv=None):
+    from compiler.experiment_gen import BioCompiler
+
+    parser = argparse.ArgumentParser(description="Simulate each library control loop under stochastic drift.")
+    parser.add_argument('--embryos', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    compiler = BioCompiler()
+    print(f"{'subroutine':<45} {'sessions':>8} {'in range':>9} {'interv.':>8} {'reached':>8} {'ms':>7}")
+    for subroutine in compiler.library:
+        if not subroutine.get('control_loop'):
+            continue
+        started = time.perf_counter()
+        result = ControlLoopSimulator(subroutine).simulate(args.embryos, seed=args.seed)
+        elapsed = time.perf_counter() - started
+        print(f"{subroutine['id']:<45} {len(result['checkpoints']):>8} "
+              f"{result['time_in_range']['mean']:>9.1%} {result['interventions']['mean']:>8.2f} "
+              f"{result['outcomes']['target_reached']:>8.1%} {elapsed * 1e3:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
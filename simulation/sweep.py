@@ -0,0 +1,250 @@
+"""
+Parameter sweeps over monitoring schedules and feedback thresholds.
+
+Every (checkpoint schedule, drift thresholds) pair is simulated with the
+control loop simulator on a process pool. Each finished evaluation is
+appended to a JSON-lines cache file keyed by a hash of everything that
+determines its result (subroutine, drift model, schedule, thresholds,
+embryo count, seed, time step), so an interrupted sweep resumes where it
+stopped and repeated sweeps only simulate what is new.
+
+All candidates share one seed (common random numbers), so differences
+between schedules reflect the schedules rather than sampling noise.
+
+Usage:
+    python -m simulation.sweep ORGAN SPECIES [--cache PATH] [--embryos N] [--workers N]
+                                             [--min-time-in-range 0.9]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from compiler.experiment_gen import CHECKPOINT_TIERS, default_checkpoints
+from instrumentation.log import configure_logging
+from .control_loop import ControlLoopSimulator, DriftModel
+
+DEFAULT_INTERVALS = (2, 3, 4, 6, 8, 12, 24)
+DEFAULT_MARGINS = (-5.0, -2.5, 0.0, 2.5, 5.0)
+
+_worker_simulator: Optional[ControlLoopSimulator] = None
+
+
+def uniform_schedule(interval: float, max_hours: float) -> List[float]:
+    """Checkpoints every `interval` hours from T+0 through `max_hours`."""
+    count = int(max_hours // interval)
+    schedule = [i * interval for i in range(count + 1)]
+    if schedule[-1] < max_hours:
+        schedule.append(float(max_hours))
+    return schedule
+
+
+def candidate_schedules(simulator: ControlLoopSimulator,
+                        intervals: Sequence[float] = DEFAULT_INTERVALS) -> Dict[str, List[float]]:
+    """
+    Named schedules to try: the protocol's tiered timeline, the subroutine's own
+    monitoring_frequency, every tier truncated to this intervention, and uniform
+    intervals.
+    """
+    max_hours = simulator.max_hours
+    schedules = {'protocol_default': [float(t) for t in default_checkpoints(max_hours)]}
+    try:
+        schedules['monitoring_frequency'] = simulator.default_checkpoints()
+    except ValueError:
+        pass
+    for limit, checkpoints in CHECKPOINT_TIERS:
+        name = f"tier_{limit or 'long'}h"
+        schedules[name] = [float(t) for t in checkpoints if t <= max_hours]
+    for interval in intervals:
+        schedules[f"every_{interval:g}h"] = uniform_schedule(interval, max_hours)
+
+    unique, seen = {}, set()
+    for name, schedule in schedules.items():
+        if tuple(schedule) not in seen:
+            seen.add(tuple(schedule))
+            unique[name] = schedule
+    return unique
+
+
+def candidate_thresholds(simulator: ControlLoopSimulator,
+                         margins: Sequence[float] = DEFAULT_MARGINS) -> List[Tuple[float, float]]:
+    """
+    (drift_above, drift_below) pairs: the subroutine's own thresholds plus the
+    target range widened (positive margin) or narrowed (negative) by each margin.
+    """
+    low, high = simulator.target_range
+    pairs = [simulator.thresholds]
+    for margin in margins:
+        pair = (high + margin, low - margin)
+        if pair[0] >= pair[1] and pair not in pairs:
+            pairs.append(pair)
+    return pairs
+
+
+def evaluation_key(subroutine: Dict, drift: DriftModel, schedule: Sequence[float],
+                   thresholds: Tuple[float, float], n_embryos: int, seed: int, dt_hours: float) -> str:
+    """Cache key covering every input that determines a simulation's result."""
+    payload = json.dumps([subroutine, vars(drift), [float(t) for t in schedule],
+                          [float(t) for t in thresholds], n_embryos, seed, dt_hours],
+                         sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SweepCache:
+    """Append-only JSON-lines store of finished evaluations."""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            complete = data.rfind(b"\n") + 1
+            for line in data[:complete].splitlines():
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.entries[entry['key']] = entry
+            if complete < len(data):
+                # Drop the partial line left by an interrupted run so appends start clean.
+                with open(path, 'r+b') as f:
+                    f.truncate(complete)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def add(self, entry: Dict):
+        self.entries[entry['key']] = entry
+        if self.path:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry, separators=(',', ':')) + "\n")
+
+
+def _init_worker(subroutine: Dict, drift_params: Dict, dt_hours: float):
+    global _worker_simulator
+    _worker_simulator = ControlLoopSimulator(subroutine, DriftModel(**drift_params), dt_hours)
+
+
+def _evaluate(task) -> Dict:
+    key, name, schedule, thresholds, n_embryos, seed = task
+    result = _worker_simulator.simulate(n_embryos, schedule, thresholds, seed)
+    return {
+        'key': key,
+        'schedule_name': name,
+        'checkpoints': result['checkpoints'],
+        'thresholds': [thresholds[0], thresholds[1]],
+        'planned_sessions': len(result['checkpoints']),
+        'imaging_sessions': result['imaging_sessions']['mean'],
+        'time_in_range': result['time_in_range']['mean'],
+        'time_in_range_p5': result['time_in_range']['p5'],
+        'interventions': result['interventions']['mean'],
+        'target_reached': result['outcomes']['target_reached'],
+    }
+
+
+def run_sweep(subroutine: Dict, drift: Optional[DriftModel] = None,
+              schedules: Optional[Dict[str, Sequence[float]]] = None,
+              thresholds: Optional[Iterable[Tuple[float, float]]] = None,
+              n_embryos: int = 2000, seed: int = 0, dt_hours: float = 0.25,
+              cache_path: Optional[str] = None, workers: Optional[int] = None,
+              min_time_in_range: float = 0.9, min_target_reached: float = 0.0) -> Dict:
+    """
+    Evaluates every schedule x thresholds combination and picks the cheapest that works.
+
+    Args:
+        subroutine (Dict): Library entry with a control_loop.
+        drift (DriftModel, optional): Tissue dynamics (default parameters if omitted).
+        schedules (Dict[str, Sequence[float]], optional): Named checkpoint lists
+            (default: candidate_schedules()).
+        thresholds (Iterable[Tuple[float, float]], optional): (above, below) pairs
+            (default: candidate_thresholds()).
+        n_embryos, seed, dt_hours: Simulation settings shared by every candidate.
+        cache_path (str, optional): JSON-lines file to read finished evaluations from
+            and append new ones to.
+        workers (int, optional): Worker processes (default: all cores; 1 runs inline).
+        min_time_in_range (float): Required mean fraction of time inside target_vmem_range.
+        min_target_reached (float): Required fraction of embryos that held the target
+            for duration_hours.
+
+    Returns:
+        Dict: 'results' (every candidate, cheapest first), 'best' (the cheapest
+        candidate meeting both requirements, or None), 'simulated' and 'cached' counts.
+    """
+    drift = drift or DriftModel()
+    simulator = ControlLoopSimulator(subroutine, drift, dt_hours)
+    if schedules is None:
+        schedules = candidate_schedules(simulator)
+    if thresholds is None:
+        thresholds = candidate_thresholds(simulator)
+    thresholds = [tuple(pair) for pair in thresholds]
+
+    cache = SweepCache(cache_path)
+    tasks, keys = [], []
+    for name, schedule in schedules.items():
+        for pair in thresholds:
+            key = evaluation_key(subroutine, drift, schedule, pair, n_embryos, seed, dt_hours)
+            keys.append(key)
+            if key not in cache:
+                tasks.append((key, name, list(schedule), pair, n_embryos, seed))
+
+    init_args = (subroutine, vars(drift), dt_hours)
+    if workers == 1 or len(tasks) <= 1:
+        _init_worker(*init_args)
+        for task in tasks:
+            cache.add(_evaluate(task))
+    elif tasks:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as pool:
+            for future in as_completed([pool.submit(_evaluate, task) for task in tasks]):
+                cache.add(future.result())
+
+    results = sorted((cache.entries[key] for key in dict.fromkeys(keys)),
+                     key=lambda r: (r['imaging_sessions'], -r['time_in_range']))
+    feasible = [r for r in results
+                if r['time_in_range'] >= min_time_in_range and r['target_reached'] >= min_target_reached]
+    return {
+        'subroutine': subroutine.get('id'),
+        'results': results,
+        'best': feasible[0] if feasible else None,
+        'simulated': len(tasks),
+        'cached': len(keys) - len(tasks),
+    }
+
+
+def main(argv=None):
+    from compiler.experiment_gen import BioCompiler
+
+    parser = argparse.ArgumentParser(description="Find the cheapest monitoring schedule for a subroutine.")
+    parser.add_argument('organ')
+    parser.add_argument('species')
+    parser.add_argument('--cache', help="JSON-lines file for resumable results")
+    parser.add_argument('--embryos', type=int, default=2000)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--min-time-in-range', type=float, default=0.9)
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    matches = BioCompiler().find_subroutines(args.organ, args.species)
+    if not matches:
+        print("[!] Error: No known bioelectric subroutine for this morphology.")
+        return
+    sweep = run_sweep(matches[0], n_embryos=args.embryos, cache_path=args.cache,
+                      workers=args.workers, min_time_in_range=args.min_time_in_range)
+    print(f"[*] {sweep['subroutine']}: {sweep['simulated']} simulated, {sweep['cached']} from cache")
+    print(f"{'schedule':<22} {'above':>7} {'below':>7} {'sessions':>9} {'in range':>9} {'interv.':>8}")
+    for r in sweep['results'][:10]:
+        print(f"{r['schedule_name']:<22} {r['thresholds'][0]:>7.1f} {r['thresholds'][1]:>7.1f} "
+              f"{r['imaging_sessions']:>9.2f} {r['time_in_range']:>9.1%} {r['interventions']:>8.2f}")
+    best = sweep['best']
+    if best:
+        print(f"[*] Cheapest schedule keeping >= {args.min_time_in_range:.0%} time in range: "
+              f"{best['schedule_name']} {best['checkpoints']} with thresholds {best['thresholds']}")
+    else:
+        print(f"[!] Warning: No candidate keeps >= {args.min_time_in_range:.0%} of time in range.")
+
+
+if __name__ == "__main__":
+    main()
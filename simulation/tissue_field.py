@@ -0,0 +1,364 @@
+"""
+Forward model: Vmem maps from hardware drivers on a gap-junction-coupled lattice.
+
+Every cell of a 2D lattice has a leak conductance toward the tissue's resting
+potential, optionally a driver conductance (an expressed channel, pump or
+ionophore) toward that driver's effective reversal potential, and gap-junction
+conductances to its four neighbours. The steady state solves
+
+    (g_leak + g_drv + sum g_gj) V_i - sum g_gj V_j = g_leak E_leak + g_drv E_drv
+
+a sparse, diagonally dominant linear system with one row per cell. Instead of
+assembling a sparse matrix it is solved matrix-free with red-black successive
+over-relaxation: each half-sweep is a handful of whole-array NumPy stencil
+operations, so memory stays O(cells) and 10^6 cells solve in seconds.
+
+For large lattices the solve can be split into horizontal strips over a
+process pool. Strips live in shared memory. Each round, a worker relaxes its
+strip plus a halo of 2 * exchange_every rows for exchange_every sweeps, then
+writes back only the strip's interior, which is exact because one red-black
+sweep propagates information by at most two rows.
+
+The result is a plain float32 Vmem map with the domain label image alongside,
+ready for BioDecoder.predict_many and BioStateValidator.verify_state.
+
+Usage:
+    python -m simulation.tissue_field [--size N] [--workers W]
+"""
+
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from instrumentation.log import configure_logging, get_logger
+from shm import attach_shared_memory
+
+_log = get_logger(__name__)
+
+
+class DriverModel:
+    """Effective electrical action of one hardware driver on the cells expressing it."""
+
+    def __init__(self, name: str, reversal_mv: float = 0.0, conductance: float = 0.0,
+                 coupling_scale: float = 1.0):
+        """
+        Args:
+            name (str): Driver name as used in 'hardware_drivers'.
+            reversal_mv (float): Potential the driver pulls the membrane toward (mV).
+            conductance (float): Driver conductance at dose 1, relative to the leak.
+            coupling_scale (float): Multiplier on gap-junction conductance in treated
+                cells at dose 1 (below 1 for gap-junction blockers); dose d applies
+                coupling_scale ** d.
+        """
+        self.name = name
+        self.reversal_mv = reversal_mv
+        self.conductance = conductance
+        self.coupling_scale = coupling_scale
+
+
+# Effective parameters (relative to a leak conductance of 1) for the drivers in the
+# library; they reproduce the direction and rough size of each driver's effect and
+# are meant to be tuned against imaging data.
+DRIVER_MODELS = {model.name.lower(): model for model in [
+    DriverModel('Kv1.5', reversal_mv=-85.0, conductance=1.0),
+    DriverModel('Kir4.1', reversal_mv=-85.0, conductance=1.5),
+    DriverModel('Yeast PMA1 H+ Pump', reversal_mv=-10.0, conductance=0.5),
+    DriverModel('V-ATPase', reversal_mv=-10.0, conductance=0.5),
+    DriverModel('Monensin Cocktail', reversal_mv=40.0, conductance=0.3),
+    DriverModel('ChR2', reversal_mv=0.0, conductance=1.0),
+    DriverModel('Gap Junction Blocker (Octanol)', coupling_scale=0.05),
+]}
+
+
+def driver_model(driver: Union[str, Dict, DriverModel]) -> DriverModel:
+    """Resolves a driver name (or 'hardware_drivers' entry) to its DriverModel."""
+    if isinstance(driver, DriverModel):
+        return driver
+    name = driver['name'] if isinstance(driver, dict) else driver
+    model = DRIVER_MODELS.get(name.lower())
+    if model is None:
+        raise ValueError(f"No electrical model for driver '{name}'. "
+                         f"Known drivers: {', '.join(m.name for m in DRIVER_MODELS.values())}")
+    return model
+
+
+def _relax(v: np.ndarray, source: np.ndarray, diagonal: np.ndarray, g_east: np.ndarray,
+           g_south: np.ndarray, row0: int, omega: float, sweeps: int,
+           measure: Optional[slice] = None) -> float:
+    """
+    Runs red-black SOR sweeps in place on a block of rows starting at global row `row0`.
+
+    `v` may carry leading batch axes (independent lattices solved together);
+    the other arrays and `omega` broadcast against it.
+
+    Rows outside the block are treated as absent, so only rows at least
+    2 * sweeps away from a cut edge are exact. Returns the largest change
+    made by the last sweep within the `measure` rows (default: all).
+    """
+    rows, cols = v.shape[-2:]
+    parity = (np.arange(row0, row0 + rows)[:, None] + np.arange(cols)[None, :]) % 2
+    colors = [parity == 0, parity == 1]
+    total = np.empty_like(v)
+    update = np.empty_like(v)
+    east = np.empty(np.broadcast_shapes(g_east.shape, v[..., 1:].shape))
+    south = np.empty(np.broadcast_shapes(g_south.shape, v[..., 1:, :].shape))
+    delta = 0.0
+    for sweep in range(sweeps):
+        last = sweep == sweeps - 1
+        for color in colors:
+            np.copyto(total, source)
+            np.multiply(g_east, v[..., 1:], out=east)
+            total[..., :-1] += east
+            np.multiply(g_east, v[..., :-1], out=east)
+            total[..., 1:] += east
+            np.multiply(g_south, v[..., 1:, :], out=south)
+            total[..., :-1, :] += south
+            np.multiply(g_south, v[..., :-1, :], out=south)
+            total[..., 1:, :] += south
+            np.divide(total, diagonal, out=update)
+            update -= v
+            update *= omega
+            if last:
+                change = np.abs(np.where(color, update, 0.0)[..., measure or slice(None), :])
+                delta = max(delta, float(change.max(initial=0.0)))
+            np.add(v, update, out=v, where=color)
+    return delta
+
+
+_shared: Dict[str, Tuple] = {}
+
+
+def _attach(names: Dict[str, Tuple[str, Tuple[int, ...]]]):
+    """Worker initializer: maps the shared problem arrays (owned and unlinked by the parent)."""
+    for key, (name, shape) in names.items():
+        block = attach_shared_memory(name)
+        _shared[key] = (block, np.ndarray(shape, dtype=np.float64, buffer=block.buf))
+
+
+def _relax_strip(task) -> float:
+    """Worker: relax one strip (with halo) from the `src` buffer into `dst`."""
+    src, dst, start, stop, halo, omega, sweeps = task
+    arrays = {key: array for key, (_, array) in _shared.items()}
+    rows = arrays['source'].shape[0]
+    lo, hi = max(start - halo, 0), min(stop + halo, rows)
+    v = arrays[src][lo:hi].copy()
+    delta = _relax(v, arrays['source'][lo:hi], arrays['diagonal'][lo:hi], arrays['g_east'][lo:hi],
+                   arrays['g_south'][lo:hi - 1], lo, omega, sweeps, slice(start - lo, stop - lo))
+    arrays[dst][start:stop] = v[start - lo:stop - lo]
+    return delta
+
+
+class TissueField:
+    """A 2D cell lattice with leak, driver and gap-junction conductances."""
+
+    def __init__(self, shape: Tuple[int, int], resting_vmem: float = -25.0,
+                 leak_conductance: float = 1.0, gap_junction_conductance: float = 10.0):
+        """
+        Args:
+            shape (Tuple[int, int]): Lattice size (rows, cols); one cell per pixel.
+            resting_vmem (float): Leak reversal, i.e. the untreated tissue's Vmem (mV).
+            leak_conductance (float): Leak conductance per cell.
+            gap_junction_conductance (float): Conductance between neighbouring cells.
+                The space constant is about sqrt(gap / leak) cells.
+        """
+        if len(shape) != 2 or min(shape) < 2:
+            raise ValueError("shape must be 2D with at least 2 cells per side.")
+        self.shape = tuple(shape)
+        self.resting_vmem = resting_vmem
+        self.leak_conductance = leak_conductance
+        self.gap_junction_conductance = gap_junction_conductance
+        self.labels = np.full(self.shape, -1, dtype=np.int32)
+        self.domain_names: List[str] = []
+        self._driver_conductance = np.zeros(self.shape)
+        self._driver_current = np.zeros(self.shape)
+        self._coupling = np.ones(self.shape)
+        self.last_solve: Dict = {}
+
+    def add_domain(self, name: str, mask: np.ndarray) -> int:
+        """Labels the cells of a spatial domain; returns the domain's label."""
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != self.shape:
+            raise ValueError(f"Domain mask has shape {mask.shape}, expected {self.shape}.")
+        if name in self.domain_names:
+            label = self.domain_names.index(name)
+        else:
+            label = len(self.domain_names)
+            self.domain_names.append(name)
+        self.labels[mask] = label
+        return label
+
+    def domain_mask(self, name: str) -> np.ndarray:
+        return self.labels == self.domain_names.index(name)
+
+    def apply_driver(self, driver: Union[str, Dict, DriverModel], domain: Union[str, np.ndarray],
+                     dose: float = 1.0):
+        """
+        Expresses a driver in a domain (by name, or a boolean mask).
+
+        Args:
+            driver: Driver name, 'hardware_drivers' entry or DriverModel.
+            domain: Name of a domain added with add_domain, or a boolean mask.
+            dose (float): Scales the driver conductance.
+        """
+        model = driver_model(driver)
+        mask = self.domain_mask(domain) if isinstance(domain, str) else np.asarray(domain, dtype=bool)
+        g = model.conductance * dose
+        self._driver_conductance[mask] += g
+        self._driver_current[mask] += g * model.reversal_mv
+        self._coupling[mask] *= model.coupling_scale ** dose
+
+    def apply_subroutine(self, subroutine: Dict, mask: np.ndarray, driver_index: int = 0, dose: float = 1.0):
+        """Labels `mask` as the subroutine's spatial_domain and applies one of its drivers."""
+        domain = subroutine['bioelectric_state']['spatial_domain']
+        self.add_domain(domain, mask)
+        self.apply_driver(subroutine['hardware_drivers'][driver_index], domain, dose)
+
+    def _system(self):
+        """Source, diagonal and edge conductances of the linear system."""
+        g_leak = self.leak_conductance
+        g_gj = self.gap_junction_conductance
+        g_east = g_gj * np.minimum(self._coupling[:, :-1], self._coupling[:, 1:])
+        g_south = g_gj * np.minimum(self._coupling[:-1, :], self._coupling[1:, :])
+
+        source = g_leak * self.resting_vmem + self._driver_current
+        diagonal = g_leak + self._driver_conductance
+        diagonal[:, :-1] += g_east
+        diagonal[:, 1:] += g_east
+        diagonal[:-1, :] += g_south
+        diagonal[1:, :] += g_south
+
+        # Optimal SOR factor from the Jacobi spectral radius bound.
+        rho = float(((diagonal - g_leak - self._driver_conductance) / diagonal).max())
+        omega = 2.0 / (1.0 + float(np.sqrt(max(1.0 - rho * rho, 0.0))))
+        return source, diagonal, g_east, g_south, omega
+
+    def solve(self, tol: float = 1e-4, max_sweeps: int = 20000, workers: int = 1,
+              exchange_every: int = 8, check_every: int = 10) -> np.ndarray:
+        """
+        Computes the steady-state Vmem map.
+
+        Args:
+            tol (float): Stop once a sweep changes no cell by more than this (mV).
+            max_sweeps (int): Upper bound on red-black sweeps.
+            workers (int): Strips solved in parallel processes (1 = in-process).
+            exchange_every (int): Sweeps between halo exchanges when workers > 1.
+            check_every (int): Sweeps between convergence checks when workers == 1.
+
+        Returns:
+            np.ndarray: float32 Vmem map (mV) of the lattice shape; see `labels`
+            and `domain_names` for the matching domain label image.
+        """
+        started = time.perf_counter()
+        source, diagonal, g_east, g_south, omega = self._system()
+        v = np.full(self.shape, float(self.resting_vmem))
+        if workers > 1:
+            sweeps, delta = self._solve_parallel(v, source, diagonal, g_east, g_south, omega,
+                                                 tol, max_sweeps, workers, exchange_every)
+        else:
+            sweeps, delta = 0, np.inf
+            while sweeps < max_sweeps and delta > tol:
+                n = min(check_every, max_sweeps - sweeps)
+                delta = _relax(v, source, diagonal, g_east, g_south, 0, omega, n)
+                sweeps += n
+
+        converged = delta <= tol
+        if not converged:
+            _log.warning("Tissue field did not converge in %d sweeps (last change %.2e mV).", sweeps, delta)
+        self.last_solve = {'sweeps': sweeps, 'last_change_mv': float(delta), 'converged': converged,
+                           'omega': omega, 'seconds': time.perf_counter() - started}
+        return v.astype(np.float32)
+
+    def _solve_parallel(self, v, source, diagonal, g_east, g_south, omega,
+                        tol, max_sweeps, workers, exchange_every):
+        rows = self.shape[0]
+        halo = 2 * exchange_every
+        bounds = np.linspace(0, rows, workers + 1).astype(int)
+        strips = [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+        arrays = {'a': v, 'b': v, 'source': source, 'diagonal': diagonal,
+                  'g_east': g_east, 'g_south': g_south}
+        blocks, names = [], {}
+        try:
+            for key, array in arrays.items():
+                block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                blocks.append(block)
+                np.ndarray(array.shape, dtype=np.float64, buffer=block.buf)[...] = array
+                names[key] = (block.name, array.shape)
+
+            sweeps, delta, src, dst = 0, np.inf, 'a', 'b'
+            with ProcessPoolExecutor(max_workers=len(strips), initializer=_attach, initargs=(names,)) as pool:
+                while sweeps < max_sweeps and delta > tol:
+                    n = min(exchange_every, max_sweeps - sweeps)
+                    tasks = [(src, dst, a, b, 2 * n, omega, n) for a, b in strips]
+                    delta = max(pool.map(_relax_strip, tasks))
+                    sweeps += n
+                    src, dst = dst, src
+
+            result_block = blocks[list(arrays).index(src)]
+            v[...] = np.ndarray(self.shape, dtype=np.float64, buffer=result_block.buf)
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+        return sweeps, delta
+
+
+def solve_many(fields: List[TissueField], tol: float = 1e-4, max_sweeps: int = 20000,
+               check_every: int = 10) -> np.ndarray:
+    """
+    Solves several same-shaped lattices as one batched stencil computation.
+
+    Much faster than solving small lattices one at a time, since every NumPy
+    call covers the whole batch. Returns a float32 array (n_fields, rows, cols).
+    """
+    if not fields:
+        raise ValueError("At least one field is required.")
+    if len({field.shape for field in fields}) != 1:
+        raise ValueError("All fields must have the same shape.")
+    systems = [field._system() for field in fields]
+    source, diagonal, g_east, g_south = (np.stack([system[i] for system in systems]) for i in range(4))
+    omega = np.array([system[4] for system in systems])[:, None, None]
+
+    v = np.stack([np.full(field.shape, float(field.resting_vmem)) for field in fields])
+    sweeps, delta = 0, np.inf
+    while sweeps < max_sweeps and delta > tol:
+        n = min(check_every, max_sweeps - sweeps)
+        delta = _relax(v, source, diagonal, g_east, g_south, 0, omega, n)
+        sweeps += n
+    if delta > tol:
+        _log.warning("Tissue fields did not converge in %d sweeps (last change %.2e mV).", sweeps, delta)
+    return v.astype(np.float32)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate an eye-field Kv1.5 injection on a cell lattice.")
+    parser.add_argument('--size', type=int, default=512, help="Lattice side length (cells)")
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    from compiler.experiment_gen import BioCompiler
+    from verification.dye_decode import BioStateValidator
+
+    subroutine = BioCompiler().find_subroutines("eye", "Xenopus laevis")[0]
+    n = args.size
+    yy, xx = np.mgrid[:n, :n]
+    mask = (yy - n / 2) ** 2 + (xx - n / 2) ** 2 <= (n / 4) ** 2
+
+    field = TissueField((n, n))
+    field.apply_subroutine(subroutine, mask)
+    vmem_map = field.solve(workers=args.workers)
+    info = field.last_solve
+    print(f"[*] {n}x{n} lattice: {info['sweeps']} sweeps in {info['seconds']:.2f}s "
+          f"(converged={info['converged']})")
+    print(f"[*] Domain mean Vmem: {vmem_map[mask].mean():.1f} mV, outside: {vmem_map[~mask].mean():.1f} mV")
+    success, message = BioStateValidator().verify_state(vmem_map, subroutine['bioelectric_state'], mask)
+    print(message)
+
+
+if __name__ == "__main__":
+    main()
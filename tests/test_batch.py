@@ -0,0 +1,87 @@
+"""
+Unit tests for batch protocol compilation
+"""
+
+import unittest
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compiler.batch import compile_batch
+from compiler.experiment_gen import BioCompiler
+
+FIXED_TIME = datetime(2025, 1, 1, 9, 30)
+
+
+def read_outputs(directory):
+    outputs = {}
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), 'rb') as f:
+            outputs[name] = f.read()
+    return outputs
+
+
+class TestBatchCompilation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.compiler = BioCompiler()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_protocols_match_generate_protocol(self):
+        """Test that each written protocol equals the single-subroutine render"""
+        report = compile_batch(self.tmpdir.name, generated_at=FIXED_TIME, workers=1)
+        self.assertEqual(report['count'], len(self.compiler.library))
+        for sub in self.compiler.library:
+            with open(os.path.join(self.tmpdir.name, f"{sub['id']}.txt")) as f:
+                self.assertEqual(f.read(), self.compiler.generate_protocol(sub, generated_at=FIXED_TIME))
+
+    def test_fixed_timestamp_is_deterministic(self):
+        """Test that two batch runs (serial and pooled) produce identical files"""
+        serial = os.path.join(self.tmpdir.name, 'serial')
+        pooled = os.path.join(self.tmpdir.name, 'pooled')
+        compile_batch(serial, generated_at=FIXED_TIME, workers=1)
+        compile_batch(pooled, generated_at=FIXED_TIME, workers=2)
+        self.assertEqual(read_outputs(serial), read_outputs(pooled))
+
+    def test_manifest_and_filters(self):
+        """Test that filters restrict the batch and the manifest lists it"""
+        report = compile_batch(self.tmpdir.name, generated_at=FIXED_TIME, workers=1, organ='eye')
+        with open(report['manifest']) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['generated_at'], '2025-01-01 09:30')
+        self.assertEqual(report['count'], len(manifest['protocols']))
+        self.assertGreater(report['count'], 0)
+        ids = [entry['id'] for entry in manifest['protocols']]
+        self.assertEqual(ids, sorted(ids))
+        eye_ids = {s['id'] for s in self.compiler.library if s['target_morphology']['organ'] == 'eye'}
+        self.assertEqual(set(ids), eye_ids)
+        self.assertEqual(manifest['skipped'], [])
+
+    def test_unsafe_and_duplicate_ids_are_skipped(self):
+        """Test that ids cannot escape the output directory or overwrite each other"""
+        library = [dict(sub) for sub in self.compiler.library]
+        library[1]['id'] = '../escaped'
+        library[2]['id'] = library[0]['id']
+        database = os.path.join(self.tmpdir.name, 'library.json')
+        with open(database, 'w') as f:
+            json.dump(library, f)
+        output = os.path.join(self.tmpdir.name, 'out')
+
+        report = compile_batch(output, database, generated_at=FIXED_TIME, workers=1)
+        self.assertEqual(report['count'], len(library) - 2)
+        self.assertEqual([(e['position'], e['id']) for e in report['skipped']],
+                         [(1, '../escaped'), (2, library[0]['id'])])
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, 'escaped.txt')))
+        with open(os.path.join(output, f"{library[0]['id']}.txt")) as f:
+            self.assertEqual(f.read(), self.compiler.generate_protocol(library[0], generated_at=FIXED_TIME))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+Unit tests for the benchmark suite's baseline handling
+"""
+
+import unittest
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.suite import CASES, PROFILES, compare, load_baseline, main, run, save_baseline
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.baseline_path = os.path.join(self.tmpdir.name, 'baseline.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_profiles_cover_requested_sizes(self):
+        for profile in PROFILES.values():
+            self.assertEqual(set(profile), set(CASES))
+        full = PROFILES['full']
+        self.assertEqual(max(full['find_subroutine']), 10 ** 6)
+        self.assertEqual(max(full['analyze_ratiometric_tiled']), 16384)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'results': {'a[1]': {'seconds': 1.0}, 'b[1]': {'seconds': 1.0}, 'c[1]': {'seconds': 1.0}}}
+        results = {'a[1]': {'seconds': 1.1}, 'b[1]': {'seconds': 1.5}, 'c[1]': {'seconds': 0.5},
+                   'd[1]': {'seconds': 1.0}}
+        statuses = {row['key']: row['status'] for row in compare(results, baseline, threshold=0.25)}
+        self.assertEqual(statuses, {'a[1]': 'ok', 'b[1]': 'regression', 'c[1]': 'faster', 'd[1]': 'new'})
+
+    def test_save_baseline_merges_entries(self):
+        save_baseline(self.baseline_path, {'a[1]': {'seconds': 1.0, 'unit': 'query'}})
+        save_baseline(self.baseline_path, {'b[1]': {'seconds': 2.0, 'unit': 'query'}},
+                      load_baseline(self.baseline_path))
+        baseline = load_baseline(self.baseline_path)
+        self.assertEqual(sorted(baseline['results']), ['a[1]', 'b[1]'])
+        self.assertIsNotNone(baseline['machine'])
+        self.assertEqual(load_baseline(os.path.join(self.tmpdir.name, 'missing.json'))['results'], {})
+
+    def test_run_selected_case(self):
+        results = run('quick', only=r'^find_subroutine\[1000\]$', repeats=1)
+        self.assertEqual(list(results), ['find_subroutine[1000]'])
+        self.assertGreater(results['find_subroutine[1000]']['seconds'], 0.0)
+
+    def test_main_exit_status(self):
+        only = ['--only', r'^verify_state\[512\]$', '--repeats', '1', '--baseline', self.baseline_path, '--json']
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()) as stderr:
+            self.assertEqual(main(only + ['--update-baseline']), 0)
+            baseline = load_baseline(self.baseline_path)
+            baseline['results']['verify_state[512]']['seconds'] = 1e-9
+            save_baseline(self.baseline_path, baseline['results'])
+            self.assertEqual(main(only), 1)
+        self.assertIn("slower than the baseline", stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+"""
+Unit tests for per-pixel ratiometric calibration
+"""
+
+import unittest
+import os
+import pickle
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from verification.calibration import CalibrationCache, CalibrationMap, fit_block, fit_calibration, ratio_map
+from verification.dye_decode import BioStateValidator
+
+SHAPE = (48, 64)
+CLAMP_MV = [-60.0, -45.0, -30.0, -15.0, 0.0]
+
+
+def true_calibration():
+    """A field whose standard curve drifts from left to right and top to bottom."""
+    rows, cols = np.mgrid[0:SHAPE[0], 0:SHAPE[1]].astype(np.float32)
+    slope = 80.0 + 40.0 * cols / SHAPE[1]
+    intercept = -75.0 + 10.0 * rows / SHAPE[0]
+    return slope, intercept
+
+
+def clamp_frame(vmem, slope, intercept, acceptor_level=200.0):
+    """Donor/acceptor frames whose ratio decodes to `vmem` under the given calibration."""
+    acceptor = np.full(SHAPE, acceptor_level, dtype=np.float32)
+    donor = acceptor * (vmem - intercept) / slope
+    return np.clip(donor, 0, 255).astype(np.uint8), acceptor.astype(np.uint8)
+
+
+def clamp_series(slope, intercept, levels=CLAMP_MV):
+    frames = [clamp_frame(v, slope, intercept) for v in levels]
+    return [d for d, _ in frames], [a for _, a in frames]
+
+
+class TestFit(unittest.TestCase):
+
+    def test_fit_block_recovers_linear_and_quadratic_curves(self):
+        ratios = np.linspace(0.2, 1.0, 5)[:, None] * np.array([1.0, 1.5, 2.0])
+        linear = -70.0 + 100.0 * ratios[:, 0]
+        coefficients, rms = fit_block(ratios, linear, degree=1)
+        np.testing.assert_allclose(coefficients[:, 0], [-70.0, 100.0], atol=1e-9)
+        self.assertLess(rms[0], 1e-9)
+
+        r = ratios[:, 1]
+        quadratic = -60.0 + 30.0 * r + 20.0 * r ** 2
+        coefficients, rms = fit_block(ratios[:, 1:2], quadratic, degree=2)
+        np.testing.assert_allclose(coefficients[:, 0], [-60.0, 30.0, 20.0], atol=1e-6)
+
+    def test_per_pixel_fit_recovers_spatial_calibration(self):
+        slope, intercept = true_calibration()
+        donors, acceptors = clamp_series(slope, intercept)
+        coefficients, residual, stats = fit_calibration(donors, acceptors, CLAMP_MV, chunk=32)
+        interior = (slice(4, -4), slice(4, -4))
+        np.testing.assert_allclose(coefficients[1][interior], slope[interior], rtol=0.05)
+        np.testing.assert_allclose(coefficients[0][interior], intercept[interior], atol=4.0)
+        self.assertEqual(stats['degenerate_pixels'], 0)
+        self.assertLess(stats['median_rms_mv'], 1.0)
+
+    def test_chunking_does_not_change_the_fit(self):
+        slope, intercept = true_calibration()
+        donors, acceptors = clamp_series(slope, intercept)
+        whole, _, _ = fit_calibration(donors, acceptors, CLAMP_MV, chunk=1024)
+        chunked, _, _ = fit_calibration(donors, acceptors, CLAMP_MV, chunk=16)
+        np.testing.assert_array_equal(whole, chunked)
+
+    def test_tile_fit_is_constant_per_tile(self):
+        slope, intercept = true_calibration()
+        donors, acceptors = clamp_series(slope, intercept)
+        coefficients, _, _ = fit_calibration(donors, acceptors, CLAMP_MV, tile=16, chunk=20)
+        block = coefficients[1][16:32, 32:48]
+        self.assertTrue(np.all(block == block[0, 0]))
+        self.assertNotEqual(coefficients[1][16, 0], coefficients[1][16, 63])
+
+    def test_flat_pixels_get_median_curve(self):
+        slope, intercept = true_calibration()
+        donors, acceptors = clamp_series(slope, intercept)
+        for donor in donors:
+            donor[:, :8] = 50
+        coefficients, residual, stats = fit_calibration(donors, acceptors, CLAMP_MV)
+        self.assertGreater(stats['degenerate_pixels'], 0)
+        self.assertTrue(np.isfinite(coefficients).all())
+        self.assertTrue(np.isnan(residual[:, 0]).all())
+
+    def test_too_few_ratio_levels_are_degenerate(self):
+        """Test that pixels with fewer distinct ratios than coefficients do not abort the fit"""
+        ratios = np.array([[0.3, 0.3, 0.2], [0.3, 0.5, 0.4], [0.5, 0.5, 0.6], [0.5, 0.7, 0.8]])
+        clamp = [-90.0, -60.0, -30.0, 0.0]
+        coefficients, rms = fit_block(ratios, clamp, degree=2)
+        self.assertTrue(np.isnan(coefficients[:, 0]).all())
+        self.assertTrue(np.isfinite(coefficients[:, 1:]).all())
+        self.assertTrue(np.isnan(rms[0]))
+
+        donors = [np.full(SHAPE, 60, dtype=np.uint8) for _ in clamp]
+        acceptors = [np.full(SHAPE, level, dtype=np.uint8) for level in (200, 200, 100, 100)]
+        for k, donor in enumerate(donors):
+            donor[:, SHAPE[1] // 2:] = 30 + 20 * k
+        coefficients, residual, stats = fit_calibration(donors, acceptors, clamp, degree=2)
+        half = SHAPE[1] // 2
+        self.assertGreater(stats['degenerate_pixels'], 0)
+        self.assertTrue(np.isfinite(coefficients).all())
+        self.assertTrue(np.isnan(residual[:, :half - 4]).all())
+        self.assertTrue(np.isfinite(residual[:, half + 4:]).all())
+
+    def test_rejects_underdetermined_series(self):
+        slope, intercept = true_calibration()
+        donors, acceptors = clamp_series(slope, intercept, levels=[-30.0, -30.0])
+        with self.assertRaises(ValueError):
+            fit_calibration(donors, acceptors, [-30.0, -30.0])
+        with self.assertRaises(ValueError):
+            fit_calibration(donors, acceptors[:1], [-50.0, -30.0])
+
+
+class TestCalibratedPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = CalibrationCache(self.tmpdir.name)
+        self.slope, self.intercept = true_calibration()
+        donors, acceptors = clamp_series(self.slope, self.intercept)
+        self.calibration = self.cache.fit('scope2', 'session-1', donors, acceptors, CLAMP_MV)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_cache_layout_and_lookup(self):
+        self.assertIsInstance(self.calibration.coefficients, np.memmap)
+        self.assertEqual(self.calibration.shape, SHAPE)
+        self.assertEqual(self.calibration.metadata['clamp_mv'], CLAMP_MV)
+        self.assertEqual(self.cache.rigs(), ['scope2'])
+        self.assertEqual(self.cache.sessions('scope2'), ['session-1'])
+        self.assertIsNone(self.cache.get('scope2', 'session-2'))
+        self.assertEqual(self.cache.get('scope2').path, self.calibration.path)
+        restored = pickle.loads(pickle.dumps(self.calibration))
+        self.assertIsInstance(restored.coefficients, np.memmap)
+        with self.assertRaises(ValueError):
+            self.cache.path('../scope2', 'session-1')
+
+    def test_calibrated_validator_corrects_field_variation(self):
+        donor, acceptor = clamp_frame(-40.0, self.slope, self.intercept)
+        calibrated = BioStateValidator(calibration=self.calibration)._vmem_from_images(donor, acceptor)
+        uncalibrated = BioStateValidator()._vmem_from_images(donor, acceptor)
+        interior = (slice(4, -4), slice(4, -4))
+        self.assertLess(np.abs(calibrated[interior] + 40.0).max(), 3.0)
+        self.assertGreater(np.abs(uncalibrated[interior] + 40.0).max(), 10.0)
+
+    def test_kernel_matches_map_evaluation(self):
+        donor, acceptor = clamp_frame(-40.0, self.slope, self.intercept)
+        quadratic = CalibrationMap(np.stack([self.intercept, self.slope, np.full(SHAPE, 5.0, np.float32)]))
+        vmem = BioStateValidator(calibration=quadratic)._vmem_from_images(donor, acceptor)
+        np.testing.assert_allclose(vmem, quadratic.evaluate(ratio_map(donor, acceptor)), rtol=1e-5, atol=1e-4)
+
+    def test_tiled_and_stack_paths_use_the_maps(self):
+        donor, acceptor = clamp_frame(-40.0, self.slope, self.intercept)
+        validator = BioStateValidator(calibration=self.calibration)
+        expected = validator._vmem_from_images(donor, acceptor)
+
+        np.save(os.path.join(self.tmpdir.name, 'donor.npy'), donor)
+        np.save(os.path.join(self.tmpdir.name, 'acceptor.npy'), acceptor)
+        tiled = validator.analyze_ratiometric_tiled(os.path.join(self.tmpdir.name, 'donor.npy'),
+                                                    os.path.join(self.tmpdir.name, 'acceptor.npy'), tile_size=16)
+        np.testing.assert_array_equal(tiled, expected)
+
+        frames = os.path.join(self.tmpdir.name, 'frames')
+        os.makedirs(frames)
+        for t in range(2):
+            cv2.imwrite(os.path.join(frames, f't{t}_donor.png'), donor)
+            cv2.imwrite(os.path.join(frames, f't{t}_acceptor.png'), acceptor)
+        stack = validator.analyze_stack(frames, workers=2)
+        np.testing.assert_array_equal(stack[1], expected)
+
+    def test_rejects_mismatched_frames(self):
+        validator = BioStateValidator(calibration=self.calibration)
+        small = np.full((8, 8), 100, dtype=np.uint8)
+        with self.assertRaises(ValueError):
+            validator._vmem_from_images(small, small)
+
+
+if __name__ == '__main__':
+    unittest.main()
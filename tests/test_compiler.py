@@ -5,11 +5,14 @@ Unit tests for the BioCompiler module
 import unittest
 import sys
 import os
+import copy
+from datetime import datetime
 
 # Add parent directory to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from compiler.experiment_gen import BioCompiler
+from compiler.protocol_renderer import ProtocolRenderer
 
 
 class TestBioCompiler(unittest.TestCase):
@@ -62,6 +65,61 @@ class TestBioCompiler(unittest.TestCase):
         
         self.assertEqual(result1['id'], result2['id'])
 
+    def test_find_subroutines_returns_all_matches(self):
+        """Test that the indexed lookup returns every matching entry"""
+        duplicate = dict(self.compiler.library[0], id='duplicate_eye_v2')
+        compiler = BioCompiler()
+        compiler.library = compiler.library + [duplicate]
+        compiler._build_indexes()
+
+        matches = compiler.find_subroutines(organ="eye", species="Xenopus laevis")
+        self.assertEqual([m['id'] for m in matches],
+                         ['xenopus_ectopic_eye_induction_v1', 'duplicate_eye_v2'])
+        self.assertEqual(compiler.find_subroutine("eye", "Xenopus laevis")['id'],
+                         'xenopus_ectopic_eye_induction_v1')
+
+    def test_find_subroutines_with_action(self):
+        """Test narrowing an organ/species lookup by action"""
+        self.assertEqual(len(self.compiler.find_subroutines("tail", "Xenopus laevis", "regenerate")), 1)
+        self.assertEqual(self.compiler.find_subroutines("tail", "Xenopus laevis", "induce"), [])
+
+    def test_secondary_indexes(self):
+        """Test lookups by spatial domain and hardware driver"""
+        by_domain = self.compiler.find_by_domain("Ventral_Ectoderm")
+        self.assertEqual([s['id'] for s in by_domain], ['xenopus_ectopic_eye_induction_v1'])
+
+        by_driver = self.compiler.find_by_driver("kir4.1")
+        self.assertEqual([s['id'] for s in by_driver], ['xenopus_ectopic_eye_induction_v1'])
+        self.assertEqual(self.compiler.find_by_driver("Unknown Channel"), [])
+
+
+class TestProtocolRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.compiler = BioCompiler()
+        self.renderer = ProtocolRenderer(self.compiler)
+        self.generated_at = datetime(2025, 1, 1, 12, 0)
+
+    def test_matches_generate_protocol(self):
+        """Test that cached rendering is identical to generate_protocol"""
+        for _ in range(2):
+            for sub in self.compiler.library:
+                self.assertEqual(self.renderer.render(sub, self.generated_at),
+                                 self.compiler.generate_protocol(sub, self.generated_at))
+        self.assertGreater(self.renderer.hits, 0)
+
+    def test_biomarker_edit_rerenders_one_section(self):
+        """Test that editing biomarkers only misses the verification section"""
+        sub = copy.deepcopy(self.compiler.library[0])
+        self.renderer.render(sub, self.generated_at)
+        misses = self.renderer.misses
+
+        sub['downstream_biomarkers'][0]['check_time'] = '96h post-intervention'
+        rendered = self.renderer.render(sub, self.generated_at)
+        self.assertEqual(self.renderer.misses, misses + 1)
+        self.assertIn('96h post-intervention', rendered)
+        self.assertEqual(rendered, self.compiler.generate_protocol(sub, self.generated_at))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,190 @@
+"""
+Unit tests for the BioDecoder module
+"""
+
+import unittest
+import os
+import random
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compiler.predict_morphology import BioDecoder
+from compiler.vmem_index import IntervalTree
+from compiler.scoring import domain_similarity
+
+
+def make_library(size, seed=0):
+    """Builds a small random library with overlapping ranges and domains."""
+    rng = random.Random(seed)
+    domains = ['ventral_ectoderm', 'ectoderm', 'regeneration_bud', 'Amputation_Stump', 'bud']
+    library = []
+    for i in range(size):
+        low = rng.randint(-80, 10)
+        high = low + rng.randint(0, 30)
+        vmem_range = [low, high] if rng.random() < 0.5 else [high, low]
+        library.append({
+            'id': f'sub_{i}',
+            'target_morphology': {'organ': 'eye', 'species': rng.choice(['Xenopus laevis', 'Danio rerio']),
+                                  'action': 'induce'},
+            'bioelectric_state': {'target_vmem_range': vmem_range,
+                                  'spatial_domain': rng.choice(domains), 'notes': ''},
+        })
+    return library
+
+
+class TestBioDecoder(unittest.TestCase):
+
+    def setUp(self):
+        self.decoder = BioDecoder()
+
+    def test_predict_eye(self):
+        """Test that -40mV in ventral ectoderm decodes to the eye subroutine"""
+        matches = self.decoder.predict(vmem=-40.0, spatial_domain="ventral_ectoderm", species="Xenopus laevis")
+        self.assertEqual([m['id'] for m in matches], ['xenopus_ectopic_eye_induction_v1'])
+
+    def test_predict_no_match(self):
+        """Test that an out-of-range voltage returns no predictions"""
+        self.assertEqual(self.decoder.predict(vmem=20.0, spatial_domain="ventral_ectoderm"), [])
+
+    def test_range_endpoints_inclusive(self):
+        """Test that range endpoints are treated as inside the range"""
+        self.assertEqual(len(self.decoder.predict(vmem=-50.0, spatial_domain="ventral_ectoderm")), 1)
+        self.assertEqual(len(self.decoder.predict(vmem=-30.0, spatial_domain="ventral_ectoderm")), 1)
+
+    def test_index_matches_linear_reference(self):
+        """Test that the interval-tree index agrees with the linear scan"""
+        decoder = BioDecoder()
+        decoder.library = make_library(300)
+        decoder._build_indexes()
+
+        rng = random.Random(1)
+        for _ in range(500):
+            vmem = rng.choice([rng.uniform(-90, 45), float(rng.randint(-90, 45)), float('nan')])
+            domain = rng.choice(['ectoderm', 'VENTRAL_ECTODERM', 'bud', 'stump', 'amputation_stump_left', 'gut'])
+            species = rng.choice([None, 'xenopus laevis', 'Danio rerio'])
+            self.assertEqual(decoder.predict(vmem, domain, species),
+                             decoder.predict_linear(vmem, domain, species))
+
+    def test_interval_tree_stab(self):
+        """Test stabbing queries on a standalone interval tree"""
+        tree = IntervalTree([(0, 10, 'a'), (5, 15, 'b'), (20, 20, 'c')])
+        self.assertEqual(sorted(tree.stab(7)), ['a', 'b'])
+        self.assertEqual(tree.stab(20), ['c'])
+        self.assertEqual(tree.stab(17), [])
+        self.assertEqual(tree.stab(float('nan')), [])
+
+    def test_predict_many_matches_predict(self):
+        """Test that vectorized decoding agrees with per-point predict"""
+        decoder = BioDecoder()
+        decoder.library = make_library(200, seed=3)
+        decoder._build_indexes()
+
+        names = ['ectoderm', None, 'bud', 'gut', 'amputation_stump']
+        rng = np.random.default_rng(0)
+        vmem_map = rng.uniform(-90, 45, size=(40, 50)).astype(np.float32)
+        vmem_map[::7, ::3] = np.round(vmem_map[::7, ::3])
+        vmem_map[0, 0] = np.nan
+        labels = rng.integers(-1, len(names) + 1, size=vmem_map.shape)
+
+        for species in [None, 'Danio rerio']:
+            ids = decoder.predict_many(vmem_map, labels, names, species=species)
+            self.assertEqual(ids.shape, vmem_map.shape)
+            for (y, x), pos in np.ndenumerate(ids):
+                label = labels[y, x]
+                name = names[label] if 0 <= label < len(names) else None
+                expected = decoder.predict_linear(float(vmem_map[y, x]), name, species) if name else []
+                self.assertEqual(pos, decoder.library.index(expected[0]) if expected else -1)
+
+    def test_predict_many_label_mapping(self):
+        """Test decoding a small map with a dict of label names"""
+        vmem_map = np.array([[-40.0, -40.0], [-10.0, 50.0]])
+        labels = np.array([[1, 0], [2, 2]])
+        ids = self.decoder.predict_many(vmem_map, labels, {1: 'ventral_ectoderm', 2: 'regeneration_bud'})
+        self.assertEqual(ids.tolist(), [[0, -1], [1, -1]])
+
+
+class TestScoringDecoder(unittest.TestCase):
+
+    def setUp(self):
+        self.decoder = BioDecoder()
+
+    def test_in_range_match_scores_one(self):
+        """Test that a hard match ranks first with likelihood 1"""
+        results = self.decoder.predict_scored(-40.0, "ventral_ectoderm", "Xenopus laevis")
+        self.assertEqual(results[0]['subroutine']['id'], 'xenopus_ectopic_eye_induction_v1')
+        self.assertEqual(results[0]['likelihood'], 1.0)
+
+    def test_near_miss_is_graded(self):
+        """Test that a voltage just outside the range still ranks, with lower likelihood"""
+        self.assertEqual(self.decoder.predict(-53.0, "ventral_ectoderm"), [])
+        results = self.decoder.predict_scored(-53.0, "ventral_ectoderm")
+        self.assertEqual(results[0]['subroutine']['id'], 'xenopus_ectopic_eye_induction_v1')
+        self.assertTrue(0.5 < results[0]['likelihood'] < 1.0)
+        far = self.decoder.predict_scored(-75.0, "ventral_ectoderm")
+        self.assertEqual(far, [])
+
+    def test_species_is_a_prior_not_a_filter(self):
+        """Test that a species mismatch lowers the likelihood instead of excluding the match"""
+        results = self.decoder.predict_scored(0.0, "global_network", species="Xenopus laevis")
+        self.assertEqual(results[0]['subroutine']['id'], 'planaria_head_species_remodeling_v1')
+        self.assertAlmostEqual(results[0]['likelihood'], 0.1)
+        results = self.decoder.predict_scored(0.0, "global_network", species="Xenopus laevis", cross_species=0.5)
+        self.assertAlmostEqual(results[0]['likelihood'], 0.5)
+
+    def test_ties_rank_in_library_order(self):
+        """Test that top_k keeps the earliest library entries among tied scores"""
+        rng = np.random.default_rng(3)
+        scores = np.repeat(rng.choice([0.2, 0.5, 1.0], (20, 40)), 2, axis=1).astype(np.float32)
+        positions, likelihoods, _ = self.decoder.scorer.top_k(scores, 7)
+        for row, top in zip(scores, positions):
+            self.assertEqual(top.tolist(), np.argsort(-row, kind='stable')[:7].tolist())
+
+    def test_domain_similarity(self):
+        """Test that domain similarity orders exact, partial and unrelated domains"""
+        self.assertEqual(domain_similarity("Ventral_Ectoderm", "ventral_ectoderm"), 1.0)
+        self.assertGreater(domain_similarity("stump", "amputation_stump"),
+                           domain_similarity("dorsal_ectoderm", "ventral_ectoderm"))
+        self.assertGreater(domain_similarity("dorsal_ectoderm", "ventral_ectoderm"),
+                           domain_similarity("gut", "ventral_ectoderm"))
+
+    def test_batch_matches_single_observations(self):
+        """Test that ranking a batch equals ranking each observation alone"""
+        decoder = BioDecoder()
+        decoder.library = make_library(300, seed=5)
+        decoder._build_indexes()
+        rng = np.random.default_rng(2)
+        vmems = rng.uniform(-90, 45, 50)
+        domains = rng.choice(['ectoderm', 'bud', 'stump', 'gut'], 50).tolist()
+        positions, likelihoods, probabilities = decoder.rank_many(vmems, domains, 'Danio rerio', top_k=4)
+        self.assertEqual(positions.shape, (50, 4))
+        for i in range(50):
+            single = decoder.predict_scored(vmems[i], domains[i], 'Danio rerio', top_k=4)
+            self.assertEqual([r['position'] for r in single], [p for p in positions[i] if p >= 0])
+            self.assertTrue(np.all(np.diff(likelihoods[i]) <= 0))
+            self.assertLessEqual(probabilities[i].sum(), 1.0 + 1e-9)
+
+    def test_hard_matches_have_full_likelihood(self):
+        """Test that every predict() match scores 1 for an exact domain"""
+        decoder = BioDecoder()
+        decoder.library = make_library(300, seed=6)
+        decoder._build_indexes()
+        for vmem in np.linspace(-80, 20, 21):
+            for domain in ['ectoderm', 'bud']:
+                scores = decoder.scorer.likelihoods(vmem, domain)[0]
+                for match in decoder.predict(vmem, domain):
+                    if match['bioelectric_state']['spatial_domain'].lower() == domain:
+                        self.assertEqual(scores[decoder.library.index(match)], 1.0)
+
+    def test_report_shows_graded_confidence(self):
+        """Test that the report states graded and exact-match confidence"""
+        report = self.decoder.generate_report(self.decoder.predict_scored(-53.0, "ventral_ectoderm"))
+        self.assertIn("Confidence: Medium (likelihood", report)
+        report = self.decoder.generate_report(self.decoder.predict(-40.0, "ventral_ectoderm"))
+        self.assertIn("Confidence: High (Voltage matches", report)
+
+
+if __name__ == '__main__':
+    unittest.main()
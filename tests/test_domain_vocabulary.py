@@ -0,0 +1,127 @@
+"""
+Unit tests for the spatial domain vocabulary
+"""
+
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compiler.domain_vocabulary import DomainVocabulary, default_vocabulary, normalize
+from compiler.experiment_gen import BioCompiler
+from compiler.predict_morphology import BioDecoder
+
+
+class TestDomainVocabulary(unittest.TestCase):
+    def setUp(self):
+        self.vocabulary = DomainVocabulary()
+
+    def test_normalize(self):
+        self.assertEqual(normalize(" Amputation-Stump "), "amputation_stump")
+        self.assertEqual(normalize("ventral  ectoderm"), "ventral_ectoderm")
+
+    def test_resolves_names_and_synonyms(self):
+        self.assertEqual(self.vocabulary.resolve("Regeneration Bud"), "regeneration_bud")
+        self.assertEqual(self.vocabulary.resolve("stump"), "amputation_stump")
+        self.assertEqual(self.vocabulary.resolve("whole-body"), "global_network")
+
+    def test_suggests_for_free_form_names(self):
+        """Test token, prefix and fuzzy suggestions, which resolve() never makes"""
+        self.assertEqual(self.vocabulary.suggest("amputation_stump_left"), "amputation_stump")
+        self.assertEqual(self.vocabulary.suggest("posterior_blastema"), "blastema")
+        self.assertEqual(self.vocabulary.suggest("regen"), "regeneration_bud")
+        self.assertEqual(self.vocabulary.suggest("ventral_ectodrem"), "ventral_ectoderm")
+        self.assertEqual(self.vocabulary.suggest("stump"), "amputation_stump")
+        self.assertIsNone(self.vocabulary.suggest("bud"))
+        self.assertIsNone(self.vocabulary.suggest("gut"))
+        for name in ("amputation_stump_left", "regen", "ventral_ectodrem", "ventral_mesoderm"):
+            self.assertIsNone(self.vocabulary.resolve(name))
+
+    def test_ambiguity_resolves_to_common_ancestor(self):
+        vocabulary = DomainVocabulary({
+            'ectoderm': {},
+            'ventral_ectoderm': {'parent': 'ectoderm'},
+            'ventral_endoderm': {},
+        })
+        # 'ventral' prefixes ventral_ectoderm and ventral_endoderm, which share no ancestor.
+        self.assertIsNone(vocabulary.suggest("ventral"))
+        self.assertEqual(vocabulary.suggest("ecto"), "ectoderm")
+
+    def test_hierarchy(self):
+        self.assertEqual(self.vocabulary.ancestors("blastema"),
+                         ("blastema", "regeneration_bud", "amputation_stump"))
+        self.assertEqual(self.vocabulary.distance("blastema", "amputation_stump"), 2)
+        self.assertEqual(self.vocabulary.distance("amputation_stump", "blastema"), 2)
+        self.assertTrue(self.vocabulary.related("ectoderm", "ventral_ectoderm"))
+        self.assertFalse(self.vocabulary.related("dorsal_ectoderm", "ventral_ectoderm"))
+        # Unrecognized names only match themselves.
+        self.assertTrue(self.vocabulary.related("Gut", "gut"))
+        self.assertFalse(self.vocabulary.related("bud", "regeneration_bud"))
+
+    def test_unknown_names_do_not_borrow_known_domains(self):
+        """Test that unknown siblings never match a similar domain or fall back to the parent"""
+        self.assertFalse(self.vocabulary.related("ventral_mesoderm", "ventral_ectoderm"))
+        self.assertFalse(self.vocabulary.related("dorsal_mesoderm", "dorsal_ectoderm"))
+        self.assertFalse(self.vocabulary.related("lateral_ectoderm", "ectoderm"))
+        self.assertFalse(self.vocabulary.related("lateral_ectoderm", "ventral_ectoderm"))
+        self.assertEqual(self.vocabulary.ancestors("lateral_ectoderm"), ())
+
+    def test_scope_is_inherited(self):
+        self.assertEqual(self.vocabulary.scope("blastema"), "local")
+        self.assertEqual(self.vocabulary.scope("global_network"), "systemic")
+        self.assertIsNone(self.vocabulary.scope("neural_plate"))
+        self.assertIsNone(self.vocabulary.scope("ventral"))
+        self.assertIsNone(self.vocabulary.scope("stumpy"))
+
+    def test_rejects_inconsistent_specs(self):
+        with self.assertRaises(ValueError):
+            DomainVocabulary({'a_domain': {'synonyms': ['shared']}, 'b_domain': {'synonyms': ['shared']}})
+        with self.assertRaises(ValueError):
+            DomainVocabulary({'a_domain': {'parent': 'missing'}})
+        with self.assertRaises(ValueError):
+            DomainVocabulary({'a_domain': {'parent': 'b_domain'}, 'b_domain': {'parent': 'a_domain'}})
+
+    def test_default_is_shared(self):
+        self.assertIs(default_vocabulary(), default_vocabulary())
+
+
+class TestVocabularyConsumers(unittest.TestCase):
+    def test_spatial_risk_uses_hierarchy(self):
+        compiler = BioCompiler()
+        systemic = {'type': 'Bath Application', 'spatial_restriction': 'systemic'}
+        self.assertIsNotNone(compiler._analyze_spatial_risks("blastema", systemic))
+        self.assertIsNotNone(compiler._analyze_spatial_risks("Amputation Stump", systemic))
+        self.assertIsNone(compiler._analyze_spatial_risks("global_network", systemic))
+        self.assertIsNone(compiler._analyze_spatial_risks("stumpy", systemic))
+
+    def test_find_by_domain_accepts_synonyms(self):
+        compiler = BioCompiler()
+        self.assertEqual(compiler.find_by_domain("stump"), compiler.find_by_domain("amputation_stump"))
+        self.assertTrue(compiler.find_by_domain("stump"))
+
+    def test_predict_matches_parts_not_substrings(self):
+        decoder = BioDecoder()
+        decoder.library = [
+            {'id': domain, 'target_morphology': {'organ': 'limb', 'species': 'Xenopus laevis'},
+             'bioelectric_state': {'target_vmem_range': [-60.0, -20.0], 'spatial_domain': domain}}
+            for domain in ['amputation_stump', 'blastema', 'tail_bud', 'dorsal_ectoderm']
+        ]
+        decoder._build_indexes()
+        ids = [sub['id'] for sub in decoder.predict(-40.0, "regeneration_bud")]
+        self.assertEqual(ids, ['amputation_stump', 'blastema'])
+        self.assertEqual([sub['id'] for sub in decoder.predict(-40.0, "bud")], [])
+        self.assertEqual(decoder.predict(-40.0, "regeneration_bud"),
+                         decoder.predict_linear(-40.0, "regeneration_bud"))
+
+    def test_predict_ignores_unknown_siblings(self):
+        """Test that mesoderm queries no longer match ectoderm subroutines"""
+        decoder = BioDecoder()
+        self.assertEqual(decoder.predict(-40.0, "ventral_mesoderm"), [])
+        self.assertEqual(decoder.predict(-40.0, "lateral_ectoderm"), [])
+        self.assertEqual([sub['id'] for sub in decoder.predict(-40.0, "ventral_ectoderm")],
+                         ['xenopus_ectopic_eye_induction_v1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
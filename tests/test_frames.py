@@ -0,0 +1,223 @@
+"""
+Unit tests for in-memory frames and the shared-memory frame ring
+"""
+
+import unittest
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import shm
+from verification import frames
+from verification.dye_decode import BioStateValidator
+from verification.frames import FrameRing, as_frame
+from verification.kernel import RatiometricScratch
+
+SHAPE = (40, 56)
+
+
+def frame_pair(seed=0):
+    rng = np.random.default_rng(seed)
+    donor = rng.integers(40, 120, SHAPE, dtype=np.uint8)
+    acceptor = rng.integers(150, 250, SHAPE, dtype=np.uint8)
+    return donor, acceptor
+
+
+def mean_vmem_worker(ring, results):
+    """Analysis process: reduce every frame to (seq, mean Vmem, shares ring memory)."""
+    validator = BioStateValidator()
+    out = np.empty(ring.shape, dtype=np.float32)
+    scratch = RatiometricScratch()
+    for frame in ring.frames(timeout=30):
+        validator.compute_vmem_into(frame.donor, frame.acceptor, out, scratch)
+        results.put((frame.seq, float(out.mean()), np.shares_memory(frame.donor, ring._frames)))
+    ring.close()
+    results.put(None)
+
+
+def acquisition_worker(ring, pairs):
+    """Acquisition process that did not create the ring: writes every pair, then closes."""
+    for donor, acceptor in pairs:
+        ring.put(donor, acceptor, timeout=30)
+    ring.close_writer()
+    ring.close()
+
+
+class TestInMemoryFrames(unittest.TestCase):
+
+    def setUp(self):
+        self.validator = BioStateValidator()
+        self.donor, self.acceptor = frame_pair()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.donor_path = os.path.join(self.tmpdir.name, 'donor.png')
+        self.acceptor_path = os.path.join(self.tmpdir.name, 'acceptor.png')
+        cv2.imwrite(self.donor_path, self.donor)
+        cv2.imwrite(self.acceptor_path, self.acceptor)
+        self.expected = self.validator.analyze_ratiometric(self.donor_path, self.acceptor_path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_arrays_match_files(self):
+        vmem = self.validator.analyze_ratiometric(self.donor, self.acceptor)
+        np.testing.assert_array_equal(vmem, self.expected)
+
+    def test_shared_memory_blocks(self):
+        blocks = [shared_memory.SharedMemory(create=True, size=self.donor.nbytes) for _ in range(2)]
+        try:
+            for block, frame in zip(blocks, (self.donor, self.acceptor)):
+                block.buf[:frame.nbytes] = frame.tobytes()
+            view = as_frame(blocks[0], SHAPE)
+            self.assertTrue(np.shares_memory(view, np.ndarray(SHAPE, np.uint8, buffer=blocks[0].buf)))
+            del view
+            vmem = self.validator.analyze_ratiometric(blocks[0], blocks[1], shape=SHAPE)
+            np.testing.assert_array_equal(vmem, self.expected)
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    def test_attach_without_tracking(self):
+        """Test that attaching maps the owner's block and stays importable from frames"""
+        self.assertIs(frames.attach_shared_memory, shm.attach_shared_memory)
+        block = shared_memory.SharedMemory(create=True, size=self.donor.nbytes)
+        try:
+            block.buf[:self.donor.nbytes] = self.donor.tobytes()
+            attached = shm.attach_shared_memory(block.name)
+            np.testing.assert_array_equal(as_frame(attached, SHAPE), self.donor)
+            attached.close()
+        finally:
+            block.close()
+            block.unlink()
+
+    def test_buffer_protocol_objects(self):
+        donor = bytearray(self.donor.tobytes())
+        acceptor = memoryview(self.acceptor)
+        vmem = self.validator.analyze_ratiometric(donor, acceptor, shape=SHAPE)
+        np.testing.assert_array_equal(vmem, self.expected)
+
+        # 2-D buffers describe their own shape
+        self.assertEqual(as_frame(memoryview(self.donor)).shape, SHAPE)
+        with self.assertRaises(ValueError):
+            as_frame(bytes(donor))
+
+    def test_mixed_sources_and_mismatches(self):
+        vmem = self.validator.analyze_ratiometric(self.donor_path, self.acceptor)
+        np.testing.assert_array_equal(vmem, self.expected)
+        self.assertIsNone(self.validator.analyze_ratiometric(self.donor, self.acceptor[:8]))
+        self.assertIsNone(self.validator.analyze_ratiometric(self.donor, os.path.join(self.tmpdir.name, 'x.png')))
+
+
+class TestFrameRing(unittest.TestCase):
+
+    def test_round_trip_in_process(self):
+        with FrameRing(SHAPE, slots=2) as ring:
+            donor, acceptor = frame_pair()
+            self.assertEqual(ring.put(donor, acceptor, timestamp=12.5), 0)
+            frame = ring.get(timeout=5)
+            self.assertEqual((frame.seq, frame.timestamp), (0, 12.5))
+            np.testing.assert_array_equal(frame.donor, donor)
+            np.testing.assert_array_equal(frame.acceptor, acceptor)
+            self.assertTrue(np.shares_memory(frame.donor, ring._frames))
+            ring.release(frame)
+
+    def test_in_place_fill(self):
+        with FrameRing(SHAPE, dtype=np.uint16, slots=1) as ring:
+            index = ring.acquire()
+            donor, acceptor = ring.slot(index)
+            donor[:] = 1000
+            acceptor[:] = 2000
+            ring.publish(index)
+            frame = ring.get(timeout=5)
+            self.assertEqual(frame.donor.dtype, np.uint16)
+            self.assertEqual(int(frame.acceptor[0, 0]), 2000)
+            ring.release(frame)
+
+    def test_full_ring_drops_frames(self):
+        with FrameRing(SHAPE, slots=2) as ring:
+            donor, acceptor = frame_pair()
+            self.assertEqual(ring.put(donor, acceptor, timeout=0), 0)
+            self.assertEqual(ring.put(donor, acceptor, timeout=0), 1)
+            self.assertIsNone(ring.put(donor, acceptor, timeout=0))
+            self.assertEqual(ring.dropped, 1)
+            ring.release(ring.get(timeout=5))
+            self.assertEqual(ring.put(donor, acceptor, timeout=5), 2)
+
+    def test_frames_stop_after_close_writer(self):
+        with FrameRing(SHAPE, slots=3) as ring:
+            for seed in range(3):
+                ring.put(*frame_pair(seed))
+            ring.close_writer()
+            self.assertEqual([frame.seq for frame in ring.frames()], [0, 1, 2])
+            with self.assertRaises(queue.Empty):
+                ring.get(timeout=0.01)
+
+    def test_workers_share_ring_memory(self):
+        """Test that frames reach worker processes without being pickled"""
+        pairs = [frame_pair(seed) for seed in range(6)]
+        validator = BioStateValidator()
+        expected = [float(validator.analyze_ratiometric(d, a).mean()) for d, a in pairs]
+
+        context = multiprocessing.get_context()
+        results = context.Queue()
+        with FrameRing(SHAPE, slots=2, context=context) as ring:
+            workers = [context.Process(target=mean_vmem_worker, args=(ring, results)) for _ in range(2)]
+            for worker in workers:
+                worker.start()
+            for donor, acceptor in pairs:
+                ring.put(donor, acceptor, timeout=30)
+            ring.close_writer(readers=len(workers))
+
+            received, finished = {}, 0
+            while finished < len(workers):
+                item = results.get(timeout=30)
+                if item is None:
+                    finished += 1
+                else:
+                    received[item[0]] = item[1:]
+            for worker in workers:
+                worker.join(timeout=30)
+                self.assertEqual(worker.exitcode, 0)
+            name = ring.name
+
+        self.assertEqual(sorted(received), list(range(len(pairs))))
+        for seq, (mean, shared) in received.items():
+            self.assertAlmostEqual(mean, expected[seq], places=4)
+            self.assertTrue(shared)
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+    def test_separate_acquisition_process(self):
+        """Test that a process other than the creator can produce into the ring"""
+        pairs = [frame_pair(seed) for seed in range(5)]
+        context = multiprocessing.get_context()
+        with FrameRing(SHAPE, slots=2, context=context) as ring:
+            producer = context.Process(target=acquisition_worker, args=(ring, pairs))
+            producer.start()
+            received = []
+            for frame in ring.frames(timeout=30):
+                received.append(frame.seq)
+                np.testing.assert_array_equal(frame.donor, pairs[frame.seq][0])
+            producer.join(timeout=30)
+            self.assertEqual(producer.exitcode, 0)
+            self.assertEqual(received, list(range(len(pairs))))
+            self.assertEqual(ring.put(*pairs[0], timeout=0), len(pairs))
+
+    def test_rejects_bad_layout(self):
+        with self.assertRaises(ValueError):
+            FrameRing(SHAPE, slots=0)
+        with FrameRing(SHAPE, slots=1) as ring:
+            with self.assertRaises(ValueError):
+                ring.put(np.zeros(SHAPE[0] * SHAPE[1] + 1, np.uint8), np.zeros(SHAPE, np.uint8))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+Unit tests for spans, metrics export and leveled logging
+"""
+
+import unittest
+import unittest.mock
+import io
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compiler.experiment_gen import BioCompiler
+from compiler.predict_morphology import BioDecoder
+from instrumentation import Histogram, MetricsRegistry, configure_logging, get_logger
+from instrumentation import metrics
+from instrumentation.log import ROOT_LOGGER
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_disabled_span_is_shared_no_op(self):
+        registry = MetricsRegistry()
+        self.assertIs(registry.span('lookup'), registry.span('render'))
+        with registry.span('lookup'):
+            pass
+        registry.count('library_cache_total', result='hit')
+        self.assertEqual(registry.to_dict(), {'counters': [], 'histograms': []})
+
+    def test_enabled_span_records_duration(self):
+        registry = MetricsRegistry(enabled=True)
+        for _ in range(3):
+            with registry.span('lookup'):
+                pass
+        histogram = registry.histogram('span_seconds', span='lookup')
+        self.assertEqual(histogram.count, 3)
+        self.assertGreaterEqual(histogram.sum, 0.0)
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram(buckets=[1, 2, 4])
+        for value in [0.5, 1.5, 1.5, 3.0, 10.0]:
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [(1, 1), (2, 3), (4, 4), (float('inf'), 5)])
+        self.assertEqual(histogram.quantile(0.5), 2)
+        self.assertEqual(histogram.quantile(1.0), 10.0)
+        self.assertEqual(Histogram().quantile(0.5), 0.0)
+
+    def test_prometheus_export(self):
+        registry = MetricsRegistry(enabled=True)
+        registry.count('library_cache_total', result='miss')
+        registry.histogram('span_seconds', buckets=[0.1], span='verify').observe(0.05)
+        text = registry.to_prometheus()
+        self.assertIn('# TYPE morpholang_library_cache_total counter\n', text)
+        self.assertIn('morpholang_library_cache_total{result="miss"} 1\n', text)
+        self.assertIn('# TYPE morpholang_span_seconds histogram\n', text)
+        self.assertIn('morpholang_span_seconds_bucket{span="verify",le="0.1"} 1\n', text)
+        self.assertIn('morpholang_span_seconds_bucket{span="verify",le="+Inf"} 1\n', text)
+        self.assertIn('morpholang_span_seconds_count{span="verify"} 1\n', text)
+
+    def test_json_export(self):
+        registry = MetricsRegistry(enabled=True)
+        registry.count('library_cache_total', 2, result='hit')
+        exported = json.loads(registry.to_json())
+        self.assertEqual(exported['counters'],
+                         [{'name': 'library_cache_total', 'labels': {'result': 'hit'}, 'value': 2}])
+
+
+class TestPipelineSpans(unittest.TestCase):
+
+    def setUp(self):
+        metrics.registry.reset()
+        metrics.enable()
+
+    def tearDown(self):
+        metrics.disable()
+        metrics.registry.reset()
+
+    def test_compiler_and_decoder_record_spans(self):
+        compiler = BioCompiler()
+        subroutine = compiler.find_subroutine(organ="eye", species="Xenopus laevis")
+        compiler.generate_protocol(subroutine)
+        BioDecoder().predict(vmem=-40.0, spatial_domain="ventral_ectoderm")
+
+        spans = {h['labels']['span']: h['count'] for h in metrics.registry.to_dict()['histograms']}
+        self.assertEqual(spans['lookup'], 1)
+        self.assertEqual(spans['render'], 1)
+        self.assertEqual(spans['decode'], 1)
+
+
+class TestLogging(unittest.TestCase):
+
+    def tearDown(self):
+        logger = logging.getLogger(ROOT_LOGGER)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        logger.setLevel(logging.NOTSET)
+        logger.propagate = True
+
+    def test_info_is_silent_by_default(self):
+        stdout = io.StringIO()
+        with unittest.mock.patch('sys.stdout', stdout):
+            BioCompiler().find_subroutine(organ="eye", species="Xenopus laevis")
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertFalse(get_logger('compiler.experiment_gen').isEnabledFor(logging.INFO))
+
+    def test_configured_console_format(self):
+        stream = io.StringIO()
+        configure_logging(stream=stream)
+        BioCompiler().find_subroutine(organ="eye", species="Xenopus laevis")
+        get_logger('test').warning("Snapshot is stale.")
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(lines[0], "[*] Compiling request: Build 'eye' in 'Xenopus laevis'...")
+        self.assertEqual(lines[-1], "[!] Warning: Snapshot is stale.")
+
+    def test_reconfiguring_replaces_handler(self):
+        first, second = io.StringIO(), io.StringIO()
+        configure_logging(stream=first)
+        configure_logging(level=logging.WARNING, stream=second)
+        get_logger('test').info("hidden")
+        get_logger('test').error("shown")
+        self.assertEqual(first.getvalue(), '')
+        self.assertEqual(second.getvalue(), "[!] Error: shown\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+Unit tests for inverse design of new subroutines
+"""
+
+import unittest
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compiler.experiment_gen import BioCompiler
+from compiler.inverse_design import DesignGeometry, InverseDesigner, physical_effect
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), '..', 'subroutine_schema.json')
+
+
+class TestInverseDesign(unittest.TestCase):
+
+    def setUp(self):
+        self.compiler = BioCompiler()
+        self.template = self.compiler.find_subroutines("eye", "Xenopus laevis")[0]
+        self.designer = InverseDesigner(self.compiler.library, DesignGeometry((24, 24)), workers=1)
+        self.space = {'drivers': ['Kv1.5', 'Kir4.1', 'ChR2'], 'doses': (0.5, 1.0, 1.5), 'max_drivers': 2}
+
+    def test_equivalent_candidates_share_a_simulation(self):
+        """Test that drivers with the same electrical effect map to one memo key"""
+        self.assertEqual(physical_effect([('Kv1.5', 1.5)], 'local'), physical_effect([('Kir4.1', 1.0)], 'local'))
+        self.assertNotEqual(physical_effect([('Kv1.5', 1.0)], 'local'), physical_effect([('Kv1.5', 1.0)], 'systemic'))
+
+    def test_search_is_memoized(self):
+        """Test that unique lattices are simulated once, across searches"""
+        first = self.designer.search(self.template['bioelectric_state'], top_k=3, **self.space)
+        stats = self.designer.stats()
+        self.assertLess(stats['simulated'], stats['candidates'])
+
+        second = self.designer.search(self.template['bioelectric_state'], top_k=3, **self.space)
+        self.assertEqual(self.designer.stats()['simulated'], stats['simulated'])
+        self.assertEqual(first, second)
+        self.assertGreaterEqual(first[0]['score'], first[-1]['score'])
+
+    def test_best_candidate_reaches_target(self):
+        best = self.designer.search(self.template['bioelectric_state'], top_k=1, **self.space)[0]
+        self.assertGreater(best['in_range_fraction'], 0.9)
+        low, high = self.template['bioelectric_state']['target_vmem_range']
+        self.assertTrue(low <= best['domain_mean_vmem'] <= high)
+
+    def test_design_emits_schema_subroutines(self):
+        """Test that proposals carry every schema-required field"""
+        with open(SCHEMA_PATH) as f:
+            schema = json.load(f)
+        proposals = self.designer.design(self.template, top_k=2, **self.space)
+        self.assertEqual(len(proposals), 2)
+        for proposal in proposals:
+            for field in schema['required']:
+                self.assertIn(field, proposal)
+            self.assertIn(proposal['delivery_method']['spatial_restriction'], ('local', 'regional', 'systemic'))
+            self.assertEqual(proposal['target_morphology'], self.template['target_morphology'])
+        self.assertNotEqual(proposals[0]['id'], proposals[1]['id'])
+        protocol = self.compiler.generate_protocol(proposals[0])
+        self.assertIn("PHASE 2: HARDWARE SELECTION", protocol)
+
+    def test_proposals_do_not_share_template_sections(self):
+        """Test that editing a proposal leaves the library entry and other proposals alone"""
+        original = json.dumps(self.template, sort_keys=True)
+        first, second = self.designer.design(self.template, top_k=2, **self.space)
+        first['control_loop']['feedback_mechanism']['if_vmem_drifts_above'] = 99
+        first['bioelectric_state']['target_vmem_range'][0] = -99
+        self.assertEqual(json.dumps(self.template, sort_keys=True), original)
+        self.assertNotEqual(second['control_loop']['feedback_mechanism']['if_vmem_drifts_above'], 99)
+
+
+if __name__ == '__main__':
+    unittest.main()
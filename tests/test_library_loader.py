@@ -0,0 +1,115 @@
+"""
+Unit tests for the shared library loader
+"""
+
+import unittest
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compiler.experiment_gen import BioCompiler
+from compiler.predict_morphology import BioDecoder
+from compiler.library_loader import LibraryCache, default_database_path, invalidate_library
+
+
+def write_library(path, ids):
+    with open(path, 'w') as f:
+        json.dump([{'id': i} for i in ids], f)
+
+
+class TestLibraryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'library.json')
+        write_library(self.path, ['a', 'b'])
+        self.cache = LibraryCache(maxsize=2)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_repeated_loads_are_cached(self):
+        """Test that an unchanged file is parsed only once"""
+        first = self.cache.load(self.path)
+        second = self.cache.load(self.path)
+        self.assertIs(first, second)
+        self.assertEqual((self.cache.misses, self.cache.hits), (1, 1))
+
+    def test_hot_reload_on_change(self):
+        """Test that a modified file is re-read on the next load"""
+        first = self.cache.load(self.path)
+        write_library(self.path, ['a', 'b', 'c'])
+        os.utime(self.path, ns=(0, os.stat(self.path).st_mtime_ns + 1000))
+        second = self.cache.load(self.path)
+        self.assertEqual([e['id'] for e in second], ['a', 'b', 'c'])
+        self.assertIsNot(first, second)
+
+    def test_explicit_invalidation(self):
+        """Test that invalidate forces a re-parse"""
+        first = self.cache.load(self.path)
+        self.cache.invalidate(self.path)
+        self.assertIsNot(first, self.cache.load(self.path))
+
+    def test_lru_eviction(self):
+        """Test that the least recently used library is evicted"""
+        paths = []
+        for name in ['x', 'y', 'z']:
+            path = os.path.join(self.tmpdir.name, f'{name}.json')
+            write_library(path, [name])
+            paths.append(path)
+        first = self.cache.load(paths[0])
+        self.cache.load(paths[1])
+        self.cache.load(paths[2])
+        self.assertIsNot(first, self.cache.load(paths[0]))
+
+    def test_derived_objects_follow_library(self):
+        """Test that derived objects are memoized per cached library"""
+        library = self.cache.load(self.path)
+        calls = []
+        factory = lambda lib: calls.append(1) or len(lib)
+        self.assertEqual(self.cache.derive(library, 'size', factory), 2)
+        self.assertEqual(self.cache.derive(library, 'size', factory), 2)
+        self.assertEqual(len(calls), 1)
+
+        self.cache.derive([{'id': 'x'}], 'size', factory)
+        self.assertEqual(len(calls), 2)
+
+    def test_missing_file(self):
+        """Test that a missing database yields an empty library"""
+        self.assertEqual(self.cache.load(os.path.join(self.tmpdir.name, 'missing.json')), [])
+
+
+class TestSharedLoading(unittest.TestCase):
+
+    def test_compiler_and_decoder_share_library(self):
+        """Test that compiler and decoder instances reuse one parsed library"""
+        invalidate_library()
+        compiler = BioCompiler()
+        decoder = BioDecoder()
+        self.assertIs(compiler.library, decoder.library)
+        self.assertIs(BioCompiler().index, compiler.index)
+        self.assertIs(BioDecoder().vmem_index, decoder.vmem_index)
+
+    def test_refresh_picks_up_changes(self):
+        """Test that refresh reloads a database changed on disk"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'db.json')
+            with open(default_database_path(), 'r') as f:
+                seed = json.load(f)
+            with open(path, 'w') as f:
+                json.dump(seed[:1], f)
+            compiler = BioCompiler(database_path=path)
+            self.assertIsNone(compiler.find_subroutine("tail", "Xenopus laevis"))
+
+            with open(path, 'w') as f:
+                json.dump(seed, f)
+            invalidate_library(path)
+            compiler.refresh()
+            self.assertIsNotNone(compiler.find_subroutine("tail", "Xenopus laevis"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+"""
+Unit tests for bulk schema validation
+"""
+
+import copy
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compiler.schema_validator import SchemaValidator, compile_schema, validate_corpus
+
+SEED_DATABASE = os.path.join(os.path.dirname(__file__), '..', 'database', 'database_seed.json')
+
+
+def load_seed():
+    with open(SEED_DATABASE, 'r') as f:
+        return json.load(f)
+
+
+class TestCompiledSchema(unittest.TestCase):
+    def test_keywords(self):
+        check = compile_schema({
+            'type': 'object',
+            'required': ['name'],
+            'properties': {
+                'name': {'type': 'string'},
+                'kind': {'type': 'string', 'enum': ['a', 'b']},
+                'values': {'type': 'array', 'items': {'type': 'number'}},
+            },
+        })
+        errors = []
+        check({'kind': 'c', 'values': [1, 2.5, True, 'x']}, '', errors)
+        self.assertEqual([(pointer, code) for pointer, code, _ in errors],
+                         [('', 'required'), ('/kind', 'enum'), ('/values/2', 'type'), ('/values/3', 'type')])
+
+        errors = []
+        check([], '', errors)
+        self.assertEqual(errors, [('', 'type', 'expected object, got list')])
+
+    def test_rejects_unsupported_types(self):
+        with self.assertRaises(ValueError):
+            compile_schema({'type': 'decimal'})
+
+
+class TestSchemaValidator(unittest.TestCase):
+    def setUp(self):
+        self.validator = SchemaValidator()
+        self.entry = copy.deepcopy(load_seed()[0])
+
+    def test_seed_entries_are_valid(self):
+        for entry in load_seed():
+            self.assertEqual(self.validator.validate(entry), [], entry['id'])
+
+    def test_structured_errors(self):
+        del self.entry['control_loop']['termination_criteria']['max_duration_hours']
+        self.entry['delivery_method']['type'] = 'osmosis'
+        errors = self.validator.validate(self.entry, source='db.json', index=7)
+        self.assertEqual([(e['path'], e['code']) for e in errors],
+                         [('/control_loop/termination_criteria', 'required'), ('/delivery_method/type', 'enum')])
+        self.assertEqual(errors[0]['source'], 'db.json')
+        self.assertEqual(errors[0]['index'], 7)
+        self.assertEqual(errors[0]['id'], self.entry['id'])
+
+    def test_semantic_checks(self):
+        state = self.entry['bioelectric_state']
+        state['target_vmem_range'] = [-30, -50]
+        feedback = self.entry['control_loop']['feedback_mechanism']
+        feedback['if_vmem_drifts_above'] = -35
+        feedback['if_vmem_drifts_below'] = -60
+        state['duration_hours'] = 100
+        self.entry['control_loop']['termination_criteria']['max_duration_hours'] = 48
+        codes = [(e['path'], e['code'], e['severity']) for e in self.validator.validate(self.entry)]
+        self.assertEqual(codes, [
+            ('/bioelectric_state/target_vmem_range', 'vmem_range_order', 'warning'),
+            ('/control_loop/feedback_mechanism/if_vmem_drifts_above', 'feedback_thresholds', 'error'),
+            ('/bioelectric_state/duration_hours', 'duration_limit', 'error'),
+        ])
+
+        state['target_vmem_range'] = [-50, -40, -30]
+        self.assertIn(('vmem_range_size', 'error'),
+                      [(e['code'], e['severity']) for e in self.validator.validate(self.entry)])
+
+    def test_semantic_checks_tolerate_malformed_entries(self):
+        self.entry['bioelectric_state'] = 'ventral_ectoderm'
+        self.entry['control_loop']['feedback_mechanism'] = None
+        codes = [e['code'] for e in self.validator.validate(self.entry)]
+        self.assertEqual(codes, ['type', 'type'])
+
+
+class TestValidateCorpus(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        return path
+
+    def test_bundled_corpus_is_valid(self):
+        report = validate_corpus(workers=1)
+        self.assertEqual(report['errors'], [])
+        self.assertEqual(report['warnings'], [])
+        self.assertGreater(report['entries'], 0)
+
+    def test_reports_every_source(self):
+        seed = load_seed()
+        broken = copy.deepcopy(seed[1])
+        broken['bioelectric_state']['target_vmem_range'] = [0, -20]
+        paths = [
+            self.write('database.json', seed + [broken]),
+            self.write('single.json', seed[0]),
+            os.path.join(self.tmp, 'missing.json'),
+        ]
+        with open(os.path.join(self.tmp, 'torn.json'), 'w') as f:
+            f.write('[{"id": ')
+        paths.append(os.path.join(self.tmp, 'torn.json'))
+
+        report = validate_corpus(paths, workers=2)
+        self.assertEqual(report['entries'], len(seed) + 2)
+        self.assertEqual([(os.path.basename(e['source']), e['index'], e['code']) for e in report['errors']], [
+            ('database.json', len(seed), 'duplicate_id'),
+            ('missing.json', None, 'parse'),
+            ('torn.json', None, 'parse'),
+        ])
+        self.assertEqual([(os.path.basename(e['source']), e['index'], e['code']) for e in report['warnings']],
+                         [('database.json', len(seed), 'vmem_range_order')])
+        self.assertEqual(report['invalid_entries'], 3)
+
+    def test_blocks_match_whole_files(self):
+        """Test that splitting a large file into blocks reports the same errors"""
+        library = []
+        for i in range(50):
+            entry = copy.deepcopy(load_seed()[i % 4])
+            entry['id'] = f"entry_{i % 45}"
+            if i % 7 == 0:
+                entry['bioelectric_state']['duration_hours'] = 1000
+            library.append(entry)
+        path = self.write('large.json', library)
+
+        whole = validate_corpus([path], workers=1)
+        for workers in (1, 2):
+            split = validate_corpus([path], workers=workers, block_size=8, split_bytes=0)
+            self.assertEqual(split['errors'], whole['errors'])
+            self.assertEqual(split['warnings'], whole['warnings'])
+        self.assertEqual(sum(e['code'] == 'duplicate_id' for e in whole['errors']), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
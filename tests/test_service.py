@@ -0,0 +1,168 @@
+"""
+Unit tests for the local verification service
+"""
+
+import unittest
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from verification.calibration import CalibrationCache
+from verification.service import VerificationClient, VerificationService
+
+EYE = 'xenopus_ectopic_eye_induction_v1'  # target range [-50, -30] mV
+SHAPE = (64, 96)
+
+
+def frames_for(vmem, slope=100.0, intercept=-70.0):
+    """A uniform donor/acceptor pair that decodes to `vmem` under a linear calibration."""
+    acceptor = np.full(SHAPE, 200, dtype=np.uint8)
+    donor = np.full(SHAPE, round(200 * (vmem - intercept) / slope), dtype=np.uint8)
+    return donor, acceptor
+
+
+class TestVerificationService(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.socket_path = os.path.join(cls.tmpdir.name, 'morpholang.sock')
+        cls.cache = CalibrationCache(os.path.join(cls.tmpdir.name, 'calibration'))
+        levels = [-60.0, -40.0, -20.0, 0.0]
+        pairs = [frames_for(v, slope=60.0, intercept=-70.0) for v in levels]
+        cls.cache.fit('scope2', 'session-1', [d for d, _ in pairs], [a for _, a in pairs], levels)
+
+        cls.service = VerificationService(cls.socket_path, calibration_dir=cls.cache.root, workers=2)
+        cls.loop = asyncio.new_event_loop()
+        asyncio.run_coroutine_threadsafe(cls.service.start(), cls.loop)
+        cls.thread = threading.Thread(target=cls.loop.run_forever, daemon=True)
+        cls.thread.start()
+        while not os.path.exists(cls.socket_path):
+            threading.Event().wait(0.01)
+
+    @classmethod
+    def tearDownClass(cls):
+        asyncio.run_coroutine_threadsafe(cls.service.close(), cls.loop).result()
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join()
+        cls.loop.close()
+        cls.tmpdir.cleanup()
+
+    def client(self):
+        return VerificationClient(self.socket_path, timeout=30)
+
+    def test_ping(self):
+        with self.client() as client:
+            reply = client.ping()
+        self.assertEqual(reply['workers'], 2)
+        self.assertEqual(reply['subroutines'], len(self.service.subroutines))
+
+    def test_verify_shared_memory_frames(self):
+        with self.client() as client:
+            inside = client.verify(EYE, *frames_for(-40.0))
+            outside = client.verify(EYE, *frames_for(-10.0))
+        self.assertTrue(inside['success'])
+        self.assertAlmostEqual(inside['mean_vmem'], -40.0, places=3)
+        self.assertEqual(inside['in_range_fraction'], 1.0)
+        self.assertEqual(inside['target_vmem_range'], [-50, -30])
+        self.assertFalse(outside['success'])
+        self.assertIn("Deviation: 20.00 mV", outside['message'])
+
+    def test_verify_files(self):
+        donor, acceptor = frames_for(-45.0)
+        donor_path = os.path.join(self.tmpdir.name, 'donor.png')
+        acceptor_path = os.path.join(self.tmpdir.name, 'acceptor.png')
+        cv2.imwrite(donor_path, donor)
+        cv2.imwrite(acceptor_path, acceptor)
+        with self.client() as client:
+            reply = client.verify_files(EYE, donor_path, acceptor_path)
+        self.assertTrue(reply['success'])
+
+    def test_rig_calibration_is_applied(self):
+        """Test that a rig's cached maps replace the global calibration"""
+        donor, acceptor = frames_for(-40.0, slope=60.0, intercept=-70.0)
+        with self.client() as client:
+            uncalibrated = client.verify(EYE, donor, acceptor)
+            calibrated = client.verify(EYE, donor, acceptor, rig='scope2')
+            with self.assertRaises(RuntimeError):
+                client.verify(EYE, donor, acceptor, rig='scope9')
+        self.assertFalse(uncalibrated['success'])
+        self.assertTrue(calibrated['success'])
+        self.assertAlmostEqual(calibrated['mean_vmem'], -40.0, delta=0.5)
+
+    def test_refits_apply_without_reload(self):
+        """Test that a refit, or a newer session, takes effect on the next request"""
+        levels = [-60.0, -40.0, -20.0, 0.0]
+
+        def fit(session, slope):
+            pairs = [frames_for(v, slope=slope, intercept=-70.0) for v in levels]
+            self.cache.fit('scope3', session, [d for d, _ in pairs], [a for _, a in pairs], levels)
+
+        def decoded(client, slope, **rig):
+            return client.verify(EYE, *frames_for(-40.0, slope=slope, intercept=-70.0), rig='scope3', **rig)
+
+        fit('session-1', 60.0)
+        with self.client() as client:
+            self.assertAlmostEqual(decoded(client, 60.0)['mean_vmem'], -40.0, delta=0.5)
+            fit('session-1', 150.0)
+            self.assertAlmostEqual(decoded(client, 150.0, session='session-1')['mean_vmem'], -40.0, delta=0.5)
+            self.assertAlmostEqual(decoded(client, 150.0)['mean_vmem'], -40.0, delta=0.5)
+            fit('session-2', 80.0)
+            self.assertAlmostEqual(decoded(client, 80.0)['mean_vmem'], -40.0, delta=0.5)
+
+    def test_bad_requests_are_reported(self):
+        with self.client() as client:
+            with self.assertRaises(RuntimeError):
+                client.verify('missing_subroutine', *frames_for(-40.0))
+            with self.assertRaises(RuntimeError):
+                client.request({'op': 'explode', 'id': 7})
+            with self.assertRaises(RuntimeError):
+                client.request({'op': 'verify', 'subroutine': EYE, 'frames': {'shm': 'x', 'shape': [1], 'dtype': 'uint8'}})
+            self.assertEqual(client.ping()['workers'], 2)
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as raw:
+            raw.connect(self.socket_path)
+            raw.sendall(b'not json\n{"op": "ping", "id": "a"}\n')
+            replies = raw.makefile('rb')
+            self.assertIn(b'"ok": false', replies.readline())
+            self.assertIn(b'"id": "a"', replies.readline())
+
+    def test_concurrent_clients(self):
+        def rig(vmem):
+            with self.client() as client:
+                return [client.verify(EYE, *frames_for(vmem))['success'] for _ in range(5)]
+
+        with ThreadPoolExecutor(max_workers=8) as clients:
+            results = list(clients.map(rig, [-40.0, -10.0] * 4))
+        self.assertEqual(results, [[True] * 5, [False] * 5] * 4)
+
+    def test_client_releases_shared_memory(self):
+        client = self.client()
+        client.verify(EYE, *frames_for(-40.0))
+        name = client._block.name
+        client.close()
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+    def test_reload_and_stats(self):
+        with self.client() as client:
+            self.assertEqual(client.reload()['subroutines'], len(self.service.subroutines))
+            client.ping()
+            stats = client.stats()
+        names = {(c['name'], c['labels']['op']) for c in stats['counters']}
+        self.assertIn(('service_requests_total', 'reload'), names)
+        self.assertTrue(any(h['name'] == 'service_request_seconds' for h in stats['histograms']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+"""
+Unit tests for the control loop simulator
+"""
+
+import unittest
+import sys
+import os
+import json
+import subprocess
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compiler.experiment_gen import BioCompiler
+from compiler.experiment_gen import default_checkpoints
+from simulation.control_loop import ControlLoopSimulator, DriftModel, parse_monitoring_frequency
+from simulation.sweep import candidate_schedules, run_sweep, uniform_schedule
+from simulation.tissue_field import TissueField
+from compiler.predict_morphology import BioDecoder
+from verification.dye_decode import BioStateValidator
+
+
+class TestMonitoringFrequency(unittest.TestCase):
+
+    def test_single_interval(self):
+        """Test a constant interval up to the safety cutoff"""
+        self.assertEqual(parse_monitoring_frequency("Every 6 hours from Stage 10.5 to Stage 24", 24),
+                         [0, 6, 12, 18, 24])
+
+    def test_multi_phase(self):
+        """Test schedules that change interval after an initial window"""
+        checkpoints = parse_monitoring_frequency(
+            "Every 4 hours for first 24h, then every 12 hours until tail elongation completes", 72)
+        self.assertEqual(checkpoints, [0, 4, 8, 12, 16, 20, 24, 36, 48, 60, 72])
+        self.assertEqual(parse_monitoring_frequency("Every 12 hours during 48h treatment window, then daily", 96),
+                         [0, 12, 24, 36, 48, 72, 96])
+
+    def test_unparseable(self):
+        with self.assertRaises(ValueError):
+            parse_monitoring_frequency("When convenient", 48)
+
+
+class TestControlLoopSimulator(unittest.TestCase):
+
+    def setUp(self):
+        self.subroutine = BioCompiler().find_subroutines("eye", "Xenopus laevis")[0]
+
+    def test_summary_shape(self):
+        """Test that the simulation reports per-embryo and summary results"""
+        result = ControlLoopSimulator(self.subroutine).simulate(n_embryos=500, seed=1)
+        self.assertEqual(result['embryos'], 500)
+        self.assertEqual(len(result['per_embryo']['time_in_range']), 500)
+        self.assertAlmostEqual(sum(result['outcomes'].values()), 1.0)
+        self.assertTrue(0.0 <= result['time_in_range']['mean'] <= 1.0)
+        self.assertLessEqual(result['termination_hours']['p95'], 48)
+        self.assertLessEqual(result['imaging_sessions']['mean'], len(result['checkpoints']))
+
+    def test_reproducible_with_seed(self):
+        simulator = ControlLoopSimulator(self.subroutine)
+        first = simulator.simulate(n_embryos=200, seed=7)
+        second = simulator.simulate(n_embryos=200, seed=7)
+        np.testing.assert_array_equal(first['per_embryo']['interventions'],
+                                      second['per_embryo']['interventions'])
+
+    def test_no_drift_holds_target(self):
+        """Test that a noiseless tissue resting at the target never needs correction"""
+        drift = DriftModel(setpoint=-40.0, noise_mv=0.0, measurement_noise_mv=0.0, initial_spread_mv=0.0)
+        result = ControlLoopSimulator(self.subroutine, drift).simulate(n_embryos=50)
+        self.assertEqual(result['interventions']['mean'], 0.0)
+        self.assertEqual(result['outcomes']['target_reached'], 1.0)
+        self.assertEqual(result['time_in_range']['mean'], 1.0)
+
+    def test_denser_monitoring_keeps_more_time_in_range(self):
+        """Test that checking more often corrects drift sooner"""
+        drift = DriftModel(relaxation_hours=12.0, noise_mv=1.0)
+        simulator = ControlLoopSimulator(self.subroutine, drift)
+        sparse = simulator.simulate(n_embryos=2000, checkpoints=[0, 24, 48], seed=3)
+        dense = simulator.simulate(n_embryos=2000, checkpoints=np.arange(0, 49, 2), seed=3)
+        self.assertGreater(dense['time_in_range']['mean'], sparse['time_in_range']['mean'])
+
+    def test_requires_control_loop(self):
+        subroutine = dict(self.subroutine)
+        del subroutine['control_loop']
+        with self.assertRaises(ValueError):
+            ControlLoopSimulator(subroutine)
+
+    def test_runs_as_module_without_warnings(self):
+        """Test that the package does not pre-import control_loop before `python -m` runs it"""
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        result = subprocess.run([sys.executable, '-W', 'error::RuntimeWarning', '-m', 'simulation.control_loop',
+                                 '--help'], cwd=root, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+        import simulation
+        self.assertIs(simulation.ControlLoopSimulator, ControlLoopSimulator)
+        self.assertIs(simulation.TissueField, TissueField)
+
+
+class TestScheduleSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.subroutine = BioCompiler().find_subroutines("eye", "Xenopus laevis")[0]
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmpdir.name, 'sweep.jsonl')
+        self.schedules = {'every_6h': uniform_schedule(6, 48), 'every_24h': uniform_schedule(24, 48)}
+        self.thresholds = [(-30.0, -50.0), (-35.0, -45.0)]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def sweep(self, **kwargs):
+        return run_sweep(self.subroutine, schedules=self.schedules, thresholds=self.thresholds,
+                         n_embryos=300, cache_path=self.cache_path, workers=1, **kwargs)
+
+    def test_candidates_include_protocol_default(self):
+        schedules = candidate_schedules(ControlLoopSimulator(self.subroutine))
+        self.assertEqual(schedules['protocol_default'], default_checkpoints(48))
+        self.assertEqual(uniform_schedule(10, 48), [0, 10, 20, 30, 40, 48])
+
+    def test_picks_cheapest_feasible(self):
+        """Test that the best candidate meets the requirement with the fewest sessions"""
+        result = self.sweep(min_time_in_range=0.5)
+        self.assertEqual(len(result['results']), 4)
+        feasible = [r for r in result['results'] if r['time_in_range'] >= 0.5]
+        self.assertEqual(result['best']['imaging_sessions'], min(r['imaging_sessions'] for r in feasible))
+        self.assertIsNone(self.sweep(min_time_in_range=1.01)['best'])
+
+    def test_resumes_from_cache(self):
+        """Test that finished evaluations are not re-simulated, even after a torn write"""
+        first = self.sweep()
+        self.assertEqual((first['simulated'], first['cached']), (4, 0))
+
+        with open(self.cache_path) as f:
+            lines = f.readlines()
+        with open(self.cache_path, 'w') as f:
+            f.writelines(lines[:2])
+            f.write(lines[2][:20])  # interrupted mid-line
+
+        resumed = self.sweep()
+        self.assertEqual((resumed['simulated'], resumed['cached']), (2, 2))
+        self.assertEqual([r['key'] for r in resumed['results']], [r['key'] for r in first['results']])
+        with open(self.cache_path) as f:
+            for line in f:
+                json.loads(line)
+
+
+
+class TestTissueField(unittest.TestCase):
+
+    def setUp(self):
+        self.shape = (80, 60)
+        self.mask = np.zeros(self.shape, dtype=bool)
+        self.mask[20:60, 15:45] = True
+
+    def test_untreated_tissue_rests(self):
+        field = TissueField(self.shape, resting_vmem=-25.0)
+        vmem_map = field.solve()
+        self.assertEqual(vmem_map.dtype, np.float32)
+        np.testing.assert_allclose(vmem_map, -25.0, atol=1e-4)
+
+    def test_driver_hyperpolarizes_domain(self):
+        """Test that Kv1.5 pulls its domain down and coupling spreads it outward"""
+        field = TissueField(self.shape)
+        field.add_domain('ventral_ectoderm', self.mask)
+        field.apply_driver('Kv1.5', 'ventral_ectoderm')
+        vmem_map = field.solve()
+        self.assertTrue(field.last_solve['converged'])
+        self.assertLess(vmem_map[40, 30], vmem_map[40, 10])
+        self.assertLess(vmem_map[40, 10], vmem_map[40, 0] + 1e-3)
+        self.assertGreater(vmem_map[40, 30], -55.0)  # leak keeps it above E_K / 2 + rest / 2
+        self.assertLess(vmem_map[40, 30], -50.0)
+
+    def test_gap_junction_blocker_isolates(self):
+        """Test that blocking coupling sharpens the domain edge"""
+        coupled = TissueField(self.shape)
+        coupled.apply_driver('Kv1.5', self.mask)
+        blocked = TissueField(self.shape)
+        blocked.apply_driver('Kv1.5', self.mask)
+        blocked.apply_driver('Gap Junction Blocker (Octanol)', self.mask)
+        edge_coupled = coupled.solve()[40, 14]
+        edge_blocked = blocked.solve()[40, 14]
+        self.assertGreater(edge_blocked, edge_coupled)
+
+    def test_parallel_matches_serial(self):
+        field = TissueField(self.shape)
+        field.apply_driver('Kir4.1', self.mask)
+        serial = field.solve(tol=1e-9)
+        parallel = field.solve(tol=1e-9, workers=2, exchange_every=4)
+        np.testing.assert_allclose(parallel, serial, atol=1e-5)
+
+    def test_unknown_driver(self):
+        with self.assertRaises(ValueError):
+            TissueField(self.shape).apply_driver('Mystery Channel', self.mask)
+
+    def test_output_feeds_decoder_and_validator(self):
+        """Test that a simulated map goes straight into predict_many and verify_state"""
+        subroutine = BioCompiler().find_subroutines("eye", "Xenopus laevis")[0]
+        field = TissueField(self.shape, resting_vmem=-5.0)
+        field.apply_subroutine(subroutine, self.mask, driver_index=1, dose=0.5)
+        vmem_map = field.solve()
+
+        success, _ = BioStateValidator().verify_state(vmem_map, subroutine['bioelectric_state'], self.mask)
+        self.assertTrue(success)
+        decoder = BioDecoder()
+        positions = decoder.predict_many(vmem_map, field.labels, field.domain_names)
+        self.assertEqual(positions.shape, self.shape)
+        self.assertTrue((positions[~self.mask] == -1).all())
+        inside = positions[self.mask]
+        self.assertEqual(decoder.library[int(np.bincount(inside[inside >= 0]).argmax())]['id'], subroutine['id'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+"""
+Unit tests for compiled database snapshots
+"""
+
+import unittest
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest.mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compiler.experiment_gen import BioCompiler
+from compiler.library_loader import default_database_path
+from compiler.predict_morphology import BioDecoder
+from compiler.snapshot import SnapshotLibrary, build_snapshot, default_sources, read_sources
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.sources = []
+        for path in default_sources():
+            target = os.path.join(self.tmpdir.name, os.path.basename(path))
+            shutil.copy(path, target)
+            self.sources.append(target)
+        self.snapshot_path = build_snapshot(os.path.join(self.tmpdir.name, 'library.mlsnap'), self.sources)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_round_trip(self):
+        """Test that the snapshot reproduces the merged JSON sources"""
+        snapshot = SnapshotLibrary(self.snapshot_path)
+        expected = read_sources(self.sources)
+        self.assertEqual(len(snapshot), len(expected))
+        self.assertEqual(list(snapshot), expected)
+        self.assertEqual(snapshot[-1], expected[-1])
+        self.assertTrue(snapshot.is_fresh())
+
+    def test_numeric_columns_are_zero_copy(self):
+        """Test that numeric columns are read-only views over the mapping"""
+        snapshot = SnapshotLibrary(self.snapshot_path)
+        low = snapshot.column('vmem_low')
+        self.assertFalse(low.flags.writeable)
+        self.assertEqual(low.tolist(), [sorted(s['bioelectric_state']['target_vmem_range'])[0]
+                                        for s in read_sources(self.sources)])
+        self.assertTrue(np.isnan(snapshot.column('drift_above')).sum() == 0)
+        self.assertEqual(snapshot.column('organ'), ['eye', 'tail', 'head', 'limb'])
+
+    def test_compiler_and_decoder_use_snapshot(self):
+        """Test that lookups and decoding work from a snapshot without decoding every document"""
+        compiler = BioCompiler(database_path=self.snapshot_path)
+        self.assertIsInstance(compiler.library, SnapshotLibrary)
+        result = compiler.find_subroutine(organ="tail", species="Xenopus laevis")
+        self.assertEqual(result['id'], 'xenopus_tail_regeneration_rescue_v1')
+        self.assertEqual(len(compiler.library._documents), 1)
+
+        decoder = BioDecoder(database_path=self.snapshot_path)
+        matches = decoder.predict(vmem=-40.0, spatial_domain="ventral_ectoderm")
+        self.assertEqual([m['id'] for m in matches], ['xenopus_ectopic_eye_induction_v1'])
+
+    def test_snapshot_is_opt_in(self):
+        """Test that the seed JSON stays the default and MORPHOLANG_DATABASE selects a snapshot"""
+        with unittest.mock.patch.dict(os.environ):
+            os.environ.pop('MORPHOLANG_DATABASE', None)
+            self.assertEqual(os.path.basename(default_database_path()), 'database_seed.json')
+            os.environ['MORPHOLANG_DATABASE'] = self.snapshot_path
+            compiler = BioCompiler()
+        self.assertIsInstance(compiler.library, SnapshotLibrary)
+        self.assertEqual(len(compiler.library), len(read_sources(self.sources)))
+
+    def test_stale_snapshot_falls_back_to_json(self):
+        """Test that editing a source makes the loader parse JSON instead"""
+        with open(self.sources[0], 'r') as f:
+            seed = json.load(f)
+        seed[0]['target_morphology']['organ'] = 'brain'
+        with open(self.sources[0], 'w') as f:
+            json.dump(seed, f)
+
+        compiler = BioCompiler(database_path=self.snapshot_path)
+        self.assertNotIsInstance(compiler.library, SnapshotLibrary)
+        self.assertIsNotNone(compiler.find_subroutine(organ="brain", species="Xenopus laevis"))
+
+    def test_new_glob_match_makes_snapshot_stale(self):
+        """Test that a new file matching a recorded source glob is picked up"""
+        subroutines = os.path.join(self.tmpdir.name, 'subroutines')
+        os.makedirs(subroutines)
+        pattern = os.path.join(subroutines, '*.json')
+        path = build_snapshot(os.path.join(self.tmpdir.name, 'globbed.mlsnap'), self.sources[:1], [pattern])
+        self.assertTrue(SnapshotLibrary(path).is_fresh())
+
+        new = dict(read_sources(self.sources[:1])[0], id='new_brain_subroutine_v1')
+        new['target_morphology'] = dict(new['target_morphology'], organ='brain')
+        with open(os.path.join(subroutines, 'new_brain.json'), 'w') as f:
+            json.dump(new, f)
+        snapshot = SnapshotLibrary(path)
+        self.assertFalse(snapshot.is_fresh())
+        self.assertEqual(snapshot.current_sources()[-1], os.path.join(subroutines, 'new_brain.json'))
+
+        compiler = BioCompiler(database_path=path)
+        self.assertNotIsInstance(compiler.library, SnapshotLibrary)
+        self.assertEqual(compiler.find_subroutine(organ="brain", species=new['target_morphology']['species'])['id'],
+                         'new_brain_subroutine_v1')
+
+    def test_rejects_foreign_files(self):
+        """Test that a non-snapshot file is rejected"""
+        with self.assertRaises(ValueError):
+            SnapshotLibrary(self.sources[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+"""
+Unit tests for the SQLite subroutine store
+"""
+
+import unittest
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import sys
+import tempfile
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compiler.experiment_gen import BioCompiler
+from compiler.library_index import SubroutineIndex, index_rows
+from compiler.predict_morphology import BioDecoder
+from compiler.snapshot import default_sources, read_sources
+from compiler.sqlite_store import SubroutineStore, build_store
+from compiler.vmem_index import VmemIndex
+
+
+def _lookup_ids(task):
+    store, organ, species = task
+    return [sub['id'] for sub in store.lookup(organ, species)]
+
+
+class TestSubroutineStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.sources = []
+        for path in default_sources():
+            target = os.path.join(self.tmpdir.name, os.path.basename(path))
+            shutil.copy(path, target)
+            self.sources.append(target)
+        self.store_path = build_store(os.path.join(self.tmpdir.name, 'library.sqlite'), self.sources)
+        self.library = read_sources(self.sources)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_round_trip(self):
+        """Test that the store reproduces the merged JSON sources"""
+        store = SubroutineStore(self.store_path)
+        self.assertEqual(len(store), len(self.library))
+        self.assertEqual(list(store), self.library)
+        self.assertEqual(store[-1], self.library[-1])
+        self.assertEqual(store[1:3], self.library[1:3])
+        self.assertEqual(list(store.index_rows()), list(index_rows(self.library)))
+        self.assertTrue(store.is_fresh())
+
+    def test_lookups_match_in_memory_indexes(self):
+        store = SubroutineStore(self.store_path)
+        index, vmem_index = SubroutineIndex(self.library), VmemIndex(self.library)
+        self.assertEqual(store.lookup('Tail', 'xenopus laevis'), index.lookup('Tail', 'xenopus laevis'))
+        self.assertEqual(store.lookup('eye', 'Xenopus laevis', 'induce'), index.lookup('eye', 'Xenopus laevis', 'induce'))
+        self.assertEqual(store.by_domain('stump'), index.by_domain('stump'))
+        self.assertEqual(store.by_driver('kv1.5'), index.by_driver('kv1.5'))
+        self.assertEqual(store.domains(), index.domains())
+        self.assertEqual(store.drivers(), index.drivers())
+        for vmem in range(-60, 15, 5):
+            for domain in ['ventral_ectoderm', 'stump', 'blastema', 'global_network', 'gut']:
+                self.assertEqual(store.query(vmem, domain), vmem_index.query(vmem, domain))
+                self.assertEqual(store.query(vmem, domain, 'Xenopus laevis'),
+                                 vmem_index.query(vmem, domain, 'Xenopus laevis'))
+
+    def test_compiler_and_decoder_push_filters_down(self):
+        """Test that lookups go through SQL and only matching documents are decoded"""
+        compiler = BioCompiler(database_path=self.store_path)
+        self.assertIsInstance(compiler.library, SubroutineStore)
+        self.assertIs(compiler.index, compiler.library)
+        result = compiler.find_subroutine(organ="tail", species="Xenopus laevis")
+        self.assertEqual(result['id'], 'xenopus_tail_regeneration_rescue_v1')
+        self.assertEqual(len(compiler.library._documents), 1)
+
+        decoder = BioDecoder(database_path=self.store_path)
+        self.assertIs(decoder.vmem_index, decoder.library)
+        matches = decoder.predict(vmem=-40.0, spatial_domain="ventral_ectoderm")
+        self.assertEqual([m['id'] for m in matches], ['xenopus_ectopic_eye_induction_v1'])
+
+    def test_document_cache_is_bounded(self):
+        store = SubroutineStore(self.store_path, cache_size=2)
+        for i in range(len(store)):
+            store[i]
+        self.assertEqual(len(store._documents), 2)
+
+    def test_store_is_read_only(self):
+        store = SubroutineStore(self.store_path)
+        with self.assertRaises(sqlite3.OperationalError):
+            store._connection().execute("DELETE FROM subroutines")
+
+    def test_workers_share_one_store(self):
+        store = SubroutineStore(self.store_path)
+        self.assertEqual(pickle.loads(pickle.dumps(store))[0], store[0])
+        tasks = [(store, 'tail', 'Xenopus laevis'), (store, 'eye', 'Xenopus laevis')]
+        with Pool(2) as pool:
+            results = pool.map(_lookup_ids, tasks)
+        self.assertEqual(results, [['xenopus_tail_regeneration_rescue_v1'], ['xenopus_ectopic_eye_induction_v1']])
+
+    def test_stale_store_falls_back_to_json(self):
+        """Test that editing a source makes the loader parse JSON instead"""
+        with open(self.sources[0], 'r') as f:
+            seed = json.load(f)
+        seed[0]['target_morphology']['organ'] = 'brain'
+        with open(self.sources[0], 'w') as f:
+            json.dump(seed, f)
+
+        compiler = BioCompiler(database_path=self.store_path)
+        self.assertNotIsInstance(compiler.library, SubroutineStore)
+        self.assertIsNotNone(compiler.find_subroutine(organ="brain", species="Xenopus laevis"))
+
+    def test_failed_build_leaves_no_files(self):
+        """Test that a build failing midway removes its temporary database"""
+        torn = os.path.join(self.tmpdir.name, 'torn.json')
+        with open(torn, 'w') as f:
+            f.write('[{"id": ')
+        output = os.path.join(self.tmpdir.name, 'broken.sqlite')
+        with self.assertRaises(ValueError):
+            build_store(output, self.sources + [torn])
+        self.assertFalse([name for name in os.listdir(self.tmpdir.name) if name.startswith('broken')])
+
+    def test_rejects_foreign_files(self):
+        """Test that a non-store file is rejected"""
+        with self.assertRaises(ValueError):
+            SubroutineStore(self.sources[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
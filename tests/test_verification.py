@@ -0,0 +1,345 @@
+"""
+Unit tests for the BioStateValidator module
+"""
+
+import unittest
+import os
+import sys
+import tempfile
+import threading
+import unittest.mock
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from verification.dye_decode import BioStateValidator
+from verification.domains import grouped_statistics, masks_to_labels
+from verification.stack import discover_frames
+from verification.kernel import RatiometricScratch
+from verification.streaming import StreamingVerifier, synthetic_frames
+from verification.tiled import iter_tiles, open_image
+
+
+def random_pair(shape, seed=0):
+    """Random donor/acceptor images, with some zero acceptor pixels."""
+    rng = np.random.default_rng(seed)
+    donor = rng.integers(0, 256, size=shape, dtype=np.uint8)
+    acceptor = rng.integers(0, 256, size=shape, dtype=np.uint8)
+    acceptor[:8, :8] = 0
+    return donor, acceptor
+
+
+def reference_vmem(donor, acceptor, slope=100.0, intercept=-70.0):
+    """The original allocating pipeline, kept as the equivalence reference."""
+    img_d_blur = cv2.GaussianBlur(donor, (5, 5), 0).astype(np.float32)
+    img_a_blur = cv2.GaussianBlur(acceptor, (5, 5), 0).astype(np.float32)
+    img_a_blur[img_a_blur == 0] = 0.1
+    return ((img_d_blur / img_a_blur) * slope) + intercept
+
+
+class TestBioStateValidator(unittest.TestCase):
+
+    def setUp(self):
+        self.validator = BioStateValidator()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def test_mock_images_verify(self):
+        """Test the documented mock: R = 60/200 = 0.3 -> -40 mV"""
+        cv2.imwrite(self.path('donor.png'), np.full((100, 100), 60, dtype=np.uint8))
+        cv2.imwrite(self.path('acceptor.png'), np.full((100, 100), 200, dtype=np.uint8))
+        vmem_map = self.validator.analyze_ratiometric(self.path('donor.png'), self.path('acceptor.png'))
+        self.assertAlmostEqual(float(vmem_map.mean()), -40.0, places=4)
+
+        success, _ = self.validator.verify_state(vmem_map, {"target_vmem_range": [-50, -30],
+                                                            "spatial_domain": "ventral_ectoderm"})
+        self.assertTrue(success)
+
+    def test_tiled_matches_full_frame(self):
+        """Test that tiled processing reproduces the full-frame Vmem map exactly"""
+        donor, acceptor = random_pair((203, 157))
+        cv2.imwrite(self.path('donor.png'), donor)
+        cv2.imwrite(self.path('acceptor.png'), acceptor)
+        expected = self.validator.analyze_ratiometric(self.path('donor.png'), self.path('acceptor.png'))
+
+        np.save(self.path('donor.npy'), donor)
+        np.save(self.path('acceptor.npy'), acceptor)
+        for tile_size in (1, 5, 64, 1000):
+            result = self.validator.analyze_ratiometric_tiled(
+                self.path('donor.npy'), self.path('acceptor.npy'),
+                output_path=self.path('vmem.npy'), tile_size=tile_size)
+            np.testing.assert_array_equal(result, expected)
+        np.testing.assert_array_equal(np.load(self.path('vmem.npy')), expected)
+
+    def test_tiled_tiff_and_raw_inputs(self):
+        """Test memory-mapped TIFF and raw inputs"""
+        donor, acceptor = random_pair((120, 90), seed=1)
+        expected = self.validator._vmem_from_images(donor, acceptor)
+
+        params = [cv2.IMWRITE_TIFF_COMPRESSION, 1]
+        cv2.imwrite(self.path('donor.tif'), donor, params)
+        cv2.imwrite(self.path('acceptor.tif'), acceptor, params)
+        np.testing.assert_array_equal(open_image(self.path('donor.tif')), donor)
+        result = self.validator.analyze_ratiometric_tiled(self.path('donor.tif'), self.path('acceptor.tif'),
+                                                          tile_size=32)
+        np.testing.assert_array_equal(result, expected)
+
+        donor.tofile(self.path('donor.raw'))
+        acceptor.tofile(self.path('acceptor.raw'))
+        result = self.validator.analyze_ratiometric_tiled(self.path('donor.raw'), self.path('acceptor.raw'),
+                                                          tile_size=50, shape=donor.shape, dtype=np.uint8)
+        np.testing.assert_array_equal(result, expected)
+
+    def test_kernel_matches_reference(self):
+        """Test that the in-place kernel is bit-identical to the allocating pipeline"""
+        for dtype in (np.uint8, np.uint16, np.float32):
+            donor, acceptor = (a.astype(dtype) for a in random_pair((64, 48), seed=2))
+            out = np.empty(donor.shape, dtype=np.float32)
+            self.validator.compute_vmem_into(donor, acceptor, out, RatiometricScratch())
+            np.testing.assert_array_equal(out, reference_vmem(donor, acceptor))
+
+    def test_kernel_reuses_buffers(self):
+        """Test that repeated same-shaped frames allocate no new arrays"""
+        import tracemalloc
+        donor, acceptor = random_pair((256, 256), seed=3)
+        out = np.empty(donor.shape, dtype=np.float32)
+        scratch = RatiometricScratch(donor.shape, donor.dtype)
+        buffers = (scratch.blur_donor, scratch.acceptor, scratch.zero_mask)
+        self.validator.compute_vmem_into(donor, acceptor, out, scratch)
+
+        tracemalloc.start()
+        for _ in range(5):
+            self.validator.compute_vmem_into(donor, acceptor, out, scratch)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.assertLess(peak, donor.nbytes // 4)
+        self.assertEqual(buffers, (scratch.blur_donor, scratch.acceptor, scratch.zero_mask))
+        np.testing.assert_array_equal(out, reference_vmem(donor, acceptor))
+
+    def _write_frame_pairs(self, n_frames, shape=(40, 30)):
+        pairs = [random_pair(shape, seed=10 + t) for t in range(n_frames)]
+        frame_dir = self.path('frames')
+        os.mkdir(frame_dir)
+        for t, (donor, acceptor) in enumerate(pairs):
+            cv2.imwrite(os.path.join(frame_dir, f't{t:03d}_donor.png'), donor)
+            cv2.imwrite(os.path.join(frame_dir, f't{t:03d}_acceptor.png'), acceptor)
+        return frame_dir, pairs
+
+    def test_stack_from_directory(self):
+        """Test processing a directory of frame pairs across a process pool"""
+        frame_dir, pairs = self._write_frame_pairs(5)
+        expected = np.stack([reference_vmem(d, a) for d, a in pairs])
+
+        stack = self.validator.analyze_stack(frame_dir, workers=2)
+        self.assertEqual(stack.shape, (5, 40, 30))
+        np.testing.assert_array_equal(stack, expected)
+
+        stats = self.validator.analyze_stack(frame_dir, summary=True, workers=1)
+        self.assertEqual([s['frame'] for s in stats], list(range(5)))
+        self.assertAlmostEqual(stats[3]['mean'], float(expected[3].mean()), places=3)
+        self.assertIn('p95', stats[0])
+
+    def test_stack_from_multipage_tiff(self):
+        """Test separate and interleaved multi-page TIFF stacks"""
+        pairs = [random_pair((32, 32), seed=20 + t) for t in range(3)]
+        expected = np.stack([reference_vmem(d, a) for d, a in pairs])
+        cv2.imwritemulti(self.path('donor.tif'), [d for d, _ in pairs])
+        cv2.imwritemulti(self.path('acceptor.tif'), [a for _, a in pairs])
+        cv2.imwritemulti(self.path('interleaved.tif'), [img for pair in pairs for img in pair])
+
+        separate = self.validator.analyze_stack(self.path('donor.tif'), self.path('acceptor.tif'), workers=1)
+        np.testing.assert_array_equal(separate, expected)
+
+        interleaved = self.validator.analyze_stack(self.path('interleaved.tif'), workers=2,
+                                                   output_path=self.path('stack.npy'))
+        np.testing.assert_array_equal(interleaved, expected)
+        np.testing.assert_array_equal(np.load(self.path('stack.npy')), expected)
+
+    def test_multipage_tiff_without_page_ranges(self):
+        """Test reading pages on OpenCV builds without imcount or the (start, count) overload"""
+        pairs = [random_pair((32, 32), seed=30 + t) for t in range(3)]
+        cv2.imwritemulti(self.path('interleaved.tif'), [img for pair in pairs for img in pair])
+        imreadmulti = cv2.imreadmulti
+
+        def whole_file_only(path, flags=cv2.IMREAD_ANYCOLOR, **kwargs):
+            if kwargs:
+                raise TypeError("'start' is an invalid keyword argument for imreadmulti()")
+            return imreadmulti(path, flags=flags)
+
+        with unittest.mock.patch.object(cv2, 'imreadmulti', whole_file_only), \
+                unittest.mock.patch.object(cv2, 'imcount', None):
+            stack = self.validator.analyze_stack(self.path('interleaved.tif'), workers=1)
+        np.testing.assert_array_equal(stack, np.stack([reference_vmem(d, a) for d, a in pairs]))
+
+    def test_directory_frames_in_natural_order(self):
+        """Test that unpadded frame numbers sort by value (t2 before t10)"""
+        frame_dir = self.path('unpadded')
+        os.mkdir(frame_dir)
+        donor, acceptor = random_pair((8, 8))
+        for t in (1, 2, 10):
+            cv2.imwrite(os.path.join(frame_dir, f't{t}_donor.png'), donor)
+            cv2.imwrite(os.path.join(frame_dir, f't{t}_acceptor.png'), acceptor)
+        names = [os.path.basename(d[1]) for d, _ in discover_frames(frame_dir)]
+        self.assertEqual(names, ['t1_donor.png', 't2_donor.png', 't10_donor.png'])
+
+    def test_streaming_verifies_every_frame(self):
+        """Test streaming verification of a synthetic -40 mV feed"""
+        target = {"target_vmem_range": [-50, -30], "spatial_domain": "ventral_ectoderm"}
+        verifier = StreamingVerifier(self.validator, target, max_pending=100)
+        results = list(verifier.run(synthetic_frames(10, shape=(64, 64), noise=2.0)))
+
+        self.assertEqual([r['frame'] for r in results], list(range(10)))
+        self.assertTrue(all(r['success'] for r in results))
+        self.assertAlmostEqual(results[0]['mean_vmem'], -40.0, delta=1.0)
+        self.assertGreater(results[0]['in_range_fraction'], 0.99)
+        self.assertEqual(set(results[0]['timings_ms']), {'queue_wait', 'vmem', 'verify'})
+        self.assertEqual(verifier.stats()['stages']['vmem']['count'], 10)
+
+    def test_streaming_drops_under_backpressure(self):
+        """Test that a slow consumer drops frames instead of building a backlog"""
+        import time
+        target = {"target_vmem_range": [-50, -30], "spatial_domain": "ventral_ectoderm"}
+        verifier = StreamingVerifier(self.validator, target, max_pending=1)
+        results = []
+        for result in verifier.run(synthetic_frames(50, shape=(32, 32), interval=0.001)):
+            results.append(result)
+            time.sleep(0.01)
+
+        stats = verifier.stats()
+        self.assertEqual(stats['received'], 50)
+        self.assertGreater(stats['dropped'], 0)
+        self.assertEqual(len(results) + stats['dropped'], 50)
+        self.assertEqual(sum(r['dropped'] for r in results), stats['dropped'])
+        self.assertEqual(results[-1]['frame'], 49)
+
+    def test_streaming_stops_endless_source_on_early_exit(self):
+        """Test that closing the result generator stops the producer reading the camera"""
+        target = {"target_vmem_range": [-50, -30], "spatial_domain": "ventral_ectoderm"}
+        verifier = StreamingVerifier(self.validator, target, max_pending=1)
+        endless = synthetic_frames(10 ** 9, shape=(16, 16), interval=0.001)
+        results = verifier.run(endless)
+        for _, result in zip(range(3), results):
+            self.assertTrue(result['success'])
+        results.close()
+
+        received = verifier.stats()['received']
+        threading.Event().wait(0.05)
+        self.assertEqual(verifier.stats()['received'], received)
+        self.assertFalse(any(t.name == 'frame-producer' for t in threading.enumerate()))
+
+    def test_streaming_async_queue(self):
+        """Test consuming frames from an asyncio queue"""
+        import asyncio
+        target = {"target_vmem_range": [-20, 0], "spatial_domain": "regeneration_bud"}
+        verifier = StreamingVerifier(self.validator, target, max_pending=8)
+
+        async def scenario():
+            queue = asyncio.Queue()
+            for frame in synthetic_frames(5, shape=(32, 32), vmem=-40.0):
+                await queue.put(frame)
+            await queue.put(None)
+            return [r async for r in verifier.run_async(queue)]
+
+        results = asyncio.run(scenario())
+        self.assertEqual(len(results), 5)
+        self.assertFalse(any(r['success'] for r in results))
+        self.assertIn("Deviation", results[0]['message'])
+
+    def test_verdict(self):
+        """Test the public range verdict shared by the streaming verifier and the service"""
+        self.assertEqual(BioStateValidator.verdict(-40.0, [-50, -30])[0], True)
+        success, message = BioStateValidator.verdict(-20.0, [-50, -30])
+        self.assertFalse(success)
+        self.assertIn("Deviation: 10.00 mV", message)
+
+    def test_verify_state_with_domain_mask(self):
+        """Test that a domain mask restricts the average to the domain"""
+        vmem_map = np.full((20, 20), 10.0)
+        mask = np.zeros((20, 20), dtype=bool)
+        mask[5:10, 5:10] = True
+        vmem_map[mask] = -40.0
+        target = {"target_vmem_range": [-50, -30], "spatial_domain": "ventral_ectoderm"}
+
+        self.assertFalse(self.validator.verify_state(vmem_map, target)[0])
+        self.assertTrue(self.validator.verify_state(vmem_map, target, domain_mask=mask)[0])
+
+    def test_grouped_statistics_match_per_roi(self):
+        """Test grouped reductions against one masked pass per label"""
+        rng = np.random.default_rng(4)
+        values = rng.normal(-40, 10, size=(60, 70)).astype(np.float32)
+        labels = rng.integers(-1, 6, size=values.shape)
+        ranges = np.array([[-50, -30], [-45, -35], [np.nan, np.nan], [-60, -20], [0, 10], [-40, -40]])
+
+        stats = grouped_statistics(values, labels, 7, np.vstack([ranges, [[-50, -30]]]))
+        for label in range(6):
+            roi = values[labels == label].astype(np.float64)
+            self.assertEqual(stats['pixels'][label], roi.size)
+            self.assertAlmostEqual(stats['mean'][label], roi.mean(), places=4)
+            for q in (5, 50, 95):
+                self.assertAlmostEqual(stats[f'p{q}'][label], np.percentile(roi, q), places=4)
+            if label != 2:
+                low, high = ranges[label]
+                self.assertAlmostEqual(stats['in_range_fraction'][label], ((roi >= low) & (roi <= high)).mean())
+        self.assertTrue(np.isnan(stats['in_range_fraction'][2]))
+        self.assertEqual(stats['pixels'][6], 0)
+        self.assertTrue(np.isnan(stats['mean'][6]))
+
+    def test_grouped_statistics_skip_non_finite_pixels(self):
+        """Test that NaN and infinite pixels are left out, and that zero labels give empty results"""
+        values = np.array([[-40.0, np.nan, -30.0], [np.inf, -50.0, np.nan]])
+        labels = np.array([[0, 0, 0], [1, 1, 2]])
+        stats = grouped_statistics(values, labels, 3, [[-45, -35], [-60, -40], [-50, -30]])
+        self.assertEqual(stats['pixels'].tolist(), [2, 1, 0])
+        np.testing.assert_allclose(stats['mean'][:2], [-35.0, -50.0])
+        np.testing.assert_allclose(stats['p50'][:2], [-35.0, -50.0])
+        np.testing.assert_allclose(stats['in_range_fraction'][:2], [0.5, 1.0])
+        self.assertTrue(np.isnan(stats['mean'][2]))
+
+        empty = grouped_statistics(values, labels, 0, np.zeros((0, 2)))
+        self.assertEqual({key: len(value) for key, value in empty.items()},
+                         {'pixels': 0, 'mean': 0, 'p5': 0, 'p50': 0, 'p95': 0, 'in_range_fraction': 0})
+
+    def test_verify_domains(self):
+        """Test verifying several embryos' domains in one call"""
+        vmem_map = np.zeros((30, 30), dtype=np.float32)
+        masks = {name: np.zeros((30, 30), dtype=bool) for name in ('embryo_1/eye', 'embryo_2/eye', 'embryo_2/bud')}
+        masks['embryo_1/eye'][0:10, 0:10] = True
+        masks['embryo_2/eye'][10:20, 0:10] = True
+        masks['embryo_2/bud'][20:30, 0:10] = True
+        vmem_map[0:10, 0:10] = -40
+        vmem_map[10:20, 0:10] = -10
+        vmem_map[20:30, 0:10] = -5
+        labels, names = masks_to_labels(masks)
+
+        eye = {"target_vmem_range": [-50, -30], "spatial_domain": "ventral_ectoderm"}
+        bud = {"target_vmem_range": [-20, 0], "spatial_domain": "regeneration_bud"}
+        results = self.validator.verify_domains(vmem_map, labels, names,
+                                                {'embryo_1/eye': eye, 'embryo_2/eye': eye, 'embryo_2/bud': bud})
+        self.assertTrue(results['embryo_1/eye']['success'])
+        self.assertFalse(results['embryo_2/eye']['success'])
+        self.assertTrue(results['embryo_2/bud']['success'])
+        self.assertEqual(results['embryo_2/bud']['pixels'], 100)
+        self.assertEqual(results['embryo_1/eye']['in_range_fraction'], 1.0)
+
+        shared = self.validator.verify_domains(vmem_map, labels, names, eye)
+        self.assertEqual([shared[n]['success'] for n in names], [True, False, False])
+
+    def test_iter_tiles_covers_image(self):
+        """Test that output tiles cover every pixel exactly once"""
+        coverage = np.zeros((37, 23), dtype=int)
+        for read, crop in iter_tiles(coverage.shape, 10):
+            window = coverage[read]
+            window[crop] += 1
+        self.assertTrue((coverage == 1).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,430 @@
+"""
+Per-pixel ratiometric calibration from valinomycin/K+ clamp series.
+
+BioStateValidator's default calibration is one global line, Vmem = R * slope
++ intercept. Dye loading, illumination and optics vary across the field,
+so the real standard curve varies per pixel too. A clamp series images the
+same field at several known potentials (valinomycin with graded
+extracellular K+). From it, `fit_calibration` fits a polynomial Vmem =
+c0 + c1*R + c2*R^2 + ... per pixel, or per tile x tile block. The fit
+works through the frames in overlapping chunks with the same blur, so R is
+exactly the ratio the pipeline sees at analysis time, and all pixels of a
+chunk are solved at once with closed-form or batched normal equations.
+
+Fitted maps are cached on disk by rig and session as memory-mapped .npy
+planes. BioStateValidator(calibration=...) applies them in the
+ratiometric kernel straight from the mapping:
+
+    cache = CalibrationCache()
+    cache.fit('scope2', '2024-05-01', donor_stack, acceptor_stack, clamp_mv=[-90, -60, -30, 0])
+    validator = BioStateValidator(calibration=cache.get('scope2', '2024-05-01'))
+
+Usage:
+    python -m verification.calibration --rig scope2 --session 2024-05-01 \\
+        --clamp -90 -60 -30 0 donor_series.tif acceptor_series.tif
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from instrumentation.log import configure_logging, get_logger
+
+from .kernel import RatiometricScratch, ratiometric_kernel
+from .stack import discover_frames, read_frame
+from .tiled import iter_tiles
+
+_log = get_logger(__name__)
+
+COEFFICIENTS_FILE = 'coefficients.npy'
+RESIDUAL_FILE = 'residual.npy'
+METADATA_FILE = 'calibration.json'
+FIT_CHUNK = 512
+MIN_RATIO_VARIANCE = 1e-10
+MIN_RATIO_STEP = 1e-5
+_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+
+
+class CalibrationMap:
+    """
+    Fitted calibration: Vmem = c0 + c1*R + c2*R^2 + ... per pixel.
+
+    `coefficients` is a (degree + 1, H, W) float32 array (c0 first), usually
+    a read-only memory map from a CalibrationCache. `residual` holds the
+    per-pixel RMS error of the fit in mV (NaN where the clamp series showed no
+    ratio change and the median curve was substituted).
+    """
+
+    def __init__(self, coefficients: np.ndarray, residual: Optional[np.ndarray] = None,
+                 metadata: Optional[Dict] = None, path: Optional[str] = None):
+        if coefficients.ndim != 3 or len(coefficients) < 2:
+            raise ValueError("Calibration coefficients must have shape (degree + 1, H, W) with degree >= 1.")
+        self.coefficients = coefficients
+        self.residual = residual
+        self.metadata = metadata or {}
+        self.path = path
+
+    @classmethod
+    def open(cls, path: str) -> 'CalibrationMap':
+        """Maps a calibration directory written by CalibrationCache read-only."""
+        with open(os.path.join(path, METADATA_FILE), 'r') as f:
+            metadata = json.load(f)
+        coefficients = np.load(os.path.join(path, COEFFICIENTS_FILE), mmap_mode='r')
+        residual = np.load(os.path.join(path, RESIDUAL_FILE), mmap_mode='r')
+        return cls(coefficients, residual, metadata, path)
+
+    def __reduce__(self):
+        # Worker processes re-map the files instead of receiving a copy of every plane.
+        if self.path is not None:
+            return (CalibrationMap.open, (self.path,))
+        return (CalibrationMap, (np.asarray(self.coefficients), self.residual, self.metadata))
+
+    @property
+    def degree(self) -> int:
+        return len(self.coefficients) - 1
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.coefficients.shape[1:]
+
+    @property
+    def intercept(self) -> np.ndarray:
+        return self.coefficients[0]
+
+    @property
+    def slope(self) -> np.ndarray:
+        return self.coefficients[1]
+
+    @property
+    def higher_order(self) -> Tuple[np.ndarray, ...]:
+        return tuple(self.coefficients[2:])
+
+    def terms(self, window: Optional[Tuple[slice, slice]] = None) -> Tuple:
+        """(slope, intercept, higher_order) for ratiometric_kernel, optionally for a sub-window (views)."""
+        planes = self.coefficients if window is None else self.coefficients[(slice(None),) + tuple(window)]
+        return planes[1], planes[0], tuple(planes[2:])
+
+    def evaluate(self, ratio: np.ndarray) -> np.ndarray:
+        """Vmem (mV) for a full-frame ratio map."""
+        vmem = np.zeros(self.shape, dtype=np.float32)
+        for coefficient in self.coefficients[::-1]:
+            vmem *= ratio
+            vmem += coefficient
+        return vmem
+
+
+def ratio_map(img_donor: np.ndarray, img_acceptor: np.ndarray, out: Optional[np.ndarray] = None,
+              scratch: Optional[RatiometricScratch] = None) -> np.ndarray:
+    """R = blur(donor) / blur(acceptor), exactly as the ratiometric kernel computes it."""
+    if out is None:
+        out = np.empty(img_donor.shape, dtype=np.float32)
+    return ratiometric_kernel(img_donor, img_acceptor, 1.0, 0.0, out, scratch or RatiometricScratch())
+
+
+def _bin_means(ratios: np.ndarray, tile: int) -> np.ndarray:
+    """Means of tile x tile blocks over the last two axes (edge blocks may be partial)."""
+    rows, cols = np.arange(0, ratios.shape[1], tile), np.arange(0, ratios.shape[2], tile)
+    sums = np.add.reduceat(np.add.reduceat(ratios, rows, axis=1, dtype=np.float64), cols, axis=2)
+    heights = np.diff(np.append(rows, ratios.shape[1]))
+    widths = np.diff(np.append(cols, ratios.shape[2]))
+    return sums / np.outer(heights, widths)
+
+
+def fit_block(ratios: np.ndarray, clamp_mv: np.ndarray, degree: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Least-squares fit of Vmem = sum(c_j * R^j) for every column of `ratios`.
+
+    Args:
+        ratios: (K, N) ratios, one row per clamp level.
+        clamp_mv: (K,) clamp potentials.
+        degree: Polynomial degree (1 = linear).
+
+    Returns:
+        (coefficients (degree + 1, N), rms (N,)). Columns that cannot determine
+        the curve get NaN coefficients: those whose ratio does not vary across
+        the clamp series, or (e.g. saturated or clipped pixels) takes fewer than
+        degree + 1 distinct levels.
+    """
+    x = ratios.astype(np.float64)
+    y = np.asarray(clamp_mv, dtype=np.float64)
+    levels = 1 + np.count_nonzero(np.diff(np.sort(x, axis=0), axis=0) > MIN_RATIO_STEP, axis=0)
+    valid = (x.var(axis=0) > MIN_RATIO_VARIANCE) & (levels > degree)
+    if degree == 1:
+        x_mean, y_mean = x.mean(axis=0), y.mean()
+        dx = x - x_mean
+        sxx = np.einsum('kn,kn->n', dx, dx)
+        slope = np.divide((y - y_mean) @ dx, sxx, out=np.full(sxx.shape, np.nan), where=valid)
+        coefficients = np.stack([y_mean - slope * x_mean, slope])
+    else:
+        powers = x[..., None] ** np.arange(degree + 1)
+        gram = np.einsum('kni,knj->nij', powers, powers)
+        gram[~valid] = np.eye(degree + 1)
+        rhs = np.einsum('k,kni->ni', y, powers)
+        try:
+            coefficients = np.linalg.solve(gram, rhs[..., None])[..., 0].T
+        except np.linalg.LinAlgError:
+            # Numerically singular despite distinct levels: solve what is solvable.
+            valid &= np.linalg.matrix_rank(gram) == degree + 1
+            gram[~valid] = np.eye(degree + 1)
+            coefficients = np.linalg.solve(gram, rhs[..., None])[..., 0].T
+        coefficients[:, ~valid] = np.nan
+
+    predicted = np.zeros_like(x)
+    for coefficient in coefficients[::-1]:
+        predicted *= x
+        predicted += coefficient
+    rms = np.sqrt(np.mean((predicted - y[:, None]) ** 2, axis=0))
+    return coefficients, rms
+
+
+def fit_calibration(donor_frames: Sequence[np.ndarray], acceptor_frames: Sequence[np.ndarray],
+                    clamp_mv: Sequence[float], degree: int = 1, tile: int = 1,
+                    out: Optional[np.ndarray] = None, residual_out: Optional[np.ndarray] = None,
+                    chunk: int = FIT_CHUNK) -> Tuple[np.ndarray, np.ndarray, Dict]:
+    """
+    Fits a calibration map from a clamp series.
+
+    Args:
+        donor_frames, acceptor_frames: K same-shaped frames each (a (K, H, W) array,
+            memory map, or list of 2-D arrays), one pair per clamp level.
+        clamp_mv: The K clamp potentials in mV (levels may repeat).
+        degree: Polynomial degree of the standard curve (1 = linear).
+        tile: Fit one curve per tile x tile block from its mean ratio instead of
+            one per pixel (1 = per pixel).
+        out, residual_out: Optional (degree + 1, H, W) and (H, W) float32 buffers
+            (e.g. memory maps) to fit into.
+        chunk: Edge length of the blocks processed at once.
+
+    Returns:
+        (coefficients, residual, stats) where stats has 'degenerate_pixels' (pixels
+        whose ratios cannot determine the curve, see fit_block, given the median
+        coefficients)
+        and 'median_rms_mv'.
+    """
+    clamp_mv = np.asarray(clamp_mv, dtype=np.float64)
+    count = len(clamp_mv)
+    if len(donor_frames) != count or len(acceptor_frames) != count:
+        raise ValueError(f"Expected {count} donor and acceptor frames, one per clamp level.")
+    if degree < 1:
+        raise ValueError("Calibration degree must be at least 1.")
+    if len(np.unique(clamp_mv)) <= degree:
+        raise ValueError(f"A degree-{degree} fit needs at least {degree + 1} distinct clamp levels.")
+    if tile < 1:
+        raise ValueError("Calibration tile must be a positive number of pixels.")
+
+    shape = tuple(donor_frames[0].shape)
+    if out is None:
+        out = np.empty((degree + 1,) + shape, dtype=np.float32)
+    if residual_out is None:
+        residual_out = np.empty(shape, dtype=np.float32)
+
+    chunk = max(tile, chunk // tile * tile)
+    scratch = RatiometricScratch()
+    degenerate = 0
+    for read, crop in iter_tiles(shape, chunk):
+        window = (read[0].stop - read[0].start, read[1].stop - read[1].start)
+        ratios = np.empty((count,) + window, dtype=np.float32)
+        for k in range(count):
+            ratio_map(np.ascontiguousarray(donor_frames[k][read]), np.ascontiguousarray(acceptor_frames[k][read]),
+                      ratios[k], scratch)
+        ratios = ratios[(slice(None),) + crop]
+        height, width = ratios.shape[1:]
+
+        samples = _bin_means(ratios, tile) if tile > 1 else ratios
+        coefficients, rms = fit_block(samples.reshape(count, -1), clamp_mv, degree)
+        coefficients = coefficients.reshape((degree + 1,) + samples.shape[1:])
+        rms = rms.reshape(samples.shape[1:])
+        if tile > 1:
+            coefficients = coefficients.repeat(tile, axis=1).repeat(tile, axis=2)[:, :height, :width]
+            rms = rms.repeat(tile, axis=0).repeat(tile, axis=1)[:height, :width]
+
+        y0, x0 = read[0].start + crop[0].start, read[1].start + crop[1].start
+        out[:, y0:y0 + height, x0:x0 + width] = coefficients
+        residual_out[y0:y0 + height, x0:x0 + width] = rms
+        degenerate += int(np.count_nonzero(np.isnan(coefficients[0])))
+
+    stats = {'degenerate_pixels': degenerate, 'median_rms_mv': float(np.nanmedian(_sample(residual_out)))}
+    if degenerate:
+        _fill_degenerate(out)
+    return out, residual_out, stats
+
+
+def _sample(plane: np.ndarray, limit: int = 1 << 20) -> np.ndarray:
+    """A strided subsample of at most ~`limit` values, for medians over huge maps."""
+    step = max(1, int(np.sqrt(plane.size / limit)))
+    return plane[::step, ::step]
+
+
+def _fill_degenerate(coefficients: np.ndarray):
+    """Gives pixels without a fit the median curve of the fitted pixels (their residual stays NaN)."""
+    fitted = np.isfinite(_sample(coefficients[0]))
+    if not fitted.any():
+        raise ValueError("The clamp series shows no ratio change at any pixel; cannot calibrate.")
+    for plane in coefficients:
+        median = np.median(_sample(plane)[fitted])
+        for rows in range(0, plane.shape[0], FIT_CHUNK):
+            block = plane[rows:rows + FIT_CHUNK]
+            block[np.isnan(block)] = median
+
+
+def _check_name(kind: str, name: str) -> str:
+    if not _NAME.match(name):
+        raise ValueError(f"Invalid {kind} name '{name}': use letters, digits, '.', '_' and '-'.")
+    return name
+
+
+def default_cache_dir() -> str:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.environ.get('MORPHOLANG_CALIBRATION_DIR', os.path.join(base_dir, 'database', 'calibration'))
+
+
+class CalibrationCache:
+    """
+    Fitted calibration maps on disk, one directory per rig and session:
+
+        <root>/<rig>/<session>/coefficients.npy   (degree + 1, H, W) float32
+        <root>/<rig>/<session>/residual.npy       (H, W) float32, RMS fit error in mV
+        <root>/<rig>/<session>/calibration.json   clamp levels, degree, tile, fit statistics
+
+    Maps are fitted straight into memory-mapped files and returned mapped
+    read-only, so neither fitting nor loading holds a full-frame copy.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or default_cache_dir()
+
+    def path(self, rig: str, session: str) -> str:
+        return os.path.join(self.root, _check_name('rig', rig), _check_name('session', session))
+
+    def rigs(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def sessions(self, rig: str) -> List[str]:
+        directory = os.path.join(self.root, _check_name('rig', rig))
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name for name in os.listdir(directory)
+                      if os.path.exists(os.path.join(directory, name, METADATA_FILE)))
+
+    def get(self, rig: str, session: Optional[str] = None) -> Optional[CalibrationMap]:
+        """The map for a rig and session (default: the rig's most recently fitted session), or None."""
+        if session is None:
+            fitted = [(self._metadata(rig, name)['fitted'], name) for name in self.sessions(rig)]
+            if not fitted:
+                return None
+            session = max(fitted)[1]
+        path = self.path(rig, session)
+        if not os.path.exists(os.path.join(path, METADATA_FILE)):
+            return None
+        return CalibrationMap.open(path)
+
+    def stamp(self, rig: str, session: Optional[str] = None) -> Tuple:
+        """
+        Cheap fingerprint of the metadata behind get(rig, session).
+
+        It changes whenever that session is refitted or, without a session,
+        whenever any of the rig's sessions is fitted, refitted or removed.
+        """
+        sessions = [session] if session is not None else self.sessions(rig)
+        stamp = []
+        for name in sessions:
+            try:
+                st = os.stat(os.path.join(self.path(rig, name), METADATA_FILE))
+            except OSError:
+                continue
+            stamp.append((name, st.st_ino, st.st_mtime_ns, st.st_size))
+        return tuple(stamp)
+
+    def _metadata(self, rig: str, session: str) -> Dict:
+        with open(os.path.join(self.path(rig, session), METADATA_FILE), 'r') as f:
+            return json.load(f)
+
+    def fit(self, rig: str, session: str, donor_frames: Sequence[np.ndarray],
+            acceptor_frames: Sequence[np.ndarray], clamp_mv: Sequence[float],
+            degree: int = 1, tile: int = 1) -> CalibrationMap:
+        """Fits a clamp series (see fit_calibration) and stores it, replacing any previous fit."""
+        target = self.path(rig, session)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shape = tuple(donor_frames[0].shape)
+
+        staging = tempfile.mkdtemp(prefix=f'.{session}.', dir=os.path.dirname(target))
+        try:
+            coefficients = np.lib.format.open_memmap(os.path.join(staging, COEFFICIENTS_FILE), mode='w+',
+                                                     dtype=np.float32, shape=(degree + 1,) + shape)
+            residual = np.lib.format.open_memmap(os.path.join(staging, RESIDUAL_FILE), mode='w+',
+                                                 dtype=np.float32, shape=shape)
+            _, _, stats = fit_calibration(donor_frames, acceptor_frames, clamp_mv, degree, tile,
+                                          out=coefficients, residual_out=residual)
+            coefficients.flush()
+            residual.flush()
+            del coefficients, residual
+
+            metadata = dict(stats, rig=rig, session=session, degree=degree, tile=tile,
+                            clamp_mv=[float(v) for v in clamp_mv], shape=list(shape),
+                            fitted=datetime.now().isoformat(timespec='seconds'))
+            with open(os.path.join(staging, METADATA_FILE), 'w') as f:
+                json.dump(metadata, f, indent=2)
+
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            os.replace(staging, target)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return CalibrationMap.open(target)
+
+
+def read_series(donor: str, acceptor: Optional[str] = None) -> Tuple[Sequence[np.ndarray], Sequence[np.ndarray]]:
+    """
+    Loads a clamp series: two (K, H, W) .npy stacks (memory-mapped), or any
+    frame layout accepted by verification.stack.discover_frames.
+    """
+    if donor.endswith('.npy') and acceptor is not None and acceptor.endswith('.npy'):
+        return np.load(donor, mmap_mode='r'), np.load(acceptor, mmap_mode='r')
+    frames = discover_frames(donor, acceptor)
+    donors, acceptors = [], []
+    for donor_spec, acceptor_spec in frames:
+        img_donor, img_acceptor = read_frame(donor_spec), read_frame(acceptor_spec)
+        if img_donor is None or img_acceptor is None:
+            raise ValueError(f"Could not read {donor_spec[1]} / {acceptor_spec[1]}")
+        donors.append(img_donor)
+        acceptors.append(img_acceptor)
+    return donors, acceptors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit a per-pixel calibration map from a K+ clamp series.")
+    parser.add_argument('donor', help="Donor stack (.npy or multi-page TIFF) or directory of frame pairs")
+    parser.add_argument('acceptor', nargs='?', help="Acceptor stack matching `donor`")
+    parser.add_argument('--clamp', type=float, nargs='+', required=True,
+                        help="Clamp potential (mV) of each frame pair, in order")
+    parser.add_argument('--rig', required=True)
+    parser.add_argument('--session', required=True)
+    parser.add_argument('--degree', type=int, default=1, help="Polynomial degree (default: 1, linear)")
+    parser.add_argument('--tile', type=int, default=1, help="Fit per tile x tile block (default: per pixel)")
+    parser.add_argument('--cache', help=f"Cache directory (default: {default_cache_dir()})")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    donors, acceptors = read_series(args.donor, args.acceptor)
+    calibration = CalibrationCache(args.cache).fit(args.rig, args.session, donors, acceptors, args.clamp,
+                                                   args.degree, args.tile)
+    meta = calibration.metadata
+    _log.info("Fitted degree-%d calibration for %dx%d pixels from %d clamp levels",
+              meta['degree'], meta['shape'][0], meta['shape'][1], len(meta['clamp_mv']))
+    _log.info("Median RMS residual: %.2f mV, pixels without a fit: %d",
+              meta['median_rms_mv'], meta['degenerate_pixels'])
+    _log.info("Stored in %s", calibration.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,20 @@ import json
 import sys
 import os
 
+from instrumentation import metrics
+from instrumentation.log import configure_logging, get_logger
+
+from .domains import DEFAULT_PERCENTILES, grouped_statistics
+from .frames import as_frame
+from .kernel import RatiometricScratch, ratiometric_kernel
+from .stack import discover_frames, process_stack
+from .tiled import create_output, iter_tiles, open_image
+
+_log = get_logger(__name__)
+
+
 class BioStateValidator:
-    def __init__(self, calibration_slope=100.0, calibration_intercept=-70.0):
+    def __init__(self, calibration_slope=100.0, calibration_intercept=-70.0, calibration=None):
         """
         Initialize with calibration data for Ratiometric Imaging.
         
@@ -15,10 +27,16 @@ class BioStateValidator:
         Formula: Vmem = (Ratio * slope) + intercept
         
         Note: These default calibration values are placeholders. Real conversion requires 
-        generating a standard curve using valinomycin/K+ clamping.
+        generating a standard curve using valinomycin/K+ clamping; pass the fitted
+        per-pixel maps as `calibration` (a verification.calibration.CalibrationMap,
+        e.g. from CalibrationCache.get) to use them instead of the global line.
         """
         self.slope = calibration_slope
         self.intercept = calibration_intercept
+        self.higher_order = ()
+        self.calibration = calibration
+        if calibration is not None:
+            self.slope, self.intercept, self.higher_order = calibration.terms()
 
     def load_subroutine(self, json_path):
         """Loads the Target Bioelectric State from our MorphoLang Schema."""
@@ -26,69 +44,242 @@ class BioStateValidator:
             data = json.load(f)
         return data['bioelectric_state']
 
-    def analyze_ratiometric(self, donor_path, acceptor_path):
+    def analyze_ratiometric(self, donor, acceptor, shape=None, dtype=None):
         """
         Reads Donor (CC2-DMPE) and Acceptor (DiBAC4) images and calculates the Voltage Ratio Map.
         
         R = I_donor / I_acceptor
         
         Args:
-            donor_path (str): Path to the blue channel image (CC2-DMPE).
-            acceptor_path (str): Path to the green channel image (DiBAC4).
+            donor: Blue channel (CC2-DMPE) image path, or the frame itself already in
+                memory: a NumPy array, a multiprocessing.shared_memory block or a
+                buffer-protocol object (see verification.frames.as_frame).
+            acceptor: Green channel (DiBAC4) image, in the same forms.
+            shape, dtype: Layout of raw buffers and shared memory blocks.
             
         Returns:
             np.ndarray: Calculated Vmem map in millivolts (mV).
         """
-        # Load images (Grayscale for intensity analysis)
-        img_donor = cv2.imread(donor_path, cv2.IMREAD_GRAYSCALE)
-        img_acceptor = cv2.imread(acceptor_path, cv2.IMREAD_GRAYSCALE)
+        # In-memory frames are used as views; only paths are read from disk
+        img_donor = as_frame(donor, shape, dtype)
+        img_acceptor = as_frame(acceptor, shape, dtype)
+        if img_donor is None or img_acceptor is None:
+            # Load images (Grayscale for intensity analysis)
+            with metrics.span('image_read'):
+                if img_donor is None:
+                    img_donor = cv2.imread(os.fspath(donor), cv2.IMREAD_GRAYSCALE)
+                if img_acceptor is None:
+                    img_acceptor = cv2.imread(os.fspath(acceptor), cv2.IMREAD_GRAYSCALE)
         
         if img_donor is None:
-            print(f"[!] Error: Could not load donor image at {donor_path}")
+            _log.error("Could not load donor image at %s", donor)
             return None
         if img_acceptor is None:
-            print(f"[!] Error: Could not load acceptor image at {acceptor_path}")
+            _log.error("Could not load acceptor image at %s", acceptor)
             return None
             
         if img_donor.shape != img_acceptor.shape:
-            print("[!] Error: Donor and Acceptor images must have the same dimensions.")
+            _log.error("Donor and Acceptor images must have the same dimensions.")
             return None
 
-        # Pre-processing: Denoising
-        # Bioelectric signals are spatially consistent; Gaussian blur reduces pixel noise
-        img_d_blur = cv2.GaussianBlur(img_donor, (5, 5), 0).astype(np.float32)
-        img_a_blur = cv2.GaussianBlur(img_acceptor, (5, 5), 0).astype(np.float32)
+        return self._vmem_from_images(img_donor, img_acceptor)
 
-        # Avoid division by zero
-        img_a_blur[img_a_blur == 0] = 0.1
+    def _vmem_from_images(self, img_donor, img_acceptor):
+        """Blur, ratio and calibrate a donor/acceptor pair that is already in memory."""
+        vmem_map = np.empty(img_donor.shape, dtype=np.float32)
+        return self.compute_vmem_into(img_donor, img_acceptor, vmem_map, RatiometricScratch())
 
-        # Calculate Ratio (R = Donor / Acceptor)
-        # Higher Ratio = More Hyperpolarized (typically, as DiBAC4 enters depolarized cells, increasing acceptor signal)
-        ratio_map = img_d_blur / img_a_blur
-        
-        # Convert Ratio to Membrane Potential (mV) using calibration curve
-        vmem_map = (ratio_map * self.slope) + self.intercept
-        
+    def compute_vmem_into(self, img_donor, img_acceptor, out, scratch, window=None):
+        """
+        Allocation-free variant of the ratiometric pipeline for live acquisition.
+
+        Writes the Vmem map into the caller-owned float32 `out` buffer, using
+        `scratch` (a verification.kernel.RatiometricScratch) for intermediates.
+        Reusing both across same-shaped frames means no per-frame allocation.
+
+        Args:
+            img_donor (np.ndarray): Donor (CC2-DMPE) frame.
+            img_acceptor (np.ndarray): Acceptor (DiBAC4) frame, same shape.
+            out (np.ndarray): float32 output buffer, same shape.
+            scratch (RatiometricScratch): Reusable intermediate buffers.
+            window (tuple of slices, optional): Region of the calibration maps the
+                frames cover, when they are a tile of the calibrated field.
+
+        Returns:
+            np.ndarray: `out`, holding Vmem in mV.
+        """
+        slope, intercept, higher_order = self.slope, self.intercept, self.higher_order
+        if self.calibration is not None:
+            if window is not None:
+                slope, intercept, higher_order = self.calibration.terms(window)
+            if slope.shape != img_donor.shape:
+                raise ValueError(f"Frames of shape {img_donor.shape} do not match the "
+                                 f"{slope.shape} calibration map.")
+        # Pre-processing: Gaussian blur reduces pixel noise (signals are spatially consistent).
+        # Ratio R = Donor / Acceptor, with zero acceptor pixels clamped to 0.1;
+        # higher ratio = more hyperpolarized. Vmem = (R * slope) + intercept.
+        return ratiometric_kernel(img_donor, img_acceptor, slope, intercept, out, scratch, higher_order)
+
+    def analyze_ratiometric_tiled(self, donor_path, acceptor_path, output_path=None,
+                                  tile_size=1024, shape=None, dtype=None):
+        """
+        Out-of-core variant of analyze_ratiometric for images larger than memory.
+
+        Donor and acceptor are memory-mapped (see verification.tiled.open_image:
+        .npy, uncompressed TIFF, or raw with `shape`/`dtype`) and processed in
+        tiles that overlap by the Gaussian blur halo, so the result is identical
+        to the full-frame pipeline. Peak memory is a few tile-sized buffers.
+
+        Args:
+            donor_path (str): Donor (CC2-DMPE) image.
+            acceptor_path (str): Acceptor (DiBAC4) image.
+            output_path (str, optional): Where to write the float32 Vmem map as a
+                memory-mapped .npy (or raw) file. If omitted, the map is held in memory.
+            tile_size (int): Edge length of the output tiles in pixels.
+            shape, dtype: Layout of raw (headerless) inputs.
+
+        Returns:
+            np.ndarray: Vmem map in mV (an np.memmap when output_path is given).
+        """
+        try:
+            img_donor = open_image(donor_path, shape, dtype)
+            img_acceptor = open_image(acceptor_path, shape, dtype)
+        except (OSError, ValueError) as e:
+            _log.error("Could not map input images: %s", e)
+            return None
+
+        if img_donor.shape != img_acceptor.shape:
+            _log.error("Donor and Acceptor images must have the same dimensions.")
+            return None
+
+        if output_path is not None:
+            vmem_map = create_output(output_path, img_donor.shape)
+        else:
+            vmem_map = np.empty(img_donor.shape, dtype=np.float32)
+
+        scratch = RatiometricScratch()
+        tile = np.empty(0, dtype=np.float32)
+        for read, crop in iter_tiles(img_donor.shape, tile_size):
+            window = (read[0].stop - read[0].start, read[1].stop - read[1].start)
+            if tile.shape != window:
+                tile = np.empty(window, dtype=np.float32)
+            self.compute_vmem_into(np.ascontiguousarray(img_donor[read]),
+                                   np.ascontiguousarray(img_acceptor[read]), tile, scratch, window=read)
+            y0, x0 = read[0].start + crop[0].start, read[1].start + crop[1].start
+            vmem_map[y0:y0 + tile[crop].shape[0], x0:x0 + tile[crop].shape[1]] = tile[crop]
+
+        if isinstance(vmem_map, np.memmap):
+            vmem_map.flush()
         return vmem_map
 
-    def verify_state(self, vmem_map, target_state):
+    def analyze_stack(self, donor, acceptor=None, summary=False, output_path=None, workers=None):
+        """
+        Processes a time-lapse stack of donor/acceptor frames across a process pool.
+
+        Args:
+            donor (str): A directory of '*donor*'/'*acceptor*' frame pairs, a multi-page
+                donor TIFF, or a single TIFF with interleaved donor/acceptor pages.
+            acceptor (str, optional): Multi-page acceptor TIFF matching `donor`.
+            summary (bool): Return per-frame statistics (mean, std, min, max,
+                p5/p50/p95) instead of the full Vmem stack.
+            output_path (str, optional): Write the (T, H, W) float32 stack to this .npy
+                file as a memory map instead of collecting it in memory.
+            workers (int, optional): Worker processes (default: all cores; 1 runs inline).
+
+        Returns:
+            np.ndarray of shape (T, H, W) in mV, or a list of per-frame summary dicts.
+        """
+        frames = discover_frames(donor, acceptor)
+        _log.info("Processing %d frame pairs...", len(frames))
+        return process_stack(frames, self.slope, self.intercept, summary=summary,
+                             output_path=output_path, workers=workers, calibration=self.calibration)
+
+    def verify_state(self, vmem_map, target_state, domain_mask=None):
         """
         Compares the observed Vmem against the Target Range defined in the schema.
+
+        If `domain_mask` (a boolean image of the 'spatial_domain') is given, only
+        those pixels are averaged; otherwise the whole map is treated as the ROI.
+        For many domains at once, use verify_domains.
         """
-        target_range = target_state['target_vmem_range'] # e.g., [-30, -50]
+        target_range = target_state['target_vmem_range'] # [low, high], e.g., [-50, -30]
         spatial_domain = target_state['spatial_domain']
         
         if vmem_map is None:
              return False, "FAILURE: No Vmem map data."
 
-        # In a real tool, we would mask the 'spatial_domain'.
-        # Here we analyze the mean of the entire ROI provided.
-        avg_observed_vmem = np.mean(vmem_map)
-        
-        print(f"[*] Analyzing Domain: {spatial_domain}...")
-        print(f"[*] Target Range:     {target_range} mV")
-        print(f"[*] Observed Avg:     {avg_observed_vmem:.2f} mV")
-        
+        with metrics.span('verify'):
+            if domain_mask is not None:
+                domain_mask = np.asarray(domain_mask, dtype=bool)
+                if not domain_mask.any():
+                    return False, f"FAILURE: Domain mask for '{spatial_domain}' is empty."
+                avg_observed_vmem = np.mean(vmem_map[domain_mask])
+            else:
+                avg_observed_vmem = np.mean(vmem_map)
+
+            _log.info("Analyzing Domain: %s...", spatial_domain)
+            _log.info("Target Range:     %s mV", target_range)
+            _log.info("Observed Avg:     %.2f mV", avg_observed_vmem)
+
+            return self.verdict(avg_observed_vmem, target_range)
+
+    def verify_domains(self, vmem_map, domain_labels, domain_names, targets,
+                       percentiles=DEFAULT_PERCENTILES):
+        """
+        Verifies every spatial domain in a frame in one grouped pass.
+
+        Args:
+            vmem_map (np.ndarray): Vmem map in mV.
+            domain_labels (np.ndarray): Integer label image; domain_labels[y, x]
+                indexes `domain_names`. Negative/out-of-range labels are background.
+                (verification.domains.masks_to_labels builds this from named ROI masks.)
+            domain_names (Sequence[str]): Domain name per label, e.g. 'embryo_07/ventral_ectoderm'.
+            targets (Dict): Either one target bioelectric_state applied to every domain,
+                or a dict of domain name -> target state. Domains without a target are
+                measured but not judged.
+            percentiles: Percentiles to report per domain.
+
+        Returns:
+            Dict[str, Dict]: Per domain: pixels, mean, p<q> percentiles, in_range_fraction,
+            and (when a target exists) success and message as from verify_state.
+        """
+        if vmem_map is None:
+            return {}
+        names = list(domain_names)
+        if 'target_vmem_range' in targets:
+            per_domain = {name: targets for name in names}
+        else:
+            per_domain = targets
+
+        ranges = np.full((len(names), 2), np.nan)
+        for label, name in enumerate(names):
+            target = per_domain.get(name)
+            if target is not None:
+                ranges[label] = sorted(target['target_vmem_range'])
+
+        with metrics.span('verify'):
+            stats = grouped_statistics(vmem_map, domain_labels, len(names), ranges, percentiles)
+
+        results = {}
+        for label, name in enumerate(names):
+            domain = {key: (int(values[label]) if key == 'pixels' else float(values[label]))
+                      for key, values in stats.items()}
+            if name in per_domain:
+                if domain['pixels'] == 0:
+                    domain['success'], domain['message'] = False, f"FAILURE: Domain '{name}' has no pixels."
+                else:
+                    domain['success'], domain['message'] = self.verdict(domain['mean'], ranges[label])
+            results[name] = domain
+        return results
+
+    @staticmethod
+    def verdict(avg_observed_vmem, target_range):
+        """
+        Compares a mean Vmem against the target range and explains the outcome.
+
+        Returns:
+            Tuple[bool, str]: (success, message), as verify_state reports them.
+        """
         # Verification Logic
         min_v, max_v = sorted(target_range)
         
@@ -105,6 +296,7 @@ class BioStateValidator:
 
 # --- EXECUTION MOCKUP ---
 if __name__ == "__main__":
+    configure_logging()
     validator = BioStateValidator()
     
     # 1. Define Target State (e.g., Eye Induction)
@@ -127,18 +319,9 @@ if __name__ == "__main__":
     # For R=0.3, Acceptor should be 60/0.3 = 200
     acceptor_data = np.full(img_size, 200, dtype=np.uint8)
     
-    cv2.imwrite('mock_donor_cc2.png', donor_data)
-    cv2.imwrite('mock_acceptor_dibac.png', acceptor_data)
-    
-    # 3. Run Verification
+    # 3. Run Verification (frames are passed in memory; no PNG round-trip)
     print("Running Ratiometric Verification...")
-    vmem_map = validator.analyze_ratiometric('mock_donor_cc2.png', 'mock_acceptor_dibac.png')
+    vmem_map = validator.analyze_ratiometric(donor_data, acceptor_data)
     success, message = validator.verify_state(vmem_map, target_state)
     
     print(message)
-    
-    # Clean up
-    if os.path.exists('mock_donor_cc2.png'):
-        os.remove('mock_donor_cc2.png')
-    if os.path.exists('mock_acceptor_dibac.png'):
-        os.remove('mock_acceptor_dibac.png')
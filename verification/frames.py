@@ -0,0 +1,270 @@
+"""
+In-memory frames and a shared-memory ring buffer for live acquisition.
+
+`as_frame` turns whatever the acquisition code holds into a 2-D NumPy view
+without copying, so BioStateValidator.analyze_ratiometric can take frames
+straight from memory instead of a PNG/TIFF round-trip. It accepts a NumPy
+array, a multiprocessing.shared_memory block, or any buffer-protocol
+object (memoryview, bytearray, mmap, camera SDK buffers).
+
+FrameRing moves frames between an acquisition process and analysis worker
+processes. A fixed number of (donor, acceptor) slots live in one shared
+memory block, together with a free flag per slot and the next sequence
+number, both guarded by one cross-process condition. Producers claim a
+free slot under it; only the slot index then travels through the ready
+queue to the consumers, which set the flag again on release. Each slot is
+owned by exactly one process at a time, and frame data is never pickled
+or copied:
+
+    ring = FrameRing((2048, 2048), slots=8)            # acquisition process
+    workers = [Process(target=analyze, args=(ring,)) for _ in range(4)]
+    ...
+    index = ring.acquire()                             # camera writes into ring.slot(index)
+    ring.publish(index)                                # or: ring.put(donor, acceptor)
+    ...
+    ring.close_writer(readers=4)
+
+    def analyze(ring):                                 # worker process
+        for frame in ring.frames():
+            validator.compute_vmem_into(frame.donor, frame.acceptor, out, scratch)
+
+A ring reaches other processes the way multiprocessing queues do: as an
+argument when the process is started (Process args, pool initializer).
+Any process holding the ring may produce or consume, so the acquisition
+process need not be the one that created it.
+"""
+
+import multiprocessing
+import os
+import time
+from contextlib import suppress
+from multiprocessing import shared_memory
+from typing import Iterator, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+from shm import attach_shared_memory  # re-exported for existing callers
+
+FrameSource = Union[str, os.PathLike, np.ndarray, shared_memory.SharedMemory, memoryview, bytes, bytearray]
+
+_ALIGN = 64
+_HEADER = np.dtype([('magic', '<u4'), ('slots', '<u4'), ('height', '<u4'), ('width', '<u4'), ('dtype', 'S8'),
+                    ('next_seq', '<i8')])
+_SLOT_META = np.dtype([('seq', '<i8'), ('timestamp', '<f8'), ('free', '<i8')])
+_MAGIC = 0x4E524C4D  # 'MLRN'
+
+
+def as_frame(source: FrameSource, shape: Optional[Tuple[int, int]] = None, dtype=None,
+             offset: int = 0) -> Optional[np.ndarray]:
+    """
+    Views an in-memory frame as a 2-D array.
+
+    Args:
+        source: A NumPy array, a SharedMemory block or a buffer-protocol object.
+            Paths (str / os.PathLike) return None; the caller reads them from disk.
+        shape, dtype: Layout of raw buffers (dtype defaults to uint8). Shared
+            memory and flat buffers need `shape`; buffers that describe their
+            own shape (2-D memoryviews, arrays) do not.
+        offset: Byte offset of the frame within the buffer.
+
+    Returns:
+        np.ndarray: A view of the source. Only arrays that are not C-contiguous
+        are copied (once), since the blur needs contiguous rows.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return None
+    if isinstance(source, np.ndarray):
+        frame = source
+    else:
+        buffer = source.buf if isinstance(source, shared_memory.SharedMemory) else source
+        if shape is not None:
+            frame = np.ndarray(tuple(shape), dtype=np.dtype(dtype or np.uint8), buffer=buffer, offset=offset)
+        else:
+            frame = np.asarray(memoryview(buffer))
+    if frame.ndim != 2:
+        raise ValueError(f"Frames must be 2-D (got shape {frame.shape}); pass `shape` for flat buffers.")
+    return np.ascontiguousarray(frame)
+
+
+def _aligned(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class RingFrame(NamedTuple):
+    """A filled ring slot, valid until it is released."""
+    seq: int
+    timestamp: float
+    donor: np.ndarray
+    acceptor: np.ndarray
+    index: int
+
+
+class FrameRing:
+    """
+    Fixed slots of (donor, acceptor) frames in shared memory (see the module docstring).
+
+    The creating process owns the block and unlinks it on close(); copies
+    unpickled in other processes only map it. `dropped` counts the frames
+    dropped by acquire() and put() calls in this process.
+    """
+
+    def __init__(self, shape: Tuple[int, int], dtype=np.uint8, slots: int = 4, context=None):
+        if slots < 1:
+            raise ValueError("A frame ring needs at least one slot.")
+        context = context or multiprocessing.get_context()
+        dtype = np.dtype(dtype)
+        frames_offset = _aligned(_HEADER.itemsize) + _aligned(slots * _SLOT_META.itemsize)
+        size = frames_offset + slots * 2 * shape[0] * shape[1] * dtype.itemsize
+
+        self._block = shared_memory.SharedMemory(create=True, size=size)
+        header = np.ndarray((), dtype=_HEADER, buffer=self._block.buf)
+        header['magic'], header['slots'] = _MAGIC, slots
+        header['height'], header['width'], header['dtype'] = shape[0], shape[1], dtype.str.encode()
+        header['next_seq'] = 0
+        del header
+        self._owner = True
+        self._slots_changed = context.Condition(context.Lock())
+        self._ready = context.Queue()
+        self.dropped = 0
+        self._map()
+        self._meta['free'] = 1
+
+    def _map(self):
+        header = np.ndarray((), dtype=_HEADER, buffer=self._block.buf)
+        if header['magic'] != _MAGIC:
+            raise ValueError(f"Shared memory block {self._block.name} is not a frame ring.")
+        self.slots = int(header['slots'])
+        self.shape = (int(header['height']), int(header['width']))
+        self.dtype = np.dtype(header['dtype'].item().decode())
+        meta_offset = _aligned(_HEADER.itemsize)
+        frames_offset = meta_offset + _aligned(self.slots * _SLOT_META.itemsize)
+        self._header = header
+        self._meta = np.ndarray((self.slots,), dtype=_SLOT_META, buffer=self._block.buf, offset=meta_offset)
+        self._frames = np.ndarray((self.slots, 2) + self.shape, dtype=self.dtype, buffer=self._block.buf,
+                                  offset=frames_offset)
+
+    def __getstate__(self):
+        return {'name': self._block.name, 'slots_changed': self._slots_changed, 'ready': self._ready}
+
+    def __setstate__(self, state):
+        self._block = attach_shared_memory(state['name'])
+        self._owner = False
+        self._slots_changed, self._ready = state['slots_changed'], state['ready']
+        self.dropped = 0
+        self._map()
+
+    @property
+    def name(self) -> str:
+        return self._block.name
+
+    def slot(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(donor, acceptor) views of one slot."""
+        return self._frames[index, 0], self._frames[index, 1]
+
+    # Producer side
+
+    def acquire(self, timeout: Optional[float] = None) -> Optional[int]:
+        """
+        Takes an empty slot for writing, waiting up to `timeout` seconds (None: forever).
+
+        Returns None, and counts a dropped frame, when no slot frees up in
+        time, i.e. when analysis is falling behind acquisition.
+        """
+        free = self._meta['free']
+        with self._slots_changed:
+            if not self._slots_changed.wait_for(free.any, timeout):
+                self.dropped += 1
+                return None
+            index = int(free.argmax())
+            free[index] = 0
+        return index
+
+    def _return(self, index: int):
+        with self._slots_changed:
+            self._meta['free'][index] = 1
+            self._slots_changed.notify()
+
+    def publish(self, index: int, timestamp: Optional[float] = None) -> int:
+        """Hands a filled slot to the consumers and returns its sequence number."""
+        with self._slots_changed:
+            seq = int(self._header['next_seq'])
+            self._header['next_seq'] = seq + 1
+        self._meta['seq'][index] = seq
+        self._meta['timestamp'][index] = time.time() if timestamp is None else timestamp
+        self._ready.put(index)
+        return seq
+
+    def put(self, donor: FrameSource, acceptor: FrameSource, timeout: Optional[float] = None,
+            timestamp: Optional[float] = None) -> Optional[int]:
+        """
+        Copies a frame pair into a free slot and publishes it.
+
+        This is the one copy out of a camera driver's own buffers; cameras that
+        can write into a given buffer should fill ring.slot(ring.acquire())
+        directly. Returns the sequence number, or None if the frame was dropped.
+        """
+        index = self.acquire(timeout)
+        if index is None:
+            return None
+        slot_donor, slot_acceptor = self.slot(index)
+        try:
+            np.copyto(slot_donor, as_frame(donor, self.shape, self.dtype))
+            np.copyto(slot_acceptor, as_frame(acceptor, self.shape, self.dtype))
+        except (TypeError, ValueError):
+            self._return(index)
+            raise
+        return self.publish(index, timestamp)
+
+    def close_writer(self, readers: int = 1):
+        """Tells `readers` consumers that no more frames will follow."""
+        for _ in range(readers):
+            self._ready.put(None)
+
+    # Consumer side
+
+    def get(self, timeout: Optional[float] = None) -> Optional[RingFrame]:
+        """
+        Takes the next filled slot, or returns None once the writer has closed.
+
+        Raises queue.Empty if nothing arrives within `timeout` seconds. The
+        frame's arrays stay valid until release().
+        """
+        index = self._ready.get(timeout=timeout)
+        if index is None:
+            return None
+        seq, timestamp = int(self._meta['seq'][index]), float(self._meta['timestamp'][index])
+        donor, acceptor = self.slot(index)
+        return RingFrame(seq, timestamp, donor, acceptor, index)
+
+    def release(self, frame: RingFrame):
+        """Returns a frame's slot to the producers."""
+        self._return(frame.index)
+
+    def frames(self, timeout: Optional[float] = None) -> Iterator[RingFrame]:
+        """Yields frames until the writer closes, releasing each one when the next is requested."""
+        while True:
+            frame = self.get(timeout)
+            if frame is None:
+                return
+            try:
+                yield frame
+            finally:
+                self.release(frame)
+
+    def close(self):
+        """Unmaps the ring; the owning process also unlinks it."""
+        self._header = self._meta = self._frames = None
+        # Views still held by callers keep the mapping alive until they are collected.
+        with suppress(BufferError):
+            self._block.close()
+        if self._owner:
+            with suppress(FileNotFoundError):
+                self._block.unlink()
+            self._owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,97 @@
+"""
+Allocation-free ratiometric kernel.
+
+The reference pipeline allocates a fresh array for each blur, the float
+conversion, the zero mask, the ratio and the calibration. For live
+acquisition the same steps run against caller-owned buffers instead, so
+repeated calls on same-shaped frames allocate nothing.
+"""
+
+from typing import Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from instrumentation import metrics
+
+BLUR_KSIZE = (5, 5)
+
+
+class RatiometricScratch:
+    """
+    Reusable intermediate buffers for `ratiometric_kernel`.
+
+    Buffers are (re)allocated only when the frame shape or dtype changes, so
+    one scratch object serves an entire acquisition of same-sized frames.
+    """
+
+    def __init__(self, shape: Tuple[int, ...] = None, dtype=np.uint8):
+        self.shape = None
+        self.dtype = None
+        if shape is not None:
+            self.ensure(shape, dtype)
+
+    def ensure(self, shape: Tuple[int, ...], dtype) -> 'RatiometricScratch':
+        shape, dtype = tuple(shape), np.dtype(dtype)
+        if shape != self.shape or dtype != self.dtype:
+            self.shape, self.dtype = shape, dtype
+            self.blur_donor = np.empty(shape, dtype=dtype)
+            self.blur_acceptor = np.empty(shape, dtype=dtype)
+            self.acceptor = np.empty(shape, dtype=np.float32)
+            self.zero_mask = np.empty(shape, dtype=bool)
+        return self
+
+
+def ratiometric_kernel(img_donor: np.ndarray, img_acceptor: np.ndarray,
+                       slope, intercept, out: np.ndarray,
+                       scratch: RatiometricScratch, higher_order: Sequence = ()) -> np.ndarray:
+    """
+    Computes Vmem = (blur(donor) / blur(acceptor)) * slope + intercept into `out`.
+
+    Bit-identical to BioStateValidator's reference pipeline: blur in the
+    input dtype, convert to float32, replace zero acceptor pixels with 0.1,
+    divide, then apply the calibration. `slope` and `intercept` may be
+    scalars or per-pixel float32 maps.
+
+    With `higher_order` = (c2, c3, ...) the calibration is the polynomial
+    intercept + slope*R + c2*R^2 + ..., evaluated in place by Horner's rule
+    with the ratio kept in the scratch acceptor buffer.
+
+    Args:
+        img_donor, img_acceptor (np.ndarray): Same-shaped single-channel frames.
+        slope, intercept: Calibration (scalars or arrays broadcastable to the frame).
+        out (np.ndarray): float32 output buffer with the frame's shape.
+        scratch (RatiometricScratch): Intermediate buffers; resized if needed.
+        higher_order: Coefficients of R^2 and up (scalars or maps), if any.
+
+    Returns:
+        np.ndarray: `out`.
+    """
+    scratch.ensure(img_donor.shape, img_donor.dtype)
+
+    with metrics.span('blur'):
+        cv2.GaussianBlur(img_donor, BLUR_KSIZE, 0, dst=scratch.blur_donor)
+        cv2.GaussianBlur(img_acceptor, BLUR_KSIZE, 0, dst=scratch.blur_acceptor)
+
+    with metrics.span('ratio'):
+        np.copyto(out, scratch.blur_donor, casting='unsafe')
+        np.copyto(scratch.acceptor, scratch.blur_acceptor, casting='unsafe')
+
+        # Avoid division by zero
+        np.equal(scratch.acceptor, 0, out=scratch.zero_mask)
+        np.copyto(scratch.acceptor, np.float32(0.1), where=scratch.zero_mask)
+
+        np.divide(out, scratch.acceptor, out=out)
+        if higher_order:
+            ratio = scratch.acceptor
+            np.copyto(ratio, out)
+            np.multiply(out, higher_order[-1], out=out)
+            for coefficient in reversed(higher_order[:-1]):
+                np.add(out, coefficient, out=out)
+                np.multiply(out, ratio, out=out)
+            np.add(out, slope, out=out)
+            np.multiply(out, ratio, out=out)
+        else:
+            np.multiply(out, slope, out=out)
+        np.add(out, intercept, out=out)
+    return out
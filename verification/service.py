@@ -0,0 +1,441 @@
+"""
+Local verification service for many imaging rigs.
+
+Rig scripts that build a BioStateValidator and parse subroutine JSON on
+every call pay the interpreter, NumPy/OpenCV import and library load cost
+each time. The service pays it once. It keeps the subroutine library and
+the rigs' calibration maps resident, accepts requests from any number of
+clients on a Unix socket, and runs the image work on a process pool.
+Clients hand frames over in shared memory, so a frame pair is written once
+by the rig and read in place by the worker that processes it.
+
+Protocol: one JSON object per line in each direction. Requests:
+
+    {"op": "ping"}
+    {"op": "verify", "subroutine": "<id>", "rig": "scope2", "session": "2024-05-01",
+     "frames": {"shm": "<name>", "shape": [H, W], "dtype": "uint8"}}
+    {"op": "verify", "subroutine": "<id>", "donor_path": "...", "acceptor_path": "..."}
+    {"op": "reload"}     re-read the library and forget resolved calibrations
+    {"op": "stats"}      request counters and latency histograms
+
+A shared-memory frame block holds the donor frame followed by the
+acceptor frame, i.e. a (2, H, W) array. "rig"/"session" are optional:
+without them the validator's global calibration applies, and without a
+session the rig's latest fit is used. Calibration metadata is re-checked
+on every request, so a refit or a newer session takes effect for all
+workers on the next request. An optional "id" is echoed back.
+Replies carry "ok" and either the result or an "error" message.
+
+VerificationClient wraps all of this for rig scripts:
+
+    with VerificationClient() as client:
+        result = client.verify('xenopus_ectopic_eye_induction_v1', donor, acceptor, rig='scope2')
+
+Usage:
+    python -m verification.service [--socket PATH] [--workers N]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from compiler.library_loader import default_database_path, invalidate_library, load_library
+from instrumentation.log import configure_logging, get_logger
+from instrumentation.metrics import MetricsRegistry
+from shm import attach_shared_memory
+
+from .calibration import CalibrationCache, CalibrationMap
+from .dye_decode import BioStateValidator
+from .kernel import RatiometricScratch, ratiometric_kernel
+
+_log = get_logger(__name__)
+
+FRAME_DTYPES = ('uint8', 'uint16')
+MAX_REQUEST_BYTES = 1 << 20
+ATTACHED_BLOCKS = 8
+CALIBRATION_MAPS = 4
+
+
+def default_socket_path() -> str:
+    return os.environ.get('MORPHOLANG_SOCKET', os.path.join(tempfile.gettempdir(), 'morpholang.sock'))
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+_scratch = RatiometricScratch()
+_outputs: Dict[Tuple[int, int], np.ndarray] = {}
+_blocks: 'OrderedDict[str, shared_memory.SharedMemory]' = OrderedDict()
+_calibrations: 'OrderedDict[Tuple, CalibrationMap]' = OrderedDict()
+
+
+def _init_worker():
+    cv2.setNumThreads(1)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Maps a client's frame block, keeping the last few mapped for reuse."""
+    block = _blocks.pop(name, None)
+    if block is None:
+        block = attach_shared_memory(name)
+        if len(_blocks) >= ATTACHED_BLOCKS:
+            _blocks.popitem(last=False)[1].close()
+    _blocks[name] = block
+    return block
+
+
+def _read_frames(frames: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    if 'shm' in frames:
+        shape, dtype = tuple(frames['shape']), np.dtype(frames['dtype'])
+        block = _attach(frames['shm'])
+        pair = np.ndarray((2,) + shape, dtype=dtype, buffer=block.buf)
+        return pair[0], pair[1]
+    donor = cv2.imread(frames['donor_path'], cv2.IMREAD_GRAYSCALE)
+    acceptor = cv2.imread(frames['acceptor_path'], cv2.IMREAD_GRAYSCALE)
+    if donor is None or acceptor is None:
+        raise ValueError(f"Could not read {frames['donor_path']} / {frames['acceptor_path']}")
+    if donor.shape != acceptor.shape:
+        raise ValueError("Donor and Acceptor images must have the same dimensions.")
+    return donor, acceptor
+
+
+def _calibration_terms(calibration: Optional[Tuple], slope: float, intercept: float):
+    """Terms of a calibration keyed by (path, metadata stamp), keeping the last few maps open."""
+    if calibration is None:
+        return slope, intercept, ()
+    calibration_map = _calibrations.pop(calibration, None)
+    if calibration_map is None:
+        for key in [key for key in _calibrations if key[0] == calibration[0]]:
+            del _calibrations[key]  # an older fit of the same session
+        calibration_map = CalibrationMap.open(calibration[0])
+        if len(_calibrations) >= CALIBRATION_MAPS:
+            _calibrations.popitem(last=False)
+    _calibrations[calibration] = calibration_map
+    return calibration_map.terms()
+
+
+def _verify_frames(task) -> Dict:
+    """Worker: compute the Vmem map of one frame pair and judge it against the target range."""
+    frames, calibration, slope, intercept, target_range = task
+    started = time.perf_counter()
+    donor, acceptor = _read_frames(frames)
+    slope, intercept, higher_order = _calibration_terms(calibration, slope, intercept)
+    if np.shape(slope) not in ((), donor.shape):
+        raise ValueError(f"Frames of shape {donor.shape} do not match the {np.shape(slope)} calibration map.")
+
+    out = _outputs.get(donor.shape)
+    if out is None:
+        _outputs.clear()
+        out = _outputs[donor.shape] = np.empty(donor.shape, dtype=np.float32)
+    ratiometric_kernel(donor, acceptor, slope, intercept, out, _scratch, higher_order)
+
+    min_v, max_v = sorted(target_range)
+    mean_vmem = float(out.mean())
+    in_range = np.count_nonzero((out >= min_v) & (out <= max_v)) / max(out.size, 1)
+    success, message = BioStateValidator.verdict(mean_vmem, target_range)
+    return {'success': success, 'message': message, 'mean_vmem': mean_vmem,
+            'in_range_fraction': in_range, 'worker_ms': (time.perf_counter() - started) * 1e3}
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+class VerificationService:
+    """
+    Serves verification requests on a Unix socket (see the module docstring).
+
+    The library and calibration lookups stay in this process; frame work runs
+    on a pool of `workers` processes. At most `max_in_flight` frame requests
+    are handed to the pool at once (default: twice the workers); the rest
+    wait in the event loop, so a burst from many rigs queues rather than
+    piling up pickled tasks.
+    """
+
+    def __init__(self, socket_path: Optional[str] = None, database_path: Optional[str] = None,
+                 calibration_dir: Optional[str] = None, workers: Optional[int] = None,
+                 max_in_flight: Optional[int] = None, validator: Optional[BioStateValidator] = None):
+        self.socket_path = socket_path or default_socket_path()
+        self.database_path = database_path or default_database_path()
+        self.calibrations = CalibrationCache(calibration_dir)
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or 2 * self.workers
+        self.validator = validator or BioStateValidator()
+        self.metrics = MetricsRegistry(enabled=True)
+        self.subroutines: Dict[str, Dict] = {}
+        self._calibration_keys: Dict[Tuple[str, Optional[str]], Tuple[Tuple, Tuple]] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.load_library()
+
+    def load_library(self):
+        """(Re)loads the subroutine library and forgets resolved calibrations."""
+        invalidate_library(self.database_path)
+        self.subroutines = {sub['id']: sub for sub in load_library(self.database_path)}
+        self._calibration_keys.clear()
+        _log.info("Loaded %d subroutines from %s", len(self.subroutines), self.database_path)
+
+    def _calibration(self, rig: Optional[str], session: Optional[str]) -> Optional[Tuple]:
+        """
+        (path, metadata stamp) of a rig's calibration, the key of the worker caches.
+
+        The metadata is re-stat'ed on every request (as library_loader does for
+        libraries), so a refit, or a newer session when none is named, yields
+        a new key and every worker loads the new maps.
+        """
+        if rig is None:
+            return None
+        key = (rig, session)
+        stamp = self.calibrations.stamp(rig, session)
+        cached = self._calibration_keys.get(key)
+        if cached is None or cached[0] != stamp:
+            calibration = self.calibrations.get(rig, session)
+            if calibration is None:
+                self._calibration_keys.pop(key, None)
+                raise ValueError(f"No calibration for rig '{rig}'" + (f", session '{session}'" if session else ""))
+            session_stamp = self.calibrations.stamp(rig, os.path.basename(calibration.path))
+            cached = self._calibration_keys[key] = (stamp, (calibration.path, session_stamp))
+        return cached[1]
+
+    async def start(self):
+        """Starts the worker pool and begins accepting connections."""
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.socket_path,
+                                                       limit=MAX_REQUEST_BYTES)
+        _log.info("Serving on %s with %d workers", self.socket_path, self.workers)
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves one client; its requests are answered in order."""
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write(_encode({'ok': False, 'error': 'Request too large.'}))
+                    break
+                if not line:
+                    break
+                writer.write(_encode(await self.handle_request(line)))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, line: bytes) -> Dict:
+        """Answers one request line; failures become {'ok': False, 'error': ...} replies."""
+        started = time.perf_counter()
+        request, op = None, 'invalid'
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Requests must be JSON objects.")
+            op = request.get('op', 'invalid')
+            handler = self._handlers.get(op)
+            if handler is None:
+                raise ValueError(f"Unknown op '{op}'.")
+            reply = dict(await handler(self, request), ok=True)
+        except ValueError as e:
+            reply = {'ok': False, 'error': str(e)}
+        except Exception as e:  # a bad request must not take the service down
+            _log.error("%s request failed: %s: %s", op, type(e).__name__, e)
+            reply = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+
+        if isinstance(request, dict) and 'id' in request:
+            reply['id'] = request['id']
+        if not reply['ok']:
+            self.metrics.count('service_errors_total', op=op)
+        self.metrics.count('service_requests_total', op=op)
+        self.metrics.histogram('service_request_seconds', op=op).observe(time.perf_counter() - started)
+        return reply
+
+    async def _ping(self, request: Dict) -> Dict:
+        return {'pid': os.getpid(), 'workers': self.workers, 'subroutines': len(self.subroutines)}
+
+    async def _reload(self, request: Dict) -> Dict:
+        self.load_library()
+        return {'subroutines': len(self.subroutines)}
+
+    async def _stats(self, request: Dict) -> Dict:
+        return {'metrics': self.metrics.to_dict()}
+
+    async def _verify(self, request: Dict) -> Dict:
+        subroutine_id = request.get('subroutine')
+        subroutine = self.subroutines.get(subroutine_id)
+        if subroutine is None:
+            raise ValueError(f"Unknown subroutine '{subroutine_id}'.")
+        target_range = subroutine['bioelectric_state']['target_vmem_range']
+        frames = _frame_spec(request)
+        calibration = self._calibration(request.get('rig'), request.get('session'))
+
+        task = (frames, calibration, self.validator.slope, self.validator.intercept, target_range)
+        async with self._slots:
+            result = await asyncio.get_running_loop().run_in_executor(self._pool, _verify_frames, task)
+        return dict(result, subroutine=subroutine_id,
+                    spatial_domain=subroutine['bioelectric_state']['spatial_domain'],
+                    target_vmem_range=target_range)
+
+    _handlers = {'ping': _ping, 'reload': _reload, 'stats': _stats, 'verify': _verify}
+
+
+def _frame_spec(request: Dict) -> Dict:
+    """Validates a request's frame reference."""
+    if 'frames' in request:
+        frames = request['frames']
+        if not isinstance(frames, dict) or not {'shm', 'shape', 'dtype'} <= set(frames):
+            raise ValueError("'frames' needs 'shm', 'shape' and 'dtype'.")
+        shape = frames['shape']
+        if (not isinstance(shape, list) or len(shape) != 2
+                or not all(isinstance(n, int) and n > 0 for n in shape)):
+            raise ValueError("'frames.shape' must be [height, width].")
+        if frames['dtype'] not in FRAME_DTYPES:
+            raise ValueError(f"'frames.dtype' must be one of {FRAME_DTYPES}.")
+        return {'shm': str(frames['shm']), 'shape': shape, 'dtype': frames['dtype']}
+    if 'donor_path' in request and 'acceptor_path' in request:
+        return {'donor_path': str(request['donor_path']), 'acceptor_path': str(request['acceptor_path'])}
+    raise ValueError("A verify request needs 'frames' or 'donor_path' and 'acceptor_path'.")
+
+
+def _encode(message: Dict) -> bytes:
+    return json.dumps(message).encode() + b"\n"
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+
+class VerificationClient:
+    """
+    Blocking client for rig scripts.
+
+    Frames are copied into one shared-memory block owned by the client (grown
+    when a larger frame pair arrives) and released by close().
+    """
+
+    def __init__(self, socket_path: Optional[str] = None, timeout: Optional[float] = None):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(socket_path or default_socket_path())
+        self._file = self._socket.makefile('rb')
+        self._block: Optional[shared_memory.SharedMemory] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        if self._block is not None:
+            self._block.close()
+            self._block.unlink()
+            self._block = None
+        self._file.close()
+        self._socket.close()
+
+    def request(self, message: Dict) -> Dict:
+        """Sends one request and returns the reply; raises RuntimeError if it failed."""
+        self._socket.sendall(_encode(message))
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("The verification service closed the connection.")
+        reply = json.loads(line)
+        if not reply.pop('ok', False):
+            raise RuntimeError(reply.get('error', 'Verification request failed.'))
+        return reply
+
+    def ping(self) -> Dict:
+        return self.request({'op': 'ping'})
+
+    def reload(self) -> Dict:
+        return self.request({'op': 'reload'})
+
+    def stats(self) -> Dict:
+        return self.request({'op': 'stats'})['metrics']
+
+    def verify(self, subroutine_id: str, donor: np.ndarray, acceptor: np.ndarray,
+               rig: Optional[str] = None, session: Optional[str] = None) -> Dict:
+        """Verifies an in-memory donor/acceptor pair against a subroutine's target state."""
+        if donor.shape != acceptor.shape or donor.dtype != acceptor.dtype or donor.ndim != 2:
+            raise ValueError("Donor and acceptor must be 2-D frames of the same shape and dtype.")
+        nbytes = 2 * donor.nbytes
+        if self._block is None or self._block.size < nbytes:
+            if self._block is not None:
+                self._block.close()
+                self._block.unlink()
+            self._block = shared_memory.SharedMemory(create=True, size=nbytes)
+        pair = np.ndarray((2,) + donor.shape, dtype=donor.dtype, buffer=self._block.buf)
+        pair[0], pair[1] = donor, acceptor
+        del pair
+        frames = {'shm': self._block.name, 'shape': list(donor.shape), 'dtype': donor.dtype.name}
+        return self.request(_verify_request(subroutine_id, rig, session, frames=frames))
+
+    def verify_files(self, subroutine_id: str, donor_path: str, acceptor_path: str,
+                     rig: Optional[str] = None, session: Optional[str] = None) -> Dict:
+        """Verifies a donor/acceptor image pair that the service reads from disk."""
+        return self.request(_verify_request(subroutine_id, rig, session, donor_path=os.path.abspath(donor_path),
+                                            acceptor_path=os.path.abspath(acceptor_path)))
+
+
+def _verify_request(subroutine_id: str, rig: Optional[str], session: Optional[str], **frames) -> Dict:
+    request = dict(frames, op='verify', subroutine=subroutine_id)
+    if rig is not None:
+        request['rig'] = rig
+    if session is not None:
+        request['session'] = session
+    return request
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve bioelectric state verification to local imaging rigs.")
+    parser.add_argument('--socket', help=f"Unix socket path (default: {default_socket_path()})")
+    parser.add_argument('--database', help="Library to serve (default: bundled database)")
+    parser.add_argument('--calibration-dir', help="Calibration cache directory")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    service = VerificationService(args.socket, args.database, args.calibration_dir, args.workers)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        _log.info("Shutting down.")
+
+
+if __name__ == "__main__":
+    main()
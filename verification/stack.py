@@ -0,0 +1,204 @@
+"""
+Time-lapse stack processing for ratiometric Vmem imaging.
+
+Control loops sample Vmem every few hours for up to a week, so a single
+experiment yields a stack of donor/acceptor frames. Frames are independent,
+so they are spread across a process pool; each worker pins OpenCV to a
+single thread so the pool does not oversubscribe the cores.
+"""
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from instrumentation import metrics
+
+from .kernel import RatiometricScratch, ratiometric_kernel
+
+IMAGE_EXTENSIONS = ('.png', '.tif', '.tiff', '.bmp', '.jpg', '.jpeg', '.pgm')
+SUMMARY_PERCENTILES = (5, 50, 95)
+
+# A frame source is ('file', path) or ('page', path, page_index).
+FrameSpec = Tuple
+
+# Per-process intermediates, reused across the frames a worker handles.
+_scratch = RatiometricScratch()
+
+
+def _natural_key(name: str) -> List:
+    """Sort key that orders embedded numbers by value ('t2' before 't10')."""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+def _pair_directory(directory: str) -> List[Tuple[FrameSpec, FrameSpec]]:
+    """Pairs '*donor*' and '*acceptor*' image files in a directory by their shared name."""
+    donors, acceptors = {}, {}
+    for name in os.listdir(directory):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        lowered = name.lower()
+        if 'donor' in lowered:
+            donors[re.sub('donor', '{}', lowered, count=1)] = name
+        elif 'acceptor' in lowered:
+            acceptors[re.sub('acceptor', '{}', lowered, count=1)] = name
+
+    keys = sorted(set(donors) & set(acceptors), key=_natural_key)
+    if len(keys) != len(donors) or len(keys) != len(acceptors):
+        unpaired = sorted(set(donors) ^ set(acceptors), key=_natural_key)
+        raise ValueError(f"Unpaired frames in {directory}: {[k.format('*') for k in unpaired]}")
+    return [(('file', os.path.join(directory, donors[k])), ('file', os.path.join(directory, acceptors[k])))
+            for k in keys]
+
+
+def discover_frames(donor: str, acceptor: Optional[str] = None) -> List[Tuple[FrameSpec, FrameSpec]]:
+    """
+    Resolves a stack description into an ordered list of (donor, acceptor) frame sources.
+
+    Accepted layouts:
+        directory              - files named like 't012_donor.png' / 't012_acceptor.png',
+                                 in natural order (t2 before t10)
+        donor.tif, acceptor.tif - two multi-page TIFFs with one page per time point
+        stack.tif              - one multi-page TIFF with interleaved donor/acceptor pages
+    """
+    if os.path.isdir(donor):
+        return _pair_directory(donor)
+
+    if acceptor is None:
+        pages = _page_count(donor)
+        if pages % 2:
+            raise ValueError(f"{donor}: interleaved stack has an odd number of pages ({pages}).")
+        return [(('page', donor, 2 * t), ('page', donor, 2 * t + 1)) for t in range(pages // 2)]
+
+    n_donor, n_acceptor = _page_count(donor), _page_count(acceptor)
+    if n_donor != n_acceptor:
+        raise ValueError(f"Donor and acceptor stacks differ in length ({n_donor} vs {n_acceptor}).")
+    return [(('page', donor, t), ('page', acceptor, t)) for t in range(n_donor)]
+
+
+def _page_count(path: str) -> int:
+    imcount = getattr(cv2, 'imcount', None)
+    if imcount is not None:
+        return imcount(path)
+    ok, mats = cv2.imreadmulti(path, flags=cv2.IMREAD_GRAYSCALE)  # early OpenCV 4.5 releases
+    return len(mats) if ok else 0
+
+
+def _read_page(path: str, page: int) -> Optional[np.ndarray]:
+    """One page of a multi-page file, decoding only that page where OpenCV can."""
+    try:
+        ok, mats = cv2.imreadmulti(path, start=page, count=1, flags=cv2.IMREAD_GRAYSCALE)
+    except (TypeError, cv2.error):
+        # Early OpenCV 4.5 releases have no (start, count) overload: decode every page.
+        ok, mats = cv2.imreadmulti(path, flags=cv2.IMREAD_GRAYSCALE)
+        mats = mats[page:page + 1] if ok else []
+    return mats[0] if ok and mats else None
+
+
+def read_frame(spec: FrameSpec) -> Optional[np.ndarray]:
+    """Reads one grayscale frame from a frame source."""
+    with metrics.span('image_read'):
+        if spec[0] == 'file':
+            return cv2.imread(spec[1], cv2.IMREAD_GRAYSCALE)
+        return _read_page(spec[1], spec[2])
+
+
+def summarize(vmem_map: np.ndarray, percentiles: Sequence[float] = SUMMARY_PERCENTILES) -> Dict:
+    """Per-frame summary statistics of a Vmem map."""
+    values = np.percentile(vmem_map, percentiles)
+    summary = {
+        'mean': float(vmem_map.mean()),
+        'std': float(vmem_map.std()),
+        'min': float(vmem_map.min()),
+        'max': float(vmem_map.max()),
+    }
+    summary.update({f'p{p:g}': float(v) for p, v in zip(percentiles, values)})
+    return summary
+
+
+def _init_worker(opencv_threads: int):
+    cv2.setNumThreads(opencv_threads)
+
+
+def _process_frame(task):
+    """Worker: read one frame pair, compute Vmem, and return it, summarize it, or write it out."""
+    index, donor_spec, acceptor_spec, slope, intercept, calibration, summary, output_path = task
+    img_donor, img_acceptor = read_frame(donor_spec), read_frame(acceptor_spec)
+    if img_donor is None or img_acceptor is None:
+        raise ValueError(f"Frame {index}: could not read {donor_spec[1]} / {acceptor_spec[1]}")
+    if img_donor.shape != img_acceptor.shape:
+        raise ValueError(f"Frame {index}: donor and acceptor shapes differ.")
+
+    higher_order = ()
+    if calibration is not None:
+        slope, intercept, higher_order = calibration.terms()
+
+    vmem_map = np.empty(img_donor.shape, dtype=np.float32)
+    ratiometric_kernel(img_donor, img_acceptor, slope, intercept, vmem_map, _scratch, higher_order)
+    result = dict(summarize(vmem_map), frame=index) if summary else vmem_map
+
+    if output_path is not None:
+        stack = np.load(output_path, mmap_mode='r+')
+        stack[index] = vmem_map
+        stack.flush()
+        if not summary:
+            result = None
+    return index, result
+
+
+def process_stack(frames: List[Tuple[FrameSpec, FrameSpec]], slope: float, intercept: float,
+                  summary: bool = False, output_path: Optional[str] = None,
+                  workers: Optional[int] = None, opencv_threads: int = 1, calibration=None):
+    """
+    Computes Vmem for every frame pair, in parallel when `workers` > 1.
+
+    A `calibration` (verification.calibration.CalibrationMap) replaces
+    slope/intercept; cached maps reach the workers as file paths and are
+    memory-mapped there rather than copied into every task.
+
+    Returns a (T, H, W) float32 array (an np.memmap of `output_path` if given),
+    or, with `summary=True`, a list of per-frame statistics dicts.
+    """
+    if not frames:
+        return [] if summary else np.empty((0, 0, 0), dtype=np.float32)
+
+    if output_path is not None:
+        first = read_frame(frames[0][0])
+        if first is None:
+            raise ValueError(f"Could not read {frames[0][0][1]}")
+        stack = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.float32,
+                                          shape=(len(frames),) + first.shape)
+        del stack
+
+    if calibration is not None:
+        slope = intercept = None
+    tasks = [(t, d, a, slope, intercept, calibration, summary, output_path) for t, (d, a) in enumerate(frames)]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        results = map(_process_frame, tasks)
+        return _collect(results, len(frames), summary, output_path)
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(frames)), initializer=_init_worker,
+                             initargs=(opencv_threads,)) as pool:
+        chunksize = max(1, len(tasks) // (4 * workers))
+        return _collect(pool.map(_process_frame, tasks, chunksize=chunksize), len(frames), summary, output_path)
+
+
+def _collect(results, n_frames: int, summary: bool, output_path: Optional[str]):
+    if summary:
+        return [stats for _, stats in sorted(results, key=lambda r: r[0])]
+    if output_path is not None:
+        for _ in results:
+            pass
+        return np.load(output_path, mmap_mode='r+')
+
+    stack = None
+    for index, vmem_map in results:
+        if stack is None:
+            stack = np.empty((n_frames,) + vmem_map.shape, dtype=np.float32)
+        stack[index] = vmem_map
+    return stack
@@ -0,0 +1,249 @@
+"""
+Live streaming verification against a camera feed.
+
+Frames arrive faster than they can sometimes be processed, so they pass
+through a small bounded queue. When the queue is full the oldest frame is
+dropped (with `max_pending=1` this coalesces to "always the latest frame"),
+which keeps result latency bounded by roughly one frame's processing time
+instead of growing without limit.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+from .kernel import RatiometricScratch
+
+STAGES = ('queue_wait', 'vmem', 'verify')
+PRODUCER_JOIN_TIMEOUT = 5.0
+
+
+class StageTimer:
+    """Running count / total / max per pipeline stage."""
+
+    def __init__(self, stages=STAGES):
+        self._stats = {stage: [0, 0.0, 0.0] for stage in stages}
+
+    def record(self, stage: str, seconds: float):
+        stat = self._stats[stage]
+        stat[0] += 1
+        stat[1] += seconds
+        stat[2] = max(stat[2], seconds)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Mean and max milliseconds per stage."""
+        return {
+            stage: {'count': n, 'mean_ms': (total / n * 1e3) if n else 0.0, 'max_ms': peak * 1e3}
+            for stage, (n, total, peak) in self._stats.items()
+        }
+
+
+class StreamingVerifier:
+    """
+    Continuously verifies a (donor, acceptor) frame stream against a target state.
+
+    Each processed frame yields a result dict:
+        frame             - sequence number of the frame in the source
+        success, message  - verdict, as from BioStateValidator.verify_state
+        mean_vmem         - mean Vmem over the frame (mV)
+        in_range_fraction - fraction of pixels inside target_vmem_range
+        dropped           - frames discarded under backpressure since the previous result
+        latency_ms        - time from frame arrival to result
+        timings_ms        - per-stage times for this frame
+    """
+
+    def __init__(self, validator, target_state: Dict, max_pending: int = 2, keep_maps: bool = False):
+        """
+        Args:
+            validator (BioStateValidator): Supplies calibration and the verdict logic.
+            target_state (Dict): bioelectric_state with 'target_vmem_range'.
+            max_pending (int): Frames buffered before the oldest is dropped (1 = latest only).
+            keep_maps (bool): Attach a copy of each Vmem map to its result as 'vmem_map'.
+        """
+        if max_pending < 1:
+            raise ValueError("max_pending must be at least 1.")
+        self.validator = validator
+        self.target_state = target_state
+        self.max_pending = max_pending
+        self.keep_maps = keep_maps
+        self.timer = StageTimer()
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+
+        self._min_v, self._max_v = sorted(target_state['target_vmem_range'])
+        self._scratch = RatiometricScratch()
+        self._out = np.empty(0, dtype=np.float32)
+        self._in_range = np.empty(0, dtype=bool)
+        self._below_max = np.empty(0, dtype=bool)
+
+    def _enqueue(self, pending: deque, frame) -> bool:
+        """Adds a frame, dropping the oldest one if the queue is full. Returns True if one was dropped."""
+        self.received += 1
+        dropped = len(pending) == self.max_pending
+        if dropped:
+            pending.popleft()
+            self.dropped += 1
+        pending.append((self.received - 1, time.perf_counter(), frame))
+        return dropped
+
+    def process_frame(self, seq: int, arrived: float, frame: Tuple[np.ndarray, np.ndarray],
+                      dropped: int = 0) -> Dict:
+        """Runs one frame through Vmem computation and verification."""
+        started = time.perf_counter()
+        donor, acceptor = frame
+        if self._out.shape != donor.shape:
+            self._out = np.empty(donor.shape, dtype=np.float32)
+            self._in_range = np.empty(donor.shape, dtype=bool)
+            self._below_max = np.empty(donor.shape, dtype=bool)
+
+        self.validator.compute_vmem_into(donor, acceptor, self._out, self._scratch)
+        computed = time.perf_counter()
+
+        mean_vmem = float(self._out.mean())
+        np.greater_equal(self._out, self._min_v, out=self._in_range)
+        np.less_equal(self._out, self._max_v, out=self._below_max)
+        np.logical_and(self._in_range, self._below_max, out=self._in_range)
+        in_range_fraction = float(np.count_nonzero(self._in_range)) / max(self._out.size, 1)
+        success, message = self.validator.verdict(mean_vmem, (self._min_v, self._max_v))
+        finished = time.perf_counter()
+
+        timings = {'queue_wait': started - arrived, 'vmem': computed - started, 'verify': finished - computed}
+        for stage, seconds in timings.items():
+            self.timer.record(stage, seconds)
+        self.processed += 1
+
+        result = {
+            'frame': seq,
+            'success': success,
+            'message': message,
+            'mean_vmem': mean_vmem,
+            'in_range_fraction': in_range_fraction,
+            'dropped': dropped,
+            'latency_ms': (finished - arrived) * 1e3,
+            'timings_ms': {stage: seconds * 1e3 for stage, seconds in timings.items()},
+        }
+        if self.keep_maps:
+            result['vmem_map'] = self._out.copy()
+        return result
+
+    def run(self, frames: Iterable[Tuple[np.ndarray, np.ndarray]]) -> Iterator[Dict]:
+        """
+        Verifies frames from a (blocking) iterable such as a camera generator.
+
+        The source is drained on a background thread into the bounded queue,
+        so a slow consumer causes drops rather than a growing backlog. When the
+        consumer stops early (breaks out, closes or drops the generator), the
+        producer stops reading the source after the frame it is waiting for,
+        and is joined for up to PRODUCER_JOIN_TIMEOUT seconds.
+        """
+        pending: deque = deque()
+        cond = threading.Condition()
+        stop = threading.Event()
+        state = {'done': False, 'error': None, 'dropped': 0}
+
+        def produce():
+            try:
+                for frame in frames:
+                    if stop.is_set():
+                        break
+                    with cond:
+                        if self._enqueue(pending, frame):
+                            state['dropped'] += 1
+                        cond.notify()
+            except BaseException as e:
+                state['error'] = e
+            finally:
+                with cond:
+                    state['done'] = True
+                    cond.notify()
+
+        producer = threading.Thread(target=produce, name='frame-producer', daemon=True)
+        producer.start()
+        try:
+            while True:
+                with cond:
+                    while not pending and not state['done']:
+                        cond.wait()
+                    if not pending:
+                        break
+                    seq, arrived, frame = pending.popleft()
+                    dropped, state['dropped'] = state['dropped'], 0
+                yield self.process_frame(seq, arrived, frame, dropped)
+        finally:
+            stop.set()
+            producer.join(PRODUCER_JOIN_TIMEOUT)
+        if state['error'] is not None:
+            raise state['error']
+
+    async def run_async(self, source: 'asyncio.Queue') -> AsyncIterator[Dict]:
+        """
+        Verifies frames from an asyncio.Queue; put None on the queue to stop.
+
+        Frames are processed in a worker thread so the event loop (and the
+        task filling the queue) stays responsive.
+        """
+        loop = asyncio.get_running_loop()
+        pending: deque = deque()
+        available = asyncio.Event()
+        state = {'done': False, 'dropped': 0}
+
+        async def drain():
+            while True:
+                frame = await source.get()
+                if frame is None:
+                    break
+                if self._enqueue(pending, frame):
+                    state['dropped'] += 1
+                available.set()
+            state['done'] = True
+            available.set()
+
+        drainer = asyncio.ensure_future(drain())
+        try:
+            while True:
+                if not pending:
+                    if state['done']:
+                        break
+                    available.clear()
+                    await available.wait()
+                    continue
+                seq, arrived, frame = pending.popleft()
+                dropped, state['dropped'] = state['dropped'], 0
+                yield await loop.run_in_executor(None, self.process_frame, seq, arrived, frame, dropped)
+        finally:
+            drainer.cancel()
+
+    def stats(self) -> Dict:
+        """Frame counters and per-stage timing summary."""
+        return {'received': self.received, 'processed': self.processed,
+                'dropped': self.dropped, 'stages': self.timer.summary()}
+
+
+def synthetic_frames(n_frames: int, shape=(100, 100), vmem: float = -40.0, noise: float = 0.0,
+                     slope: float = 100.0, intercept: float = -70.0, donor_level: int = 60,
+                     interval: float = 0.0, seed: Optional[int] = 0) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Mock camera feed, built like the mock images in dye_decode's __main__.
+
+    For the requested Vmem, R = (vmem - intercept) / slope and the acceptor
+    intensity is donor_level / R; `noise` adds Gaussian intensity noise and
+    `interval` sleeps between frames to emulate a frame rate.
+    """
+    rng = np.random.default_rng(seed)
+    ratio = (vmem - intercept) / slope
+    acceptor_level = donor_level / ratio
+    for _ in range(n_frames):
+        donor = np.full(shape, donor_level, dtype=np.float32)
+        acceptor = np.full(shape, acceptor_level, dtype=np.float32)
+        if noise:
+            donor += rng.normal(0, noise, shape)
+            acceptor += rng.normal(0, noise, shape)
+        yield (np.clip(donor, 0, 255).round().astype(np.uint8),
+               np.clip(acceptor, 0, 255).round().astype(np.uint8))
+        if interval:
+            time.sleep(interval)
@@ -0,0 +1,121 @@
+"""
+Memory-mapped image access and tiling for out-of-core ratiometric analysis.
+
+Whole-embryo mosaics do not fit in memory as five full-frame float buffers,
+so the tiled pipeline maps the donor/acceptor inputs and the Vmem output on
+disk and works through them one overlapping tile at a time.
+"""
+
+import os
+import struct
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+# The 5x5 Gaussian pre-filter reads two pixels beyond each output pixel.
+BLUR_HALO = 2
+
+_TIFF_TAGS = {
+    256: 'width', 257: 'height', 258: 'bits', 259: 'compression', 273: 'strip_offsets',
+    277: 'samples', 278: 'rows_per_strip', 279: 'strip_counts', 284: 'planar', 322: 'tile_width',
+    339: 'sample_format',
+}
+_TIFF_TYPES = {3: 'H', 4: 'I', 16: 'Q'}
+_TIFF_SAMPLE_KINDS = {1: 'u', 2: 'i', 3: 'f'}
+
+
+def _read_tiff_layout(path: str) -> Tuple[Tuple[int, int], np.dtype, int]:
+    """Parses the first IFD of a baseline TIFF and returns (shape, dtype, data offset)."""
+    with open(path, 'rb') as f:
+        order = f.read(2)
+        if order not in (b'II', b'MM'):
+            raise ValueError(f"{path} is not a TIFF file.")
+        endian = '<' if order == b'II' else '>'
+        magic, ifd_offset = struct.unpack(endian + 'HI', f.read(6))
+        if magic != 42:
+            raise ValueError(f"{path}: BigTIFF and non-standard TIFFs are not supported.")
+
+        f.seek(ifd_offset)
+        (n_entries,) = struct.unpack(endian + 'H', f.read(2))
+        tags = {}
+        for _ in range(n_entries):
+            tag, typ, count, value = struct.unpack(endian + 'HHI4s', f.read(12))
+            if tag not in _TIFF_TAGS or typ not in _TIFF_TYPES:
+                continue
+            fmt = _TIFF_TYPES[typ]
+            size = struct.calcsize(fmt) * count
+            if size <= 4:
+                values = struct.unpack(endian + fmt * count, value[:size])
+            else:
+                here = f.tell()
+                f.seek(struct.unpack(endian + 'I', value)[0])
+                values = struct.unpack(endian + fmt * count, f.read(size))
+                f.seek(here)
+            tags[_TIFF_TAGS[tag]] = values
+
+    def tag(name, default=None):
+        return tags[name][0] if name in tags else default
+
+    if tag('compression', 1) != 1:
+        raise ValueError(f"{path}: only uncompressed TIFFs can be memory-mapped.")
+    if tag('samples', 1) != 1:
+        raise ValueError(f"{path}: only single-channel TIFFs can be memory-mapped.")
+    if 'tile_width' in tags:
+        raise ValueError(f"{path}: tiled TIFF layouts are not supported; use strips.")
+
+    offsets, counts = tags['strip_offsets'], tags['strip_counts']
+    for i in range(len(offsets) - 1):
+        if offsets[i] + counts[i] != offsets[i + 1]:
+            raise ValueError(f"{path}: strips are not contiguous and cannot be memory-mapped.")
+
+    kind = _TIFF_SAMPLE_KINDS[tag('sample_format', 1)]
+    dtype = np.dtype(f"{endian}{kind}{tag('bits', 8) // 8}")
+    return (tag('height'), tag('width')), dtype, offsets[0]
+
+
+def open_image(path: str, shape: Optional[Tuple[int, int]] = None, dtype=None) -> np.ndarray:
+    """
+    Opens a single-channel image read-only without loading it into memory.
+
+    Supported inputs:
+        .npy          - NumPy array files
+        .tif / .tiff  - uncompressed, strip-organized baseline TIFF
+        anything else - headerless raw data; `shape` and `dtype` are required
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.npy':
+        return np.load(path, mmap_mode='r')
+    if ext in ('.tif', '.tiff'):
+        tiff_shape, tiff_dtype, offset = _read_tiff_layout(path)
+        return np.memmap(path, dtype=tiff_dtype, mode='r', offset=offset, shape=tiff_shape)
+    if shape is None or dtype is None:
+        raise ValueError(f"{path}: raw images need an explicit shape and dtype.")
+    return np.memmap(path, dtype=dtype, mode='r', shape=tuple(shape))
+
+
+def create_output(path: str, shape: Tuple[int, int], dtype=np.float32) -> np.ndarray:
+    """Creates a writable memory-mapped output (.npy with header, otherwise raw)."""
+    if path.lower().endswith('.npy'):
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+    return np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+
+
+def iter_tiles(shape: Tuple[int, int], tile_size: int,
+               halo: int = BLUR_HALO) -> Iterator[Tuple[Tuple[slice, slice], Tuple[slice, slice]]]:
+    """
+    Yields (read window, crop) pairs covering an image.
+
+    The read window is the output tile grown by `halo` pixels on every side
+    (clamped to the image). The crop selects the output tile inside the
+    window, so `result[read][crop]` lands at the output tile's position,
+    which is `(read[0].start + crop[0].start, read[1].start + crop[1].start)`.
+    """
+    height, width = shape
+    for y0 in range(0, height, tile_size):
+        y1 = min(y0 + tile_size, height)
+        ry0, ry1 = max(y0 - halo, 0), min(y1 + halo, height)
+        for x0 in range(0, width, tile_size):
+            x1 = min(x0 + tile_size, width)
+            rx0, rx1 = max(x0 - halo, 0), min(x1 + halo, width)
+            yield ((slice(ry0, ry1), slice(rx0, rx1)),
+                   (slice(y0 - ry0, y1 - ry0), slice(x0 - rx0, x1 - rx0)))